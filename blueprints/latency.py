@@ -3,10 +3,9 @@ from database.latency_db import OrderLatency, latency_session
 from utils.session import check_session_validity
 from limiter import limiter
 from utils.logging import get_logger
+from utils.feed_latency import HOPS, get_feed_latency_stats, get_sample_rate
 from sqlalchemy import func
-from collections import defaultdict
-import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 import csv
 import io
@@ -30,17 +29,13 @@ def format_ist_time(timestamp):
     ist_time = convert_to_ist(timestamp)
     return ist_time.strftime('%d-%m-%Y %I:%M:%S %p')
 
-def get_histogram_data(broker=None):
-    """Get histogram data for RTT distribution"""
+def get_histogram_data(broker=None, start=None, end=None):
+    """Get histogram data for RTT distribution in a time window (default: all time)"""
     try:
-        query = OrderLatency.query
-        if broker:
-            query = query.filter_by(broker=broker)
+        # Merged from the latency rollups - no per-order rows are loaded
+        hist = OrderLatency.get_histogram('rtt', broker=broker, start=start, end=end)
         
-        # Get all RTT values
-        rtts = [r[0] for r in query.with_entities(OrderLatency.rtt_ms).all()]
-        
-        if not rtts:
+        if not hist.count:
             return {
                 'bins': [],
                 'counts': [],
@@ -49,21 +44,9 @@ def get_histogram_data(broker=None):
                 'max_rtt': 0
             }
         
-        # Calculate statistics
-        avg_rtt = sum(rtts) / len(rtts)
-        min_rtt = min(rtts)
-        max_rtt = max(rtts)
-        
         # Create histogram bins
         bin_count = 30  # Number of bins
-        bin_width = (max_rtt - min_rtt) / bin_count if max_rtt > min_rtt else 1
-        
-        # Create histogram using numpy
-        counts, bins = np.histogram(rtts, bins=bin_count, range=(min_rtt, max_rtt))
-        
-        # Convert to list for JSON serialization
-        counts = counts.tolist()
-        bins = bins.tolist()
+        bins, counts = hist.linear_bins(bin_count)
         
         # Create bin labels (use the start of each bin)
         bin_labels = [f"{bins[i]:.1f}" for i in range(len(bins)-1)]
@@ -71,9 +54,9 @@ def get_histogram_data(broker=None):
         data = {
             'bins': bin_labels,
             'counts': counts,
-            'avg_rtt': float(avg_rtt),
-            'min_rtt': float(min_rtt),
-            'max_rtt': float(max_rtt)
+            'avg_rtt': float(hist.mean),
+            'min_rtt': float(hist.min),
+            'max_rtt': float(hist.max)
         }
         
         # logger.info(f"Histogram data for broker {broker}: {data}")  # Commented out to reduce log verbosity
@@ -89,6 +72,13 @@ def get_histogram_data(broker=None):
             'max_rtt': 0
         }
 
+def parse_window_args():
+    """Parse optional ?minutes=N window for stats endpoints (None = all time)"""
+    minutes = request.args.get('minutes', type=int)
+    if minutes and minutes > 0:
+        return datetime.utcnow() - timedelta(minutes=minutes), None
+    return None, None
+
 def generate_csv(logs):
     """Generate CSV file from latency logs"""
     output = io.StringIO()
@@ -123,7 +113,7 @@ def latency_dashboard():
     
     # Get histogram data for each broker
     broker_histograms = {}
-    brokers = [b[0] for b in OrderLatency.query.with_entities(OrderLatency.broker).distinct().all()]
+    brokers = OrderLatency.get_brokers()
     for broker in brokers:
         if broker:  # Skip None values
             broker_histograms[broker] = get_histogram_data(broker)
@@ -137,7 +127,10 @@ def latency_dashboard():
     return render_template('latency/dashboard.html',
                          stats=stats,
                          logs=recent_logs,
-                         broker_histograms=broker_histograms)
+                         broker_histograms=broker_histograms,
+                         feed_latency=get_feed_latency_stats(),
+                         feed_hops=HOPS,
+                         feed_sample_rate=get_sample_rate())
 
 @latency_bp.route('/api/logs', methods=['GET'])
 @check_session_validity
@@ -172,12 +165,13 @@ def get_logs():
 def get_stats():
     """API endpoint to get latency statistics"""
     try:
-        stats = OrderLatency.get_latency_stats()
+        start, end = parse_window_args()
+        stats = OrderLatency.get_latency_stats(start, end)
         
-        # Add histogram data for each broker
+        # Add histogram data for each broker, over the same window as the stats
         broker_histograms = {}
         for broker in stats.get('broker_stats', {}):
-            broker_histograms[broker] = get_histogram_data(broker)
+            broker_histograms[broker] = get_histogram_data(broker, start, end)
         
         stats['broker_histograms'] = broker_histograms
         return jsonify(stats)
@@ -185,6 +179,20 @@ def get_stats():
         logger.error(f"Error fetching latency stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+@latency_bp.route('/api/feed', methods=['GET'])
+@check_session_validity
+@limiter.limit("60/minute")
+def get_feed_stats():
+    """API endpoint to get sampled market data feed latency per broker and hop"""
+    try:
+        return jsonify({
+            'sample_rate': get_sample_rate(),
+            'brokers': get_feed_latency_stats()
+        })
+    except Exception as e:
+        logger.error(f"Error fetching feed latency stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @latency_bp.route('/api/broker/<broker>/stats', methods=['GET'])
 @check_session_validity
 @limiter.limit("60/minute")
@@ -0,0 +1,32 @@
+import hmac
+import os
+
+from flask import Blueprint, Response, abort, request, session
+
+from utils.metrics import CONTENT_TYPE_LATEST, generate_latest
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+_LOOPBACK = ('127.0.0.1', '::1')
+
+
+def _is_authorized():
+    """Bearer METRICS_TOKEN if configured, otherwise a direct localhost scrape or a logged-in session"""
+    token = os.getenv('METRICS_TOKEN', '')
+    if token:
+        provided = request.headers.get('Authorization', '')
+        return hmac.compare_digest(provided.encode(), f'Bearer {token}'.encode())
+    if session.get('logged_in'):
+        return True
+    # A forwarded request reached us through a proxy, so remote_addr is not the caller
+    return request.remote_addr in _LOOPBACK and 'X-Forwarded-For' not in request.headers
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of all registered metrics"""
+    if os.getenv('METRICS_ENABLED', 'True').lower() != 'true':
+        abort(404)
+    if not _is_authorized():
+        abort(403)
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
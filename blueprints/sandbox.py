@@ -114,7 +114,10 @@ def update_config():
                     from database.sandbox_db import SandboxFunds, db_session
                     from decimal import Decimal
 
+                    from sandbox import account_state
+
                     new_capital = Decimal(str(config_value))
+                    account_state.sync()
 
                     # Update all user funds with new starting capital
                     # This resets their balance to the new capital value
@@ -126,6 +129,7 @@ def update_config():
                         fund.available_balance = new_capital - fund.used_margin + fund.total_pnl
 
                     db_session.commit()
+                    account_state.invalidate()
                     logger.info(f"Updated {len(funds)} user funds with new starting capital: ₹{new_capital}")
                 except Exception as e:
                     logger.error(f"Error updating user funds with new capital: {e}")
@@ -204,6 +208,9 @@ def reset_config():
 
         # Clear all sandbox data for the current user
         try:
+            from sandbox import account_state
+            account_state.sync()
+
             # Delete all orders
             deleted_orders = SandboxOrders.query.filter_by(user_id=user_id).delete()
             logger.info(f"Deleted {deleted_orders} sandbox orders for user {user_id}")
@@ -256,6 +263,7 @@ def reset_config():
                 logger.info(f"Created new sandbox funds for user {user_id}")
 
             db_session.commit()
+            account_state.invalidate([user_id])
             logger.info(f"Successfully reset all sandbox data for user {user_id}")
 
         except Exception as e:
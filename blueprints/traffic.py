@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, render_template, request, session, Response
 from database.traffic_db import TrafficLog, logs_session
+from database.write_behind import get_write_behind_stats
 from utils.session import check_session_validity
 from limiter import limiter
 from sqlalchemy import func
@@ -136,7 +137,8 @@ def get_stats():
         return jsonify({
             'overall': overall_stats,
             'api': api_stats,
-            'endpoints': endpoint_stats
+            'endpoints': endpoint_stats,
+            'log_sinks': get_write_behind_stats()
         })
     except Exception as e:
         logger.error(f"Error fetching traffic stats: {e}")
@@ -0,0 +1,216 @@
+"""
+Decoder for Fyers HSM data feed messages (message type 6).
+
+A data feed message carries a 2-byte scrip count at offset 7, followed by
+scrips that are either a snapshot (data type 83) or an update (data type 85):
+
+- snapshot: topic id, topic name (``sf|``, ``if|`` or ``dp|`` + segment and
+  token), field count and big-endian int32 field values; scrip and depth
+  snapshots then carry multiplier, precision and exchange/token/symbol strings
+- update: topic id, field count and the field values again, where the
+  ``-2147483648`` sentinel marks a field that did not change
+
+Fields are read with precompiled ``struct.Struct`` objects straight from a
+``memoryview`` of the message. Each topic keeps its field table and a
+preallocated list of current values from its snapshot, so an update only
+compares and applies the fields that changed and produces one message for the
+whole update (not one per changed field).
+
+The topic id is read in native byte order, as the official client does; it
+is only used as a key between a snapshot and its updates.
+"""
+import logging
+import struct
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("fyers_hsm_websocket")
+
+SNAPSHOT = 83
+UPDATE = 85
+NULL_VALUE = -2147483648
+
+# Numeric fields per topic kind, in wire order (from the official library's map.json,
+# without the trailing "type"/"symbol" entries, which are not sent as numbers)
+DATA_FIELDS = (
+    "ltp", "vol_traded_today", "last_traded_time", "exch_feed_time",
+    "bid_size", "ask_size", "bid_price", "ask_price", "last_traded_qty",
+    "tot_buy_qty", "tot_sell_qty", "avg_trade_price", "OI", "low_price",
+    "high_price", "Yhigh", "Ylow", "lower_ckt", "upper_ckt", "open_price",
+    "prev_close_price"
+)
+
+INDEX_FIELDS = (
+    "ltp", "prev_close_price", "exch_feed_time", "high_price", "low_price",
+    "open_price"
+)
+
+DEPTH_FIELDS = tuple(
+    f"{name}{level}" for name in ("bid_price", "ask_price", "bid_size", "ask_size", "bid_order", "ask_order")
+    for level in range(1, 6)
+)
+
+TOPIC_FIELDS = {"sf": DATA_FIELDS, "if": INDEX_FIELDS, "dp": DEPTH_FIELDS}
+STRING_FIELDS = ("exchange", "exchange_token", "symbol")
+
+_SCRIP_COUNT = struct.Struct(">H")
+_BYTE = struct.Struct("B")
+_TOPIC_HEAD = struct.Struct("=HB")   # topic id, topic name length (snapshot) or field count (update)
+_TRAILER = struct.Struct(">2xHB")    # padding, multiplier, precision
+
+
+@lru_cache(maxsize=None)
+def _values(count: int) -> struct.Struct:
+    """Reader for ``count`` big-endian int32 field values"""
+    return struct.Struct(f">{count}i")
+
+
+class _Topic:
+    """Field table, current values and last message of one subscribed topic"""
+
+    __slots__ = ("name", "fields", "values", "data")
+
+    def __init__(self, name: str, fields: Tuple[str, ...], data: Dict):
+        self.name = name
+        self.fields = fields
+        self.values = [None] * len(fields)
+        self.data = data
+
+
+class HSMFeedDecoder:
+    """
+    Stateful decoder for the data feed of one HSM connection
+
+    Snapshots register their topic; updates for topics without a snapshot
+    are skipped. Called from the websocket thread only.
+    """
+
+    def __init__(self, symbol_mappings: Optional[Dict[str, str]] = None):
+        # hsm_token -> original symbol, shared with (and updated by) the client
+        self.symbol_mappings = symbol_mappings if symbol_mappings is not None else {}
+        self.topics: Dict[int, _Topic] = {}
+
+    def clear(self):
+        """Forget every topic (a new connection sends fresh snapshots)"""
+        self.topics.clear()
+
+    def decode(self, data) -> List[Dict]:
+        """
+        Messages for every scrip of a data feed message, in order
+
+        Args:
+            data: the whole message (bytes, bytearray or memoryview)
+        """
+        buf = memoryview(data)
+        size = len(buf)
+        if size < 9:
+            logger.warning(f"Data feed too short: {size} bytes")
+            return []
+
+        messages = []
+        offset = 9
+        for _ in range(_SCRIP_COUNT.unpack_from(buf, 7)[0]):
+            if offset >= size:
+                break
+            data_type = buf[offset]
+            offset += 1
+            if data_type == UPDATE:
+                offset = self._update(buf, offset, size, messages)
+            elif data_type == SNAPSHOT:
+                offset = self._snapshot(buf, offset, size, messages)
+            else:
+                logger.warning(f"Unknown data type: {data_type}, skipping")
+                break
+        return messages
+
+    def _fields(self, buf, offset: int, size: int) -> Tuple[Tuple[int, ...], int]:
+        """Field count byte and the values after it (as many as the message holds)"""
+        count = buf[offset]
+        offset += 1
+        count = min(count, (size - offset) // 4)
+        return _values(count).unpack_from(buf, offset), offset + 4 * count
+
+    def _snapshot(self, buf, offset: int, size: int, messages: List[Dict]) -> int:
+        if offset + 3 > size:
+            return offset
+        topic_id, name_len = _TOPIC_HEAD.unpack_from(buf, offset)
+        offset += 3
+        if offset + name_len > size:
+            return offset
+        name = str(buf[offset:offset + name_len], "utf-8", "ignore")
+        offset += name_len
+
+        kind = name[:2]
+        fields = TOPIC_FIELDS.get(kind)
+        if fields is None or name[2:3] != "|":
+            self.topics.pop(topic_id, None)
+            return offset
+        if offset + 1 > size:
+            return offset
+
+        values, offset = self._fields(buf, offset, size)
+        data = {"type": kind}
+        for field, value in zip(fields, values):
+            if value != NULL_VALUE:
+                data[field] = value
+
+        if kind != "if":
+            if offset + _TRAILER.size > size:
+                # truncated snapshot: the topic stays unknown, so are its updates
+                self.topics.pop(topic_id, None)
+                return offset + 2
+            data["multiplier"], data["precision"] = _TRAILER.unpack_from(buf, offset)
+            offset += _TRAILER.size
+            for field in STRING_FIELDS:
+                if offset + 1 > size:
+                    break
+                length = buf[offset]
+                offset += 1
+                if offset + length > size:
+                    break
+                data[field] = str(buf[offset:offset + length], "utf-8", "ignore")
+                offset += length
+
+        original = self.symbol_mappings.get(name)
+        if original is not None:
+            data["original_symbol"] = original
+        elif kind == "sf":
+            logger.warning(f"No symbol mapping found for topic_name: {name}")
+        data["hsm_token"] = name
+
+        topic = _Topic(name, fields, data)
+        current = topic.values
+        for index, value in enumerate(values[:len(fields)]):
+            if value != NULL_VALUE:
+                current[index] = value
+        self.topics[topic_id] = topic
+        messages.append(data.copy())
+        return offset
+
+    def _update(self, buf, offset: int, size: int, messages: List[Dict]) -> int:
+        if offset + 3 > size:
+            return offset
+        topic_id, count = _TOPIC_HEAD.unpack_from(buf, offset)
+        offset += 3
+        topic = self.topics.get(topic_id)
+        if topic is None:
+            return offset + 4 * count
+
+        count = min(count, (size - offset) // 4)
+        values = _values(count).unpack_from(buf, offset)
+        offset += 4 * count
+
+        fields = topic.fields
+        current = topic.values
+        data = topic.data
+        changed = False
+        for index, value in enumerate(values[:len(fields)]):
+            if value != NULL_VALUE and value != current[index]:
+                current[index] = value
+                data[fields[index]] = value
+                changed = True
+        if changed:
+            update = data.copy()
+            update["update_type"] = "live"
+            messages.append(update)
+        return offset
@@ -15,6 +15,10 @@ import logging
 from typing import Dict, List, Any, Optional, Callable
 from datetime import datetime
 
+from utils.feed_latency import mark_frame
+
+from .fyers_hsm_decoder import HSMFeedDecoder
+
 class FyersHSMWebSocket:
     """
     Fyers HSM WebSocket client using binary protocol
@@ -24,30 +28,6 @@ class FyersHSMWebSocket:
     HSM_URL = "wss://socket.fyers.in/hsm/v1-5/prod"
     SYMBOLS_TOKEN_API = "https://api-t1.fyers.in/data/symbol-token"
     
-    # Data field mappings (from official library map.json)
-    DATA_FIELDS = [
-        "ltp", "vol_traded_today", "last_traded_time", "exch_feed_time",
-        "bid_size", "ask_size", "bid_price", "ask_price", "last_traded_qty",
-        "tot_buy_qty", "tot_sell_qty", "avg_trade_price", "OI", "low_price",
-        "high_price", "Yhigh", "Ylow", "lower_ckt", "upper_ckt", "open_price",
-        "prev_close_price", "type", "symbol"
-    ]
-    
-    INDEX_FIELDS = [
-        "ltp", "prev_close_price", "exch_feed_time", "high_price", "low_price",
-        "open_price", "type", "symbol"
-    ]
-    
-    DEPTH_FIELDS = [
-        "bid_price1", "bid_price2", "bid_price3", "bid_price4", "bid_price5",
-        "ask_price1", "ask_price2", "ask_price3", "ask_price4", "ask_price5",
-        "bid_size1", "bid_size2", "bid_size3", "bid_size4", "bid_size5",
-        "ask_size1", "ask_size2", "ask_size3", "ask_size4", "ask_size5",
-        "bid_order1", "bid_order2", "bid_order3", "bid_order4", "bid_order5",
-        "ask_order1", "ask_order2", "ask_order3", "ask_order4", "ask_order5",
-        "type", "symbol"
-    ]
-    
     # Exchange segment mapping
     EXCHANGE_SEGMENTS = {
         "1010": "nse_cm",    # NSE Cash
@@ -86,11 +66,8 @@ class FyersHSMWebSocket:
         self.running = False
         
         # Data structures
-        self.subscriptions = {}  # topic_id -> topic_name mapping
         self.symbol_mappings = {}  # hsm_token -> original_symbol
-        self.scrips_data = {}  # topic_id -> data for scrips
-        self.index_data = {}   # topic_id -> data for indices  
-        self.depth_data = {}   # topic_id -> data for depth
+        self.decoder = HSMFeedDecoder(self.symbol_mappings)  # topic_id -> field table and values
         
         # Callbacks
         self.on_message_callback = None
@@ -101,13 +78,6 @@ class FyersHSMWebSocket:
         # Threading
         self.lock = threading.Lock()
         
-        # Initialize data structures to prevent AttributeError in cleanup
-        self.subscriptions = {}
-        self.symbol_mappings = {}
-        self.scrips_data = {}
-        self.index_data = {}
-        self.depth_data = {}
-        
         # Source identifier
         self.source = "MarvelQuant-HSM"
         self.mode = "P"  # Production mode
@@ -242,7 +212,7 @@ class FyersHSMWebSocket:
         
         return buffer_msg
     
-    def _parse_binary_message(self, data: bytearray):
+    def _parse_binary_message(self, data: bytes):
         """
         Parse incoming binary message from HSM WebSocket
         
@@ -265,7 +235,6 @@ class FyersHSMWebSocket:
                     
             elif msg_type == 6:
                 # Data feed message
-                self.logger.debug(f"Received data feed message (type 6): {len(data)} bytes")
                 self._parse_data_feed(data)
                 
             elif msg_type == 13:
@@ -284,388 +253,24 @@ class FyersHSMWebSocket:
             if self.on_error_callback:
                 self.on_error_callback(e)
     
-    def _parse_data_feed(self, data: bytearray):
+    def _parse_data_feed(self, data):
         """
-        Parse data feed message (message type 6)
-        
+        Parse data feed message (message type 6) and pass each scrip to the callback
+
         Args:
             data: Binary data containing market data
         """
         try:
-            if len(data) < 9:
-                self.logger.warning(f"Data feed too short: {len(data)} bytes")
-                return
-                
-            # Get scrip count
-            scrip_count = struct.unpack("!H", data[7:9])[0]
-            self.logger.debug(f"Data feed contains {scrip_count} scrips")
-            offset = 9
-            
-            for i in range(scrip_count):
-                if offset >= len(data):
-                    self.logger.warning(f"Reached end of data at scrip {i}")
-                    break
-                    
-                # Get data type
-                data_type = struct.unpack("B", data[offset:offset + 1])[0]
-                offset += 1
-                
-                self.logger.debug(f"Processing scrip {i+1}/{scrip_count}, data_type: {data_type}")
-                
-                if data_type == 83:  # Snapshot data feed
-                    offset = self._parse_snapshot_data(data, offset)
-                elif data_type == 85:  # Update data feed
-                    offset = self._parse_update_data(data, offset)
-                else:
-                    self.logger.warning(f"Unknown data type: {data_type}, skipping")
-                    break
-                    
+            messages = self.decoder.decode(data)
         except Exception as e:
             self.logger.error(f"Error parsing data feed: {e}")
-    
-    def _parse_snapshot_data(self, data: bytearray, offset: int) -> int:
-        """
-        Parse snapshot data (data_type = 83)
-        
-        Args:
-            data: Binary data
-            offset: Current offset in data
-            
-        Returns:
-            New offset after parsing
-        """
-        try:
-            if offset + 3 > len(data):
-                return offset
-                
-            # Get topic ID
-            topic_id = struct.unpack("H", data[offset:offset + 2])[0]
-            offset += 2
-            
-            # Get topic name length
-            topic_name_len = struct.unpack("B", data[offset:offset + 1])[0]
-            offset += 1
-            
-            if offset + topic_name_len > len(data):
-                return offset
-                
-            # Get topic name (HSM token)
-            topic_name = data[offset:offset + topic_name_len].decode("utf-8")
-            offset += topic_name_len
-            
-            # Store mapping
-            self.subscriptions[topic_id] = topic_name
-            self.logger.debug(f"Mapped topic_id {topic_id} -> {topic_name}")
-            
-            # Parse based on topic type
-            if topic_name.startswith("sf|"):
-                offset = self._parse_scrip_snapshot(data, offset, topic_id, topic_name)
-            elif topic_name.startswith("if|"):
-                offset = self._parse_index_snapshot(data, offset, topic_id, topic_name)
-            elif topic_name.startswith("dp|"):
-                offset = self._parse_depth_snapshot(data, offset, topic_id, topic_name)
-                
-        except Exception as e:
-            self.logger.error(f"Error parsing snapshot data: {e}")
-            
-        return offset
-    
-    def _parse_scrip_snapshot(self, data: bytearray, offset: int, topic_id: int, topic_name: str) -> int:
-        """Parse scrip snapshot data"""
-        try:
-            if offset + 1 > len(data):
-                return offset
-                
-            field_count = struct.unpack("B", data[offset:offset + 1])[0]
-            offset += 1
-            
-            scrip_data = {"type": "sf"}
-            
-            # Parse field values
-            for index in range(field_count):
-                if offset + 4 > len(data):
-                    break
-                    
-                value = struct.unpack(">i", data[offset:offset + 4])[0]
-                offset += 4
-                
-                if value != -2147483648 and index < len(self.DATA_FIELDS):
-                    scrip_data[self.DATA_FIELDS[index]] = value
-            
-            # Skip 2 bytes
-            offset += 2
-            
-            if offset + 3 > len(data):
-                return offset
-                
-            # Get multiplier and precision
-            multiplier = struct.unpack(">H", data[offset:offset + 2])[0]
-            scrip_data["multiplier"] = multiplier
-            offset += 2
-            
-            precision = struct.unpack("B", data[offset:offset + 1])[0]
-            scrip_data["precision"] = precision
-            offset += 1
-            
-            # Parse exchange, token, symbol strings
-            string_fields = ["exchange", "exchange_token", "symbol"]
-            for field in string_fields:
-                if offset + 1 > len(data):
-                    break
-                    
-                string_len = struct.unpack("B", data[offset:offset + 1])[0]
-                offset += 1
-                
-                if offset + string_len > len(data):
-                    break
-                    
-                string_data = data[offset:offset + string_len].decode("utf-8", errors='ignore')
-                scrip_data[field] = string_data
-                offset += string_len
-            
-            # Add original symbol mapping and HSM token
-            if topic_name in self.symbol_mappings:
-                scrip_data["original_symbol"] = self.symbol_mappings[topic_name]
-                self.logger.debug(f"Symbol mapping: {topic_name} -> {self.symbol_mappings[topic_name]}")
-            else:
-                self.logger.warning(f"No symbol mapping found for topic_name: {topic_name}")
-            
-            # Add HSM token for reliable matching in adapter
-            scrip_data["hsm_token"] = topic_name
-            
-            # Store data
-            self.scrips_data[topic_id] = scrip_data
-            
-            # Send to callback
-            if self.on_message_callback:
-                self.logger.debug(f"Sending scrip data to callback: {scrip_data.get('symbol', 'Unknown')} LTP={scrip_data.get('ltp', 'N/A')}")
-                # Debug: Log all available fields in HSM data
-                self.logger.debug(f"Complete HSM scrip_data fields: {list(scrip_data.keys())}")
-                self.logger.debug(f"OHLC values: open={scrip_data.get('open_price', 'N/A')}, high={scrip_data.get('high_price', 'N/A')}, low={scrip_data.get('low_price', 'N/A')}, close={scrip_data.get('prev_close_price', 'N/A')}")
-                self.on_message_callback(scrip_data)
-            else:
-                self.logger.warning(f"No callback set for scrip data: {scrip_data.get('symbol', 'Unknown')}")
-                
-        except Exception as e:
-            self.logger.error(f"Error parsing scrip snapshot: {e}")
-            
-        return offset
-    
-    def _parse_index_snapshot(self, data: bytearray, offset: int, topic_id: int, topic_name: str) -> int:
-        """Parse index snapshot data"""
-        try:
-            if offset + 1 > len(data):
-                return offset
-                
-            field_count = struct.unpack("B", data[offset:offset + 1])[0]
-            offset += 1
-            
-            index_data = {"type": "if"}
-            
-            # Parse field values
-            for index in range(field_count):
-                if offset + 4 > len(data):
-                    break
-                    
-                value = struct.unpack(">i", data[offset:offset + 4])[0]
-                offset += 4
-                
-                if value != -2147483648 and index < len(self.INDEX_FIELDS):
-                    index_data[self.INDEX_FIELDS[index]] = value
-            
-            # Add original symbol mapping and HSM token
-            if topic_name in self.symbol_mappings:
-                index_data["original_symbol"] = self.symbol_mappings[topic_name]
-            
-            # Add HSM token for reliable matching in adapter
-            index_data["hsm_token"] = topic_name
-            
-            # Store data
-            self.index_data[topic_id] = index_data
-            
-            # Send to callback
-            if self.on_message_callback:
-                self.on_message_callback(index_data)
-                
-        except Exception as e:
-            self.logger.error(f"Error parsing index snapshot: {e}")
-            
-        return offset
-    
-    def _parse_depth_snapshot(self, data: bytearray, offset: int, topic_id: int, topic_name: str) -> int:
-        """Parse depth snapshot data"""
-        try:
-            if offset + 1 > len(data):
-                return offset
-                
-            field_count = struct.unpack("B", data[offset:offset + 1])[0]
-            offset += 1
-            
-            depth_data = {"type": "dp"}
-            
-            # Parse field values
-            for index in range(field_count):
-                if offset + 4 > len(data):
-                    break
-                    
-                value = struct.unpack(">i", data[offset:offset + 4])[0]
-                offset += 4
-                
-                if value != -2147483648 and index < len(self.DEPTH_FIELDS):
-                    depth_data[self.DEPTH_FIELDS[index]] = value
-            
-            # Skip 2 bytes (similar to scrip snapshot)
-            offset += 2
-            
-            if offset + 3 > len(data):
-                return offset
-                
-            # Get multiplier and precision (depth data also has these)
-            multiplier = struct.unpack(">H", data[offset:offset + 2])[0]
-            depth_data["multiplier"] = multiplier
-            offset += 2
-            
-            precision = struct.unpack("B", data[offset:offset + 1])[0]
-            depth_data["precision"] = precision
-            offset += 1
-            
-            # Parse exchange, token, symbol strings (same as scrip)
-            string_fields = ["exchange", "exchange_token", "symbol"]
-            for field in string_fields:
-                if offset + 1 > len(data):
-                    break
-                    
-                string_len = struct.unpack("B", data[offset:offset + 1])[0]
-                offset += 1
-                
-                if offset + string_len > len(data):
-                    break
-                    
-                string_data = data[offset:offset + string_len].decode("utf-8", errors='ignore')
-                depth_data[field] = string_data
-                offset += string_len
-            
-            # Add original symbol mapping and HSM token
-            if topic_name in self.symbol_mappings:
-                depth_data["original_symbol"] = self.symbol_mappings[topic_name]
-            
-            # Add HSM token for reliable matching in adapter
-            depth_data["hsm_token"] = topic_name
-            
-            # Store data
-            self.depth_data[topic_id] = depth_data
-            
-            # Log depth data for debugging
-            #self.logger.info(f"Parsed depth data: {depth_data.get('symbol', 'Unknown')}")
-            self.logger.debug(f"Depth fields: bid_price1={depth_data.get('bid_price1', 'N/A')}, ask_price1={depth_data.get('ask_price1', 'N/A')}")
-            #self.logger.info(f"Multiplier={multiplier}, Precision={precision}")
-            
-            # Send to callback
-            if self.on_message_callback:
-                self.on_message_callback(depth_data)
-                
-        except Exception as e:
-            self.logger.error(f"Error parsing depth snapshot: {e}")
-            
-        return offset
-    
-    def _parse_update_data(self, data: bytearray, offset: int) -> int:
-        """
-        Parse update data (data_type = 85)
-        
-        Args:
-            data: Binary data
-            offset: Current offset
-            
-        Returns:
-            New offset
-        """
-        try:
-            if offset + 3 > len(data):
-                return offset
-                
-            # Get topic ID
-            topic_id = struct.unpack("H", data[offset:offset + 2])[0]
-            offset += 2
-            
-            # Get field count
-            field_count = struct.unpack("B", data[offset:offset + 1])[0]
-            offset += 1
-            
-            # Determine data type based on topic ID
-            if topic_id in self.subscriptions:
-                topic_name = self.subscriptions[topic_id]
-                
-                if topic_name.startswith("sf|") and topic_id in self.scrips_data:
-                    # Update scrip data
-                    for index in range(field_count):
-                        if offset + 4 > len(data):
-                            break
-                            
-                        value = struct.unpack(">i", data[offset:offset + 4])[0]
-                        offset += 4
-                        
-                        if value != -2147483648 and index < len(self.DATA_FIELDS):
-                            old_value = self.scrips_data[topic_id].get(self.DATA_FIELDS[index])
-                            if old_value != value:
-                                self.scrips_data[topic_id][self.DATA_FIELDS[index]] = value
-                                
-                                # Send update to callback
-                                if self.on_message_callback:
-                                    update_data = self.scrips_data[topic_id].copy()
-                                    update_data["update_type"] = "live"
-                                    self.logger.debug(f"Sending live update: {update_data.get('symbol', 'Unknown')} LTP={update_data.get('ltp', 'N/A')}")
-                                    self.on_message_callback(update_data)
-                
-                elif topic_name.startswith("if|") and topic_id in self.index_data:
-                    # Update index data
-                    for index in range(field_count):
-                        if offset + 4 > len(data):
-                            break
-                            
-                        value = struct.unpack(">i", data[offset:offset + 4])[0]
-                        offset += 4
-                        
-                        if value != -2147483648 and index < len(self.INDEX_FIELDS):
-                            old_value = self.index_data[topic_id].get(self.INDEX_FIELDS[index])
-                            if old_value != value:
-                                self.index_data[topic_id][self.INDEX_FIELDS[index]] = value
-                                
-                                # Send update to callback
-                                if self.on_message_callback:
-                                    update_data = self.index_data[topic_id].copy()
-                                    update_data["update_type"] = "live"
-                                    self.on_message_callback(update_data)
-                
-                elif topic_name.startswith("dp|") and topic_id in self.depth_data:
-                    # Update depth data
-                    for index in range(field_count):
-                        if offset + 4 > len(data):
-                            break
-                            
-                        value = struct.unpack(">i", data[offset:offset + 4])[0]
-                        offset += 4
-                        
-                        if value != -2147483648 and index < len(self.DEPTH_FIELDS):
-                            old_value = self.depth_data[topic_id].get(self.DEPTH_FIELDS[index])
-                            if old_value != value:
-                                self.depth_data[topic_id][self.DEPTH_FIELDS[index]] = value
-                                
-                                # Send update to callback
-                                if self.on_message_callback:
-                                    update_data = self.depth_data[topic_id].copy()
-                                    update_data["update_type"] = "live"
-                                    self.logger.debug(f"Sending live depth update: {update_data.get('symbol', 'Unknown')}")
-                                    self.on_message_callback(update_data)
-            else:
-                # Skip unknown data
-                offset += field_count * 4
-                
-        except Exception as e:
-            self.logger.error(f"Error parsing update data: {e}")
-            
-        return offset
-    
+            return
+
+        callback = self.on_message_callback
+        if callback:
+            for message in messages:
+                callback(message)
+
     def set_callbacks(self, on_message=None, on_error=None, on_open=None, on_close=None):
         """Set callback functions"""
         self.on_message_callback = on_message
@@ -686,7 +291,8 @@ class FyersHSMWebSocket:
     def _on_ws_message(self, ws, message):
         """Handle WebSocket message event"""
         if isinstance(message, bytes):
-            self._parse_binary_message(bytearray(message))
+            mark_frame()
+            self._parse_binary_message(message)
         else:
             self.logger.warning(f"Received unexpected text message: {message}")
     
@@ -755,11 +361,8 @@ class FyersHSMWebSocket:
             
             # Clear all data structures
             with self.lock:
-                self.subscriptions.clear()
                 self.symbol_mappings.clear()
-                self.scrips_data.clear()
-                self.index_data.clear()
-                self.depth_data.clear()
+                self.decoder.clear()
                 self.logger.info("Cleared all data structures and subscriptions")
             
             # Close WebSocket connection
@@ -852,16 +455,10 @@ class FyersHSMWebSocket:
             self.authenticated = False
             
             # Force clear data structures
-            if hasattr(self, 'subscriptions'):
-                self.subscriptions.clear()
             if hasattr(self, 'symbol_mappings'):
                 self.symbol_mappings.clear()
-            if hasattr(self, 'scrips_data'):
-                self.scrips_data.clear()
-            if hasattr(self, 'index_data'):
-                self.index_data.clear()
-            if hasattr(self, 'depth_data'):
-                self.depth_data.clear()
+            if hasattr(self, 'decoder'):
+                self.decoder.clear()
                 
             # Force close WebSocket
             if hasattr(self, 'ws') and self.ws:
@@ -67,10 +67,10 @@ class BaseAPIClient:
             # Import here to avoid circular dependency
             try:
                 from .order_api import get_httpx_client
-                self._client = get_httpx_client()
             except ImportError:
-                # Fallback: create new client if import fails
-                self._client = httpx.Client(timeout=self.default_timeout)
+                # Fallback: the shared per-host pools, never a private client
+                from utils.httpx_client import get_httpx_client
+            self._client = get_httpx_client()
         
         return self._client
     
@@ -164,8 +164,7 @@ class BaseAPIClient:
         
         # Log request (DEBUG level)
         logger.debug(f"{method} {url}")
-        # CRITICAL DEBUG: Log the actual URL and route key being called
-        logger.info(f"CRITICAL DEBUG - Route: '{route_key}' -> URL: {url}, Params: {params}")
+        logger.debug("Route: '%s' -> URL: %s, Params: %s", route_key, url, params)
         if json_data:
             logger.debug(f"Request JSON: {json_data}")
         elif content:
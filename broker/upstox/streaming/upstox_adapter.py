@@ -6,9 +6,12 @@ import logging
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from google.protobuf.json_format import MessageToDict
+
 from websocket_proxy.base_adapter import BaseBrokerWebSocketAdapter
 from websocket_proxy.mapping import SymbolMapper
 from .upstox_client import UpstoxWebSocketClient
+from . import MarketDataFeedV3_pb2
 from database.auth_db import get_auth_token
 
 
@@ -18,7 +21,7 @@ class UpstoxWebSocketAdapter(BaseBrokerWebSocketAdapter):
     
     Features:
     - Handles all WebSocket operations through UpstoxWebSocketClient
-    - Processes protobuf messages decoded to dict format
+    - Reads market data straight off the FeedResponse protobufs (no dict conversion)
     - Manages subscriptions and market data publishing
     """
     
@@ -372,76 +375,65 @@ class UpstoxWebSocketAdapter(BaseBrokerWebSocketAdapter):
         except Exception as e:
             self.logger.error(f"Reconnection error: {e}")
 
-    async def _on_market_data(self, data: Dict[str, Any]):
-        """Handle market data messages"""
+    async def _on_market_data(self, feed_response: MarketDataFeedV3_pb2.FeedResponse):
+        """Handle market data messages (parsed FeedResponse protobufs)"""
         try:
             # Handle market info messages
-            if data.get("type") == "market_info":
-                self._handle_market_info(data)
+            if feed_response.type == MarketDataFeedV3_pb2.market_info:
+                self._handle_market_info(feed_response)
                 return
-                
+
             # Process market data feeds
-            feeds = data.get("feeds", {})
+            feeds = feed_response.feeds
             if not feeds:
                 return
-                
-            current_ts = data.get("currentTs", 0)
-            
-            for feed_key, feed_data in feeds.items():
-                self._process_feed(feed_key, feed_data, current_ts)
-                
+
+            current_ts = feed_response.currentTs
+
+            for feed_key, feed in feeds.items():
+                self._process_feed(feed_key, feed, current_ts)
+
         except Exception as e:
             self.logger.error(f"Market data handler error: {e}")
 
-    def _handle_market_info(self, data: Dict[str, Any]):
+    def _handle_market_info(self, feed_response: MarketDataFeedV3_pb2.FeedResponse):
         """Handle market info messages"""
-        if "marketInfo" in data:
-            self.market_status = data["marketInfo"]
+        if feed_response.HasField("marketInfo"):
+            self.market_status = MessageToDict(feed_response.marketInfo)
             if "segmentStatus" in self.market_status:
                 self.logger.debug(f"Market status update: {self.market_status['segmentStatus']}")
 
-    def _process_feed(self, feed_key: str, feed_data: Dict[str, Any], current_ts: int):
+    def _process_feed(self, feed_key: str, feed: MarketDataFeedV3_pb2.Feed, current_ts: int):
         """Process individual feed data"""
         try:
             # Find all subscriptions that match this feed key (could be multiple modes)
             matching_subscriptions = []
             with self.lock:
-                self.logger.debug(f"Looking for matches for feed_key: {feed_key}")
-                self.logger.debug(f"Available subscriptions: {list(self.subscriptions.keys())}")
-                
                 for correlation_id, sub_info in self.subscriptions.items():
                     # Check instrument_key match
                     if sub_info.get('instrument_key') == feed_key:
                         matching_subscriptions.append((correlation_id, sub_info))
-                        self.logger.debug(f"Matched by instrument_key: {correlation_id}")
                     # Check token match as fallback
                     elif '|' in feed_key:
                         token = feed_key.split('|')[-1]
                         if sub_info.get('token') == token or sub_info.get('token') == feed_key:
                             matching_subscriptions.append((correlation_id, sub_info))
-                            self.logger.debug(f"Matched by token: {correlation_id}")
-                
-                self.logger.debug(f"Found {len(matching_subscriptions)} matching subscriptions for {feed_key}")
-            
+
             if not matching_subscriptions:
                 self.logger.warning(f"No subscription found for feed key: {feed_key}")
                 return
-            
-            # Process data for each matching subscription (different modes)
+
+            # Process data for each matching subscription (different modes); only the
+            # parts of the feed a subscribed mode publishes are read off the message
             for correlation_id, sub_info in matching_subscriptions:
                 symbol = sub_info['symbol']
                 exchange = sub_info['exchange']
                 mode = sub_info['mode']
-                token = sub_info['token']
-                
+
                 topic = self._create_topic(exchange, symbol, mode)
-                market_data = self._extract_market_data(feed_data, sub_info, current_ts)
-                
+                market_data = self._extract_market_data(feed, sub_info, current_ts)
+
                 if market_data:
-                    self.logger.debug(f"Publishing data for {symbol} mode {mode} on topic: {topic}")
-                    if mode == 2:  # Quote mode - show the complete data structure
-                        self.logger.debug(f"QUOTE DATA: {market_data}")
-                    
                     if mode == 3:  # Depth mode
                         # For depth mode, structure the data properly with LTP at top level
                         depth_data = market_data.copy()
@@ -455,144 +447,124 @@ class UpstoxWebSocketAdapter(BaseBrokerWebSocketAdapter):
                         self.publish_market_data(topic, depth_data)
                     else:
                         self.publish_market_data(topic, market_data)
-                    
+
         except Exception as e:
             self.logger.error(f"Error processing feed for {feed_key}: {e}")
 
-    def _extract_market_data(self, feed_data: Dict[str, Any], sub_info: Dict[str, Any], current_ts: int) -> Dict[str, Any]:
+    def _extract_market_data(self, feed: MarketDataFeedV3_pb2.Feed, sub_info: Dict[str, Any], current_ts: int) -> Dict[str, Any]:
         """Extract market data based on subscription mode"""
         mode = sub_info['mode']
         symbol = sub_info['symbol']
         exchange = sub_info['exchange']
         token = sub_info['token']
-        
+
         base_data = {"symbol": symbol, "exchange": exchange, "token": token}
-        
+
         if mode == 1:  # LTP mode
-            return self._extract_ltp_data(feed_data, base_data)
+            return self._extract_ltp_data(feed, base_data)
         elif mode == 2:  # QUOTE mode
-            return self._extract_quote_data(feed_data, base_data, current_ts)
+            return self._extract_quote_data(feed, base_data, current_ts)
         elif mode == 3:  # DEPTH mode
-            depth_data = self._extract_depth_data(feed_data, current_ts)
+            depth_data = self._extract_depth_data(feed, current_ts)
             depth_data.update(base_data)
             return depth_data
-        
+
         return {}
 
-    def _extract_ltp_data(self, feed_data: Dict[str, Any], base_data: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _full_feed(feed: MarketDataFeedV3_pb2.Feed):
+        """(market or index full feed, is_market) of a full feed, or (None, False)"""
+        if feed.WhichOneof("FeedUnion") != "fullFeed":
+            return None, False
+        full_feed = feed.fullFeed
+        if full_feed.WhichOneof("FullFeedUnion") == "marketFF":
+            return full_feed.marketFF, True
+        return full_feed.indexFF, False
+
+    def _extract_ltp_data(self, feed: MarketDataFeedV3_pb2.Feed, base_data: Dict[str, Any]) -> Dict[str, Any]:
         """Extract LTP data from feed"""
         market_data = base_data.copy()
-        
-        if "ltpc" in feed_data:
-            ltpc = feed_data["ltpc"]
-            market_data.update({
-                "ltp": float(ltpc.get("ltp", 0)),
-                "ltq": int(ltpc.get("ltq", 0)),
-                "ltt": int(ltpc.get("ltt", 0)),
-                "cp": float(ltpc.get("cp", 0))
-            })
-        
+
+        if feed.HasField("ltpc"):
+            ltpc = feed.ltpc
+        else:
+            # the instrument is also subscribed in full mode, which carries the same LTPC
+            ff, _ = self._full_feed(feed)
+            if ff is None or not ff.HasField("ltpc"):
+                return market_data
+            ltpc = ff.ltpc
+
+        market_data.update({
+            "ltp": ltpc.ltp,
+            "ltq": ltpc.ltq,
+            "ltt": ltpc.ltt,
+            "cp": ltpc.cp
+        })
         return market_data
 
-    def _extract_quote_data(self, feed_data: Dict[str, Any], base_data: Dict[str, Any], current_ts: int) -> Dict[str, Any]:
+    def _extract_quote_data(self, feed: MarketDataFeedV3_pb2.Feed, base_data: Dict[str, Any], current_ts: int) -> Dict[str, Any]:
         """Extract QUOTE data from feed"""
-        if "fullFeed" not in feed_data:
+        ff, is_market = self._full_feed(feed)
+        if ff is None:
             return {}
-            
-        full_feed = feed_data["fullFeed"]
-        ff = full_feed.get("marketFF") or full_feed.get("indexFF", {})
-        
-        # Log the full feed structure to understand available fields
-        self.logger.debug(f"Full feed structure for quote extraction: {list(ff.keys())}")
-        
+
         # Extract LTP and quantity data
-        ltpc = ff.get("ltpc", {})
-        ltp = ltpc.get("ltp", 0)
-        ltq = ltpc.get("ltq", 0)  # Last traded quantity
-        
-        # Extract OHLC data
-        ohlc_list = ff.get("marketOHLC", {}).get("ohlc", [])
-        ohlc = next((o for o in ohlc_list if o.get("interval") == "1d"), ohlc_list[0] if ohlc_list else {})
-        
-        # Extract market level data - try different possible field names
-        market_level = ff.get("marketLevel", {})
-        self.logger.debug(f"Market level keys: {list(market_level.keys()) if market_level else 'None'}")
-        
-        # Also check what's in OHLC
-        self.logger.debug(f"OHLC keys: {list(ohlc.keys()) if ohlc else 'None'}")
-        
-        # Check if there are other sections with volume data
-        if "marketStatus" in ff:
-            self.logger.info(f"Market status keys: {list(ff['marketStatus'].keys())}")
-        if "optionGreeks" in ff:
-            self.logger.debug(f"Option Greeks keys: {list(ff['optionGreeks'].keys())}")
-        
-        # Extract volume from OHLC (confirmed working)
-        volume = ohlc.get("vol", 0) if ohlc else 0
-        
-        # Extract average price from 'atp' field (Average Traded Price)
-        avg_price = float(ff.get("atp", 0))
-        
-        # Extract buy/sell quantities from 'tbq' and 'tsq' fields
-        total_buy_qty = int(ff.get("tbq", 0))  # Total Buy Quantity
-        total_sell_qty = int(ff.get("tsq", 0))  # Total Sell Quantity
-        
-        self.logger.debug(f"Extracted values - volume: {volume}, atp: {avg_price}, tbq: {total_buy_qty}, tsq: {total_sell_qty}")
-        
+        ltpc = ff.ltpc
+
+        # Extract OHLC data (the daily candle, else the first one)
+        candles = ff.marketOHLC.ohlc
+        ohlc = next((candle for candle in candles if candle.interval == "1d"), candles[0] if candles else None)
+
         market_data = base_data.copy()
         market_data.update({
-            "open": float(ohlc.get("open", 0)),
-            "high": float(ohlc.get("high", 0)),
-            "low": float(ohlc.get("low", 0)),
-            "close": float(ohlc.get("close", 0)),
-            "ltp": float(ltp),
-            "last_trade_quantity": int(ltq),
-            "volume": int(volume),
-            "average_price": float(avg_price),
-            "total_buy_quantity": int(total_buy_qty),
-            "total_sell_quantity": int(total_sell_qty),
-            "timestamp": int(ohlc.get("ts", current_ts))
+            "open": ohlc.open if ohlc else 0.0,
+            "high": ohlc.high if ohlc else 0.0,
+            "low": ohlc.low if ohlc else 0.0,
+            "close": ohlc.close if ohlc else 0.0,
+            "ltp": ltpc.ltp,
+            "last_trade_quantity": ltpc.ltq,
+            # Volume from the OHLC candle, average price and buy/sell quantities
+            # from 'atp', 'tbq' and 'tsq' (market feeds only)
+            "volume": ohlc.vol if ohlc else 0,
+            "average_price": ff.atp if is_market else 0.0,
+            "total_buy_quantity": int(ff.tbq) if is_market else 0,
+            "total_sell_quantity": int(ff.tsq) if is_market else 0,
+            "timestamp": (ohlc.ts if ohlc else 0) or current_ts
         })
-        
+
         return market_data
 
-    def _extract_depth_data(self, feed_data: Dict[str, Any], current_ts: int) -> Dict[str, Any]:
+    def _extract_depth_data(self, feed: MarketDataFeedV3_pb2.Feed, current_ts: int) -> Dict[str, Any]:
         """Extract depth data from feed"""
-        if "fullFeed" not in feed_data:
+        ff, is_market = self._full_feed(feed)
+        if ff is None:
             return {'buy': [], 'sell': [], 'timestamp': current_ts, 'ltp': 0}
-        
-        full_feed = feed_data["fullFeed"]
-        market_ff = full_feed.get("marketFF") or full_feed.get("indexFF", {})
-        market_level = market_ff.get("marketLevel", {})
-        bid_ask = market_level.get("bidAskQuote", [])
-        
+
         # Extract LTP data from ltpc field
-        ltpc = market_ff.get("ltpc", {})
-        ltp = float(ltpc.get("ltp", 0))
-        
+        ltp = ff.ltpc.ltp
+
         buy_levels = []
         sell_levels = []
-        
-        for level in bid_ask:
+
+        # index feeds have no market depth
+        for level in (ff.marketLevel.bidAskQuote if is_market else ()):
             # Process bids
-            bid_price = float(level.get("bidP", 0))
-            bid_qty = int(float(level.get("bidQ", 0)))
+            bid_price = level.bidP
             if bid_price > 0:
-                buy_levels.append({'price': bid_price, 'quantity': bid_qty, 'orders': 0})
-            
+                buy_levels.append({'price': bid_price, 'quantity': level.bidQ, 'orders': 0})
+
             # Process asks
-            ask_price = float(level.get("askP", 0))
-            ask_qty = int(float(level.get("askQ", 0)))
+            ask_price = level.askP
             if ask_price > 0:
-                sell_levels.append({'price': ask_price, 'quantity': ask_qty, 'orders': 0})
-        
+                sell_levels.append({'price': ask_price, 'quantity': level.askQ, 'orders': 0})
+
         # Sort and ensure minimum 5 levels
         buy_levels = sorted(buy_levels, key=lambda x: x['price'], reverse=True)
         sell_levels = sorted(sell_levels, key=lambda x: x['price'])
-        
+
         buy_levels.extend([{'price': 0.0, 'quantity': 0, 'orders': 0}] * (5 - len(buy_levels)))
         sell_levels.extend([{'price': 0.0, 'quantity': 0, 'orders': 0}] * (5 - len(sell_levels)))
-        
+
         return {
             'buy': buy_levels[:5],
             'sell': sell_levels[:5],
@@ -6,9 +6,10 @@ import websockets
 import logging
 import uuid
 from typing import Dict, Any, Optional, List, Callable
-from google.protobuf.json_format import MessageToDict
 import requests
 
+from utils.feed_latency import mark_frame
+
 from . import MarketDataFeedV3_pb2
 
 
@@ -212,11 +213,16 @@ class UpstoxWebSocketClient:
         self.logger.error(error_message)
         await self._trigger_callback("on_error", error_message)
 
-    def _decode_protobuf_to_dict(self, buffer: bytes) -> Dict[str, Any]:
-        """Decode protobuf FeedResponse to dictionary"""
+    def _decode_feed_response(self, buffer: bytes) -> MarketDataFeedV3_pb2.FeedResponse:
+        """
+        Parse a protobuf FeedResponse
+
+        The message is handed on as is: the adapter reads the fields it needs
+        straight off it instead of converting the whole message to a dict.
+        """
         feed_response = MarketDataFeedV3_pb2.FeedResponse()
         feed_response.ParseFromString(buffer)
-        return MessageToDict(feed_response)
+        return feed_response
 
     async def _message_handler(self) -> None:
         """Handle incoming WebSocket messages"""
@@ -245,10 +251,11 @@ class UpstoxWebSocketClient:
     async def _process_binary_message(self, message: bytes) -> None:
         """Process binary (protobuf) message"""
         try:
-            self._log_binary_message("IN", message)
-            data = self._decode_protobuf_to_dict(message)
-            self.logger.debug(f"Decoded protobuf: {json.dumps(data, indent=2)}")
-            await self._trigger_callback("on_message", data)
+            mark_frame()
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self._log_binary_message("IN", message)
+            feed_response = self._decode_feed_response(message)
+            await self._trigger_callback("on_message", feed_response)
             
         except Exception as e:
             self.logger.error(f"Failed to process binary message: {e}")
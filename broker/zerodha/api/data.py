@@ -55,7 +55,8 @@ def get_api_response(endpoint, auth, method="GET", payload=None):
     if method.upper() == 'GET' and '?' in endpoint:
         # Extract query params from endpoint
         path, query = endpoint.split('?', 1)
-        params = dict(urllib.parse.parse_qsl(query))
+        # Keep repeated keys (e.g. several i= instruments on /quote)
+        params = urllib.parse.parse_qsl(query)
         endpoint = path
     
     url = f"{base_url}{endpoint}"
@@ -250,6 +251,58 @@ class BrokerData:
             logger.exception(f"Error fetching quotes: {e}")
             raise ZerodhaAPIError(f"Error fetching quotes: {e}")
 
+    def get_multiquotes(self, symbols: list) -> list:
+        """
+        Get real-time quotes for several symbols with one /quote call per 500 instruments
+        Args:
+            symbols: List of dicts with 'symbol' and 'exchange'
+        Returns:
+            list: [{'symbol', 'exchange', 'data'}] for every instrument Kite returned
+        """
+        try:
+            instruments = {}
+            for item in symbols:
+                symbol, exchange = item['symbol'], item['exchange']
+                br_symbol = get_br_symbol(symbol, exchange)
+                if not br_symbol:
+                    logger.warning(f"Skipping unknown symbol {exchange}:{symbol} in multiquote")
+                    continue
+                kite_exchange = {'NSE_INDEX': 'NSE', 'BSE_INDEX': 'BSE'}.get(exchange, exchange)
+                instruments[f"{kite_exchange}:{br_symbol}"] = (symbol, exchange)
+
+            results = []
+            keys = list(instruments)
+            for i in range(0, len(keys), 500):
+                query = '&'.join(f"i={urllib.parse.quote(key)}" for key in keys[i:i + 500])
+                response = get_api_response(f"/quote?{query}", self.auth_token)
+                for key, quote in (response.get('data') or {}).items():
+                    if key not in instruments:
+                        continue
+                    symbol, exchange = instruments[key]
+                    results.append({
+                        'symbol': symbol,
+                        'exchange': exchange,
+                        'data': {
+                            'ask': quote.get('depth', {}).get('sell', [{}])[0].get('price', 0),
+                            'bid': quote.get('depth', {}).get('buy', [{}])[0].get('price', 0),
+                            'high': quote.get('ohlc', {}).get('high', 0),
+                            'low': quote.get('ohlc', {}).get('low', 0),
+                            'ltp': quote.get('last_price', 0),
+                            'open': quote.get('ohlc', {}).get('open', 0),
+                            'prev_close': quote.get('ohlc', {}).get('close', 0),
+                            'volume': quote.get('volume', 0),
+                            'oi': quote.get('oi', 0)
+                        }
+                    })
+            return results
+
+        except ZerodhaPermissionError as e:
+            logger.exception(f"Permission error fetching multiquotes: {e}")
+            raise
+        except (ZerodhaAPIError, Exception) as e:
+            logger.exception(f"Error fetching multiquotes: {e}")
+            raise ZerodhaAPIError(f"Error fetching multiquotes: {e}")
+
     def get_history(self, symbol: str, exchange: str, timeframe: str, from_date: str, to_date: str) -> pd.DataFrame:
         """
         Get historical data for given symbol and timeframe
@@ -11,15 +11,34 @@ import json
 import os
 import threading
 import time
+from collections import namedtuple
 from typing import Dict, List, Optional, Set, Any, Callable
 
 from websocket_proxy.base_adapter import BaseBrokerWebSocketAdapter
-from database.token_db import get_token
+from database.token_db import get_token, get_tokens_bulk
 from database.auth_db import get_auth_token
 
 # Import the WebSocket client
 from .zerodha_websocket import ZerodhaWebSocket
 
+# Topic suffix of each subscription mode (1=LTP, 2=Quote, 3=Full/Depth)
+MODE_TOPICS = {1: 'LTP', 2: 'QUOTE', 3: 'DEPTH'}
+TICK_MODE_TOPICS = {'ltp': 'LTP', 'quote': 'QUOTE', 'full': 'DEPTH'}
+INDEX_EXCHANGES = ('NSE_INDEX', 'BSE_INDEX')
+
+
+class TickRoute(namedtuple('TickRoute', 'symbol exchange data_exchange is_index topics modes')):
+    """
+    Where the ticks of one instrument token go: ``topics`` maps a topic
+    suffix (LTP/QUOTE/DEPTH) to the encoded ZeroMQ topic and ``modes`` is a
+    bitmask of the subscribed modes (bit ``1 << mode``)
+    """
+
+    __slots__ = ()
+
+    def subscribed(self, mode: int) -> bool:
+        return bool(self.modes & (1 << mode))
+
 class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
     """
     Fixed Zerodha-specific implementation of the WebSocket adapter.
@@ -38,6 +57,8 @@ class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
         self.lock = threading.Lock()
         self.subscribed_symbols = {}  # {symbol: {exchange, token, mode}}
         self.token_to_symbol = {}  # {token: (symbol, exchange)}
+        # {token: TickRoute}; written under self.lock, read lock-free by _handle_ticks
+        self.tick_routes = {}
         
         # Authentication
         self.api_key = None
@@ -216,6 +237,7 @@ class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
                     # Reset subscriptions tracking
                     self.subscribed_symbols.clear()
                     self.token_to_symbol.clear()
+                    self.tick_routes.clear()
                 
                 # Always clean up ZMQ resources to ensure proper cleanup
                 self.cleanup_zmq()
@@ -253,25 +275,10 @@ class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
             if not token_data:
                 return {'status': 'error', 'message': f'Token not found for {symbol} on {exchange}'}
             
-            # Extract token (handle different formats)
-            if isinstance(token_data, dict):
-                token = token_data.get('token')
-            elif isinstance(token_data, str):
-                # Handle formats like "738561::::2885" or "738561:2885"
-                if '::::' in token_data:
-                    token = token_data.split('::::')[0]
-                elif ':' in token_data:
-                    token = token_data.split(':')[0]
-                else:
-                    token = token_data
-            else:
-                token = str(token_data)
-            
-            # Convert to integer
             try:
-                token = int(token)
-            except ValueError:
-                return {'status': 'error', 'message': f'Invalid token format: {token}'}
+                token = self._instrument_token(token_data)
+            except ValueError as e:
+                return {'status': 'error', 'message': str(e)}
             
             # Map mode to Zerodha format
             zerodha_mode = self.mode_map.get(mode, ZerodhaWebSocket.MODE_QUOTE)
@@ -302,22 +309,135 @@ class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
                     self._start_batch_timer()
             
             # Immediately track subscription (even before actual WebSocket subscription)
-            with self.lock:
+            self._track_subscription(symbol, exchange, token, mode)
+            
+            self.logger.info(f"✅ Subscribed to {exchange}:{symbol} (token: [REDACTED], mode: {zerodha_mode})")
+            return {'status': 'success', 'message': f'Subscribed to {symbol}'}
+            
+        except Exception as e:
+            self.logger.error(f"Error subscribing to {exchange}:{symbol}: {e}")
+            return {'status': 'error', 'message': str(e)}
+    
+    def subscribe_many(self, instruments: List[tuple], mode: int = 2, depth_level: int = 5) -> List[Dict[str, Any]]:
+        """
+        Subscribe to market data for many symbols at once
+        
+        Tokens are resolved in one pass and handed to the client together,
+        which sends them MAX_TOKENS_PER_SUBSCRIBE per subscribe frame, instead
+        of each symbol waiting out the batch timer. Symbols beyond the
+        connection's MAX_INSTRUMENTS_PER_CONNECTION get an error response.
+        
+        Args:
+            instruments: List of (symbol, exchange) pairs
+            mode: Subscription mode (1=LTP, 2=Quote, 3=Full)
+            depth_level: Market depth level (for compatibility, not used in Zerodha)
+        """
+        def fail(message):
+            return [{'status': 'error', 'message': message} for _ in instruments]
+        
+        if not self.ws_client:
+            return fail('WebSocket client not initialized')
+        
+        if not self.running:
+            return fail('WebSocket not connected. Call connect() first.')
+        
+        try:
+            if not self.ws_client.is_connected():
+                self.logger.warning("⚠️ WebSocket not connected, waiting for connection...")
+                if not self.ws_client.wait_for_connection(timeout=10.0):
+                    return fail('WebSocket connection timeout')
+            
+            token_data = get_tokens_bulk([(symbol, exchange) for symbol, exchange in instruments])
+        except Exception as e:
+            self.logger.error(f"Error subscribing to {len(instruments)} symbols: {e}")
+            return fail(str(e))
+        
+        responses = []
+        resolved = []
+        for index, ((symbol, exchange), data) in enumerate(zip(instruments, token_data)):
+            if not data:
+                responses.append({'status': 'error', 'message': f'Token not found for {symbol} on {exchange}'})
+                continue
+            try:
+                token = self._instrument_token(data)
+            except ValueError as e:
+                responses.append({'status': 'error', 'message': str(e)})
+                continue
+            resolved.append((index, symbol, exchange, token))
+            responses.append(None)
+        
+        subscribed = []
+        limit = ZerodhaWebSocket.MAX_INSTRUMENTS_PER_CONNECTION
+        with self.lock:
+            # the client refuses a whole batch that would go over the per-connection limit,
+            # so only the tokens that still fit (tracked ones re-subscribe for free) are recorded
+            in_use = {info['token'] for info in self.subscribed_symbols.values()}
+            in_use.update(self.ws_client.subscribed_tokens)
+            for index, symbol, exchange, token in resolved:
+                if token not in in_use:
+                    if len(in_use) >= limit:
+                        responses[index] = {'status': 'error', 'message': f'Zerodha allows {limit} instruments per connection, {symbol} on {exchange} does not fit'}
+                        continue
+                    in_use.add(token)
+                subscribed.append((symbol, exchange, token))
+                responses[index] = {'status': 'success', 'message': f'Subscribed to {symbol}'}
                 self.subscribed_symbols[f"{exchange}:{symbol}"] = {
-                    'exchange': exchange,  # Original exchange for unsubscribe
+                    'exchange': exchange,
                     'symbol': symbol,
                     'token': token,
                     'mode': mode,
-                    'mapped_exchange': subscription_exchange  # Mapped exchange for data matching
+                    'mapped_exchange': 'NSE' if exchange == 'NSE_INDEX' else exchange
                 }
                 self.token_to_symbol[token] = (symbol, exchange)
+            tokens = {token: exchange for _, exchange, token in subscribed}
+            self._update_tick_routes(tokens)
+        
+        if subscribed:
+            zerodha_mode = self.mode_map.get(mode, ZerodhaWebSocket.MODE_QUOTE)
+            self.ws_client.set_token_exchange_mapping(tokens)
+            self.ws_client.subscribe_tokens(list(tokens), zerodha_mode)
+            self.logger.info(f"✅ Subscribed to {len(subscribed)} symbols (mode: {zerodha_mode})")
+        
+        return responses
+    
+    def unsubscribe_many(self, instruments: List[tuple], mode: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Unsubscribe from market data for many symbols at once, with one
+        unsubscribe frame per MAX_TOKENS_PER_SUBSCRIBE tokens
+        
+        Args:
+            instruments: List of (symbol, exchange) pairs
+            mode: Optional mode parameter (for compatibility)
+        """
+        try:
+            responses = []
+            tokens = []
+            with self.lock:
+                for symbol, exchange in instruments:
+                    subscription = self.subscribed_symbols.pop(f"{exchange}:{symbol}", None)
+                    if subscription is None:
+                        responses.append({'status': 'error', 'message': f'Not subscribed to {symbol}'})
+                        continue
+                    tokens.append(subscription['token'])
+                    self.token_to_symbol.pop(subscription['token'], None)
+                    responses.append({'status': 'success', 'message': f'Unsubscribed from {symbol}'})
+                
+                self._update_tick_routes(tokens)
+                if tokens and self.ws_client:
+                    batch_size = ZerodhaWebSocket.MAX_TOKENS_PER_SUBSCRIBE
+                    for start in range(0, len(tokens), batch_size):
+                        asyncio.run_coroutine_threadsafe(
+                            self.ws_client.unsubscribe(tokens[start:start + batch_size]),
+                            self.ws_client.loop
+                        )
             
-            self.logger.info(f"✅ Subscribed to {exchange}:{symbol} (token: [REDACTED], mode: {zerodha_mode})")
-            return {'status': 'success', 'message': f'Subscribed to {symbol}'}
+            if tokens:
+                self.logger.info(f"✅ Unsubscribed from {len(tokens)} symbols")
+            return responses
             
         except Exception as e:
-            self.logger.error(f"Error subscribing to {exchange}:{symbol}: {e}")
-            return {'status': 'error', 'message': str(e)}
+            self.logger.error(f"Error unsubscribing from {len(instruments)} symbols: {e}")
+            return [{'status': 'error', 'message': str(e)} for _ in instruments]
     
     def unsubscribe(self, symbol: str, exchange: str, mode: Optional[int] = None, depth_level: Optional[int] = None) -> Dict[str, Any]:
         """Unsubscribe from market data for a symbol
@@ -348,6 +468,7 @@ class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
                 # Remove from tracking
                 del self.subscribed_symbols[key]
                 self.token_to_symbol.pop(token, None)
+                self._update_tick_route(token)
             
             self.logger.info(f"✅ Unsubscribed from {exchange}:{symbol}")
             return {'status': 'success', 'message': f'Unsubscribed from {symbol}'}
@@ -356,6 +477,72 @@ class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
             self.logger.error(f"Error unsubscribing from {exchange}:{symbol}: {e}")
             return {'status': 'error', 'message': str(e)}
     
+    @staticmethod
+    def _instrument_token(token_data) -> int:
+        """Instrument token from a token_db value; raises ValueError for a malformed one"""
+        if isinstance(token_data, dict):
+            token = token_data.get('token')
+        elif isinstance(token_data, str):
+            # Handle formats like "738561::::2885" or "738561:2885"
+            if '::::' in token_data:
+                token = token_data.split('::::')[0]
+            elif ':' in token_data:
+                token = token_data.split(':')[0]
+            else:
+                token = token_data
+        else:
+            token = str(token_data)
+        
+        try:
+            return int(token)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid token format: {token}')
+    
+    def _track_subscription(self, symbol: str, exchange: str, token: int, mode: int):
+        """Record a subscription and refresh the tick route of its token"""
+        subscription_exchange = 'NSE' if exchange == 'NSE_INDEX' else exchange
+        with self.lock:
+            self.subscribed_symbols[f"{exchange}:{symbol}"] = {
+                'exchange': exchange,  # Original exchange for unsubscribe
+                'symbol': symbol,
+                'token': token,
+                'mode': mode,
+                'mapped_exchange': subscription_exchange  # Mapped exchange for data matching
+            }
+            self.token_to_symbol[token] = (symbol, exchange)
+            self._update_tick_route(token)
+
+    def _update_tick_route(self, token: int):
+        """
+        Rebuild the tick route of a token from the current subscriptions.
+        Must hold self.lock; the route is swapped in as one immutable value.
+        """
+        self._update_tick_routes((token,))
+
+    def _update_tick_routes(self, tokens):
+        """Rebuild the tick routes of several tokens with one pass over the subscriptions (holding self.lock)"""
+        tokens = set(tokens)
+        if not tokens:
+            return
+        modes = dict.fromkeys(tokens, 0)
+        subscription_exchanges = {}
+        for sub_info in self.subscribed_symbols.values():
+            token = sub_info['token']
+            if token in tokens:
+                subscription_exchanges[token] = sub_info['exchange']
+                modes[token] |= 1 << sub_info['mode']
+        for token in tokens:
+            subscription_exchange = subscription_exchanges.get(token)
+            symbol_info = self.token_to_symbol.get(token)
+            if subscription_exchange is None or symbol_info is None:
+                self.tick_routes.pop(token, None)
+                continue
+            symbol, exchange = symbol_info
+            topics = {suffix: self._generate_topic(symbol, subscription_exchange, suffix).encode('utf-8')
+                      for suffix in MODE_TOPICS.values()}
+            self.tick_routes[token] = TickRoute(symbol, exchange, self._map_data_exchange(subscription_exchange),
+                                                exchange in INDEX_EXCHANGES, topics, modes[token])
+
     def get_subscriptions(self) -> Dict[str, Any]:
         """Get current subscriptions"""
         with self.lock:
@@ -400,80 +587,49 @@ class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
         if not ticks:
             return
         
+        routes = self.tick_routes
+        publish = self.publish_market_data
         try:
             for tick in ticks:
-                transformed_tick = self._transform_tick(tick)
-                if transformed_tick:
-                    symbol = transformed_tick['symbol']
-                    token = tick.get('instrument_token')
-                    original_tick_mode = transformed_tick.get('mode', 'ltp')  # Original mode from the tick
-                    subscription_exchange = None
-                    subscribed_modes = set()  # Track which modes this symbol is subscribed to
-                    
-                    # Get subscription info to determine exchange and subscribed modes
-                    with self.lock:
-                        for key, sub_info in self.subscribed_symbols.items():
-                            if sub_info['token'] == token:
-                                # Found a subscription for this token
-                                subscription_exchange = sub_info['exchange']
-                                mode_num = sub_info['mode']
-                                subscribed_modes.add(mode_num)
-                    
-                    if not subscription_exchange:
-                        self.logger.warning(f"No subscription info found for token: {token}")
-                        continue
+                token = tick.get('instrument_token')
+                route = routes.get(token)
+                if route is None:
+                    self.logger.warning(f"No subscription info found for token: {token}")
+                    continue
+                
+                original_tick_mode = tick.get('mode', 'ltp')  # Original mode from the tick
+                if route.is_index:
+                    transformed_tick = self._transform_index_tick(tick, route.symbol, route.exchange, original_tick_mode)
+                else:
+                    transformed_tick = self._transform_regular_tick(tick, route.symbol, route.exchange, original_tick_mode)
+                
+                # Set the data exchange field
+                transformed_tick['exchange'] = route.data_exchange
+                
+                # If we have a 'full' mode tick, publish separate messages for each subscribed mode.
+                # Each message is serialized on publish, so the same dict is trimmed in place.
+                if original_tick_mode == 'full':
+                    # Always publish the full depth data first
+                    publish(route.topics['DEPTH'], transformed_tick)
                     
-                    # Set the data exchange field
-                    data_exchange = self._map_data_exchange(subscription_exchange)
-                    transformed_tick['exchange'] = data_exchange
+                    # If subscribed to Quote (mode 2), publish quote data without the depth
+                    if route.subscribed(2):
+                        transformed_tick.pop('depth', None)
+                        transformed_tick['mode'] = 'quote'
+                        publish(route.topics['QUOTE'], transformed_tick)
                     
-                    # If we have a 'full' mode tick, create and publish separate messages for each subscribed mode
-                    if original_tick_mode == 'full':
-                        # Always publish the full depth data first
-                        depth_tick = transformed_tick.copy()
-                        depth_tick['mode'] = 'full'
-                        depth_topic = self._generate_topic(symbol, subscription_exchange, 'DEPTH')
-                        self.logger.debug(f"📊 Publishing DEPTH data to topic: {depth_topic}")
-                        self.publish_market_data(depth_topic, depth_tick)
-                        
-                        # If subscribed to Quote (mode 2), publish quote data
-                        if 2 in subscribed_modes:
-                            quote_tick = transformed_tick.copy()
-                            # Remove depth data for quote message
-                            if 'depth' in quote_tick:
-                                del quote_tick['depth']
-                            quote_tick['mode'] = 'quote'
-                            quote_topic = self._generate_topic(symbol, subscription_exchange, 'QUOTE')
-                            self.logger.debug(f"📊 Publishing QUOTE data to topic: {quote_topic}")
-                            self.publish_market_data(quote_topic, quote_tick)
-                        
-                        # If subscribed to LTP (mode 1), publish LTP data
-                        if 1 in subscribed_modes:
-                            ltp_tick = {
-                                'symbol': symbol,
-                                'exchange': data_exchange,
-                                'mode': 'ltp',
-                                'ltp': transformed_tick.get('ltp', 0),
-                                'timestamp': transformed_tick.get('timestamp', int(time.time() * 1000))
-                            }
-                            ltp_topic = self._generate_topic(symbol, subscription_exchange, 'LTP')
-                            self.logger.debug(f"📊 Publishing LTP data to topic: {ltp_topic}")
-                            self.publish_market_data(ltp_topic, ltp_tick)
-                            self.logger.debug(f"📊 LTP Data should be available for polling: {subscription_exchange}:{symbol}")
-                    else:
-                        # For non-full modes, just publish as-is
-                        mode_str = {
-                            'ltp': 'LTP',
-                            'quote': 'QUOTE',
-                            'full': 'DEPTH'
-                        }.get(original_tick_mode, 'LTP')
-                        
-                        topic = self._generate_topic(symbol, subscription_exchange, mode_str)
-                        self.logger.debug(f"📊 Publishing to topic: {topic}")
-                        self.logger.debug(f"📊 Data structure: {transformed_tick}")
-                        
-                        # Publish to ZeroMQ
-                        self.publish_market_data(topic, transformed_tick)
+                    # If subscribed to LTP (mode 1), publish LTP data
+                    if route.subscribed(1):
+                        publish(route.topics['LTP'], {
+                            'symbol': route.symbol,
+                            'exchange': route.data_exchange,
+                            'mode': 'ltp',
+                            'ltp': transformed_tick.get('ltp', 0),
+                            'timestamp': transformed_tick.get('timestamp', int(time.time() * 1000))
+                        })
+                else:
+                    # For non-full modes, just publish as-is
+                    publish(route.topics[TICK_MODE_TOPICS.get(original_tick_mode, 'LTP')], transformed_tick)
                         
         except Exception as e:
             self.logger.error(f"Error handling ticks: {e}")
@@ -893,6 +1049,7 @@ class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
                     self.reconnect_attempts = 0
                     self.subscribed_symbols.clear()
                     self.token_to_symbol.clear()
+                    self.tick_routes.clear()
                     self.logger.info("WebSocket client stopped and references cleared")
                 
             # Clean up ZeroMQ resources
@@ -929,6 +1086,7 @@ class ZerodhaWebSocketAdapter(BaseBrokerWebSocketAdapter):
                 # Clear subscription records
                 self.subscribed_symbols.clear()
                 self.token_to_symbol.clear()
+                self.tick_routes.clear()
             
             # Clean up ZMQ resources using base class method
             self.cleanup_zmq()
@@ -0,0 +1,205 @@
+"""
+Decoder for Zerodha binary market data frames.
+
+A frame is a 2-byte packet count followed by packets, each prefixed with its
+2-byte length (all big-endian). A packet is 8 bytes in LTP mode, 44 in quote
+mode and 184 in full mode (quote fields, last trade time, OI, exchange time
+and 5+5 depth levels).
+
+Packets are read with precompiled ``struct.Struct`` objects straight from a
+``memoryview`` of the frame, so no field is sliced out into its own bytes
+object. Frames made only of full-mode packets can instead be decoded through
+one strided ``numpy`` view over the frame (``use_numpy=True``). That path is
+off by default: the ticks still have to be built as dicts, which dominates,
+and on CPython it measured slightly slower than the struct readers (see
+scripts/benchmark_zerodha_parser.py).
+
+The decoder reads the caller's token -> mode and token -> exchange maps
+without locking; the client replaces those dicts instead of mutating them.
+"""
+import struct
+import time
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # the struct decoder is used for every frame
+    np = None
+
+MODE_LTP = "ltp"
+MODE_QUOTE = "quote"
+MODE_FULL = "full"
+
+LTP_PACKET = 8
+QUOTE_PACKET = 44
+EXTENDED_PACKET = 64
+FULL_PACKET = 184
+DEPTH_LEVELS = 5
+
+_HEADER = struct.Struct('>H')
+_LTP = struct.Struct('>Ii')
+_QUOTE = struct.Struct('>I10i')
+_EXTENDED = struct.Struct('>I15i')
+_FULL = struct.Struct('>I15i' + 'iih2x' * (2 * DEPTH_LEVELS))
+_DEPTH = struct.Struct('>' + 'iih2x' * (2 * DEPTH_LEVELS))
+
+if np is not None:
+    _LEVEL_DTYPE = np.dtype([('quantity', '>i4'), ('price', '>i4'), ('orders', '>i2'), ('pad', 'V2')])
+    _FULL_DTYPE = np.dtype({'names': ['token', 'fields', 'depth'],
+                            'formats': ['>u4', ('>i4', 15), (_LEVEL_DTYPE, 2 * DEPTH_LEVELS)],
+                            'offsets': [0, 4, EXTENDED_PACKET],
+                            'itemsize': FULL_PACKET})
+
+
+def _depth(values, start: int = 0) -> Optional[Dict]:
+    """Depth dict from flat (quantity, price paise, orders) triples; levels without a price are dropped"""
+    buy = [{'quantity': values[i], 'price': values[i + 1] / 100.0, 'orders': values[i + 2]}
+           for i in range(start, start + 3 * DEPTH_LEVELS, 3) if values[i + 1] > 0]
+    sell = [{'quantity': values[i], 'price': values[i + 1] / 100.0, 'orders': values[i + 2]}
+            for i in range(start + 3 * DEPTH_LEVELS, start + 6 * DEPTH_LEVELS, 3) if values[i + 1] > 0]
+    return {'buy': buy, 'sell': sell} if (buy or sell) else None
+
+
+def decode_depth(depth_data) -> Optional[Dict]:
+    """The 120-byte depth block of a full packet"""
+    if len(depth_data) < 2 * DEPTH_LEVELS * 12:
+        return None
+    return _depth(_DEPTH.unpack_from(depth_data))
+
+
+def _tick(f, mode: str, timestamp: int, exchange: Optional[str]) -> Dict:
+    """Tick dict from the leading quote (and extended) fields of a packet"""
+    ltp = f[1] / 100.0
+    average = f[3] / 100.0
+    open_, high, low, close = f[7] / 100.0, f[8] / 100.0, f[9] / 100.0, f[10] / 100.0
+    tick = {
+        'instrument_token': f[0],
+        'last_traded_price': ltp,
+        'last_price': ltp,
+        'mode': mode,
+        'timestamp': timestamp,
+        'last_traded_quantity': f[2],
+        'average_traded_price': average,
+        'average_price': average,
+        'volume_traded': f[4],
+        'volume': f[4],
+        'total_buy_quantity': f[5],
+        'total_sell_quantity': f[6],
+        'open_price': open_,
+        'high_price': high,
+        'low_price': low,
+        'close_price': close,
+        'ohlc': {'open': open_, 'high': high, 'low': low, 'close': close}
+    }
+    if len(f) > 11:
+        tick['last_traded_timestamp'] = f[11]
+        tick['open_interest'] = tick['oi'] = f[12]
+        tick['exchange_timestamp'] = f[15]
+    if exchange:
+        tick['source_exchange'] = exchange
+    return tick
+
+
+def decode_packet(buf, offset: int, length: int, mode_map: Dict[int, str], exchange_map: Dict[int, str],
+                  timestamp: int) -> Optional[Dict]:
+    """One packet of ``length`` bytes at ``offset`` in ``buf``"""
+    if length < LTP_PACKET:
+        return None
+    token = _LTP.unpack_from(buf, offset)[0]
+    if length == LTP_PACKET:
+        mode = MODE_LTP
+    elif length == QUOTE_PACKET:
+        mode = MODE_QUOTE
+    elif length >= FULL_PACKET:
+        mode = MODE_FULL
+    else:
+        # index packets (28/32 bytes) and anything unexpected
+        mode = mode_map.get(token, MODE_QUOTE)
+    exchange = exchange_map.get(token)
+
+    if length >= FULL_PACKET:
+        f = _FULL.unpack_from(buf, offset)
+        tick = _tick(f, mode, timestamp, exchange)
+        depth = _depth(f, 16)
+        if depth:
+            tick['depth'] = depth
+        return tick
+    if length >= EXTENDED_PACKET:
+        return _tick(_EXTENDED.unpack_from(buf, offset), mode, timestamp, exchange)
+    if length >= QUOTE_PACKET:
+        return _tick(_QUOTE.unpack_from(buf, offset), mode, timestamp, exchange)
+
+    ltp = _LTP.unpack_from(buf, offset)[1] / 100.0
+    tick = {'instrument_token': token, 'last_traded_price': ltp, 'last_price': ltp, 'mode': mode,
+            'timestamp': timestamp}
+    if exchange:
+        tick['source_exchange'] = exchange
+    return tick
+
+
+def _decode_full_frame(buf, count: int, exchange_map: Dict[int, str], timestamp: int) -> List[Dict]:
+    """A frame of ``count`` full packets, read as one strided numpy view (no copy)"""
+    records = np.ndarray((count,), dtype=_FULL_DTYPE, buffer=buf, offset=4, strides=(FULL_PACKET + 2,))
+    fields = records['fields'].tolist()
+    levels = records['depth']
+    quantities = levels['quantity'].tolist()
+    prices = levels['price'].tolist()
+    orders = levels['orders'].tolist()
+    ticks = []
+    for token, f, qty, price, ords in zip(records['token'].tolist(), fields, quantities, prices, orders):
+        tick = _tick((token, *f), MODE_FULL, timestamp, exchange_map.get(token))
+        buy = [{'quantity': qty[i], 'price': price[i] / 100.0, 'orders': ords[i]}
+               for i in range(DEPTH_LEVELS) if price[i] > 0]
+        sell = [{'quantity': qty[i], 'price': price[i] / 100.0, 'orders': ords[i]}
+                for i in range(DEPTH_LEVELS, 2 * DEPTH_LEVELS) if price[i] > 0]
+        if buy or sell:
+            tick['depth'] = {'buy': buy, 'sell': sell}
+        ticks.append(tick)
+    return ticks
+
+
+def _all_full(buf, count: int) -> bool:
+    """Whether a frame is exactly ``count`` full packets"""
+    if len(buf) != 2 + count * (FULL_PACKET + 2):
+        return False
+    lengths = np.ndarray((count,), dtype='>u2', buffer=buf, offset=2, strides=(FULL_PACKET + 2,))
+    return bool((lengths == FULL_PACKET).all())
+
+
+def decode_frame(data, mode_map: Dict[int, str], exchange_map: Dict[int, str],
+                 use_numpy: bool = False) -> List[Dict]:
+    """
+    All packets of a binary frame, in order
+
+    Args:
+        data: the frame (bytes, bytearray or memoryview)
+        mode_map: token -> subscribed mode, for packets whose length does not tell
+        exchange_map: token -> exchange, added to ticks as ``source_exchange``
+        use_numpy: decode frames made only of full packets through numpy
+            (ignored when numpy is not installed)
+    """
+    buf = memoryview(data)
+    size = len(buf)
+    if size < 4:
+        return []
+    count = _HEADER.unpack_from(buf, 0)[0]
+    # one clock read per frame: every packet in it arrived together
+    timestamp = int(time.time() * 1000)
+
+    if use_numpy and np is not None and count and _all_full(buf, count):
+        return _decode_full_frame(buf, count, exchange_map, timestamp)
+
+    ticks = []
+    offset = 2
+    for _ in range(count):
+        if offset + 2 > size:
+            break
+        length = _HEADER.unpack_from(buf, offset)[0]
+        offset += 2
+        if offset + length > size:
+            break
+        tick = decode_packet(buf, offset, length, mode_map, exchange_map, timestamp)
+        if tick:
+            ticks.append(tick)
+        offset += length
+    return ticks
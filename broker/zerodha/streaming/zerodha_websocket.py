@@ -13,14 +13,44 @@ Implements:
 """
 import asyncio
 import json
-import struct
 import threading
 import time
+import weakref
 from typing import Dict, List, Optional, Callable, Any, Set
 import websockets.client
 import websockets.exceptions
 from datetime import datetime
 from collections import deque
+from utils.feed_latency import mark_frame
+from utils.metrics import register_collector
+
+from .zerodha_decoder import decode_depth, decode_frame, decode_packet
+
+# Live clients, exported through the metrics registry
+_live_clients = weakref.WeakSet()
+
+
+def _collect_metrics():
+    """Export get_statistics() of every live client to the metrics registry"""
+    stats = [client.get_statistics() for client in list(_live_clients)]
+    if not stats:
+        return
+    labels = [{'connection': str(i)} for i in range(len(stats))]
+    yield ('openalgo_zerodha_ws_connected', 'gauge', 'Zerodha WebSocket connection state',
+           [(l, int(s['connected'])) for l, s in zip(labels, stats)])
+    yield ('openalgo_zerodha_ws_messages_total', 'counter', 'Binary messages received from Zerodha',
+           [(l, s['messages_received']) for l, s in zip(labels, stats)])
+    yield ('openalgo_zerodha_ws_ticks_total', 'counter', 'Ticks parsed from Zerodha messages',
+           [(l, s['ticks_processed']) for l, s in zip(labels, stats)])
+    yield ('openalgo_zerodha_ws_errors_total', 'counter', 'Zerodha WebSocket errors',
+           [(l, s['errors']) for l, s in zip(labels, stats)])
+    yield ('openalgo_zerodha_ws_subscribed_tokens', 'gauge', 'Tokens subscribed on the Zerodha WebSocket',
+           [(l, s['subscribed_tokens']) for l, s in zip(labels, stats)])
+    yield ('openalgo_zerodha_ws_reconnect_attempts', 'gauge', 'Reconnect attempts of the Zerodha WebSocket',
+           [(l, s['reconnect_attempts']) for l, s in zip(labels, stats)])
+
+
+register_collector('zerodha_websocket', _collect_metrics)
 
 class ZerodhaWebSocket:
     """
@@ -64,6 +94,8 @@ class ZerodhaWebSocket:
         
         # Subscription management
         self.subscribed_tokens = set()
+        # mode_map and token_exchange_map are read by the parser without the
+        # lock, so writers replace them (copy-on-write) instead of mutating
         self.mode_map = {}
         self.pending_subscriptions = deque()  # Queue for pending subscriptions
         
@@ -99,6 +131,7 @@ class ZerodhaWebSocket:
         self.message_count = 0
         self.tick_count = 0
         self.error_count = 0
+        _live_clients.add(self)
         
         # Connection state tracking
         self._connection_ready = threading.Event()
@@ -152,7 +185,7 @@ class ZerodhaWebSocket:
                                 e.g., {256265: 'NSE_INDEX', 738561: 'NSE'}
         """
         with self.lock:
-            self.token_exchange_map.update(token_exchange_map)
+            self.token_exchange_map = {**self.token_exchange_map, **token_exchange_map}
         
         #self._log_event("MAPPING", f"Updated token exchange mapping for {len(token_exchange_map)} tokens")
         self.logger.debug(f"✅ Updated token exchange mapping for {len(token_exchange_map)} tokens")
@@ -283,8 +316,8 @@ class ZerodhaWebSocket:
             self.logger.error(f"❌ Invalid token format: {e}")
             return
         
-        # Check Zerodha's limit of 3000 instruments per connection
-        total_after_subscription = len(self.subscribed_tokens) + len(tokens)
+        # Check Zerodha's limit of 3000 instruments per connection (re-subscribing a token takes no new slot)
+        total_after_subscription = len(self.subscribed_tokens.union(tokens))
         if total_after_subscription > self.MAX_INSTRUMENTS_PER_CONNECTION:
             self.logger.error(f"❌ Cannot subscribe to {len(tokens)} tokens. Would exceed Zerodha's limit of {self.MAX_INSTRUMENTS_PER_CONNECTION} instruments per connection.")
             self.logger.error(f"Current subscriptions: {len(self.subscribed_tokens)}, Requested: {len(tokens)}, Total would be: {total_after_subscription}")
@@ -378,9 +411,8 @@ class ZerodhaWebSocket:
             
             if await self._send_json(mode_msg):
                 with self.lock:
-                    for token in tokens:
-                        self.mode_map[token] = mode
-                        self.subscribed_tokens.add(token)
+                    self.mode_map = {**self.mode_map, **dict.fromkeys(tokens, mode)}
+                    self.subscribed_tokens.update(tokens)
                 self.logger.debug(f"✅ Set mode {mode} for {len(tokens)} tokens")
                 
                 # Additional delay after mode setting - important for large batches
@@ -419,11 +451,11 @@ class ZerodhaWebSocket:
             
             # Update tracking
             with self.lock:
-                for token in tokens:
-                    self.subscribed_tokens.discard(token)
-                    self.mode_map.pop(token, None)
-                    # ✅ NEW: Clean up exchange mapping
-                    self.token_exchange_map.pop(token, None)
+                removed = set(tokens)
+                self.subscribed_tokens.difference_update(removed)
+                self.mode_map = {t: m for t, m in self.mode_map.items() if t not in removed}
+                # ✅ NEW: Clean up exchange mapping
+                self.token_exchange_map = {t: e for t, e in self.token_exchange_map.items() if t not in removed}
             
             self.logger.debug(f"✅ Unsubscribed from {len(tokens)} tokens")
             return True
@@ -680,6 +712,7 @@ class ZerodhaWebSocket:
                     return
                 
                 # Parse binary data
+                mark_frame()
                 ticks = self._parse_binary_message(message)
                 if ticks:
                     self.tick_count += len(ticks)
@@ -721,36 +754,7 @@ class ZerodhaWebSocket:
     def _parse_binary_message(self, data: bytes) -> List[Dict]:
         """Parse binary message according to Zerodha specification"""
         try:
-            if len(data) < 4:
-                return []
-            
-            # Parse header: first 2 bytes = number of packets
-            num_packets = struct.unpack('>H', data[0:2])[0]
-            
-            packets = []
-            offset = 2
-            
-            for packet_idx in range(num_packets):
-                if offset + 2 > len(data):
-                    break
-                
-                # Next 2 bytes: packet length
-                packet_length = struct.unpack('>H', data[offset:offset+2])[0]
-                offset += 2
-                
-                if offset + packet_length > len(data):
-                    break
-                
-                # Extract and parse packet
-                packet_data = data[offset:offset+packet_length]
-                tick = self._parse_packet(packet_data)
-                if tick:
-                    packets.append(tick)
-                
-                offset += packet_length
-            
-            return packets
-            
+            return decode_frame(data, self.mode_map, self.token_exchange_map)
         except Exception as e:
             self.logger.error(f"❌ Error parsing binary message: {e}")
             return []
@@ -761,99 +765,8 @@ class ZerodhaWebSocket:
         ✅ ENHANCED: Adds exchange information to tick data.
         """
         try:
-            if len(packet) < 8:
-                return None
-            
-            # Extract instrument token and last price
-            instrument_token = struct.unpack('>I', packet[0:4])[0]
-            last_price_paise = struct.unpack('>i', packet[4:8])[0]
-            last_price = last_price_paise / 100.0
-            
-            # Determine mode based on packet length
-            if len(packet) == 8:
-                mode = self.MODE_LTP
-            elif len(packet) == 44:
-                mode = self.MODE_QUOTE
-            elif len(packet) >= 184:
-                mode = self.MODE_FULL
-            else:
-                mode = self.mode_map.get(instrument_token, self.MODE_QUOTE)
-            
-            # ✅ NEW: Get exchange information for this token
-            exchange = None
-            with self.lock:
-                exchange = self.token_exchange_map.get(instrument_token)
-            
-            # Basic tick structure
-            tick = {
-                'instrument_token': instrument_token,
-                'last_traded_price': last_price,
-                'last_price': last_price,
-                'mode': mode,
-                'timestamp': int(time.time() * 1000)
-            }
-            
-            # ✅ NEW: Add exchange information if available
-            if exchange:
-                tick['source_exchange'] = exchange  # Add source exchange from mapping
-            
-            # Parse additional fields for quote mode (44 bytes)
-            if len(packet) >= 44:
-                try:
-                    # Only unpack exactly 44 bytes for quote mode
-                    fields = struct.unpack('>11i', packet[0:44])  # 11 integers * 4 bytes = 44 bytes
-                    
-                    tick.update({
-                        'instrument_token': fields[0],
-                        'last_traded_price': fields[1] / 100.0,
-                        'last_price': fields[1] / 100.0,
-                        'last_traded_quantity': fields[2],
-                        'average_traded_price': fields[3] / 100.0,
-                        'average_price': fields[3] / 100.0,
-                        'volume_traded': fields[4],
-                        'volume': fields[4],
-                        'total_buy_quantity': fields[5],
-                        'total_sell_quantity': fields[6],
-                        'open_price': fields[7] / 100.0,
-                        'high_price': fields[8] / 100.0,
-                        'low_price': fields[9] / 100.0,
-                        'close_price': fields[10] / 100.0,
-                        'ohlc': {
-                            'open': fields[7] / 100.0,
-                            'high': fields[8] / 100.0,
-                            'low': fields[9] / 100.0,
-                            'close': fields[10] / 100.0
-                        }
-                    })
-                except struct.error as e:
-                    self.logger.debug(f"⚠️ Quote parsing issue (packet length: {len(packet)}): {e}")
-                    # Fallback - just use LTP data
-                    pass
-            
-            # Parse full mode fields if available (64+ bytes)
-            if len(packet) >= 64:
-                try:
-                    extended_fields = struct.unpack('>iiiii', packet[44:64])
-                    tick.update({
-                        'last_traded_timestamp': extended_fields[0],
-                        'open_interest': extended_fields[1],
-                        'oi': extended_fields[1],
-                        'exchange_timestamp': extended_fields[4]
-                    })
-                except struct.error:
-                    pass
-            
-            # Parse market depth for full mode (184+ bytes)
-            if len(packet) >= 184:
-                try:
-                    depth = self._parse_market_depth(packet[64:184])
-                    if depth:
-                        tick['depth'] = depth
-                except Exception:
-                    pass
-            
-            return tick
-            
+            return decode_packet(packet, 0, len(packet), self.mode_map, self.token_exchange_map,
+                                 int(time.time() * 1000))
         except Exception as e:
             self.logger.error(f"❌ Error parsing packet: {e}")
             return None
@@ -861,37 +774,7 @@ class ZerodhaWebSocket:
     def _parse_market_depth(self, depth_data: bytes) -> Optional[Dict]:
         """Parse market depth data"""
         try:
-            if len(depth_data) < 120:
-                return None
-            
-            depth = {'buy': [], 'sell': []}
-            
-            # Parse buy side (first 5 entries)
-            for i in range(5):
-                offset = i * 12
-                if offset + 10 <= len(depth_data):
-                    quantity, price, orders = struct.unpack('>iih', depth_data[offset:offset+10])
-                    if price > 0:  # Only add valid prices
-                        depth['buy'].append({
-                            'quantity': quantity,
-                            'price': price / 100.0,
-                            'orders': orders
-                        })
-            
-            # Parse sell side (next 5 entries)
-            for i in range(5):
-                offset = 60 + (i * 12)
-                if offset + 10 <= len(depth_data):
-                    quantity, price, orders = struct.unpack('>iih', depth_data[offset:offset+10])
-                    if price > 0:  # Only add valid prices
-                        depth['sell'].append({
-                            'quantity': quantity,
-                            'price': price / 100.0,
-                            'orders': orders
-                        })
-            
-            return depth if (depth['buy'] or depth['sell']) else None
-            
+            return decode_depth(depth_data)
         except Exception as e:
             self.logger.error(f"❌ Error parsing market depth: {e}")
             return None
@@ -10,6 +10,7 @@ from sqlalchemy.pool import NullPool
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pytz
+from database.write_behind import enable_sqlite_wal, get_sink
 from utils.logging import get_logger
 
 logger = get_logger(__name__)
@@ -33,6 +34,8 @@ else:
         pool_timeout=10
     )
 
+enable_sqlite_wal(engine)
+
 db_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 Base = declarative_base()
 Base.query = db_session.query_property()
@@ -70,6 +73,9 @@ def init_db():
 # Executor for asynchronous tasks
 executor = ThreadPoolExecutor(10)  # Increased from 2 to 10 for better concurrency
 
+# Batched write-behind buffer for analyzer logs (flushed by a background thread)
+analyzer_log_sink = get_sink('analyzer_logs', engine, AnalyzerLog.__table__)
+
 def async_log_analyzer(request_data, response_data, api_type='placeorder'):
     """Asynchronously log analyzer request"""
     try:
@@ -81,16 +87,11 @@ def async_log_analyzer(request_data, response_data, api_type='placeorder'):
         ist = pytz.timezone('Asia/Kolkata')
         now_ist = datetime.now(ist)
 
-        analyzer_log = AnalyzerLog(
-            api_type=api_type,
-            request_data=request_json,
-            response_data=response_json,
-            created_at=now_ist
-        )
-        db_session.add(analyzer_log)
-        db_session.commit()
+        analyzer_log_sink.enqueue({
+            'api_type': api_type,
+            'request_data': request_json,
+            'response_data': response_json,
+            'created_at': now_ist
+        })
     except Exception as e:
         logger.error(f"Error saving analyzer log: {e}")
-        db_session.rollback()
-    finally:
-        db_session.remove()
@@ -10,6 +10,7 @@ from sqlalchemy.pool import NullPool
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pytz
+from database.write_behind import enable_sqlite_wal, get_sink
 from utils.logging import get_logger
 
 logger = get_logger(__name__)
@@ -34,6 +35,8 @@ else:
         pool_timeout=10
     )
 
+enable_sqlite_wal(engine)
+
 db_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 Base = declarative_base()
 Base.query = db_session.query_property()
@@ -55,6 +58,9 @@ def init_db():
 # Executor for asynchronous tasks
 executor = ThreadPoolExecutor(10)  # Increased from 2 to 10 for better concurrency
 
+# Batched write-behind buffer for order logs (flushed by a background thread)
+order_log_sink = get_sink('order_logs', engine, OrderLog.__table__)
+
 def async_log_order(api_type,request_data, response_data):
     try:
         # Serialize JSON data for storage
@@ -65,10 +71,11 @@ def async_log_order(api_type,request_data, response_data):
         ist = pytz.timezone('Asia/Kolkata')
         now_ist = datetime.now(ist)
 
-        order_log = OrderLog(api_type=api_type,request_data=request_json, response_data=response_json, created_at=now_ist)
-        db_session.add(order_log)
-        db_session.commit()
+        order_log_sink.enqueue({
+            'api_type': api_type,
+            'request_data': request_json,
+            'response_data': response_json,
+            'created_at': now_ist
+        })
     except Exception as e:
         logger.error(f"Error saving order log: {e}")
-    finally:
-        db_session.remove()
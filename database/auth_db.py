@@ -2,6 +2,7 @@
 
 import os
 import base64
+import time
 from sqlalchemy import create_engine, UniqueConstraint
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm import declarative_base
@@ -15,10 +16,24 @@ from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from utils.logging import get_logger
+from utils.metrics import counter, histogram
 
 # Initialize logger
 logger = get_logger(__name__)
 
+# Auth metrics
+AUTH_CACHE_REQUESTS = counter('openalgo_auth_cache_requests_total', 'Auth cache lookups by cache and result', ('cache', 'result'))
+ARGON2_VERIFICATIONS = counter('openalgo_auth_argon2_verifications_total', 'Argon2 API key hash verifications by result', ('result',))
+API_KEY_VERIFY_SECONDS = histogram('openalgo_auth_verify_api_key_seconds', 'Time to verify an API key against all stored hashes')
+_auth_cache_hit = AUTH_CACHE_REQUESTS.labels('auth', 'hit')
+_auth_cache_miss = AUTH_CACHE_REQUESTS.labels('auth', 'miss')
+_feed_cache_hit = AUTH_CACHE_REQUESTS.labels('feed_token', 'hit')
+_feed_cache_miss = AUTH_CACHE_REQUESTS.labels('feed_token', 'miss')
+_broker_cache_hit = AUTH_CACHE_REQUESTS.labels('broker', 'hit')
+_broker_cache_miss = AUTH_CACHE_REQUESTS.labels('broker', 'miss')
+_argon2_match = ARGON2_VERIFICATIONS.labels('match')
+_argon2_mismatch = ARGON2_VERIFICATIONS.labels('mismatch')
+
 # Initialize Argon2 hasher
 ph = PasswordHasher()
 
@@ -183,6 +198,7 @@ def get_auth_token(name):
         
     cache_key = f"auth-{name}"
     if cache_key in auth_cache:
+        _auth_cache_hit.inc()
         auth_obj = auth_cache[cache_key]
         if isinstance(auth_obj, Auth) and not auth_obj.is_revoked:
             return decrypt_token(auth_obj.auth)
@@ -190,6 +206,7 @@ def get_auth_token(name):
             del auth_cache[cache_key]
             return None
     else:
+        _auth_cache_miss.inc()
         auth_obj = get_auth_token_dbquery(name)
         if isinstance(auth_obj, Auth) and not auth_obj.is_revoked:
             auth_cache[cache_key] = auth_obj
@@ -224,6 +241,7 @@ def get_feed_token(name):
         
     cache_key = f"feed-{name}"
     if cache_key in feed_token_cache:
+        _feed_cache_hit.inc()
         auth_obj = feed_token_cache[cache_key]
         if isinstance(auth_obj, Auth) and not auth_obj.is_revoked:
             return decrypt_token(auth_obj.feed_token) if auth_obj.feed_token else None
@@ -231,6 +249,7 @@ def get_feed_token(name):
             del feed_token_cache[cache_key]
             return None
     else:
+        _feed_cache_miss.inc()
         auth_obj = get_feed_token_dbquery(name)
         if isinstance(auth_obj, Auth) and not auth_obj.is_revoked:
             feed_token_cache[cache_key] = auth_obj
@@ -325,6 +344,7 @@ def verify_api_key(provided_api_key):
     import hashlib
 
     peppered_key = provided_api_key + PEPPER
+    start = time.perf_counter()
     try:
         # Query all API keys
         api_keys = ApiKeys.query.all()
@@ -333,9 +353,13 @@ def verify_api_key(provided_api_key):
         for api_key_obj in api_keys:
             try:
                 ph.verify(api_key_obj.api_key_hash, peppered_key)
+                _argon2_match.inc()
+                API_KEY_VERIFY_SECONDS.observe(time.perf_counter() - start)
                 return api_key_obj.user_id
             except VerifyMismatchError:
+                _argon2_mismatch.inc()
                 continue
+        API_KEY_VERIFY_SECONDS.observe(time.perf_counter() - start)
 
         # If we reach here, the API key is invalid
         # Track the invalid attempt
@@ -368,7 +392,9 @@ def get_broker_name(provided_api_key):
     """Get only the broker name for a valid API key with caching"""
     # Check if broker name is in cache
     if provided_api_key in broker_cache:
+        _broker_cache_hit.inc()
         return broker_cache[provided_api_key]
+    _broker_cache_miss.inc()
     
     # Not in cache, need to look it up
     user_id = verify_api_key(provided_api_key)
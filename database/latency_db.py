@@ -1,11 +1,16 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON, Text, Index, UniqueConstraint
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.pool import NullPool
 import os
 import logging
-from datetime import datetime
+import threading
+import time
+import atexit
+from datetime import datetime, timedelta, timezone
+from database.write_behind import enable_sqlite_wal, get_sink
+from utils.latency_histogram import LatencyHistogram
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +34,8 @@ else:
         pool_timeout=10
     )
 
+enable_sqlite_wal(latency_engine)
+
 latency_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=latency_engine))
 LatencyBase = declarative_base()
 LatencyBase.query = latency_session.query_property()
@@ -64,30 +71,33 @@ class OrderLatency(LatencyBase):
     
     @staticmethod
     def log_latency(order_id, user_id, broker, symbol, order_type, latencies, request_body, response_body, status, error=None):
-        """Log order execution latency"""
+        """Log order execution latency (row is written behind, rollups updated in memory)"""
         try:
-            log = OrderLatency(
-                order_id=order_id,
-                user_id=user_id,
-                broker=broker,
-                symbol=symbol,
-                order_type=order_type,
-                rtt_ms=latencies.get('rtt', 0),
-                validation_latency_ms=latencies.get('validation', 0),
-                response_latency_ms=latencies.get('broker_response', 0),
-                overhead_ms=latencies.get('overhead', 0),
-                total_latency_ms=latencies.get('total', 0),
-                request_body=request_body,
-                response_body=response_body,
-                status=status,
-                error=error
+            timestamp = datetime.utcnow()
+            latency_log_sink.enqueue({
+                'timestamp': timestamp,
+                'order_id': order_id,
+                'user_id': user_id,
+                'broker': broker,
+                'symbol': symbol,
+                'order_type': order_type,
+                'rtt_ms': latencies.get('rtt', 0),
+                'validation_latency_ms': latencies.get('validation', 0),
+                'response_latency_ms': latencies.get('broker_response', 0),
+                'overhead_ms': latencies.get('overhead', 0),
+                'total_latency_ms': latencies.get('total', 0),
+                'request_body': request_body,
+                'response_body': response_body,
+                'status': status,
+                'error': error
+            })
+            rollup_aggregator.record(
+                timestamp, broker, order_type, status == 'FAILED',
+                {metric: latencies.get(key) for metric, key in ROLLUP_METRICS.items()}
             )
-            latency_session.add(log)
-            latency_session.commit()
             return True
         except Exception as e:
             logger.error(f"Error logging latency: {str(e)}")
-            latency_session.rollback()
             return False
 
     @staticmethod
@@ -100,54 +110,67 @@ class OrderLatency(LatencyBase):
             return []
 
     @staticmethod
-    def get_latency_stats():
-        """Get latency statistics"""
+    def get_latency_stats(start=None, end=None):
+        """
+        Get latency statistics for a time window (default: all time).
+
+        Served from the pre-aggregated rollups, so the cost depends on the
+        window shape, not on the number of orders logged.
+        """
         try:
-            from sqlalchemy import func
-            
-            # Overall stats
-            total_orders = OrderLatency.query.count()
-            failed_orders = OrderLatency.query.filter(OrderLatency.status == 'FAILED').count()
-            
-            # Get average latencies
-            avg_rtt = latency_session.query(func.avg(OrderLatency.rtt_ms)).scalar() or 0
-            avg_overhead = latency_session.query(func.avg(OrderLatency.overhead_ms)).scalar() or 0
-            avg_total = latency_session.query(func.avg(OrderLatency.total_latency_ms)).scalar() or 0
-            
-            # Get p50, p90, p99 latencies for RTT
-            rtt_latencies = [l[0] for l in OrderLatency.query.with_entities(OrderLatency.rtt_ms).all()]
-            rtt_latencies.sort()
-            
-            p50_rtt = p90_rtt = p99_rtt = 0
-            if rtt_latencies:
-                p50_rtt = rtt_latencies[int(len(rtt_latencies) * 0.5)]
-                p90_rtt = rtt_latencies[int(len(rtt_latencies) * 0.9)]
-                p99_rtt = rtt_latencies[int(len(rtt_latencies) * 0.99)]
-            
+            histograms, failed = LatencyRollup.query_window(start, end)
+
+            def overall(metric):
+                hist = LatencyHistogram()
+                for (broker, name), broker_hist in histograms.items():
+                    if name == metric:
+                        hist.merge(broker_hist)
+                return hist
+
+            rtt = overall('rtt')
+            overhead = overall('overhead')
+            total = overall('total')
+
             # Breakdown by broker
             broker_stats = {}
-            brokers = [b[0] for b in OrderLatency.query.with_entities(OrderLatency.broker).distinct().all()]
-            for broker in brokers:
-                if broker:  # Skip None values
-                    broker_orders = OrderLatency.query.filter_by(broker=broker)
-                    broker_stats[broker] = {
-                        'total_orders': broker_orders.count(),
-                        'failed_orders': broker_orders.filter_by(status='FAILED').count(),
-                        'avg_rtt': float(broker_orders.with_entities(func.avg(OrderLatency.rtt_ms)).scalar() or 0),
-                        'avg_overhead': float(broker_orders.with_entities(func.avg(OrderLatency.overhead_ms)).scalar() or 0),
-                        'avg_total': float(broker_orders.with_entities(func.avg(OrderLatency.total_latency_ms)).scalar() or 0)
-                    }
-            
+            for (broker, metric), hist in histograms.items():
+                if metric != 'total' or not broker:
+                    continue
+                broker_rtt = histograms.get((broker, 'rtt'), LatencyHistogram())
+                broker_stats[broker] = {
+                    'total_orders': hist.count,
+                    'failed_orders': failed.get(broker, 0),
+                    'avg_rtt': broker_rtt.mean,
+                    'avg_overhead': histograms.get((broker, 'overhead'), LatencyHistogram()).mean,
+                    'avg_total': hist.mean,
+                    'p50_rtt': broker_rtt.percentile(50),
+                    'p90_rtt': broker_rtt.percentile(90),
+                    'p99_rtt': broker_rtt.percentile(99)
+                }
+
+            # Per-stage distributions from LatencyTracker
+            stage_stats = {}
+            for stage in ('validation', 'broker_request', 'broker_response'):
+                hist = overall(stage)
+                stage_stats[stage] = {
+                    'avg': hist.mean,
+                    'p50': hist.percentile(50),
+                    'p90': hist.percentile(90),
+                    'p99': hist.percentile(99),
+                    'max': hist.max or 0
+                }
+
             return {
-                'total_orders': total_orders,
-                'failed_orders': failed_orders,
-                'avg_rtt': float(avg_rtt),
-                'avg_overhead': float(avg_overhead),
-                'avg_total': float(avg_total),
-                'p50_rtt': float(p50_rtt),
-                'p90_rtt': float(p90_rtt),
-                'p99_rtt': float(p99_rtt),
-                'broker_stats': broker_stats
+                'total_orders': total.count,
+                'failed_orders': sum(failed.values()),
+                'avg_rtt': rtt.mean,
+                'avg_overhead': overhead.mean,
+                'avg_total': total.mean,
+                'p50_rtt': rtt.percentile(50),
+                'p90_rtt': rtt.percentile(90),
+                'p99_rtt': rtt.percentile(99),
+                'broker_stats': broker_stats,
+                'stage_stats': stage_stats
             }
         except Exception as e:
             logger.error(f"Error getting latency stats: {str(e)}")
@@ -160,9 +183,288 @@ class OrderLatency(LatencyBase):
                 'p50_rtt': 0,
                 'p90_rtt': 0,
                 'p99_rtt': 0,
-                'broker_stats': {}
+                'broker_stats': {},
+                'stage_stats': {}
             }
 
+    @staticmethod
+    def get_histogram(metric='rtt', broker=None, start=None, end=None):
+        """Merged LatencyHistogram for a metric, optionally for one broker"""
+        histograms, _ = LatencyRollup.query_window(start, end, metrics=[metric])
+        hist = LatencyHistogram()
+        for (row_broker, name), broker_hist in histograms.items():
+            if broker is None or row_broker == broker:
+                hist.merge(broker_hist)
+        return hist
+
+    @staticmethod
+    def get_brokers():
+        """Brokers that have latency rollups"""
+        rollup_aggregator.flush()
+        rows = latency_session.query(LatencyRollup.broker).filter(
+            LatencyRollup.resolution == 'd'
+        ).distinct().all()
+        return [row[0] for row in rows if row[0]]
+
+
+# Metric name in rollups -> key in the latencies dict passed to log_latency
+ROLLUP_METRICS = {
+    'rtt': 'rtt',
+    'overhead': 'overhead',
+    'total': 'total',
+    'validation': 'validation',
+    'broker_request': 'broker_request',
+    'broker_response': 'broker_response',
+}
+
+# Rollup resolutions (code, bucket size in seconds), coarsest first
+ROLLUP_RESOLUTIONS = (('d', 86400), ('h', 3600), ('m', 60))
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _floor_time(timestamp, seconds):
+    """Floor a naive UTC datetime to a multiple of ``seconds`` since the epoch"""
+    elapsed = int((timestamp - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=elapsed - elapsed % seconds)
+
+
+def _ceil_time(timestamp, seconds):
+    floored = _floor_time(timestamp, seconds)
+    return floored if floored == timestamp else floored + timedelta(seconds=seconds)
+
+
+def _cover_window(start, end, resolutions=ROLLUP_RESOLUTIONS):
+    """
+    Split [start, end) into (resolution, from, to) ranges using the coarsest
+    rollups that fit, e.g. whole days in the middle, hours and minutes at the
+    edges. A window of any length touches at most ~2 * (24 + 60) + days rows
+    per series.
+    """
+    if start >= end or not resolutions:
+        return []
+    code, seconds = resolutions[0]
+    if len(resolutions) == 1:
+        return [(code, _floor_time(start, seconds), end)]
+    aligned_start = _ceil_time(start, seconds)
+    aligned_end = _floor_time(end, seconds)
+    if aligned_start >= aligned_end:
+        return _cover_window(start, end, resolutions[1:])
+    return (_cover_window(start, aligned_start, resolutions[1:])
+            + [(code, aligned_start, aligned_end)]
+            + _cover_window(aligned_end, end, resolutions[1:]))
+
+
+class LatencyRollup(LatencyBase):
+    """Pre-aggregated latency histogram per broker / api type / metric / time bucket"""
+    __tablename__ = 'latency_rollups'
+    __table_args__ = (
+        UniqueConstraint('resolution', 'bucket_start', 'broker', 'api_type', 'metric', name='uq_latency_rollup'),
+        Index('ix_latency_rollup_window', 'resolution', 'bucket_start'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    resolution = Column(String(1), nullable=False)  # m (minute), h (hour), d (day)
+    bucket_start = Column(DateTime, nullable=False)  # UTC
+    broker = Column(String(50), nullable=False, default='')
+    api_type = Column(String(20), nullable=False, default='')
+    metric = Column(String(30), nullable=False)  # rtt, overhead, total or a LatencyTracker stage
+    count = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    sum_ms = Column(Float, nullable=False, default=0)
+    min_ms = Column(Float)
+    max_ms = Column(Float)
+    buckets = Column(Text)  # JSON {bucket_index: count}, see utils.latency_histogram
+
+    def histogram(self):
+        return LatencyHistogram.from_parts(self.buckets, self.count, self.sum_ms, self.min_ms, self.max_ms)
+
+    @staticmethod
+    def query_window(start=None, end=None, metrics=None):
+        """
+        Merge rollups covering [start, end) (naive UTC; default all time).
+
+        Returns ({(broker, metric): LatencyHistogram}, {broker: failed_orders}).
+        """
+        rollup_aggregator.flush()
+
+        end = end or datetime.utcnow() + timedelta(minutes=1)
+        start = start or _EPOCH
+        histograms = {}
+        failed = {}
+
+        for resolution, range_start, range_end in _cover_window(start, end):
+            query = LatencyRollup.query.filter(
+                LatencyRollup.resolution == resolution,
+                LatencyRollup.bucket_start >= range_start,
+                LatencyRollup.bucket_start < range_end
+            )
+            if metrics:
+                query = query.filter(LatencyRollup.metric.in_(list(metrics) + ['total']))
+
+            for row in query.all():
+                if row.metric == 'total':
+                    failed[row.broker] = failed.get(row.broker, 0) + (row.failed or 0)
+                if metrics and row.metric not in metrics:
+                    continue
+                key = (row.broker, row.metric)
+                hist = histograms.get(key)
+                if hist is None:
+                    histograms[key] = row.histogram()
+                else:
+                    hist.merge(row.histogram())
+
+        return histograms, failed
+
+
+class LatencyRollupAggregator:
+    """
+    Accumulates histograms in memory on every log_latency and merges them
+    into latency_rollups periodically (and before every dashboard read).
+    """
+
+    def __init__(self, flush_interval=5.0):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def record(self, timestamp, broker, api_type, failed, values):
+        broker = broker or ''
+        api_type = api_type or ''
+        with self._lock:
+            for resolution, seconds in ROLLUP_RESOLUTIONS:
+                bucket_start = _floor_time(timestamp, seconds)
+                for metric, value in values.items():
+                    if value is None:
+                        continue
+                    key = (resolution, bucket_start, broker, api_type, metric)
+                    entry = self._pending.get(key)
+                    if entry is None:
+                        entry = self._pending[key] = [LatencyHistogram(), 0]
+                    entry[0].record(value)
+                    if failed:
+                        entry[1] += 1
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            def run():
+                while True:
+                    time.sleep(self.flush_interval)
+                    self.flush()
+
+            self._thread = threading.Thread(target=run, name="LatencyRollupFlush", daemon=True)
+            self._thread.start()
+
+    def flush(self):
+        """Merge pending histograms into the rollup table in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            session = sessionmaker(bind=latency_engine)()
+            try:
+                bucket_keys = {(key[0], key[1]) for key in pending}
+                existing = {}
+                for resolution in {key[0] for key in bucket_keys}:
+                    starts = [start for res, start in bucket_keys if res == resolution]
+                    for row in session.query(LatencyRollup).filter(
+                        LatencyRollup.resolution == resolution,
+                        LatencyRollup.bucket_start.in_(starts)
+                    ):
+                        existing[(row.resolution, row.bucket_start, row.broker, row.api_type, row.metric)] = row
+
+                for key, (hist, failed) in pending.items():
+                    row = existing.get(key)
+                    if row is None:
+                        resolution, bucket_start, broker, api_type, metric = key
+                        session.add(LatencyRollup(
+                            resolution=resolution,
+                            bucket_start=bucket_start,
+                            broker=broker,
+                            api_type=api_type,
+                            metric=metric,
+                            count=hist.count,
+                            failed=failed,
+                            sum_ms=hist.total,
+                            min_ms=hist.min,
+                            max_ms=hist.max,
+                            buckets=hist.to_json()
+                        ))
+                    else:
+                        merged = row.histogram().merge(hist)
+                        row.count = merged.count
+                        row.failed = (row.failed or 0) + failed
+                        row.sum_ms = merged.total
+                        row.min_ms = merged.min
+                        row.max_ms = merged.max
+                        row.buckets = merged.to_json()
+
+                session.commit()
+                return len(pending)
+            except Exception as e:
+                logger.error(f"Error flushing latency rollups: {e}")
+                session.rollback()
+                # Put the data back so it is retried on the next flush
+                with self._lock:
+                    for key, (hist, failed) in pending.items():
+                        entry = self._pending.get(key)
+                        if entry is None:
+                            self._pending[key] = [hist, failed]
+                        else:
+                            entry[0].merge(hist)
+                            entry[1] += failed
+                return 0
+            finally:
+                session.close()
+
+
+# Batched write-behind buffer for per-order latency rows
+latency_log_sink = get_sink('order_latency', latency_engine, OrderLatency.__table__)
+
+rollup_aggregator = LatencyRollupAggregator()
+atexit.register(rollup_aggregator.flush)
+
+
+def backfill_latency_rollups(batch_size=1000):
+    """Build rollups from existing order_latency rows (one-time, on first start)"""
+    count = 0
+    query = latency_session.query(
+        OrderLatency.timestamp, OrderLatency.broker, OrderLatency.order_type, OrderLatency.status,
+        OrderLatency.rtt_ms, OrderLatency.overhead_ms, OrderLatency.total_latency_ms,
+        OrderLatency.validation_latency_ms, OrderLatency.response_latency_ms
+    ).yield_per(batch_size)
+
+    for timestamp, broker, order_type, status, rtt, overhead, total, validation, response in query:
+        if timestamp is None:
+            continue
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        rollup_aggregator.record(timestamp, broker, order_type, status == 'FAILED', {
+            'rtt': rtt,
+            'overhead': overhead,
+            'total': total,
+            'validation': validation,
+            'broker_request': rtt,
+            'broker_response': response
+        })
+        count += 1
+        if count % batch_size == 0:
+            rollup_aggregator.flush()
+
+    rollup_aggregator.flush()
+    latency_session.remove()
+    return count
+
 def init_latency_db():
     """Initialize the latency database"""
     # Extract directory from database URL and create if it doesn't exist
@@ -173,3 +475,13 @@ def init_latency_db():
     
     logger.info(f"Initializing Latency DB at: {LATENCY_DATABASE_URL}")
     LatencyBase.metadata.create_all(bind=latency_engine)
+
+    # Build rollups for latency rows logged before rollups existed
+    try:
+        if LatencyRollup.query.first() is None and OrderLatency.query.first() is not None:
+            backfilled = backfill_latency_rollups()
+            logger.info(f"Backfilled latency rollups from {backfilled} order latency rows")
+    except Exception as e:
+        logger.error(f"Error backfilling latency rollups: {e}")
+    finally:
+        latency_session.remove()
@@ -38,6 +38,14 @@ def load_symbols_to_cache(broker: str) -> bool:
                 f"Successfully loaded {stats['total_symbols']} symbols into cache "
                 f"in {load_time:.2f} seconds"
             )
+
+            # Sandbox margin profiles are built from the same symbol set
+            try:
+                from database.token_db_enhanced import get_cache
+                from sandbox.margin_profiles import load_from_symbol_cache
+                load_from_symbol_cache(get_cache())
+            except Exception as profile_error:
+                logger.error(f"Error building sandbox margin profiles: {profile_error}")
             
             # Emit success event to frontend
             socketio.emit('cache_loaded', {
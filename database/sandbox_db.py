@@ -1,6 +1,7 @@
 # database/sandbox_db.py
 
 import os
+import time
 from sqlalchemy import create_engine, UniqueConstraint, Index, CheckConstraint
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm import declarative_base
@@ -9,6 +10,7 @@ from sqlalchemy.sql import func
 from sqlalchemy.pool import NullPool
 from datetime import datetime
 from utils.logging import get_logger
+from database.write_behind import enable_sqlite_wal
 from dotenv import load_dotenv
 
 # Initialize logger
@@ -38,6 +40,9 @@ else:
         pool_timeout=10
     )
 
+# WAL lets the fill writer, the REST poller and API reads run concurrently
+enable_sqlite_wal(engine)
+
 db_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 Base = declarative_base()
 Base.query = db_session.query_property()
@@ -183,6 +188,15 @@ class SandboxFunds(Base):
     updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
 
 
+class SandboxSequences(Base):
+    """Sandbox sequences table - per-day counters behind order and trade IDs"""
+    __tablename__ = 'sandbox_sequences'
+
+    scope = Column(String(50), primary_key=True)  # order, trade, ...
+    day = Column(String(8), primary_key=True)  # YYYYMMDD (IST)
+    value = Column(Integer, nullable=False, default=0)  # Last reserved sequence number
+
+
 class SandboxConfig(Base):
     """Sandbox configuration table - all configurable settings"""
     __tablename__ = 'sandbox_config'
@@ -194,6 +208,18 @@ class SandboxConfig(Base):
     updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
 
 
+# get_config is read on every order (leverage, square-off times, capital)
+CONFIG_CACHE_TTL = float(os.getenv('SANDBOX_CONFIG_CACHE_TTL', '5'))
+_config_cache = {}  # config_key -> (value or None, loaded at)
+_config_version = 0
+
+
+def _invalidate_config_cache():
+    global _config_version
+    _config_cache.clear()
+    _config_version += 1
+
+
 def init_db():
     """Initialize sandbox database and tables"""
     logger.info("Initializing Sandbox DB")
@@ -318,17 +344,25 @@ def init_default_config():
 
 
 def get_config(config_key, default=None):
-    """Get configuration value by key"""
+    """Get configuration value by key (cached for CONFIG_CACHE_TTL seconds, cleared by set_config)"""
+    cached = _config_cache.get(config_key)
+    if cached is not None and time.monotonic() - cached[1] < CONFIG_CACHE_TTL:
+        return cached[0] if cached[0] is not None else default
     try:
         config = SandboxConfig.query.filter_by(config_key=config_key).first()
-        if config:
-            return config.config_value
-        return default
+        value = config.config_value if config else None
+        _config_cache[config_key] = (value, time.monotonic())
+        return value if value is not None else default
     except Exception as e:
         logger.error(f"Error fetching config {config_key}: {e}")
         return default
 
 
+def config_version():
+    """Counter bumped on every set_config, for caches derived from the config"""
+    return _config_version
+
+
 def set_config(config_key, config_value, description=None):
     """Set configuration value"""
     try:
@@ -345,6 +379,7 @@ def set_config(config_key, config_value, description=None):
             )
             db_session.add(config)
         db_session.commit()
+        _invalidate_config_cache()
         logger.info(f"Updated config: {config_key} = {config_value}")
         return True
     except Exception as e:
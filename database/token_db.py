@@ -17,6 +17,7 @@ from database.token_db_enhanced import (
     get_symbol_count,
     # Additional functions for backward compatibility
     get_token_dbquery,
+    get_tokens_bulk_dbquery,
     get_symbol_dbquery,
     get_oa_symbol_dbquery,
     get_br_symbol_dbquery,
@@ -45,6 +46,7 @@ __all__ = [
     'get_brexchange',
     'get_symbol_count',
     'get_token_dbquery',
+    'get_tokens_bulk_dbquery',
     'get_symbol_dbquery',
     'get_oa_symbol_dbquery',
     'get_br_symbol_dbquery',
@@ -10,6 +10,7 @@ from dataclasses import dataclass, field
 from collections import defaultdict
 import pytz
 from utils.logging import get_logger
+from utils.metrics import register_collector
 
 logger = get_logger(__name__)
 
@@ -352,6 +353,25 @@ def get_cache() -> BrokerSymbolCache:
         _cache_instance = BrokerSymbolCache()
     return _cache_instance
 
+def _collect_metrics():
+    """Export CacheStats to the metrics registry"""
+    cache = _cache_instance
+    if cache is None:
+        return
+    stats = cache.stats
+    yield ('openalgo_symbol_cache_lookups_total', 'counter', 'Symbol cache lookups by result',
+           [({'result': 'hit'}, stats.hits), ({'result': 'miss'}, stats.misses)])
+    yield ('openalgo_symbol_cache_db_queries_total', 'counter', 'Symbol lookups that fell back to the database',
+           [({}, stats.db_queries)])
+    yield ('openalgo_symbol_cache_bulk_queries_total', 'counter', 'Bulk symbol cache lookups',
+           [({}, stats.bulk_queries)])
+    yield ('openalgo_symbol_cache_symbols', 'gauge', 'Symbols loaded in the symbol cache',
+           [({'broker': cache.active_broker or ''}, stats.total_symbols)])
+    yield ('openalgo_symbol_cache_memory_bytes', 'gauge', 'Estimated memory used by the symbol cache',
+           [({}, int(stats.memory_usage_mb * 1024 * 1024))])
+
+register_collector('symbol_cache', _collect_metrics)
+
 # Public API - Drop-in replacement for existing token_db functions
 def get_token(symbol: str, exchange: str) -> Optional[str]:
     """
@@ -440,6 +460,28 @@ def get_token_dbquery(symbol: str, exchange: str) -> Optional[str]:
         logger.error(f"Error while querying the database: {e}")
         return None
 
+def get_tokens_bulk_dbquery(symbol_exchange_pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+    """Query database for the tokens of many symbol-exchange pairs, one query per exchange"""
+    by_exchange = defaultdict(set)
+    for symbol, exchange in symbol_exchange_pairs:
+        by_exchange[exchange].add(symbol)
+    
+    tokens = {}
+    try:
+        from database.symbol import SymToken
+        for exchange, symbols in by_exchange.items():
+            symbols = list(symbols)
+            # Chunked to stay under SQLite's bound parameter limit
+            for start in range(0, len(symbols), 500):
+                rows = SymToken.query.with_entities(SymToken.symbol, SymToken.token).filter(
+                    SymToken.exchange == exchange, SymToken.symbol.in_(symbols[start:start + 500])
+                ).order_by(SymToken.id).all()
+                for symbol, token in rows:
+                    tokens.setdefault((symbol, exchange), token)
+    except Exception as e:
+        logger.error(f"Error while querying the database: {e}")
+    return tokens
+
 def get_symbol_dbquery(token: str, exchange: str) -> Optional[str]:
     """Query database for symbol by token and exchange"""
     try:
@@ -527,13 +569,17 @@ def get_tokens_bulk(symbol_exchange_pairs: List[Tuple[str, str]]) -> List[Option
     cache = get_cache()
     
     if cache.cache_loaded and cache.is_cache_valid():
-        return cache.get_tokens_bulk(symbol_exchange_pairs)
+        results = cache.get_tokens_bulk(symbol_exchange_pairs)
+    else:
+        results = [None] * len(symbol_exchange_pairs)
     
-    # Fallback to individual queries
-    results = []
-    for symbol, exchange in symbol_exchange_pairs:
+    # Fallback to the database for the pairs the cache could not resolve, in one query per exchange
+    missing = [pair for pair, token in zip(symbol_exchange_pairs, results) if token is None]
+    if missing:
         cache.stats.db_queries += 1
-        results.append(get_token_dbquery(symbol, exchange))
+        found = get_tokens_bulk_dbquery(missing)
+        results = [found.get(pair) if token is None else token
+                   for pair, token in zip(symbol_exchange_pairs, results)]
     return results
 
 def get_symbols_bulk(token_exchange_pairs: List[Tuple[str, str]]) -> List[Optional[str]]:
@@ -5,9 +5,14 @@ from sqlalchemy.sql import func
 from sqlalchemy.pool import NullPool
 import os
 import logging
-from datetime import datetime, timedelta
+import threading
+import time
+import atexit
+from collections import deque
+from datetime import datetime, timedelta, timezone
 import json
 from database.settings_db import get_security_settings
+from database.write_behind import enable_sqlite_wal, get_sink
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +36,8 @@ else:
         pool_timeout=10
     )
 
+enable_sqlite_wal(logs_engine)
+
 logs_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=logs_engine))
 LogBase = declarative_base()
 LogBase.query = logs_session.query_property()
@@ -72,6 +79,21 @@ class TrafficLog(LogBase):
             logs_session.rollback()
             return False
 
+    @staticmethod
+    def log_request_async(client_ip, method, path, status_code, duration_ms, host=None, error=None, user_id=None):
+        """Queue a request log for the batched write-behind sink (no DB I/O)"""
+        traffic_log_sink.enqueue({
+            'timestamp': datetime.utcnow(),
+            'client_ip': client_ip,
+            'method': method,
+            'path': path,
+            'status_code': status_code,
+            'duration_ms': duration_ms,
+            'host': host,
+            'error': error,
+            'user_id': user_id
+        })
+
     @staticmethod
     def get_recent_logs(limit=100):
         """Get recent traffic logs ordered by timestamp"""
@@ -104,6 +126,9 @@ class TrafficLog(LogBase):
                 'avg_duration': 0
             }
 
+# Batched write-behind buffer for traffic logs (flushed by a background thread)
+traffic_log_sink = get_sink('traffic_logs', logs_engine, TrafficLog.__table__)
+
 class IPBan(LogBase):
     """Model for banned IPs"""
     __tablename__ = 'ip_bans'
@@ -119,32 +144,18 @@ class IPBan(LogBase):
 
     @staticmethod
     def is_ip_banned(ip_address):
-        """Check if an IP is currently banned"""
+        """Check if an IP is currently banned (in-memory lookup)"""
         try:
-            ban = IPBan.query.filter_by(ip_address=ip_address).first()
-            if not ban:
-                return False
-
-            # Check permanent ban
-            if ban.is_permanent:
-                return True
-
-            # Check temporary ban expiry
-            if ban.expires_at:
-                if datetime.utcnow() < ban.expires_at.replace(tzinfo=None):
-                    return True
-                else:
-                    # Ban expired, remove it
-                    logs_session.delete(ban)
-                    logs_session.commit()
-                    return False
-
-            return False
+            return ban_cache.is_banned(ip_address)
         except Exception as e:
             logger.error(f"Error checking IP ban status: {e}")
-            logs_session.rollback()
             return False
 
+    @staticmethod
+    def load_ban_cache():
+        """(Re)load the in-memory ban table from the database"""
+        ban_cache.load()
+
     @staticmethod
     def ban_ip(ip_address, reason, duration_hours=24, permanent=False, created_by='system'):
         """Ban an IP address"""
@@ -186,6 +197,8 @@ class IPBan(LogBase):
                 logs_session.add(ban)
 
             logs_session.commit()
+            ban = existing_ban or ban
+            ban_cache.set(ip_address, ban.is_permanent, ban.expires_at)
             logger.info(f"IP {ip_address} banned: {reason}")
             return True
         except Exception as e:
@@ -201,6 +214,7 @@ class IPBan(LogBase):
             if ban:
                 logs_session.delete(ban)
                 logs_session.commit()
+                ban_cache.remove(ip_address)
                 logger.info(f"IP {ip_address} unbanned")
                 return True
             return False
@@ -221,6 +235,7 @@ class IPBan(LogBase):
 
             for ban in expired:
                 logs_session.delete(ban)
+                ban_cache.remove(ban.ip_address)
 
             logs_session.commit()
 
@@ -243,75 +258,82 @@ class Error404Tracker(LogBase):
 
     @staticmethod
     def track_404(ip_address, path):
-        """Track a 404 error for an IP"""
+        """Track a 404 error for an IP (counted in memory, persisted asynchronously)"""
         try:
             # Check if already banned
             if IPBan.is_ip_banned(ip_address):
                 return False
 
-            # Get security settings from database
-            security_settings = get_security_settings()
-            threshold_404 = security_settings['404_threshold']
-            ban_duration_404 = security_settings['404_ban_duration']
+            error_404_events.record(ip_address, path)
+
+            # Check if threshold reached (configurable, default 20 404s per day; record returns the count)
+            # AUTOMATED BAN DISABLED - Manual ban only via /security dashboard
+            # threshold_404 = get_security_settings()['404_threshold']
+            # if error_count >= threshold_404:
+            #     # Don't ban localhost IPs
+            #     if ip_address not in ['127.0.0.1', '::1', 'localhost']:
+            #         IPBan.ban_ip(
+            #             ip_address=ip_address,
+            #             reason=f"Exceeded 404 threshold: {error_count} errors in 24 hours",
+            #             duration_hours=get_security_settings()['404_ban_duration'],
+            #             created_by='404_detector'
+            #         )
+            return True
+
+        except Exception as e:
+            logger.error(f"Error tracking 404: {e}")
+            return False
 
-            now = datetime.utcnow()
-            tracker = Error404Tracker.query.filter_by(ip_address=ip_address).first()
+    @staticmethod
+    def persist_events(pending):
+        """Apply buffered 404 events {ip: SecurityEvents} in one transaction"""
+        trackers = {
+            tracker.ip_address: tracker
+            for tracker in Error404Tracker.query.filter(
+                Error404Tracker.ip_address.in_(list(pending.keys()))
+            ).all()
+        }
+
+        for ip_address, events in pending.items():
+            tracker = trackers.get(ip_address)
 
             if tracker:
                 # Check if tracking period expired (24 hours)
-                if (now - tracker.first_error_at.replace(tzinfo=None)).days >= 1:
+                if (events.last - tracker.first_error_at.replace(tzinfo=None)).days >= 1:
                     # Reset counter for new day
-                    tracker.error_count = 1
-                    tracker.first_error_at = now
-                    tracker.paths_attempted = json.dumps([path])
+                    tracker.error_count = events.count
+                    tracker.first_error_at = events.first
+                    tracker.paths_attempted = json.dumps(events.items[-50:])
                 else:
                     # Increment counter
-                    tracker.error_count += 1
+                    tracker.error_count += events.count
 
-                    # Add path to attempted paths
+                    # Add paths to attempted paths
                     paths = json.loads(tracker.paths_attempted or '[]')
-                    if path not in paths:
-                        paths.append(path)
-                        tracker.paths_attempted = json.dumps(paths[-50:])  # Keep last 50 paths
-
-                tracker.last_error_at = now
-
-                # Check if threshold reached (configurable, default 20 404s per day)
-                # AUTOMATED BAN DISABLED - Manual ban only via /security dashboard
-                # if tracker.error_count >= threshold_404:
-                #     # Don't ban localhost IPs
-                #     if ip_address not in ['127.0.0.1', '::1', 'localhost']:
-                #         # Ban the IP
-                #         IPBan.ban_ip(
-                #             ip_address=ip_address,
-                #             reason=f"Exceeded 404 threshold: {tracker.error_count} errors in 24 hours",
-                #             duration_hours=ban_duration_404,
-                #             created_by='404_detector'
-                #         )
-                #
-                #         # Clean up tracker entry
-                #         logs_session.delete(tracker)
+                    for path in events.items:
+                        if path not in paths:
+                            paths.append(path)
+                    tracker.paths_attempted = json.dumps(paths[-50:])  # Keep last 50 paths
+
+                tracker.last_error_at = events.last
             else:
                 # Create new tracker
-                tracker = Error404Tracker(
+                logs_session.add(Error404Tracker(
                     ip_address=ip_address,
-                    error_count=1,
-                    paths_attempted=json.dumps([path])
-                )
-                logs_session.add(tracker)
+                    error_count=events.count,
+                    first_error_at=events.first,
+                    last_error_at=events.last,
+                    paths_attempted=json.dumps(events.items[-50:])
+                ))
 
-            logs_session.commit()
-            return True
-
-        except Exception as e:
-            logger.error(f"Error tracking 404: {e}")
-            logs_session.rollback()
-            return False
+        logs_session.commit()
 
     @staticmethod
     def get_suspicious_ips(min_errors=5):
         """Get IPs with suspicious 404 activity"""
         try:
+            error_404_events.flush()
+
             # Clean up old entries (older than 24 hours)
             cutoff = datetime.utcnow() - timedelta(days=1)
             old_entries = Error404Tracker.query.filter(
@@ -344,77 +366,82 @@ class InvalidAPIKeyTracker(LogBase):
 
     @staticmethod
     def track_invalid_api_key(ip_address, api_key_hash=None):
-        """Track an invalid API key attempt"""
+        """Track an invalid API key attempt (counted in memory, persisted asynchronously)"""
         try:
             # Check if already banned
             if IPBan.is_ip_banned(ip_address):
                 return False
 
-            # Get security settings from database
-            security_settings = get_security_settings()
-            threshold_api = security_settings['api_threshold']
-            ban_duration_api = security_settings['api_ban_duration']
+            invalid_api_key_events.record(ip_address, api_key_hash)
+
+            # Check if threshold reached (configurable, default 10 invalid API keys per day; record returns the count)
+            # AUTOMATED BAN DISABLED - Manual ban only via /security dashboard
+            # threshold_api = get_security_settings()['api_threshold']
+            # if attempt_count >= threshold_api:
+            #     # Don't ban localhost IPs but keep tracking
+            #     if ip_address not in ['127.0.0.1', '::1', 'localhost']:
+            #         IPBan.ban_ip(
+            #             ip_address=ip_address,
+            #             reason=f"Exceeded invalid API key threshold: {attempt_count} attempts in 24 hours",
+            #             duration_hours=get_security_settings()['api_ban_duration'],
+            #             created_by='api_key_detector'
+            #         )
+            return True
 
-            now = datetime.utcnow()
-            tracker = InvalidAPIKeyTracker.query.filter_by(ip_address=ip_address).first()
+        except Exception as e:
+            logger.error(f"Error tracking invalid API key: {e}")
+            return False
+
+    @staticmethod
+    def persist_events(pending):
+        """Apply buffered invalid API key events {ip: SecurityEvents} in one transaction"""
+        trackers = {
+            tracker.ip_address: tracker
+            for tracker in InvalidAPIKeyTracker.query.filter(
+                InvalidAPIKeyTracker.ip_address.in_(list(pending.keys()))
+            ).all()
+        }
+
+        for ip_address, events in pending.items():
+            tracker = trackers.get(ip_address)
 
             if tracker:
                 # Check if tracking period expired (24 hours)
-                if (now - tracker.first_attempt_at.replace(tzinfo=None)).days >= 1:
+                if (events.last - tracker.first_attempt_at.replace(tzinfo=None)).days >= 1:
                     # Reset counter for new day
-                    tracker.attempt_count = 1
-                    tracker.first_attempt_at = now
-                    tracker.api_keys_tried = json.dumps([api_key_hash] if api_key_hash else [])
+                    tracker.attempt_count = events.count
+                    tracker.first_attempt_at = events.first
+                    tracker.api_keys_tried = json.dumps(events.items[-20:])
                 else:
                     # Increment counter
-                    tracker.attempt_count += 1
+                    tracker.attempt_count += events.count
 
-                    # Add API key hash to tried list
-                    if api_key_hash:
-                        keys_tried = json.loads(tracker.api_keys_tried or '[]')
+                    # Add API key hashes to tried list
+                    keys_tried = json.loads(tracker.api_keys_tried or '[]')
+                    for api_key_hash in events.items:
                         if api_key_hash not in keys_tried:
                             keys_tried.append(api_key_hash)
-                            tracker.api_keys_tried = json.dumps(keys_tried[-20:])  # Keep last 20 keys
-
-                tracker.last_attempt_at = now
-
-                # Check if threshold reached (configurable, default 10 invalid API keys per day)
-                # AUTOMATED BAN DISABLED - Manual ban only via /security dashboard
-                # if tracker.attempt_count >= threshold_api:
-                #     # Don't ban localhost IPs but keep tracking
-                #     if ip_address not in ['127.0.0.1', '::1', 'localhost']:
-                #         # Ban the IP
-                #         success = IPBan.ban_ip(
-                #             ip_address=ip_address,
-                #             reason=f"Exceeded invalid API key threshold: {tracker.attempt_count} attempts in 24 hours",
-                #             duration_hours=ban_duration_api,  # Configurable hours for API abuse
-                #             created_by='api_key_detector'
-                #         )
-                #
-                #         # Only delete tracker if ban was successful
-                #         if success:
-                #             logs_session.delete(tracker)
+                    tracker.api_keys_tried = json.dumps(keys_tried[-20:])  # Keep last 20 keys
+
+                tracker.last_attempt_at = events.last
             else:
                 # Create new tracker
-                tracker = InvalidAPIKeyTracker(
+                logs_session.add(InvalidAPIKeyTracker(
                     ip_address=ip_address,
-                    attempt_count=1,
-                    api_keys_tried=json.dumps([api_key_hash] if api_key_hash else [])
-                )
-                logs_session.add(tracker)
+                    attempt_count=events.count,
+                    first_attempt_at=events.first,
+                    last_attempt_at=events.last,
+                    api_keys_tried=json.dumps(events.items[-20:])
+                ))
 
-            logs_session.commit()
-            return True
-
-        except Exception as e:
-            logger.error(f"Error tracking invalid API key: {e}")
-            logs_session.rollback()
-            return False
+        logs_session.commit()
 
     @staticmethod
     def get_suspicious_api_users(min_attempts=3):
         """Get IPs with suspicious API key activity"""
         try:
+            invalid_api_key_events.flush()
+
             # Clean up old entries (older than 24 hours)
             cutoff = datetime.utcnow() - timedelta(days=1)
             old_entries = InvalidAPIKeyTracker.query.filter(
@@ -434,6 +461,278 @@ class InvalidAPIKeyTracker(LogBase):
             logger.error(f"Error getting suspicious API users: {e}")
             return []
 
+# How often each process re-reads ip_bans (picks up bans made by other workers)
+BAN_CACHE_REFRESH_SECONDS = int(os.getenv('BAN_CACHE_REFRESH_SECONDS', '60'))
+# How often buffered 404 / invalid API key events are written to their tracker tables
+SECURITY_TRACKER_FLUSH_SECONDS = float(os.getenv('SECURITY_TRACKER_FLUSH_SECONDS', '5'))
+
+_NOT_BANNED = object()
+
+
+def _to_epoch(expires_at):
+    """Convert a naive-UTC (or aware) expiry datetime to epoch seconds"""
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at.timestamp()
+
+
+class BanCache:
+    """
+    In-process copy of ip_bans: ip -> expiry epoch seconds (None = permanent).
+
+    Reads are a lock-free dict lookup. The table is loaded at startup, kept in
+    sync by ban_ip/unban_ip, and refreshed in the background every
+    BAN_CACHE_REFRESH_SECONDS so bans made by other processes are picked up.
+
+    Every set/remove bumps a version; a load keeps the entries changed after
+    it started, so a snapshot read before a ban never drops it.
+    """
+
+    def __init__(self, refresh_seconds=BAN_CACHE_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._bans = {}
+        self._loaded_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._version = 0
+        self._changed = {}  # ip -> version of its last set/remove
+        self._loaded_version = -1  # version at the start of the last applied load
+
+    def load(self):
+        """Load all active bans from the database"""
+        with self._lock:
+            started = self._version
+        # Dedicated session so a load triggered mid-request never
+        # disturbs the caller's scoped logs_session
+        session = sessionmaker(bind=logs_engine)()
+        try:
+            now = time.time()
+            bans = {}
+            rows = session.query(IPBan.ip_address, IPBan.is_permanent, IPBan.expires_at).all()
+            for ip_address, is_permanent, expires_at in rows:
+                if is_permanent:
+                    bans[ip_address] = None
+                elif expires_at is not None:
+                    expiry = _to_epoch(expires_at)
+                    if expiry > now:
+                        bans[ip_address] = expiry
+        finally:
+            session.close()
+
+        with self._lock:
+            if started < self._loaded_version:
+                return  # a load that started later was applied already
+            for ip_address, version in self._changed.items():
+                if version > started:
+                    if ip_address in self._bans:
+                        bans[ip_address] = self._bans[ip_address]
+                    else:
+                        bans.pop(ip_address, None)
+            self._changed = {ip: version for ip, version in self._changed.items() if version > started}
+            self._bans = bans
+            self._loaded_version = started
+            self._loaded_at = now
+
+    def _touch(self, ip_address):
+        self._version += 1
+        self._changed[ip_address] = self._version
+
+    def _refresh_in_background(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def refresh():
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Error refreshing IP ban cache: {e}")
+                self._loaded_at = time.time()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="BanCacheRefresh", daemon=True).start()
+
+    def is_banned(self, ip_address):
+        if self._loaded_at is None:
+            self.load()
+        elif time.time() - self._loaded_at > self.refresh_seconds:
+            self._refresh_in_background()
+
+        expiry = self._bans.get(ip_address, _NOT_BANNED)
+        if expiry is _NOT_BANNED:
+            return False
+        if expiry is None or time.time() < expiry:
+            return True
+
+        # Ban expired; the row is purged by the next reload / get_all_bans
+        self._bans.pop(ip_address, None)
+        return False
+
+    def set(self, ip_address, is_permanent, expires_at):
+        with self._lock:
+            self._touch(ip_address)
+            if is_permanent:
+                self._bans[ip_address] = None
+            elif expires_at is not None:
+                self._bans[ip_address] = _to_epoch(expires_at)
+            else:
+                self._bans.pop(ip_address, None)
+
+    def remove(self, ip_address):
+        with self._lock:
+            self._touch(ip_address)
+            self._bans.pop(ip_address, None)
+
+    def __len__(self):
+        return len(self._bans)
+
+
+class SecurityEvents:
+    """Buffered events for one IP since the last flush"""
+
+    __slots__ = ('count', 'first', 'last', 'items')
+
+    def __init__(self, now):
+        self.count = 0
+        self.first = now
+        self.last = now
+        self.items = []
+
+
+class SecurityEventTracker:
+    """
+    Per-IP sliding-window counter for security events (404s, invalid API
+    keys). Counting is purely in memory; events are buffered and written to
+    the tracker table in one transaction by a background flusher.
+    """
+
+    def __init__(self, name, persist, window_seconds=86400, max_events_per_ip=1000, max_items=50):
+        self.name = name
+        self.persist = persist
+        self.window_seconds = window_seconds
+        self.max_events_per_ip = max_events_per_ip
+        self.max_items = max_items
+        self._windows = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def record(self, ip_address, item=None):
+        """Record an event and return the IP's event count in the window"""
+        now = datetime.utcnow()
+        now_ts = time.time()
+        cutoff = now_ts - self.window_seconds
+
+        with self._lock:
+            window = self._windows.get(ip_address)
+            if window is None:
+                window = self._windows[ip_address] = deque(maxlen=self.max_events_per_ip)
+            window.append(now_ts)
+            while window and window[0] < cutoff:
+                window.popleft()
+
+            events = self._pending.get(ip_address)
+            if events is None:
+                events = self._pending[ip_address] = SecurityEvents(now)
+            events.count += 1
+            events.last = now
+            if item and item not in events.items:
+                events.items.append(item)
+                del events.items[:-self.max_items]
+
+            count = len(window)
+
+        _ensure_tracker_flusher()
+        return count
+
+    def get_count(self, ip_address):
+        """Events recorded for an IP within the sliding window"""
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            window = self._windows.get(ip_address)
+            if not window:
+                return 0
+            while window and window[0] < cutoff:
+                window.popleft()
+            return len(window)
+
+    def clear(self, ip_address):
+        """Forget in-memory state for an IP"""
+        with self._lock:
+            self._windows.pop(ip_address, None)
+            self._pending.pop(ip_address, None)
+
+    def flush(self):
+        """Persist buffered events; returns number of IPs written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                # Drop idle windows so the map does not grow without bound
+                cutoff = time.time() - self.window_seconds
+                for ip_address in [ip for ip, window in self._windows.items() if not window or window[-1] < cutoff]:
+                    del self._windows[ip_address]
+
+            if not pending:
+                return 0
+
+            try:
+                self.persist(pending)
+                return len(pending)
+            except Exception as e:
+                logger.error(f"Error persisting {self.name} events: {e}")
+                logs_session.rollback()
+                self._requeue(pending)
+                return 0
+            finally:
+                logs_session.remove()
+
+    def _requeue(self, pending):
+        """Put events that failed to persist back in front of any recorded since"""
+        with self._lock:
+            for ip_address, events in pending.items():
+                newer = self._pending.get(ip_address)
+                if newer is not None:
+                    events.count += newer.count
+                    events.last = newer.last
+                    events.items.extend(item for item in newer.items if item not in events.items)
+                    del events.items[:-self.max_items]
+                self._pending[ip_address] = events
+
+
+ban_cache = BanCache()
+error_404_events = SecurityEventTracker('404', Error404Tracker.persist_events, max_items=50)
+invalid_api_key_events = SecurityEventTracker('invalid_api_key', InvalidAPIKeyTracker.persist_events, max_items=20)
+
+_flusher_thread = None
+_flusher_lock = threading.Lock()
+
+
+def flush_security_trackers():
+    """Write all buffered 404 / invalid API key events to the database"""
+    error_404_events.flush()
+    invalid_api_key_events.flush()
+
+
+def _ensure_tracker_flusher():
+    global _flusher_thread
+    if _flusher_thread is not None:
+        return
+    with _flusher_lock:
+        if _flusher_thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(SECURITY_TRACKER_FLUSH_SECONDS)
+                flush_security_trackers()
+
+        _flusher_thread = threading.Thread(target=run, name="SecurityTrackerFlush", daemon=True)
+        _flusher_thread.start()
+
+
+atexit.register(flush_security_trackers)
+
 def init_logs_db():
     """Initialize the logs database"""
     # Extract directory from database URL and create if it doesn't exist
@@ -446,3 +745,10 @@ def init_logs_db():
 
     # Create all tables
     LogBase.metadata.create_all(bind=logs_engine)
+
+    # Load active bans so the per-request check never hits the database
+    try:
+        ban_cache.load()
+        logger.info(f"Loaded {len(ban_cache)} active IP bans into memory")
+    except Exception as e:
+        logger.error(f"Error loading IP ban cache: {e}")
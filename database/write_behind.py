@@ -0,0 +1,282 @@
+# database/write_behind.py
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+
+from utils.logging import get_logger
+from utils.metrics import register_collector
+
+logger = get_logger(__name__)
+
+# Defaults shared by all log sinks (overridable per sink)
+FLUSH_INTERVAL_MS = int(os.getenv('LOG_SINK_FLUSH_MS', '250'))
+FLUSH_BATCH_SIZE = int(os.getenv('LOG_SINK_BATCH_SIZE', '500'))
+BUFFER_CAPACITY = int(os.getenv('LOG_SINK_CAPACITY', '50000'))
+# A batch that fails for a transient reason (database locked or down) is retried this many
+# times, backing off from the flush interval up to MAX_RETRY_BACKOFF seconds, before it is dropped
+RETRY_LIMIT = int(os.getenv('LOG_SINK_RETRIES', '8'))
+MAX_RETRY_BACKOFF = 30.0
+
+# Registry of sinks by name, used for stats and shutdown flush
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def enable_sqlite_wal(engine):
+    """
+    Switch a SQLite engine to WAL journaling so batched log writes do not
+    block readers (dashboards) and vice versa. No-op for other databases.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        finally:
+            cursor.close()
+
+
+def _is_permanent(error):
+    """Whether an insert failed because of its rows (retrying cannot help) rather than the database"""
+    if isinstance(error, (IntegrityError, DataError)):
+        return True
+    # a value the column type could not bind, raised before reaching the database
+    return isinstance(error, StatementError) and not isinstance(error, DBAPIError)
+
+
+class WriteBehindSink:
+    """
+    In-memory ring buffer of rows for one table, flushed by a background
+    thread as a single batched INSERT every ``flush_interval_ms`` or as soon
+    as ``batch_size`` rows are pending.
+
+    ``enqueue`` never touches the database. When the buffer is full the
+    oldest pending row is overwritten and counted as dropped. A batch the
+    database rejects for a transient reason goes back to the head of the
+    buffer and is retried with backoff; only rows that can never be written
+    (constraint or data errors) are dropped.
+    """
+
+    def __init__(self, name, engine, table, flush_interval_ms=None, batch_size=None, capacity=None):
+        self.name = name
+        self.engine = engine
+        self.table = table
+        self.flush_interval = (flush_interval_ms or FLUSH_INTERVAL_MS) / 1000.0
+        self.batch_size = batch_size or FLUSH_BATCH_SIZE
+        self.capacity = capacity or BUFFER_CAPACITY
+
+        self._buffer = deque(maxlen=self.capacity)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._retries = 0  # consecutive transient failures
+        self._retry_at = 0.0  # monotonic time before which the flush thread backs off
+
+        # Counters
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        """Start the background flush thread (idempotent)"""
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"WriteBehind-{self.name}", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, row):
+        """Queue a row (dict of column values) for the next batch"""
+        if len(self._buffer) >= self.capacity:
+            # deque(maxlen) evicts the oldest row on append
+            self.dropped += 1
+        self._buffer.append(row)
+        self.enqueued += 1
+
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+        if self._thread is None:
+            self.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if time.monotonic() < self._retry_at:
+                continue
+            self.flush()
+
+    def flush(self):
+        """Write all pending rows in batches; returns number of rows written"""
+        written = 0
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                try:
+                    while len(batch) < self.batch_size:
+                        batch.append(self._buffer.popleft())
+                except IndexError:
+                    pass
+
+                start = time.perf_counter()
+                pending = []
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(self.table.insert(), batch)
+                except Exception as e:
+                    if not _is_permanent(e):
+                        self._requeue(batch, e)
+                        break
+                    logger.error(f"Error flushing {len(batch)} rows to {self.name}: {e}")
+                    # Retry row by row so one bad row does not lose the batch
+                    batch, pending = self._insert_individually(batch)
+                    if pending:
+                        self._requeue(pending, e)
+
+                if batch:
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    self.flushes += 1
+                    self.written += len(batch)
+                    self.last_flush_ms = elapsed_ms
+                    self.total_flush_ms += elapsed_ms
+                    self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                    written += len(batch)
+                if pending:
+                    break
+                self._retries = 0
+        return written
+
+    def _insert_individually(self, batch):
+        """
+        Insert rows one at a time, dropping those that can never be written;
+        returns (rows written, rows that failed for a transient reason)
+        """
+        written, pending = [], []
+        for row in batch:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(self.table.insert(), [row])
+                written.append(row)
+            except Exception as e:
+                if not _is_permanent(e):
+                    pending.append(row)
+                    continue
+                self.failed += 1
+                logger.warning(f"Dropping unwritable row for {self.name}: {e}")
+        return written, pending
+
+    def _requeue(self, rows, error):
+        """Put rows that failed for a transient reason back at the head of the buffer and back off"""
+        self._retries += 1
+        if self._retries > RETRY_LIMIT:
+            self.failed += len(rows)
+            logger.error(f"Dropping {len(rows)} rows for {self.name} after {RETRY_LIMIT} retries: {error}")
+            self._retries = 0
+            return
+        # they are the oldest rows: when the buffer has filled up meanwhile, they are the ones dropped
+        overflow = len(self._buffer) + len(rows) - self.capacity
+        if overflow > 0:
+            self.dropped += overflow
+            rows = rows[overflow:]
+        self._buffer.extendleft(reversed(rows))
+        backoff = min(self.flush_interval * 2 ** self._retries, MAX_RETRY_BACKOFF)
+        self._retry_at = time.monotonic() + backoff
+        logger.warning(f"Could not write {len(rows)} rows to {self.name}, retrying in {backoff:.1f}s: {error}")
+
+    def stop(self):
+        """Stop the flush thread and write whatever is still buffered"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+    def get_stats(self):
+        """Get queue depth, flush latency and drop counters"""
+        return {
+            'queue_depth': len(self._buffer),
+            'capacity': self.capacity,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'flushes': self.flushes,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            'max_flush_ms': round(self.max_flush_ms, 3),
+        }
+
+
+def get_sink(name, engine, table, **kwargs):
+    """Get or create the named write-behind sink for a table"""
+    with _sinks_lock:
+        sink = _sinks.get(name)
+        if sink is None:
+            sink = WriteBehindSink(name, engine, table, **kwargs)
+            _sinks[name] = sink
+        return sink
+
+
+def flush_all():
+    """Synchronously flush every registered sink"""
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    for sink in sinks:
+        sink.flush()
+
+
+def get_write_behind_stats():
+    """Get stats for every registered sink keyed by sink name"""
+    with _sinks_lock:
+        sinks = list(_sinks.items())
+    return {name: sink.get_stats() for name, sink in sinks}
+
+
+def _shutdown_sinks():
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    for sink in sinks:
+        try:
+            sink.stop()
+        except Exception as e:
+            logger.error(f"Error flushing {sink.name} on shutdown: {e}")
+
+
+def _collect_metrics():
+    stats = get_write_behind_stats()
+    if not stats:
+        return
+    yield ('openalgo_log_sink_queue_depth', 'gauge', 'Rows buffered in a write-behind log sink',
+           [({'sink': name}, s['queue_depth']) for name, s in stats.items()])
+    for key, help_text in (('written', 'Rows written by a write-behind log sink'),
+                           ('dropped', 'Rows dropped because a write-behind log sink was full'),
+                           ('failed', 'Rows a write-behind log sink failed to write'),
+                           ('flushes', 'Batches flushed by a write-behind log sink')):
+        yield (f'openalgo_log_sink_{key}_total', 'counter', help_text,
+               [({'sink': name}, s[key]) for name, s in stats.items()])
+    yield ('openalgo_log_sink_max_flush_seconds', 'gauge', 'Slowest write-behind flush so far',
+           [({'sink': name}, s['max_flush_ms'] / 1000.0) for name, s in stats.items()])
+
+
+register_collector('write_behind', _collect_metrics)
+atexit.register(_shutdown_sinks)
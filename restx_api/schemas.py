@@ -83,3 +83,4 @@ class SplitOrderSchema(Schema):
     price = fields.Float(missing=0.0, validate=validate.Range(min=0, error="Price must be a non-negative number."))
     trigger_price = fields.Float(missing=0.0, validate=validate.Range(min=0, error="Trigger price must be a non-negative number."))
     disclosed_quantity = fields.Int(missing=0, validate=validate.Range(min=0, error="Disclosed quantity must be a non-negative integer."))
+    slice_interval = fields.Float(missing=0.0, validate=validate.Range(min=0, error="Slice interval must be a non-negative number."))  # Seconds between child orders (TWAP)
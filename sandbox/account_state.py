@@ -0,0 +1,431 @@
+# sandbox/account_state.py
+"""
+In-memory sandbox account state with a write-ahead journal
+
+Optional (SANDBOX_MEMORY_STATE=true). Each user's funds, open positions and
+holdings are loaded once and kept in memory behind a per-user lock, so the
+margin check, the margin block and the order insert of ``place_order`` are
+dictionary updates plus one appended journal line instead of several ORM
+queries and commits.
+
+Journal entries (fund deltas and new orders) are appended to a JSON-lines
+file before the caller gets its answer and are written to the sandbox
+database by a background thread, one transaction per batch. The sequence
+number of the last applied entry is stored in ``sandbox_sequences`` in the
+same transaction, so after a crash the entries the database has not seen
+are replayed exactly once on start and the file is truncated.
+
+Code that reads funds or orders from the database calls ``sync()`` first;
+code that writes funds or positions directly calls ``invalidate()`` so the
+affected accounts are reloaded. The engine assumes one process owns the
+sandbox database, as the execution and square-off threads already do.
+"""
+
+import atexit
+import json
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import DECIMAL, DateTime, bindparam, insert, select, update
+
+from database.sandbox_db import (
+    SandboxFunds, SandboxHoldings, SandboxOrders, SandboxPositions, SandboxSequences, engine
+)
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+ENABLED = os.getenv('SANDBOX_MEMORY_STATE', 'False').lower() == 'true'
+JOURNAL_PATH = os.getenv('SANDBOX_JOURNAL_PATH', 'db/sandbox_journal.jsonl')
+FLUSH_INTERVAL = int(os.getenv('SANDBOX_JOURNAL_FLUSH_MS', '200')) / 1000
+# fsync every append; without it a crash of the OS (not the app) can lose the tail
+JOURNAL_FSYNC = os.getenv('SANDBOX_JOURNAL_FSYNC', 'False').lower() == 'true'
+# the file is rewritten without its flushed entries once it grows past this and entries are still pending
+JOURNAL_COMPACT_BYTES = int(os.getenv('SANDBOX_JOURNAL_COMPACT_BYTES', str(4 * 1024 * 1024)))
+
+# sandbox_sequences row holding the last journal entry applied to the database
+CHECKPOINT_SCOPE, CHECKPOINT_DAY = 'journal', '-'
+
+FUND_FIELDS = ('available_balance', 'used_margin', 'realized_pnl')
+
+PositionState = namedtuple('PositionState', 'quantity ltp')
+
+_orders = SandboxOrders.__table__
+_funds = SandboxFunds.__table__
+_sequences = SandboxSequences.__table__
+_ZERO = Decimal('0')
+
+
+def _decode_order(row):
+    """Order row as appended or as read back from the file (strings) -> column values"""
+    values = {}
+    for key, value in row.items():
+        if isinstance(value, str):
+            column_type = _orders.c[key].type
+            if isinstance(column_type, DateTime):
+                value = datetime.fromisoformat(value)
+            elif isinstance(column_type, DECIMAL):
+                value = Decimal(value)
+        values[key] = value
+    return values
+
+
+class Journal:
+    """Append-only JSON-lines file of entries not yet written to the database"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = []
+        self._seq = 0
+
+    def open(self, checkpoint):
+        """
+        Open for appending; entries after ``checkpoint`` become pending again.
+        A torn last line is cut off first, so new entries start on a line of
+        their own instead of being glued to it (and lost on the next read).
+        """
+        entries, end = self._scan()
+        with self._lock:
+            self._pending = [entry for entry in entries if entry['seq'] > checkpoint]
+            self._seq = max([checkpoint] + [entry['seq'] for entry in entries])
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            if self._file.tell() > end:
+                logger.warning(f"Cutting off an incomplete sandbox journal line in {self.path} at byte {end}")
+                self._file.truncate(end)
+        return len(self._pending)
+
+    def read(self):
+        return self._scan()[0]
+
+    def _scan(self):
+        """Complete entries in the file and the offset just past the last of them"""
+        if not os.path.exists(self.path):
+            return [], 0
+        entries = []
+        end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                # a torn last line from a crash mid-write was never acknowledged
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+                end += len(line)
+        return entries, end
+
+    def append(self, entry):
+        with self._lock:
+            self._seq += 1
+            entry['seq'] = self._seq
+            self._file.write(json.dumps(entry, default=str) + '\n')
+            self._file.flush()
+            if JOURNAL_FSYNC:
+                os.fsync(self._file.fileno())
+            self._pending.append(entry)
+
+    def pending(self):
+        with self._lock:
+            return list(self._pending)
+
+    def mark_flushed(self, seq):
+        """
+        Drop entries up to ``seq``. The file is emptied once nothing is
+        pending, and rewritten with only the pending entries once it is past
+        JOURNAL_COMPACT_BYTES, so it also shrinks under steady load.
+        """
+        with self._lock:
+            self._pending = [entry for entry in self._pending if entry['seq'] > seq]
+            if self._file is None:
+                return
+            if not self._pending:
+                self._file.seek(0)
+                self._file.truncate()
+            elif self._file.tell() > JOURNAL_COMPACT_BYTES:
+                self._compact()
+
+    def _compact(self):
+        """Replace the file with one holding only the pending entries (caller holds the lock)"""
+        temp_path = f"{self.path}.compact"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for entry in self._pending:
+                f.write(json.dumps(entry, default=str) + '\n')
+            f.flush()
+            if JOURNAL_FSYNC:
+                os.fsync(f.fileno())
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Account:
+    """One user's cached funds, open positions and holdings"""
+
+    def __init__(self, user_id, funds, positions, holdings):
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.funds = funds  # dict of FUND_FIELDS, None if the user has no funds row
+        self.positions = positions  # (symbol, exchange, product) -> PositionState
+        self.holdings = holdings  # (symbol, exchange) -> quantity
+        self.stale = False
+
+
+class AccountStateEngine:
+    """Per-user account state in memory, persisted through the journal"""
+
+    def __init__(self, journal_path=None, flush_interval=None):
+        self.journal = Journal(journal_path or JOURNAL_PATH)
+        self.flush_interval = FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._accounts = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ----- lifecycle ----------------------------------------------------------------
+
+    def start(self):
+        """Replay entries the database has not seen, then start the background flusher"""
+        with engine.connect() as conn:
+            checkpoint = self._checkpoint(conn)
+        recovered = self.journal.open(checkpoint)
+        if recovered:
+            logger.info(f"Replaying {recovered} sandbox journal entries after checkpoint {checkpoint}")
+        self.flush()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name='SandboxJournalFlusher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+        self.journal.close()
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # entries stay pending (and in the file) until a flush succeeds
+                logger.error(f"Error flushing sandbox journal: {e}")
+
+    # ----- persistence --------------------------------------------------------------
+
+    def flush(self):
+        """Write every pending journal entry to the database in one transaction"""
+        with self._flush_lock:
+            entries = self.journal.pending()
+            if not entries:
+                return 0
+            with engine.begin() as conn:
+                checkpoint = self._checkpoint(conn)
+                entries = [entry for entry in entries if entry['seq'] > checkpoint]
+                if entries:
+                    self._apply(conn, entries)
+                    self._set_checkpoint(conn, entries[-1]['seq'])
+            if entries:
+                self.journal.mark_flushed(entries[-1]['seq'])
+            else:
+                self.journal.mark_flushed(checkpoint)
+            return len(entries)
+
+    @staticmethod
+    def _apply(conn, entries):
+        orders = []
+        deltas = {}
+        for entry in entries:
+            if entry['op'] == 'order':
+                orders.append(_decode_order(entry['row']))
+            elif entry['op'] == 'funds':
+                delta = deltas.setdefault(entry['user_id'], dict.fromkeys(FUND_FIELDS, _ZERO))
+                for field in FUND_FIELDS:
+                    delta[field] += Decimal(entry[field])
+        if orders:
+            conn.execute(insert(_orders), orders)
+        if deltas:
+            conn.execute(
+                _funds.update().where(_funds.c.user_id == bindparam('uid')).values(
+                    available_balance=_funds.c.available_balance + bindparam('available'),
+                    used_margin=_funds.c.used_margin + bindparam('used'),
+                    realized_pnl=_funds.c.realized_pnl + bindparam('realized'),
+                    total_pnl=_funds.c.realized_pnl + bindparam('realized') + _funds.c.unrealized_pnl,
+                ),
+                [{'uid': user_id, 'available': d['available_balance'], 'used': d['used_margin'],
+                  'realized': d['realized_pnl']} for user_id, d in deltas.items()],
+            )
+
+    @staticmethod
+    def _checkpoint(conn):
+        value = conn.execute(select(_sequences.c.value).where(
+            _sequences.c.scope == CHECKPOINT_SCOPE, _sequences.c.day == CHECKPOINT_DAY)).scalar()
+        return value or 0
+
+    @staticmethod
+    def _set_checkpoint(conn, seq):
+        result = conn.execute(update(_sequences).where(
+            _sequences.c.scope == CHECKPOINT_SCOPE, _sequences.c.day == CHECKPOINT_DAY).values(value=seq))
+        if result.rowcount == 0:
+            conn.execute(insert(_sequences).values(scope=CHECKPOINT_SCOPE, day=CHECKPOINT_DAY, value=seq))
+
+    # ----- accounts -----------------------------------------------------------------
+
+    def account(self, user_id):
+        while True:
+            account = self._accounts.get(user_id)
+            if account is not None:
+                return account
+            generation = self._generation
+            account = self._load(user_id)
+            with self._lock:
+                # an invalidate() while loading may have made what we read outdated
+                if generation == self._generation:
+                    return self._accounts.setdefault(user_id, account)
+
+    def _load(self, user_id):
+        # this user's unflushed deltas must be in the rows we are about to read
+        self.flush()
+        with engine.connect() as conn:
+            funds = conn.execute(select(*(_funds.c[field] for field in FUND_FIELDS))
+                                 .where(_funds.c.user_id == user_id)).first()
+            positions = conn.execute(
+                select(SandboxPositions.symbol, SandboxPositions.exchange, SandboxPositions.product,
+                       SandboxPositions.quantity, SandboxPositions.ltp)
+                .where(SandboxPositions.user_id == user_id, SandboxPositions.quantity != 0)).all()
+            holdings = conn.execute(
+                select(SandboxHoldings.symbol, SandboxHoldings.exchange, SandboxHoldings.quantity)
+                .where(SandboxHoldings.user_id == user_id)).all()
+        return Account(
+            user_id,
+            dict(zip(FUND_FIELDS, (Decimal(str(value)) for value in funds))) if funds else None,
+            {(symbol, exchange, product): PositionState(quantity, ltp)
+             for symbol, exchange, product, quantity, ltp in positions},
+            {(symbol, exchange): quantity for symbol, exchange, quantity in holdings},
+        )
+
+    @contextmanager
+    def _locked(self, user_id):
+        while True:
+            account = self.account(user_id)
+            account.lock.acquire()
+            if not account.stale:
+                break
+            account.lock.release()
+        try:
+            yield account
+        finally:
+            account.lock.release()
+
+    def invalidate(self, user_ids=None):
+        """Reload these users' accounts (all users if None) on next use"""
+        with self._lock:
+            self._generation += 1
+            targets = list(self._accounts) if user_ids is None else [u for u in user_ids if u in self._accounts]
+            for user_id in targets:
+                account = self._accounts.pop(user_id)
+                # wait for an in-flight update so its journal entry precedes the reload
+                with account.lock:
+                    account.stale = True
+
+    # ----- reads --------------------------------------------------------------------
+
+    def funds(self, user_id):
+        with self._locked(user_id) as account:
+            return dict(account.funds) if account.funds is not None else None
+
+    def position(self, user_id, symbol, exchange, product):
+        return self.account(user_id).positions.get((symbol, exchange, product))
+
+    def holding_quantity(self, user_id, symbol, exchange):
+        return self.account(user_id).holdings.get((symbol, exchange), 0)
+
+    # ----- writes -------------------------------------------------------------------
+
+    def adjust_funds(self, user_id, available=_ZERO, used=_ZERO, realized=_ZERO, require_available=None):
+        """
+        Apply a funds delta and journal it. With ``require_available`` the
+        delta is applied only if that much balance is available.
+
+        Returns (applied, funds after the call) - funds is None if the user
+        has no funds row.
+        """
+        with self._locked(user_id) as account:
+            funds = account.funds
+            if funds is None:
+                return False, None
+            if require_available is not None and funds['available_balance'] < require_available:
+                return False, dict(funds)
+            funds['available_balance'] += available
+            funds['used_margin'] += used
+            funds['realized_pnl'] += realized
+            self.journal.append({'op': 'funds', 'user_id': user_id, 'available_balance': available,
+                                 'used_margin': used, 'realized_pnl': realized})
+            return True, dict(funds)
+
+    def add_order(self, row):
+        """Journal a new order row (column -> value) for insertion"""
+        self.journal.append({'op': 'order', 'row': row})
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def is_enabled():
+    return ENABLED
+
+
+def get_engine():
+    """The running engine, started on first use; None when SANDBOX_MEMORY_STATE is off"""
+    global _engine
+    if _engine is None and ENABLED:
+        with _engine_lock:
+            if _engine is None:
+                state = AccountStateEngine()
+                state.start()
+                atexit.register(state.stop)
+                _engine = state
+    return _engine
+
+
+def set_engine(state):
+    """Install an engine (tests, benchmarks); returns the previous one"""
+    global _engine
+    with _engine_lock:
+        previous, _engine = _engine, state
+    return previous
+
+
+def sync():
+    """Make the database current before reading funds or orders from it"""
+    if _engine is not None:
+        _engine.flush()
+
+
+def invalidate(user_ids=None):
+    """Drop cached accounts after funds or positions were written to the database directly"""
+    if _engine is not None:
+        _engine.invalidate(user_ids)
@@ -0,0 +1,68 @@
+# sandbox/clock.py
+"""
+Clock used by the sandbox for order, trade and settlement timestamps
+
+By default this is the wall clock. A historical replay installs a
+SimulatedClock so matching, MIS square-off, T+1 settlement and fund resets
+follow the replayed market time instead of the real one.
+"""
+
+import threading
+from datetime import datetime
+
+import pytz
+
+IST = pytz.timezone('Asia/Kolkata')
+
+
+class SimulatedClock:
+    """Clock that only moves when the replay driver advances it"""
+
+    def __init__(self, start):
+        self._now = self._to_ist(start)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _to_ist(when):
+        if when.tzinfo is None:
+            return IST.localize(when)
+        return when.astimezone(IST)
+
+    def now(self):
+        return self._now
+
+    def advance_to(self, when):
+        """Move the clock forward to ``when`` (never backwards)"""
+        when = self._to_ist(when)
+        with self._lock:
+            if when > self._now:
+                self._now = when
+        return self._now
+
+
+_clock = None
+
+
+def set_clock(clock):
+    """Install a SimulatedClock for this process (None restores the wall clock)"""
+    global _clock
+    _clock = clock
+
+
+def get_clock():
+    """The installed SimulatedClock, or None when running on the wall clock"""
+    return _clock
+
+
+def now():
+    """Current time in IST (timezone aware)"""
+    if _clock is None:
+        return datetime.now(IST)
+    return _clock.now()
+
+
+def now_local():
+    """Current naive local time, the sandbox's replacement for datetime.now()"""
+    if _clock is None:
+        return datetime.now()
+    return _clock.now().replace(tzinfo=None)
@@ -14,10 +14,8 @@ Features:
 import os
 import sys
 from decimal import Decimal
-from datetime import datetime
-import pytz
+import threading
 import time
-import uuid
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -26,13 +24,33 @@ from database.sandbox_db import (
     SandboxOrders, SandboxTrades, SandboxPositions,
     db_session
 )
+from sandbox import account_state, clock
 from sandbox.fund_manager import FundManager
-from services.quotes_service import get_quotes
+from sandbox.id_allocator import next_trade_id
+from sandbox.quote_provider import fetch_quote, fetch_quotes
+from sandbox.tick_engine import untrack_order
 from database.auth_db import get_auth_token_broker
 from utils.logging import get_logger
 
 logger = get_logger(__name__)
 
+# Serialises fills between the REST poller, the tick engine and immediate
+# MARKET execution so an order can never be filled twice
+_execution_lock = threading.RLock()
+
+
+def market_execution_price(action, quote):
+    """
+    Fill price of a MARKET order: BUY at the ask (pay the seller's asking
+    price), SELL at the bid (receive the buyer's bid), LTP when the side is 0
+    """
+    ltp = Decimal(str(quote.get('ltp', 0)))
+    if action == 'BUY':
+        ask = Decimal(str(quote.get('ask', 0)))
+        return ask if ask > 0 else ltp
+    bid = Decimal(str(quote.get('bid', 0)))
+    return bid if bid > 0 else ltp
+
 
 class ExecutionEngine:
     """Executes pending orders based on market data"""
@@ -43,14 +61,20 @@ class ExecutionEngine:
         self.api_rate_limit = int(os.getenv('API_RATE_LIMIT', '50 per second').split()[0])
         self.batch_delay = 1.0  # 1 second between batches
 
-    def check_and_execute_pending_orders(self):
+    def check_and_execute_pending_orders(self, skip_symbols=None):
         """
         Main execution loop - checks all pending orders and executes if conditions met
         Respects rate limits through batch processing
+
+        Args:
+            skip_symbols: Optional set of (symbol, exchange) already matched on live ticks
         """
         try:
             # Get all pending orders
+            account_state.sync()
             pending_orders = SandboxOrders.query.filter_by(order_status='open').all()
+            if skip_symbols:
+                pending_orders = [o for o in pending_orders if (o.symbol, o.exchange) not in skip_symbols]
 
             if not pending_orders:
                 logger.debug("No pending orders to process")
@@ -66,19 +90,8 @@ class ExecutionEngine:
                     orders_by_symbol[key] = []
                 orders_by_symbol[key].append(order)
 
-            # Fetch quotes in batches (respecting API rate limit of 50/second)
-            quote_cache = {}
-            symbols_list = list(orders_by_symbol.keys())
-
-            for i in range(0, len(symbols_list), self.api_rate_limit):
-                batch = symbols_list[i:i + self.api_rate_limit]
-
-                for symbol, exchange in batch:
-                    quote_cache[(symbol, exchange)] = self._fetch_quote(symbol, exchange)
-
-                # Wait 1 second before next batch if more symbols remain
-                if i + self.api_rate_limit < len(symbols_list):
-                    time.sleep(self.batch_delay)
+            # Fetch quotes for all symbols (feed cache first, misses in one upstream call)
+            quote_cache = fetch_quotes(orders_by_symbol.keys())
 
             # Process orders in batches (respecting order rate limit of 10/second)
             orders_processed = 0
@@ -102,45 +115,22 @@ class ExecutionEngine:
 
     def _fetch_quote(self, symbol, exchange):
         """
-        Fetch real-time quote for a symbol using API key
+        Fetch real-time quote for a symbol from the shared sandbox quote provider
         Returns dict with ltp, high, low, open, close, etc.
         """
-        try:
-            # Get any user's API key for fetching quotes
-            from database.auth_db import ApiKeys, decrypt_token
-            api_key_obj = ApiKeys.query.first()
-
-            if not api_key_obj:
-                logger.warning("No API keys found for fetching quotes")
-                return None
-
-            # Decrypt the API key
-            api_key = decrypt_token(api_key_obj.api_key_encrypted)
-
-            # Use quotes service with API key authentication
-            success, response, status_code = get_quotes(
-                symbol=symbol,
-                exchange=exchange,
-                api_key=api_key
-            )
-
-            if success and 'data' in response:
-                quote_data = response['data']
-                logger.debug(f"Fetched quote for {symbol}: LTP={quote_data.get('ltp', 0)}")
-                return quote_data
-            else:
-                logger.warning(f"Failed to fetch quote for {symbol}: {response.get('message', 'Unknown error')}")
-                return None
-
-        except Exception as e:
-            logger.error(f"Error fetching quote for {symbol} on {exchange}: {e}")
-            return None
+        return fetch_quote(symbol, exchange)
 
     def _process_order(self, order, quote):
         """
         Process a single order based on current quote
         Determines if order should be executed based on price type
         """
+        with _execution_lock:
+            self._process_order_locked(order, quote)
+        if order.order_status != 'open':
+            untrack_order(order.orderid)  # filled or rejected: the tick engine stops matching it
+
+    def _process_order_locked(self, order, quote):
         try:
             # Check if this order already has a trade (prevent duplicates)
             # This can happen with MARKET orders that are executed immediately on placement
@@ -154,14 +144,12 @@ class ExecutionEngine:
                     order.average_price = existing_trade.price
                     order.filled_quantity = order.quantity
                     order.pending_quantity = 0
-                    order.update_timestamp = datetime.now(pytz.timezone('Asia/Kolkata'))
+                    order.update_timestamp = clock.now()
                     db_session.commit()
                     logger.info(f"Updated order {order.orderid} status to complete (was in race condition)")
                 return
 
             ltp = Decimal(str(quote.get('ltp', 0)))
-            bid = Decimal(str(quote.get('bid', 0)))
-            ask = Decimal(str(quote.get('ask', 0)))
 
             if ltp <= 0:
                 logger.warning(f"Invalid LTP for order {order.orderid}: {ltp}")
@@ -172,15 +160,8 @@ class ExecutionEngine:
             execution_price = None
 
             if order.price_type == 'MARKET':
-                # Market orders execute immediately at bid/ask (more realistic)
-                # BUY: Execute at ask price (pay seller's asking price)
-                # SELL: Execute at bid price (receive buyer's bid price)
-                # If bid/ask is 0, fall back to LTP
                 should_execute = True
-                if order.action == 'BUY':
-                    execution_price = ask if ask > 0 else ltp
-                else:  # SELL
-                    execution_price = bid if bid > 0 else ltp
+                execution_price = market_execution_price(order.action, quote)
 
             elif order.price_type == 'LIMIT':
                 # Limit BUY: Execute if LTP <= Limit Price (you get filled at LTP or better)
@@ -233,30 +214,7 @@ class ExecutionEngine:
             # Generate trade ID
             tradeid = self._generate_trade_id()
 
-            # Create trade record
-            trade = SandboxTrades(
-                tradeid=tradeid,
-                orderid=order.orderid,
-                user_id=order.user_id,
-                symbol=order.symbol,
-                exchange=order.exchange,
-                action=order.action,
-                quantity=order.quantity,
-                price=execution_price,
-                product=order.product,
-                strategy=order.strategy,
-                trade_timestamp=datetime.now(pytz.timezone('Asia/Kolkata'))
-            )
-
-            db_session.add(trade)
-
-            # Update order status
-            order.order_status = 'complete'
-            order.average_price = execution_price
-            order.filled_quantity = order.quantity
-            order.pending_quantity = 0
-            order.update_timestamp = datetime.now(pytz.timezone('Asia/Kolkata'))
-
+            db_session.add(self._record_fill(order, execution_price, tradeid))
             db_session.commit()
 
             # Update position
@@ -272,11 +230,36 @@ class ExecutionEngine:
             try:
                 order.order_status = 'rejected'
                 order.rejection_reason = f"Execution error: {str(e)}"
-                order.update_timestamp = datetime.now(pytz.timezone('Asia/Kolkata'))
+                order.update_timestamp = clock.now()
                 db_session.commit()
             except:
                 db_session.rollback()
 
+    def _record_fill(self, order, execution_price, tradeid):
+        """Mark the order complete and return its trade record (the caller saves both)"""
+        # Create trade record
+        trade = SandboxTrades(
+            tradeid=tradeid,
+            orderid=order.orderid,
+            user_id=order.user_id,
+            symbol=order.symbol,
+            exchange=order.exchange,
+            action=order.action,
+            quantity=order.quantity,
+            price=execution_price,
+            product=order.product,
+            strategy=order.strategy,
+            trade_timestamp=clock.now()
+        )
+
+        # Update order status
+        order.order_status = 'complete'
+        order.average_price = execution_price
+        order.filled_quantity = order.quantity
+        order.pending_quantity = 0
+        order.update_timestamp = clock.now()
+        return trade
+
     def _update_position(self, order, execution_price):
         """
         Update or create position after trade execution
@@ -297,153 +280,166 @@ class ExecutionEngine:
                 product=order.product
             ).first()
 
-            if not position:
-                # Create new position
-                # Margin already blocked at order placement time
-                position = SandboxPositions(
-                    user_id=order.user_id,
-                    symbol=order.symbol,
-                    exchange=order.exchange,
-                    product=order.product,
-                    quantity=order.quantity if order.action == 'BUY' else -order.quantity,
-                    average_price=execution_price,
-                    ltp=execution_price,
-                    pnl=Decimal('0.00'),
-                    pnl_percent=Decimal('0.00'),
-                    accumulated_realized_pnl=Decimal('0.00'),
-                    created_at=datetime.now(pytz.timezone('Asia/Kolkata'))
+            self._net_position(order, execution_price, position, fund_manager.release_margin)
+
+            db_session.commit()
+            account_state.invalidate([order.user_id])
+
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error updating position for order {order.orderid}: {e}")
+            raise
+
+    def _net_position(self, order, execution_price, position, release_margin):
+        """
+        Apply a fill to ``position`` (None creates it) without committing
+
+        ``release_margin(amount, realized_pnl, description)`` is called for
+        margin freed by closing or reducing the position. Returns the position.
+        """
+        fund_manager = FundManager(order.user_id)
+        if not position:
+            # Create new position
+            # Margin already blocked at order placement time
+            position = SandboxPositions(
+                user_id=order.user_id,
+                symbol=order.symbol,
+                exchange=order.exchange,
+                product=order.product,
+                quantity=order.quantity if order.action == 'BUY' else -order.quantity,
+                average_price=execution_price,
+                ltp=execution_price,
+                pnl=Decimal('0.00'),
+                pnl_percent=Decimal('0.00'),
+                accumulated_realized_pnl=Decimal('0.00'),
+                created_at=clock.now()
+            )
+            db_session.add(position)
+            logger.info(f"Created new position: {order.symbol} {order.action} {order.quantity} (margin already blocked: ₹{order.margin_blocked})")
+
+        else:
+            # Update existing position (netting logic)
+            old_quantity = position.quantity
+            new_quantity = order.quantity if order.action == 'BUY' else -order.quantity
+            final_quantity = old_quantity + new_quantity
+
+            # Special case: Reopening a closed position (old_quantity = 0)
+            if old_quantity == 0:
+                # Keep accumulated realized P&L from previous trades, start fresh unrealized P&L
+                position.quantity = new_quantity
+                position.average_price = execution_price
+                position.ltp = execution_price
+                position.pnl = Decimal('0.00')  # Reset current P&L (will be updated by MTM)
+                position.pnl_percent = Decimal('0.00')
+                # accumulated_realized_pnl stays as is from previous closed trades
+                logger.info(f"Reopened position: {order.symbol} {order.action} {order.quantity} (accumulated realized P&L: ₹{position.accumulated_realized_pnl}) (margin already blocked: ₹{order.margin_blocked})")
+
+            elif final_quantity == 0:
+                # Position closed completely
+                # Calculate realized P&L
+                realized_pnl = self._calculate_realized_pnl(
+                    old_quantity, position.average_price,
+                    abs(new_quantity), execution_price
                 )
-                db_session.add(position)
-                logger.info(f"Created new position: {order.symbol} {order.action} {order.quantity} (margin already blocked: ₹{order.margin_blocked})")
 
-            else:
-                # Update existing position (netting logic)
-                old_quantity = position.quantity
-                new_quantity = order.quantity if order.action == 'BUY' else -order.quantity
-                final_quantity = old_quantity + new_quantity
-
-                # Special case: Reopening a closed position (old_quantity = 0)
-                if old_quantity == 0:
-                    # Keep accumulated realized P&L from previous trades, start fresh unrealized P&L
-                    position.quantity = new_quantity
-                    position.average_price = execution_price
-                    position.ltp = execution_price
-                    position.pnl = Decimal('0.00')  # Reset current P&L (will be updated by MTM)
-                    position.pnl_percent = Decimal('0.00')
-                    # accumulated_realized_pnl stays as is from previous closed trades
-                    logger.info(f"Reopened position: {order.symbol} {order.action} {order.quantity} (accumulated realized P&L: ₹{position.accumulated_realized_pnl}) (margin already blocked: ₹{order.margin_blocked})")
-
-                elif final_quantity == 0:
-                    # Position closed completely
-                    # Calculate realized P&L
-                    realized_pnl = self._calculate_realized_pnl(
-                        old_quantity, position.average_price,
-                        abs(new_quantity), execution_price
-                    )
+                # Determine what margin to release
+                # If this order had margin blocked (order.margin_blocked), it means order was opening/adding position
+                # If order had no margin blocked (0), it means order was reducing an existing position
+                order_margin_blocked = order.margin_blocked if hasattr(order, 'margin_blocked') and order.margin_blocked else Decimal('0')
 
-                    # Determine what margin to release
-                    # If this order had margin blocked (order.margin_blocked), it means order was opening/adding position
-                    # If order had no margin blocked (0), it means order was reducing an existing position
-                    order_margin_blocked = order.margin_blocked if hasattr(order, 'margin_blocked') and order.margin_blocked else Decimal('0')
-
-                    if order_margin_blocked == Decimal('0'):
-                        # This order was reducing/closing existing position - no margin was blocked for it
-                        # We need to release margin for the old position that's now closed
-                        # Determine the original position action (BUY for long, SELL for short)
-                        position_action = 'BUY' if old_quantity > 0 else 'SELL'
-                        margin_to_release, _ = fund_manager.calculate_margin_required(
-                            order.symbol, order.exchange, order.product,
-                            abs(old_quantity), position.average_price, position_action
-                        )
-                        if margin_to_release:
-                            fund_manager.release_margin(
-                                margin_to_release,
-                                realized_pnl,
-                                f"Position closed: {order.symbol}"
-                            )
-                            logger.info(f"Released margin ₹{margin_to_release} for closed position (old position margin)")
-                    else:
-                        # This order had margin blocked at placement time
-                        # Release the exact margin that was blocked for this order
-                        fund_manager.release_margin(
-                            order_margin_blocked,
+                if order_margin_blocked == Decimal('0'):
+                    # This order was reducing/closing existing position - no margin was blocked for it
+                    # We need to release margin for the old position that's now closed
+                    # Determine the original position action (BUY for long, SELL for short)
+                    position_action = 'BUY' if old_quantity > 0 else 'SELL'
+                    margin_to_release, _ = fund_manager.calculate_margin_required(
+                        order.symbol, order.exchange, order.product,
+                        abs(old_quantity), position.average_price, position_action
+                    )
+                    if margin_to_release:
+                        release_margin(
+                            margin_to_release,
                             realized_pnl,
                             f"Position closed: {order.symbol}"
                         )
-                        logger.info(f"Released margin ₹{order_margin_blocked} for closed position (order margin)")
+                        logger.info(f"Released margin ₹{margin_to_release} for closed position (old position margin)")
+                else:
+                    # This order had margin blocked at placement time
+                    # Release the exact margin that was blocked for this order
+                    release_margin(
+                        order_margin_blocked,
+                        realized_pnl,
+                        f"Position closed: {order.symbol}"
+                    )
+                    logger.info(f"Released margin ₹{order_margin_blocked} for closed position (order margin)")
 
-                    # Keep position with 0 quantity to show it was closed
-                    # Add realized P&L to accumulated realized P&L (for day's trading)
-                    position.accumulated_realized_pnl += realized_pnl
+                # Keep position with 0 quantity to show it was closed
+                # Add realized P&L to accumulated realized P&L (for day's trading)
+                position.accumulated_realized_pnl += realized_pnl
 
-                    position.quantity = 0
-                    position.ltp = execution_price
-                    position.pnl = position.accumulated_realized_pnl  # Display total accumulated P&L
-                    position.pnl_percent = Decimal('0.00')
-                    logger.info(f"Position closed: {order.symbol}, Realized P&L: ₹{realized_pnl}, Total Accumulated P&L: ₹{position.accumulated_realized_pnl}")
+                position.quantity = 0
+                position.ltp = execution_price
+                position.pnl = position.accumulated_realized_pnl  # Display total accumulated P&L
+                position.pnl_percent = Decimal('0.00')
+                logger.info(f"Position closed: {order.symbol}, Realized P&L: ₹{realized_pnl}, Total Accumulated P&L: ₹{position.accumulated_realized_pnl}")
 
-                elif (old_quantity > 0 and final_quantity > old_quantity) or (old_quantity < 0 and final_quantity < old_quantity):
-                    # Adding to existing position (same direction, position size increasing)
-                    # Calculate new average price
-                    total_value = (abs(old_quantity) * position.average_price) + (abs(new_quantity) * execution_price)
-                    total_quantity = abs(old_quantity) + abs(new_quantity)
-                    new_average_price = total_value / total_quantity
+            elif (old_quantity > 0 and final_quantity > old_quantity) or (old_quantity < 0 and final_quantity < old_quantity):
+                # Adding to existing position (same direction, position size increasing)
+                # Calculate new average price
+                total_value = (abs(old_quantity) * position.average_price) + (abs(new_quantity) * execution_price)
+                total_quantity = abs(old_quantity) + abs(new_quantity)
+                new_average_price = total_value / total_quantity
 
-                    position.quantity = final_quantity
-                    position.average_price = new_average_price
-                    position.ltp = execution_price
+                position.quantity = final_quantity
+                position.average_price = new_average_price
+                position.ltp = execution_price
 
-                    # Margin already blocked at order placement time - no action needed
-                    logger.info(f"Added to position: {order.symbol}, New qty: {final_quantity}, Avg: {new_average_price} (margin already blocked: ₹{order.margin_blocked})")
+                # Margin already blocked at order placement time - no action needed
+                logger.info(f"Added to position: {order.symbol}, New qty: {final_quantity}, Avg: {new_average_price} (margin already blocked: ₹{order.margin_blocked})")
 
-                else:
-                    # Reducing position (opposite direction)
-                    reduced_quantity = min(abs(old_quantity), abs(new_quantity))
+            else:
+                # Reducing position (opposite direction)
+                reduced_quantity = min(abs(old_quantity), abs(new_quantity))
 
-                    # Calculate realized P&L for reduced portion
-                    realized_pnl = self._calculate_realized_pnl(
-                        old_quantity, position.average_price,
-                        reduced_quantity, execution_price
-                    )
+                # Calculate realized P&L for reduced portion
+                realized_pnl = self._calculate_realized_pnl(
+                    old_quantity, position.average_price,
+                    reduced_quantity, execution_price
+                )
 
-                    # Release margin for reduced quantity
-                    # Use position's average price for consistency (same price used when margin was blocked)
-                    # Determine the original position action (BUY for long, SELL for short)
-                    position_action = 'BUY' if old_quantity > 0 else 'SELL'
-                    margin_to_release, _ = fund_manager.calculate_margin_required(
-                        order.symbol, order.exchange, order.product,
-                        reduced_quantity, position.average_price, position_action
+                # Release margin for reduced quantity
+                # Use position's average price for consistency (same price used when margin was blocked)
+                # Determine the original position action (BUY for long, SELL for short)
+                position_action = 'BUY' if old_quantity > 0 else 'SELL'
+                margin_to_release, _ = fund_manager.calculate_margin_required(
+                    order.symbol, order.exchange, order.product,
+                    reduced_quantity, position.average_price, position_action
+                )
+
+                if margin_to_release:
+                    release_margin(
+                        margin_to_release,
+                        realized_pnl,
+                        f"Position reduced: {order.symbol}"
                     )
+                    logger.info(f"Released margin ₹{margin_to_release} for reduced position")
 
-                    if margin_to_release:
-                        fund_manager.release_margin(
-                            margin_to_release,
-                            realized_pnl,
-                            f"Position reduced: {order.symbol}"
-                        )
-                        logger.info(f"Released margin ₹{margin_to_release} for reduced position")
-
-                    # If position reversed, recalculate average price for new position
-                    if abs(new_quantity) > abs(old_quantity):
-                        # Position reversed
-                        remaining_quantity = abs(new_quantity) - abs(old_quantity)
-                        position.quantity = remaining_quantity if order.action == 'BUY' else -remaining_quantity
-                        position.average_price = execution_price
-                        # Margin for excess quantity already blocked at order time - no action needed
-                        logger.info(f"Position reversed: {order.symbol}, New qty: {position.quantity} (excess margin already blocked: ₹{order.margin_blocked})")
-                    else:
-                        # Position reduced but not reversed
-                        position.quantity = final_quantity
-
-                    position.ltp = execution_price
-                    logger.info(f"Reduced position: {order.symbol}, New qty: {final_quantity}, Realized P&L: ₹{realized_pnl}")
+                # If position reversed, recalculate average price for new position
+                if abs(new_quantity) > abs(old_quantity):
+                    # Position reversed
+                    remaining_quantity = abs(new_quantity) - abs(old_quantity)
+                    position.quantity = remaining_quantity if order.action == 'BUY' else -remaining_quantity
+                    position.average_price = execution_price
+                    # Margin for excess quantity already blocked at order time - no action needed
+                    logger.info(f"Position reversed: {order.symbol}, New qty: {position.quantity} (excess margin already blocked: ₹{order.margin_blocked})")
+                else:
+                    # Position reduced but not reversed
+                    position.quantity = final_quantity
 
-            db_session.commit()
+                position.ltp = execution_price
+                logger.info(f"Reduced position: {order.symbol}, New qty: {final_quantity}, Realized P&L: ₹{realized_pnl}")
 
-        except Exception as e:
-            db_session.rollback()
-            logger.error(f"Error updating position for order {order.orderid}: {e}")
-            raise
+        return position
 
     def _calculate_realized_pnl(self, old_quantity, avg_price, close_quantity, close_price):
         """Calculate realized P&L for closed positions"""
@@ -467,10 +463,7 @@ class ExecutionEngine:
 
     def _generate_trade_id(self):
         """Generate unique trade ID"""
-        now = datetime.now(pytz.timezone('Asia/Kolkata'))
-        timestamp = now.strftime('%Y%m%d-%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        return f"TRADE-{timestamp}-{unique_id}"
+        return next_trade_id()
 
 
 def run_execution_engine_once():
@@ -11,10 +11,15 @@ Manages the execution engine as a daemon thread that:
 import threading
 import time
 from utils.logging import get_logger
+from utils.metrics import counter, histogram
 from database.sandbox_db import get_config
 
 logger = get_logger(__name__)
 
+LOOP_SECONDS = histogram('openalgo_sandbox_engine_loop_seconds', 'Duration of one sandbox execution engine pass',
+                         buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+LOOP_ERRORS = counter('openalgo_sandbox_engine_loop_errors_total', 'Sandbox execution engine passes that raised')
+
 # Global thread instance
 _execution_thread = None
 _thread_lock = threading.Lock()
@@ -32,15 +37,35 @@ class ExecutionEngineThread(threading.Thread):
     def run(self):
         """Main thread loop"""
         from sandbox.execution_engine import ExecutionEngine
+        from sandbox.tick_engine import TICK_ENGINE_ENABLED, get_tick_engine
 
         logger.info("Sandbox Execution Engine thread started")
         engine = ExecutionEngine()
 
+        # Orders on symbols with a live feed are matched tick by tick; this
+        # loop reconciles the books now and then and REST-polls the remaining symbols
+        tick_engine = None
+        if TICK_ENGINE_ENABLED:
+            try:
+                tick_engine = get_tick_engine()
+                tick_engine.start()
+            except Exception as e:
+                logger.error(f"Sandbox tick engine unavailable, using REST polling only: {e}")
+                tick_engine = None
+
         while not self.stop_event.is_set():
+            start = time.perf_counter()
             try:
-                engine.check_and_execute_pending_orders()
+                skip_symbols = None
+                if tick_engine is not None:
+                    tick_engine.sync_if_due()
+                    tick_engine.ensure_feed_subscriptions()
+                    skip_symbols = tick_engine.live_symbols()
+                engine.check_and_execute_pending_orders(skip_symbols=skip_symbols)
             except Exception as e:
+                LOOP_ERRORS.inc()
                 logger.error(f"Error in execution engine thread: {e}")
+            LOOP_SECONDS.observe(time.perf_counter() - start)
 
             # Sleep in small increments to allow quick shutdown
             for _ in range(self.check_interval):
@@ -48,6 +73,8 @@ class ExecutionEngineThread(threading.Thread):
                     break
                 time.sleep(1)
 
+        if tick_engine is not None:
+            tick_engine.stop()
         logger.info("Sandbox Execution Engine thread stopped")
 
     def stop(self):
@@ -115,8 +142,11 @@ def is_execution_engine_running():
 
 def get_execution_engine_status():
     """Get status information about the execution engine"""
+    from sandbox.tick_engine import get_tick_engine_status
+
     return {
         'running': is_execution_engine_running(),
         'thread_name': _execution_thread.name if _execution_thread else None,
-        'check_interval': int(get_config('order_check_interval', '5'))
+        'check_interval': int(get_config('order_check_interval', '5')),
+        'tick_engine': get_tick_engine_status()
     }
@@ -18,7 +18,8 @@ Auto-Reset:
 import os
 import sys
 from decimal import Decimal
-from datetime import datetime, timedelta
+
+import numpy as np
 import pytz
 
 # Add parent directory to path
@@ -28,6 +29,8 @@ from database.sandbox_db import (
     SandboxFunds, SandboxPositions, SandboxHoldings,
     db_session, get_config
 )
+from sandbox import account_state, clock
+from sandbox.margin_profiles import get_margin_profiles, get_profile
 from utils.logging import get_logger
 
 logger = get_logger(__name__)
@@ -47,9 +50,18 @@ def is_future(symbol, exchange):
     return False
 
 
+def get_lot_size(symbol, exchange):
+    """Lot size of an instrument, None if it is not in the master contract"""
+    profile = get_profile(symbol, exchange)
+    return profile.lot_size if profile else None
+
+
 class FundManager:
     """Manages virtual funds for sandbox mode"""
 
+    # Weekly auto-reset; historical replays switch it off unless asked for
+    auto_reset = True
+
     def __init__(self, user_id):
         self.user_id = user_id
         self.starting_capital = Decimal(get_config('starting_capital', '10000000.00'))
@@ -70,11 +82,12 @@ class FundManager:
                     realized_pnl=Decimal('0.00'),
                     unrealized_pnl=Decimal('0.00'),
                     total_pnl=Decimal('0.00'),
-                    last_reset_date=datetime.now(pytz.timezone('Asia/Kolkata')),
+                    last_reset_date=clock.now(),
                     reset_count=0
                 )
                 db_session.add(funds)
                 db_session.commit()
+                account_state.invalidate([self.user_id])
                 logger.info(f"Initialized funds for user {self.user_id} with ₹{self.starting_capital}")
                 return True, "Funds initialized successfully"
             else:
@@ -89,6 +102,7 @@ class FundManager:
     def get_funds(self):
         """Get current fund status for user"""
         try:
+            account_state.sync()
             funds = SandboxFunds.query.filter_by(user_id=self.user_id).first()
 
             if not funds:
@@ -121,9 +135,11 @@ class FundManager:
 
     def _check_and_reset_funds(self, funds):
         """Check if funds need to be reset (every Sunday at midnight IST)"""
+        if not FundManager.auto_reset:
+            return
         try:
             ist = pytz.timezone('Asia/Kolkata')
-            now = datetime.now(ist)
+            now = clock.now()
             last_reset = funds.last_reset_date
 
             # Make last_reset timezone aware if it isn't
@@ -154,6 +170,7 @@ class FundManager:
         """Reset funds to starting capital"""
         try:
             logger.info(f"Resetting funds for user {self.user_id}")
+            account_state.sync()
 
             # Reset all fund values
             funds.total_capital = self.starting_capital
@@ -162,7 +179,7 @@ class FundManager:
             funds.realized_pnl = Decimal('0.00')
             funds.unrealized_pnl = Decimal('0.00')
             funds.total_pnl = Decimal('0.00')
-            funds.last_reset_date = datetime.now(pytz.timezone('Asia/Kolkata'))
+            funds.last_reset_date = clock.now()
             funds.reset_count += 1
 
             db_session.commit()
@@ -171,6 +188,7 @@ class FundManager:
             SandboxPositions.query.filter_by(user_id=self.user_id).delete()
             SandboxHoldings.query.filter_by(user_id=self.user_id).delete()
             db_session.commit()
+            account_state.invalidate([self.user_id])
 
             logger.info(f"Funds reset successfully for user {self.user_id} (Reset #{funds.reset_count})")
 
@@ -181,18 +199,24 @@ class FundManager:
     def check_margin_available(self, required_margin):
         """Check if user has sufficient margin available"""
         try:
-            funds = SandboxFunds.query.filter_by(user_id=self.user_id).first()
+            state = account_state.get_engine()
+            if state is not None:
+                funds = state.funds(self.user_id)
+                available_balance = funds['available_balance'] if funds else None
+            else:
+                funds = SandboxFunds.query.filter_by(user_id=self.user_id).first()
+                available_balance = funds.available_balance if funds else None
 
             if not funds:
                 return False, "Funds not initialized"
 
             required_margin = Decimal(str(required_margin))
 
-            if funds.available_balance >= required_margin:
+            if available_balance >= required_margin:
                 return True, "Sufficient margin available"
             else:
-                shortage = required_margin - funds.available_balance
-                return False, f"Insufficient funds. Required: ₹{required_margin}, Available: ₹{funds.available_balance}, Shortage: ₹{shortage}"
+                shortage = required_margin - available_balance
+                return False, f"Insufficient funds. Required: ₹{required_margin}, Available: ₹{available_balance}, Shortage: ₹{shortage}"
 
         except Exception as e:
             logger.error(f"Error checking margin for user {self.user_id}: {e}")
@@ -201,6 +225,18 @@ class FundManager:
     def block_margin(self, amount, description=""):
         """Block margin for a trade"""
         try:
+            state = account_state.get_engine()
+            if state is not None:
+                amount = Decimal(str(amount))
+                applied, funds = state.adjust_funds(self.user_id, available=-amount, used=amount,
+                                                    require_available=amount)
+                if funds is None:
+                    return False, "Funds not initialized"
+                if not applied:
+                    return False, f"Insufficient funds. Required: ₹{amount}, Available: ₹{funds['available_balance']}"
+                logger.info(f"Blocked ₹{amount} margin for user {self.user_id}. {description}")
+                return True, f"Margin blocked: ₹{amount}"
+
             funds = SandboxFunds.query.filter_by(user_id=self.user_id).first()
 
             if not funds:
@@ -228,6 +264,17 @@ class FundManager:
     def release_margin(self, amount, realized_pnl=0, description=""):
         """Release blocked margin and update P&L"""
         try:
+            state = account_state.get_engine()
+            if state is not None:
+                amount = Decimal(str(amount))
+                realized_pnl = Decimal(str(realized_pnl))
+                applied, _ = state.adjust_funds(self.user_id, available=amount + realized_pnl, used=-amount,
+                                                realized=realized_pnl)
+                if not applied:
+                    return False, "Funds not initialized"
+                logger.info(f"Released ₹{amount} margin for user {self.user_id}. Realized P&L: ₹{realized_pnl}. {description}")
+                return True, f"Margin released: ₹{amount}, P&L: ₹{realized_pnl}"
+
             funds = SandboxFunds.query.filter_by(user_id=self.user_id).first()
 
             if not funds:
@@ -262,6 +309,14 @@ class FundManager:
         (the money is now represented in holdings value, not available cash)
         """
         try:
+            state = account_state.get_engine()
+            if state is not None:
+                amount = Decimal(str(amount))
+                if not state.adjust_funds(self.user_id, used=-amount)[0]:
+                    return False, "Funds not initialized"
+                logger.info(f"Transferred ₹{amount} margin to holdings for user {self.user_id}. {description}")
+                return True, f"Margin transferred to holdings: ₹{amount}"
+
             funds = SandboxFunds.query.filter_by(user_id=self.user_id).first()
 
             if not funds:
@@ -289,6 +344,14 @@ class FundManager:
         Increases available_balance when holdings are sold
         """
         try:
+            state = account_state.get_engine()
+            if state is not None:
+                amount = Decimal(str(amount))
+                if not state.adjust_funds(self.user_id, available=amount)[0]:
+                    return False, "Funds not initialized"
+                logger.info(f"Credited ₹{amount} sale proceeds for user {self.user_id}. {description}")
+                return True, f"Sale proceeds credited: ₹{amount}"
+
             funds = SandboxFunds.query.filter_by(user_id=self.user_id).first()
 
             if not funds:
@@ -334,15 +397,12 @@ class FundManager:
     def calculate_margin_required(self, symbol, exchange, product, quantity, price, action=None):
         """Calculate margin required for a trade based on leverage rules"""
         try:
-            from database.symbol import SymToken
-
             quantity = abs(int(quantity))
             price = Decimal(str(price))
 
-            # Get symbol info to determine instrument type
-            symbol_obj = SymToken.query.filter_by(symbol=symbol, exchange=exchange).first()
-
-            if not symbol_obj:
+            # Instrument class and leverage come from its precomputed profile
+            profile = get_profile(symbol, exchange)
+            if profile is None:
                 logger.error(f"Symbol {symbol} not found on {exchange}")
                 return None, "Symbol not found"
 
@@ -350,10 +410,7 @@ class FundManager:
             trade_value = quantity * price
 
             # Determine leverage based on action, product and symbol type
-            leverage = self._get_leverage(exchange, product, symbol, action)
-
-            if leverage is None:
-                return None, "Unable to determine leverage"
+            leverage = profile.leverage_for(product, action)
 
             # Calculate margin (always use leverage-based calculation)
             margin = trade_value / Decimal(str(leverage))
@@ -366,32 +423,34 @@ class FundManager:
             logger.error(f"Error calculating margin: {e}")
             return None, f"Error calculating margin: {str(e)}"
 
+    def calculate_margin_bulk(self, orders):
+        """
+        Margin for many orders in one pass (basket legs, split children)
+
+        Args:
+            orders: list of dicts with symbol, exchange, product, action,
+                quantity and price (the price margin is calculated at)
+
+        Returns:
+            numpy array of margins, NaN where the instrument is not found
+        """
+        profiles = get_margin_profiles().get_many({(o['symbol'], o['exchange']) for o in orders})
+        quantity = np.empty(len(orders))
+        price = np.empty(len(orders))
+        leverage = np.empty(len(orders))
+        for i, order in enumerate(orders):
+            profile = profiles.get((order['symbol'], order['exchange']))
+            quantity[i] = abs(int(order['quantity']))
+            price[i] = float(order['price'])
+            leverage[i] = float(profile.leverage_for(order['product'], order['action'])) if profile else np.nan
+        return quantity * price / leverage
+
     def _get_leverage(self, exchange, product, symbol, action=None):
         """Get leverage multiplier based on exchange, product, symbol type, and action"""
         try:
-            # Equity exchanges
-            if exchange in ['NSE', 'BSE']:
-                if product == 'MIS':
-                    return Decimal(get_config('equity_mis_leverage', '5'))
-                elif product == 'CNC':
-                    return Decimal(get_config('equity_cnc_leverage', '1'))
-                else:  # NRML
-                    return Decimal(get_config('equity_cnc_leverage', '1'))
-
-            # Futures (NFO, BFO, MCX, CDS, BCD, NCDEX exchanges with FUT suffix)
-            elif is_future(symbol, exchange):
-                return Decimal(get_config('futures_leverage', '10'))
-
-            # Options (NFO, BFO, MCX, CDS, BCD, NCDEX exchanges with CE/PE suffix)
-            elif is_option(symbol, exchange):
-                # Options use different leverage based on BUY vs SELL
-                if action == 'BUY':
-                    return Decimal(get_config('option_buy_leverage', '1'))
-                else:  # SELL
-                    return Decimal(get_config('option_sell_leverage', '1'))
-
-            # Default to 1x leverage
-            return Decimal('1')
+            # Equity: MIS or CNC/NRML leverage; futures: futures leverage;
+            # options: BUY or SELL leverage; anything else 1x
+            return get_margin_profiles().leverage(symbol, exchange, product, action)
 
         except Exception as e:
             logger.error(f"Error getting leverage: {e}")
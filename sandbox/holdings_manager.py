@@ -12,21 +12,27 @@ Features:
 
 import os
 import sys
+from collections import defaultdict
 from decimal import Decimal
 from datetime import datetime, date
-import pytz
+
+from sqlalchemy import bindparam, delete, insert, update
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.sandbox_db import (
-    SandboxPositions, SandboxHoldings, db_session
+    SandboxPositions, SandboxHoldings, SandboxFunds, db_session
 )
-from services.quotes_service import get_quotes
+from sandbox import account_state, clock
+from sandbox.quote_provider import fetch_quote, fetch_quotes
 from utils.logging import get_logger
 
 logger = get_logger(__name__)
 
+# Rows per IN (...) list in bulk deletes
+_BULK_CHUNK = 500
+
 
 class HoldingsManager:
     """Manages holdings and T+1 settlement"""
@@ -112,114 +118,7 @@ class HoldingsManager:
         Should be called daily after market close
         """
         try:
-            ist = pytz.timezone('Asia/Kolkata')
-            today = datetime.now(ist).date()
-            settlement_cutoff = datetime.combine(today, datetime.min.time())
-
-            # Get all CNC positions from yesterday or earlier
-            cnc_positions = SandboxPositions.query.filter_by(
-                user_id=self.user_id,
-                product='CNC'
-            ).filter(
-                SandboxPositions.created_at < settlement_cutoff
-            ).all()
-
-            if not cnc_positions:
-                logger.debug(f"No CNC positions to settle for user {self.user_id}")
-                return True, "No positions to settle"
-
-            settled_count = 0
-
-            for position in cnc_positions:
-                # Skip positions with zero quantity (already squared off)
-                if position.quantity == 0:
-                    db_session.delete(position)
-                    logger.debug(f"Deleted zero-quantity position: {position.symbol} {position.exchange}")
-                    continue
-
-                # Initialize fund manager for margin operations
-                from sandbox.fund_manager import FundManager
-                fund_manager = FundManager(self.user_id)
-
-                # Check if holding already exists
-                holding = SandboxHoldings.query.filter_by(
-                    user_id=self.user_id,
-                    symbol=position.symbol,
-                    exchange=position.exchange
-                ).first()
-
-                if holding:
-                    # Update existing holding
-                    old_holding_qty = holding.quantity
-
-                    if position.quantity > 0:
-                        # Adding to holding (BUY)
-                        # Calculate new average price
-                        total_value = (abs(holding.quantity) * holding.average_price) + \
-                                      (abs(position.quantity) * position.average_price)
-                        total_quantity = abs(holding.quantity) + abs(position.quantity)
-
-                        holding.quantity += position.quantity
-                        holding.average_price = total_value / total_quantity if total_quantity > 0 else holding.average_price
-
-                        # Transfer margin from used_margin to holdings (don't credit available_balance)
-                        margin_amount = abs(position.quantity) * position.average_price
-                        fund_manager.transfer_margin_to_holdings(
-                            margin_amount,
-                            f"T+1 settlement: {position.symbol} BUY → Holdings"
-                        )
-                        logger.info(f"Added to holding: {position.symbol}, Qty: {holding.quantity}, Margin transferred: ₹{margin_amount}")
-
-                    else:
-                        # Reducing holding (SELL)
-                        holding.quantity += position.quantity
-
-                        # Credit sale proceeds to available balance
-                        sale_proceeds = abs(position.quantity) * position.average_price
-                        fund_manager.credit_sale_proceeds(
-                            sale_proceeds,
-                            f"T+1 settlement: {position.symbol} SELL from Holdings"
-                        )
-                        logger.info(f"Reduced holding: {position.symbol}, Qty: {holding.quantity}, Sale proceeds: ₹{sale_proceeds}")
-
-                    holding.ltp = position.ltp
-                    holding.updated_at = datetime.now(ist)
-
-                    # If holding quantity becomes 0 after update, delete the holding
-                    if holding.quantity == 0:
-                        db_session.delete(holding)
-                        logger.info(f"Deleted zero-quantity holding: {position.symbol}")
-
-                else:
-                    # Create new holding (BUY position becoming holding)
-                    holding = SandboxHoldings(
-                        user_id=self.user_id,
-                        symbol=position.symbol,
-                        exchange=position.exchange,
-                        quantity=position.quantity,
-                        average_price=position.average_price,
-                        ltp=position.ltp or position.average_price,
-                        pnl=Decimal('0.00'),
-                        pnl_percent=Decimal('0.00'),
-                        settlement_date=today,
-                        created_at=datetime.now(ist)
-                    )
-                    db_session.add(holding)
-
-                    # Transfer margin from used_margin to holdings (don't credit available_balance)
-                    margin_amount = abs(position.quantity) * position.average_price
-                    fund_manager.transfer_margin_to_holdings(
-                        margin_amount,
-                        f"T+1 settlement: {position.symbol} → Holdings"
-                    )
-                    logger.info(f"Created new holding: {position.symbol}, Qty: {position.quantity}, Margin transferred: ₹{margin_amount}")
-
-                # Delete the position after settling
-                db_session.delete(position)
-                settled_count += 1
-
-            db_session.commit()
-
+            settled_count = settle_cnc_positions(self.user_id)
             logger.info(f"Settled {settled_count} CNC positions for user {self.user_id}")
             return True, f"Settled {settled_count} positions"
 
@@ -239,12 +138,8 @@ class HoldingsManager:
             for holding in holdings:
                 symbols_to_fetch.add((holding.symbol, holding.exchange))
 
-            # Fetch quotes for all symbols
-            quote_cache = {}
-            for symbol, exchange in symbols_to_fetch:
-                quote = self._fetch_quote(symbol, exchange)
-                if quote:
-                    quote_cache[(symbol, exchange)] = quote
+            # Fetch quotes for all symbols in one request
+            quote_cache = fetch_quotes(symbols_to_fetch)
 
             # Update MTM for each holding
             for holding in holdings:
@@ -303,65 +198,132 @@ class HoldingsManager:
             return Decimal('0.00')
 
     def _fetch_quote(self, symbol, exchange):
-        """Fetch real-time quote for a symbol using API key"""
-        try:
-            # Get any user's API key for fetching quotes
-            from database.auth_db import ApiKeys, decrypt_token
-            api_key_obj = ApiKeys.query.first()
-
-            if not api_key_obj:
-                logger.warning("No API keys found for fetching quotes")
-                return None
-
-            # Decrypt the API key
-            api_key = decrypt_token(api_key_obj.api_key_encrypted)
-
-            # Use quotes service with API key authentication
-            success, response, status_code = get_quotes(
-                symbol=symbol,
-                exchange=exchange,
-                api_key=api_key
-            )
-
-            if success and 'data' in response:
-                return response['data']
-            else:
-                return None
-
-        except Exception as e:
-            logger.error(f"Error fetching quote for {symbol}: {e}")
-            return None
+        """Fetch real-time quote for a symbol from the shared sandbox quote provider"""
+        return fetch_quote(symbol, exchange)
+
+def settle_cnc_positions(user_id=None):
+    """
+    T+1 settlement of CNC positions opened before today, for one user or all
+
+    The positions, the holdings they merge into and the fund rows they move
+    money between are each read with one query; the results are written back
+    with bulk statements and committed together.
+
+    Returns:
+        int: number of positions moved to holdings
+    """
+    now = clock.now()
+    today = now.date()
+    settlement_cutoff = datetime.combine(today, datetime.min.time())
+
+    query = db_session.query(
+        SandboxPositions.id, SandboxPositions.user_id, SandboxPositions.symbol, SandboxPositions.exchange,
+        SandboxPositions.quantity, SandboxPositions.average_price, SandboxPositions.ltp
+    ).filter(SandboxPositions.product == 'CNC', SandboxPositions.created_at < settlement_cutoff)
+    if user_id is not None:
+        query = query.filter(SandboxPositions.user_id == user_id)
+    positions = query.all()
+
+    if not positions:
+        logger.debug("No CNC positions to settle")
+        return 0
+
+    users = {p.user_id for p in positions}
+    holdings = {
+        (h.user_id, h.symbol, h.exchange): {'id': h.id, 'quantity': h.quantity, 'average_price': h.average_price}
+        for h in db_session.query(SandboxHoldings.id, SandboxHoldings.user_id, SandboxHoldings.symbol,
+                                  SandboxHoldings.exchange, SandboxHoldings.quantity, SandboxHoldings.average_price)
+        .filter(SandboxHoldings.user_id.in_(users))
+    }
+
+    new_holdings = []
+    changed_holdings = {}
+    margin_to_holdings = defaultdict(Decimal)  # user_id -> used margin moved into holdings
+    sale_proceeds = defaultdict(Decimal)  # user_id -> cash credited for CNC sells
+
+    for position in positions:
+        # Zero-quantity positions (already squared off) are just removed
+        if position.quantity == 0:
+            continue
+
+        amount = abs(position.quantity) * position.average_price
+        holding = holdings.get((position.user_id, position.symbol, position.exchange))
+
+        if holding is None:
+            # BUY position becoming a new holding
+            new_holdings.append({
+                'user_id': position.user_id,
+                'symbol': position.symbol,
+                'exchange': position.exchange,
+                'quantity': position.quantity,
+                'average_price': position.average_price,
+                'ltp': position.ltp or position.average_price,
+                'pnl': Decimal('0.00'),
+                'pnl_percent': Decimal('0.00'),
+                'settlement_date': today,
+                'created_at': now,
+            })
+            margin_to_holdings[position.user_id] += amount
+            continue
+
+        if position.quantity > 0:
+            # Adding to holding (BUY)
+            total_quantity = abs(holding['quantity']) + abs(position.quantity)
+            if total_quantity > 0:
+                holding['average_price'] = (abs(holding['quantity']) * holding['average_price'] + amount) / total_quantity
+            margin_to_holdings[position.user_id] += amount
+        else:
+            # Reducing holding (SELL)
+            sale_proceeds[position.user_id] += amount
+
+        holding['quantity'] += position.quantity
+        holding['ltp'] = position.ltp
+        holding['updated_at'] = now
+        changed_holdings[holding['id']] = holding
+
+    position_ids = [p.id for p in positions]
+    emptied = [h['id'] for h in changed_holdings.values() if h['quantity'] == 0]
+    updated = [h for h in changed_holdings.values() if h['quantity'] != 0]
+
+    for i in range(0, len(position_ids), _BULK_CHUNK):
+        db_session.execute(delete(SandboxPositions).where(SandboxPositions.id.in_(position_ids[i:i + _BULK_CHUNK])))
+    if emptied:
+        db_session.execute(delete(SandboxHoldings).where(SandboxHoldings.id.in_(emptied)))
+    if updated:
+        db_session.execute(update(SandboxHoldings), updated)
+    if new_holdings:
+        db_session.execute(insert(SandboxHoldings), new_holdings)
+
+    # used_margin moves into holdings value; sell proceeds become available cash
+    fund_changes = [
+        {'uid': uid, 'margin': margin_to_holdings.get(uid, Decimal('0')), 'proceeds': sale_proceeds.get(uid, Decimal('0'))}
+        for uid in set(margin_to_holdings) | set(sale_proceeds)
+    ]
+    if fund_changes:
+        funds = SandboxFunds.__table__
+        db_session.execute(
+            funds.update().where(funds.c.user_id == bindparam('uid')).values(
+                used_margin=funds.c.used_margin - bindparam('margin'),
+                available_balance=funds.c.available_balance + bindparam('proceeds'),
+            ),
+            fund_changes,
+        )
+
+    db_session.commit()
+    account_state.invalidate(users)
+
+    settled_count = len(new_holdings) + len(changed_holdings)
+    logger.info(f"T+1 settlement moved {settled_count} CNC positions to holdings for {len(users)} users")
+    return settled_count
 
 
 def process_all_t1_settlements():
     """Process T+1 settlement for all users"""
     try:
-        # Get all unique users with CNC positions
-        ist = pytz.timezone('Asia/Kolkata')
-        today = datetime.now(ist).date()
-        settlement_cutoff = datetime.combine(today, datetime.min.time())
-
-        positions = SandboxPositions.query.filter_by(product='CNC').filter(
-            SandboxPositions.created_at < settlement_cutoff
-        ).all()
-
-        if not positions:
-            logger.info("No CNC positions to settle")
-            return
-
-        users = set(p.user_id for p in positions)
-        logger.info(f"Processing T+1 settlement for {len(users)} users")
-
-        settled_users = 0
-        for user_id in users:
-            hm = HoldingsManager(user_id)
-            success, message = hm.process_t1_settlement()
-            if success:
-                settled_users += 1
-
-        logger.info(f"T+1 settlement completed for {settled_users} users")
+        settle_cnc_positions()
 
     except Exception as e:
+        db_session.rollback()
         logger.error(f"Error processing all T+1 settlements: {e}")
 
 
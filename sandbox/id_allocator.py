@@ -0,0 +1,137 @@
+# sandbox/id_allocator.py
+"""
+Per-day sequence allocator for sandbox order and trade IDs
+
+Each (scope, day) pair has a counter row in ``sandbox_sequences``. A process
+reserves a block of numbers with one ``UPDATE ... RETURNING`` and hands them
+out from memory under a lock, so generating an ID is O(1) and concurrent
+placements (basket legs, split children) never share a number. Numbers left
+in a block when the process exits are skipped, not reused.
+"""
+
+import os
+import threading
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database.sandbox_db import SandboxOrders, SandboxSequences, engine
+from sandbox import clock
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Numbers reserved per database round trip
+BLOCK_SIZE = int(os.getenv('SANDBOX_ID_BLOCK_SIZE', '20'))
+
+_table = SandboxSequences.__table__
+
+
+class SequenceAllocator:
+    """Hands out increasing numbers per (scope, day) from reserved blocks"""
+
+    def __init__(self, block_size=None):
+        self.block_size = max(1, block_size or BLOCK_SIZE)
+        self._blocks = {}  # (scope, day) -> [next, last]
+        self._seeds = {}
+        self._lock = threading.Lock()
+
+    def register_seed(self, scope, seed):
+        """
+        ``seed(conn, day)`` returns the highest number already used for a day
+        that has no counter row yet (e.g. IDs written before the counter
+        table existed)
+        """
+        self._seeds[scope] = seed
+
+    def next(self, scope, day):
+        return self.take(scope, day, 1)[0]
+
+    def take(self, scope, day, count):
+        """``count`` numbers for a batch, reserving whatever the current block lacks in one round trip"""
+        key = (scope, day)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None or block[1] - block[0] + 1 < count:
+                values = list(range(block[0], block[1] + 1)) if block else []
+                needed = max(self.block_size, count - len(values))
+                last = self._reserve(scope, day, needed)
+                values += range(last - needed + 1, last + 1)
+                self._blocks = {k: v for k, v in self._blocks.items() if k[1] == day}
+                self._blocks[key] = [last - (len(values) - count) + 1, last]
+                return values[:count]
+            start = block[0]
+            block[0] += count
+            return list(range(start, start + count))
+
+    def reset(self):
+        """Forget reserved blocks (the next call reserves a fresh one)"""
+        with self._lock:
+            self._blocks.clear()
+
+    def _reserve(self, scope, day, count):
+        """Atomically add ``count`` to the counter and return its new value"""
+        for _ in range(3):
+            try:
+                with engine.begin() as conn:
+                    value = self._increment(conn, scope, day, count)
+                    if value is None:
+                        seed = self._seeds.get(scope)
+                        value = (seed(conn, day) if seed else 0) + count
+                        conn.execute(insert(_table).values(scope=scope, day=day, value=value))
+                    return value
+            except IntegrityError:
+                # Another process created the row first; increment that one
+                logger.debug(f"Sequence row {scope}/{day} created concurrently, retrying")
+        raise RuntimeError(f"Could not reserve sequence numbers for {scope}/{day}")
+
+    @staticmethod
+    def _increment(conn, scope, day, count):
+        stmt = (update(_table)
+                .where(_table.c.scope == scope, _table.c.day == day)
+                .values(value=_table.c.value + count))
+        if conn.dialect.update_returning:
+            return conn.execute(stmt.returning(_table.c.value)).scalar()
+        # The UPDATE holds the row (SQLite: database) write lock until commit,
+        # so reading it back in the same transaction is still atomic
+        if conn.execute(stmt).rowcount == 0:
+            return None
+        return conn.execute(select(_table.c.value)
+                            .where(_table.c.scope == scope, _table.c.day == day)).scalar()
+
+
+def _seed_order_ids(conn, day):
+    """Highest sequence among order IDs already issued for ``day``"""
+    prefix = day[2:]
+    last = conn.execute(select(func.max(SandboxOrders.orderid))
+                        .where(SandboxOrders.orderid.like(f"{prefix}%"),
+                               func.length(SandboxOrders.orderid) == len(prefix) + 8)).scalar()
+    return int(last[len(prefix):]) if last and last[len(prefix):].isdigit() else 0
+
+
+_allocator = SequenceAllocator()
+_allocator.register_seed('order', _seed_order_ids)
+
+
+def get_allocator():
+    return _allocator
+
+
+def next_order_ids(count):
+    """Order IDs as YYMMDD + 8-digit sequence, e.g. 25100100000001"""
+    now = clock.now()
+    return [f"{now:%y%m%d}{value:08d}" for value in _allocator.take('order', f'{now:%Y%m%d}', count)]
+
+
+def next_trade_ids(count):
+    """Trade IDs as TRADE-YYYYMMDD-8-digit sequence"""
+    day = f"{clock.now():%Y%m%d}"
+    return [f"TRADE-{day}-{value:08d}" for value in _allocator.take('trade', day, count)]
+
+
+def next_order_id():
+    return next_order_ids(1)[0]
+
+
+def next_trade_id():
+    return next_trade_ids(1)[0]
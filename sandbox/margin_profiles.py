@@ -0,0 +1,180 @@
+# sandbox/margin_profiles.py
+"""
+Per-instrument margin profiles for the sandbox
+
+A profile carries what a margin calculation needs for one instrument: lot
+size, instrument class (equity, future, option, other) and the leverage per
+product and side resolved from the sandbox config. Profiles are built in
+one pass when the broker symbol cache loads (see
+database/master_contract_cache_hook.py); instruments looked up before that
+are loaded from the master contract on first use. The leverage tables are
+rebuilt, and every profile re-pointed at them, when the sandbox config
+changes.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from database.sandbox_db import CONFIG_CACHE_TTL, config_version, get_config
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+EQUITY_EXCHANGES = ('NSE', 'BSE')
+DERIVATIVE_EXCHANGES = ('NFO', 'BFO', 'MCX', 'CDS', 'BCD', 'NCDEX')
+
+_ONE = Decimal('1')
+
+
+def instrument_class(symbol, exchange):
+    """equity, future, option or other - the rules of is_future/is_option"""
+    if exchange in EQUITY_EXCHANGES:
+        return 'equity'
+    if exchange in DERIVATIVE_EXCHANGES:
+        if symbol.endswith('FUT'):
+            return 'future'
+        if symbol.endswith('CE') or symbol.endswith('PE'):
+            return 'option'
+    return 'other'
+
+
+def _leverage_tables():
+    """instrument class -> {product or None (any): (BUY leverage, SELL leverage)}"""
+    mis = Decimal(get_config('equity_mis_leverage', '5'))
+    cnc = Decimal(get_config('equity_cnc_leverage', '1'))
+    futures = Decimal(get_config('futures_leverage', '10'))
+    option_buy = Decimal(get_config('option_buy_leverage', '1'))
+    option_sell = Decimal(get_config('option_sell_leverage', '1'))
+    return {
+        'equity': {'MIS': (mis, mis), None: (cnc, cnc)},
+        'future': {None: (futures, futures)},
+        'option': {None: (option_buy, option_sell)},
+        'other': {None: (_ONE, _ONE)},
+    }
+
+
+class MarginProfile(namedtuple('MarginProfile', 'symbol exchange lot_size instrument leverage')):
+    """Margin inputs for one instrument; ``leverage`` is shared by its instrument class"""
+
+    __slots__ = ()
+
+    @property
+    def is_future(self):
+        return self.instrument == 'future'
+
+    @property
+    def is_option(self):
+        return self.instrument == 'option'
+
+    def leverage_for(self, product, action):
+        buy, sell = self.leverage.get(product) or self.leverage[None]
+        # anything but BUY is priced as a sell, as _get_leverage always did
+        return buy if action == 'BUY' else sell
+
+    def margin(self, quantity, price, product, action):
+        return abs(int(quantity)) * Decimal(str(price)) / self.leverage_for(product, action)
+
+
+class MarginProfiles:
+    """(symbol, exchange) -> MarginProfile, kept in step with the sandbox config"""
+
+    def __init__(self):
+        self._profiles = {}
+        self._tables = None
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def tables(self):
+        """Current leverage tables; rebuilt on set_config or after CONFIG_CACHE_TTL"""
+        if (self._tables is None or self._version != config_version()
+                or time.monotonic() - self._checked >= CONFIG_CACHE_TTL):
+            with self._lock:
+                version = config_version()
+                tables = _leverage_tables()
+                if tables != self._tables:
+                    self._profiles = {key: profile._replace(leverage=tables[profile.instrument])
+                                      for key, profile in self._profiles.items()}
+                    self._tables = tables
+                    logger.debug(f"Sandbox leverage tables rebuilt for {len(self._profiles)} instruments")
+                self._version = version
+                self._checked = time.monotonic()
+        return self._tables
+
+    def load(self, rows):
+        """Replace all profiles from (symbol, exchange, lotsize) rows"""
+        tables = self.tables()
+        profiles = {}
+        for symbol, exchange, lot_size in rows:
+            instrument = instrument_class(symbol, exchange)
+            profiles[(symbol, exchange)] = MarginProfile(symbol, exchange, lot_size or 1, instrument,
+                                                         tables[instrument])
+        with self._lock:
+            self._profiles = profiles
+        return len(profiles)
+
+    def add(self, symbol, exchange, lot_size):
+        instrument = instrument_class(symbol, exchange)
+        profile = MarginProfile(symbol, exchange, lot_size or 1, instrument, self.tables()[instrument])
+        self._profiles[(symbol, exchange)] = profile
+        return profile
+
+    def get(self, symbol, exchange):
+        """Profile of an instrument, None if it is not in the master contract"""
+        return self.get_many([(symbol, exchange)]).get((symbol, exchange))
+
+    def get_many(self, pairs):
+        """Profiles for many (symbol, exchange) pairs; misses are loaded in one query"""
+        tables = self.tables()
+        profiles = self._profiles
+        found = {}
+        missing = set()
+        for key in pairs:
+            profile = profiles.get(key)
+            if profile is not None:
+                found[key] = profile
+            else:
+                missing.add(key)
+        if missing:
+            from database.symbol import SymToken
+
+            # misses are not remembered, so a later master contract download is picked up
+            rows = (SymToken.query.with_entities(SymToken.symbol, SymToken.exchange, SymToken.lotsize)
+                    .filter(SymToken.symbol.in_({symbol for symbol, _ in missing})).all())
+            for symbol, exchange, lot_size in rows:
+                if (symbol, exchange) in missing:
+                    instrument = instrument_class(symbol, exchange)
+                    profile = MarginProfile(symbol, exchange, lot_size or 1, instrument, tables[instrument])
+                    self._profiles[(symbol, exchange)] = found[(symbol, exchange)] = profile
+        return found
+
+    def leverage(self, symbol, exchange, product, action):
+        """Leverage by instrument class alone (no master contract lookup)"""
+        table = self.tables()[instrument_class(symbol, exchange)]
+        buy, sell = table.get(product) or table[None]
+        return buy if action == 'BUY' else sell
+
+    def __len__(self):
+        return len(self._profiles)
+
+
+_profiles = MarginProfiles()
+
+
+def get_margin_profiles():
+    return _profiles
+
+
+def get_profile(symbol, exchange):
+    return _profiles.get(symbol, exchange)
+
+
+def load_from_symbol_cache(cache):
+    """Build every profile from a loaded BrokerSymbolCache"""
+    start = time.perf_counter()
+    count = _profiles.load((data.symbol, data.exchange, data.lotsize)
+                           for data in cache.by_symbol_exchange.values())
+    logger.info(f"Built {count} sandbox margin profiles in {time.perf_counter() - start:.2f}s")
+    return count
@@ -12,10 +12,12 @@ Features:
 
 import os
 import sys
+from datetime import time as dt_time
 from decimal import Decimal
-from datetime import datetime
-import pytz
-import uuid
+
+import numpy as np
+
+from sqlalchemy import insert
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -23,7 +25,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database.sandbox_db import (
     SandboxOrders, SandboxTrades, SandboxPositions, db_session
 )
-from sandbox.fund_manager import FundManager
+from sandbox import account_state, clock
+from sandbox.fund_manager import FundManager, get_lot_size
+from sandbox.id_allocator import next_order_id
+from sandbox.tick_engine import track_order, untrack_order
 from database.symbol import SymToken
 from utils.logging import get_logger
 
@@ -44,6 +49,74 @@ def is_future(symbol, exchange):
     return False
 
 
+def requires_margin(symbol, exchange, product, action):
+    """Whether an order blocks margin (everything except CNC SELL of owned equity)"""
+    if action == 'BUY':
+        # All BUY orders require margin
+        return True
+    if is_option(symbol, exchange):
+        # Selling options requires margin
+        return True
+    if is_future(symbol, exchange):
+        # Short selling futures requires margin
+        return True
+    # Intraday/margin short selling of equity requires margin;
+    # CNC SELL doesn't need margin (selling owned shares)
+    return product in ['MIS', 'NRML']
+
+
+def mis_blocked_since(exchange, square_off_times=None):
+    """
+    Square-off time of ``exchange`` if new MIS exposure is blocked right now,
+    else None
+
+    Two scenarios are blocked: after square-off time the same day (e.g. 15:20
+    after a 15:15 square-off) and before market open at 09:00 the next day.
+    """
+    if square_off_times is None:
+        from sandbox.squareoff_manager import SquareOffManager
+        square_off_times = SquareOffManager().square_off_times
+
+    square_off_time = square_off_times.get(exchange)
+    if not square_off_time:
+        return None
+    current_time = clock.now().time()
+    if current_time >= square_off_time or current_time < dt_time(9, 0):
+        return square_off_time
+    return None
+
+
+def _is_reducing(position, action):
+    """BUY reduces a short position (negative qty), SELL reduces a long one"""
+    if not position:
+        return False
+    return (action == 'BUY' and position.quantity < 0) or (action == 'SELL' and position.quantity > 0)
+
+
+def _cnc_sell_rejection(symbol, quantity, position, holdings_quantity):
+    """Why a CNC SELL cannot be filled from the long position plus holdings, None if it can"""
+    # Calculate total available quantity
+    position_qty = position.quantity if position and position.quantity > 0 else 0
+    holdings_qty = holdings_quantity if holdings_quantity > 0 else 0
+    total_available = position_qty + holdings_qty
+
+    if total_available <= 0:
+        return f'Cannot sell {symbol} in CNC. No positions or holdings available. CNC (delivery) requires existing shares. Use MIS for intraday short selling.'
+    if quantity > total_available:
+        return f'Cannot sell {quantity} shares of {symbol} in CNC. Only {total_available} shares available (Position: {position_qty}, Holdings: {holdings_qty})'
+    logger.info(f"CNC SELL validation passed: {symbol} - Available: {total_available} (Pos: {position_qty}, Hold: {holdings_qty}), Requested: {quantity}")
+    return None
+
+
+def _row(record):
+    """Column values of an unsaved order or trade, for a Core INSERT"""
+    return {column.key: getattr(record, column.key) for column in record.__table__.columns if column.key != 'id'}
+
+
+def _mis_blocked_message(square_off_time):
+    return f'MIS orders cannot be placed after square-off time ({square_off_time.strftime("%H:%M")} IST). Trading resumes at 09:00 AM IST.'
+
+
 class OrderManager:
     """Manages virtual orders for sandbox mode"""
 
@@ -92,8 +165,8 @@ class OrderManager:
             strategy = order_data.get('strategy', '')
 
             # Get symbol info for lot size validation
-            symbol_obj = SymToken.query.filter_by(symbol=symbol, exchange=exchange).first()
-            if not symbol_obj:
+            lot_size = get_lot_size(symbol, exchange)
+            if lot_size is None:
                 return False, {
                     'status': 'error',
                     'message': f'Symbol {symbol} not found on {exchange}',
@@ -102,7 +175,6 @@ class OrderManager:
 
             # Validate lot size for F&O
             if exchange in ['NFO', 'BFO', 'CDS', 'BCD', 'MCX', 'NCDEX']:
-                lot_size = symbol_obj.lotsize or 1
                 if quantity % lot_size != 0:
                     return False, {
                         'status': 'error',
@@ -110,60 +182,20 @@ class OrderManager:
                         'mode': 'analyze'
                     }, 400
 
+            # Existing position in this symbol/product (used for the square-off
+            # exception, CNC sell checks, fallback pricing and margin netting)
+            existing_position = self._get_position(symbol, exchange, product)
+
             # Validate MIS orders - reject if after square-off time but before market open
             # Exception: Allow orders that reduce/close existing positions
             if product == 'MIS':
-                from sandbox.squareoff_manager import SquareOffManager
-                from datetime import time
-
-                som = SquareOffManager()
-                square_off_time = som.square_off_times.get(exchange)
-
-                if square_off_time:
-                    ist = pytz.timezone('Asia/Kolkata')
-                    now = datetime.now(ist)
-                    current_time = now.time()
-
-                    # Market opens at 9:00 AM IST
-                    market_open_time = time(9, 0)
-
-                    # Check if we're in the blocked period
-                    # Two scenarios:
-                    # 1. After square-off time same day: e.g., 15:20 (after 15:15 square-off)
-                    # 2. Before market open next day: e.g., 02:00 (before 09:00 market open)
-                    is_blocked = False
-                    if current_time >= square_off_time:
-                        # After square-off time - block until next day
-                        is_blocked = True
-                    elif current_time < market_open_time:
-                        # Before market open - still blocked from yesterday
-                        is_blocked = True
-
-                    if is_blocked:
-                        # Check if this order will reduce/close an existing OPEN position
-                        existing_position = SandboxPositions.query.filter_by(
-                            user_id=self.user_id,
-                            symbol=symbol,
-                            exchange=exchange,
-                            product=product
-                        ).filter(SandboxPositions.quantity != 0).first()
-
-                        # Allow if reducing existing position
-                        # BUY reduces short position (negative qty), SELL reduces long position (positive qty)
-                        is_reducing = False
-                        if existing_position:
-                            if action == 'BUY' and existing_position.quantity < 0:
-                                is_reducing = True  # Covering short
-                            elif action == 'SELL' and existing_position.quantity > 0:
-                                is_reducing = True  # Closing long
-
-                        # Block only if opening/increasing position, allow if closing/reducing
-                        if not is_reducing:
-                            return False, {
-                                'status': 'error',
-                                'message': f'MIS orders cannot be placed after square-off time ({square_off_time.strftime("%H:%M")} IST). Trading resumes at 09:00 AM IST.',
-                                'mode': 'analyze'
-                            }, 400
+                square_off_time = mis_blocked_since(exchange)
+                if square_off_time and not _is_reducing(existing_position, action):
+                    return False, {
+                        'status': 'error',
+                        'message': _mis_blocked_message(square_off_time),
+                        'mode': 'analyze'
+                    }, 400
 
             # Track validation for CNC SELL orders
             cnc_sell_rejection_reason = None
@@ -173,33 +205,11 @@ class OrderManager:
             if action == 'SELL':
                 if product == 'CNC':
                     # CNC SELL orders require existing long positions or holdings
-                    # Check existing position
-                    existing_position = SandboxPositions.query.filter_by(
-                        user_id=self.user_id,
-                        symbol=symbol,
-                        exchange=exchange,
-                        product=product
-                    ).first()
-
-                    # Check holdings (T+1 settled positions)
-                    from database.sandbox_db import SandboxHoldings
-                    existing_holdings = SandboxHoldings.query.filter_by(
-                        user_id=self.user_id,
-                        symbol=symbol,
-                        exchange=exchange
-                    ).first()
-
-                    # Calculate total available quantity
-                    position_qty = existing_position.quantity if existing_position and existing_position.quantity > 0 else 0
-                    holdings_qty = existing_holdings.quantity if existing_holdings and existing_holdings.quantity > 0 else 0
-                    total_available = position_qty + holdings_qty
-
-                    if total_available <= 0:
-                        cnc_sell_rejection_reason = f'Cannot sell {symbol} in CNC. No positions or holdings available. CNC (delivery) requires existing shares. Use MIS for intraday short selling.'
-                    elif quantity > total_available:
-                        cnc_sell_rejection_reason = f'Cannot sell {quantity} shares of {symbol} in CNC. Only {total_available} shares available (Position: {position_qty}, Holdings: {holdings_qty})'
-                    else:
-                        logger.info(f"CNC SELL validation passed: {symbol} - Available: {total_available} (Pos: {position_qty}, Hold: {holdings_qty}), Requested: {quantity}")
+                    # (holdings are T+1 settled positions)
+                    holdings_quantity = self._get_holding_quantity(symbol, exchange)
+
+                    cnc_sell_rejection_reason = _cnc_sell_rejection(symbol, quantity, existing_position,
+                                                                    holdings_quantity)
 
                 elif product == 'MIS':
                     # MIS allows short selling (negative positions) since it's intraday
@@ -208,14 +218,6 @@ class OrderManager:
             # Determine price for margin calculation based on order type
             margin_calculation_price = None
 
-            # Check for existing position early (needed for fallback pricing)
-            temp_existing_position = SandboxPositions.query.filter_by(
-                user_id=self.user_id,
-                symbol=symbol,
-                exchange=exchange,
-                product=product
-            ).first()
-
             if price_type == 'MARKET':
                 # For MARKET orders, fetch current LTP for margin calculation
                 try:
@@ -228,8 +230,8 @@ class OrderManager:
                     else:
                         # In sandbox mode, use a default price if API fails
                         # Try to get last execution price from positions
-                        if temp_existing_position and temp_existing_position.ltp:
-                            margin_calculation_price = temp_existing_position.ltp
+                        if existing_position and existing_position.ltp:
+                            margin_calculation_price = existing_position.ltp
                             logger.warning(f"API failed, using last known price {margin_calculation_price} for {symbol}")
                         else:
                             # Use a reasonable default for sandbox testing
@@ -238,8 +240,8 @@ class OrderManager:
                 except Exception as e:
                     logger.error(f"Error fetching quote for margin calculation: {e}")
                     # In sandbox mode, use a fallback price
-                    if temp_existing_position and temp_existing_position.ltp:
-                        margin_calculation_price = temp_existing_position.ltp
+                    if existing_position and existing_position.ltp:
+                        margin_calculation_price = existing_position.ltp
                         logger.warning(f"API error, using last known price {margin_calculation_price} for {symbol}")
                     else:
                         margin_calculation_price = Decimal('100.00')  # Default price for testing
@@ -276,15 +278,8 @@ class OrderManager:
                     'mode': 'analyze'
                 }, 400
 
-            # Check if this order will close/reduce/reverse an existing position
-            existing_position = SandboxPositions.query.filter_by(
-                user_id=self.user_id,
-                symbol=symbol,
-                exchange=exchange,
-                product=product
-            ).first()
-
             # Calculate margin to block based on position impact
+            # (whether this order will close/reduce/reverse an existing position)
             actual_margin_to_block = margin_required
 
             if existing_position and existing_position.quantity != 0:
@@ -315,22 +310,7 @@ class OrderManager:
             # - SELL orders for equity in MIS (intraday short selling requires margin)
             # - SELL orders for equity in NRML (if short selling is allowed)
             # Note: SELL orders for equity in CNC don't need margin blocking (selling owned shares)
-            should_block_margin = False
-
-            if action == 'BUY':
-                # All BUY orders require margin
-                should_block_margin = True
-            elif action == 'SELL':
-                if is_option(symbol, exchange):
-                    # Selling options requires margin
-                    should_block_margin = True
-                elif is_future(symbol, exchange):
-                    # Short selling futures requires margin
-                    should_block_margin = True
-                elif product in ['MIS', 'NRML']:
-                    # Intraday/margin short selling of equity requires margin
-                    should_block_margin = True
-                # CNC SELL doesn't need margin (selling owned shares)
+            should_block_margin = requires_margin(symbol, exchange, product, action)
 
             if should_block_margin:
                 if actual_margin_to_block > 0:
@@ -369,7 +349,7 @@ class OrderManager:
                 # For MARKET orders, store the LTP we used for margin calculation as reference price
                 order_price_to_store = margin_calculation_price if price_type == 'MARKET' else price
 
-                order = SandboxOrders(
+                self._save_order(dict(
                     orderid=orderid,
                     user_id=self.user_id,
                     strategy=strategy,
@@ -387,11 +367,8 @@ class OrderManager:
                     pending_quantity=0,
                     rejection_reason=cnc_sell_rejection_reason,
                     margin_blocked=Decimal('0'),  # No margin blocked for rejected orders
-                    order_timestamp=datetime.now(pytz.timezone('Asia/Kolkata'))
-                )
-
-                db_session.add(order)
-                db_session.commit()
+                    order_timestamp=clock.now()
+                ))
 
                 logger.info(f"Order rejected: {orderid} - {symbol} {action} {quantity} - Reason: {cnc_sell_rejection_reason}")
 
@@ -406,7 +383,8 @@ class OrderManager:
             # For MARKET orders, store the LTP we used for margin calculation as reference price
             order_price_to_store = margin_calculation_price if price_type == 'MARKET' else price
 
-            order = SandboxOrders(
+            # MARKET orders are filled right below, which needs the row in the database
+            order = self._save_order(dict(
                 orderid=orderid,
                 user_id=self.user_id,
                 strategy=strategy,
@@ -424,11 +402,8 @@ class OrderManager:
                 pending_quantity=quantity,
                 rejection_reason=None,
                 margin_blocked=actual_margin_to_block,  # Store exact margin blocked
-                order_timestamp=datetime.now(pytz.timezone('Asia/Kolkata'))
-            )
-
-            db_session.add(order)
-            db_session.commit()
+                order_timestamp=clock.now()
+            ), write_through=price_type == 'MARKET')
 
             logger.info(f"Order placed: {orderid} - {symbol} {action} {quantity} @ {price_type}")
 
@@ -450,6 +425,9 @@ class OrderManager:
                     logger.error(f"Error executing market order immediately: {e}")
                     # Order remains in 'open' status if execution fails
 
+            # Match still-open orders on live ticks
+            track_order(order)
+
             return True, {
                 'status': 'success',
                 'orderid': orderid,
@@ -465,6 +443,341 @@ class OrderManager:
                 'mode': 'analyze'
             }, 500
 
+    def place_orders(self, orders):
+        """
+        Place a batch of orders (basket legs, split children) for this user
+
+        Every leg goes through the checks of place_order, in order, and sees
+        the legs before it: margin comes out of a running balance and MARKET
+        legs fill against the positions as they go. Positions, holdings, lot
+        sizes and quotes are read once for the batch, order and trade IDs are
+        taken in one block each and all orders, trades, positions and funds
+        are written in one transaction. With the in-memory account state on,
+        funds are changed through it instead (and changed back if the
+        transaction fails), so concurrent place_order calls see every block.
+
+        Args:
+            orders: list of order dicts in place_order format
+
+        Returns:
+            list of (success: bool, response: dict, status_code: int), one per order
+        """
+        from database.sandbox_db import SandboxFunds, SandboxHoldings
+        from sandbox.execution_engine import ExecutionEngine, _execution_lock, market_execution_price
+        from sandbox.id_allocator import next_order_ids, next_trade_ids
+        from sandbox.margin_profiles import get_margin_profiles
+        from sandbox.quote_provider import fetch_quotes
+        from sandbox.squareoff_manager import SquareOffManager
+
+        def error(message, status_code=400, **fields):
+            return False, dict({'status': 'error'}, **fields, message=message, mode='analyze'), status_code
+
+        results = [None] * len(orders)
+        legs = []
+        for i, order_data in enumerate(orders):
+            is_valid, validation_msg = self._validate_order(order_data)
+            if not is_valid:
+                results[i] = error(validation_msg)
+                continue
+            legs.append((i, {
+                'symbol': order_data['symbol'],
+                'exchange': order_data['exchange'],
+                'action': order_data['action'].upper(),
+                'quantity': int(order_data['quantity']),
+                'price': Decimal(str(order_data['price'])) if order_data.get('price') else None,
+                'trigger_price': Decimal(str(order_data['trigger_price'])) if order_data.get('trigger_price') else None,
+                'price_type': order_data['price_type'].upper(),
+                'product': order_data['product'].upper(),
+                'strategy': order_data.get('strategy', ''),
+            }))
+
+        # Lot sizes for the whole batch in one lookup
+        profiles = get_margin_profiles().get_many({(leg['symbol'], leg['exchange']) for _, leg in legs})
+        accepted = []
+        for i, leg in legs:
+            profile = profiles.get((leg['symbol'], leg['exchange']))
+            if profile is None:
+                results[i] = error(f"Symbol {leg['symbol']} not found on {leg['exchange']}")
+            elif leg['exchange'] in ['NFO', 'BFO', 'CDS', 'BCD', 'MCX', 'NCDEX'] and leg['quantity'] % profile.lot_size != 0:
+                results[i] = error(f'Quantity must be in multiples of lot size {profile.lot_size}')
+            else:
+                accepted.append((i, leg, profile))
+        if not accepted:
+            return results
+
+        try:
+            # Journaled changes must be in the database before the batch reads it
+            account_state.sync()
+            quotes = fetch_quotes({(leg['symbol'], leg['exchange'])
+                                   for _, leg, _ in accepted if leg['price_type'] == 'MARKET'})
+            square_off_times = SquareOffManager().square_off_times
+
+            # IDs are reserved before the transaction takes the write lock;
+            # numbers left over by rejected legs are skipped
+            order_ids = iter(next_order_ids(len(accepted)))
+            market_legs = sum(1 for _, leg, _ in accepted if leg['price_type'] == 'MARKET')
+            trade_ids = iter(next_trade_ids(market_legs) if market_legs else ())
+        except Exception as e:
+            logger.error(f"Error preparing order batch: {e}")
+            for i, _, _ in accepted:
+                results[i] = error(f'Error placing order: {str(e)}', 500)
+            return results
+
+        engine = ExecutionEngine()
+        state = account_state.get_engine()
+        symbols = {leg['symbol'] for _, leg, _ in accepted}
+        new_orders, trades, still_open = [], [], []
+        fund_deltas = []  # (available, used, realized) applied to the account state, undone if the batch fails
+        with _execution_lock:
+            try:
+                positions = {(p.symbol, p.exchange, p.product): p for p in SandboxPositions.query.filter(
+                    SandboxPositions.user_id == self.user_id, SandboxPositions.symbol.in_(symbols))}
+                holdings = {(h.symbol, h.exchange): h.quantity for h in SandboxHoldings.query.filter(
+                    SandboxHoldings.user_id == self.user_id, SandboxHoldings.symbol.in_(symbols))}
+                if state is not None:
+                    # loads the account (and flushes its journal) before this transaction writes anything
+                    has_funds = state.funds(self.user_id) is not None
+                    funds = None
+                else:
+                    funds = SandboxFunds.query.filter_by(user_id=self.user_id).first()
+                    has_funds = funds is not None
+
+                def release_margin(amount, realized_pnl=0, description=""):
+                    # FundManager.release_margin without the commit
+                    if not has_funds:
+                        return
+                    amount = Decimal(str(amount))
+                    realized_pnl = Decimal(str(realized_pnl))
+                    if state is not None:
+                        state.adjust_funds(self.user_id, available=amount + realized_pnl, used=-amount,
+                                           realized=realized_pnl)
+                        fund_deltas.append((amount + realized_pnl, -amount, realized_pnl))
+                        logger.info(f"Released ₹{amount} margin for user {self.user_id}. Realized P&L: ₹{realized_pnl}. {description}")
+                        return
+                    funds.used_margin -= amount
+                    funds.available_balance += amount + realized_pnl
+                    funds.realized_pnl += realized_pnl
+                    funds.total_pnl = funds.realized_pnl + funds.unrealized_pnl
+                    logger.info(f"Released ₹{amount} margin for user {self.user_id}. Realized P&L: ₹{realized_pnl}. {description}")
+
+                # Rows are written together at commit, not flushed leg by leg
+                with db_session.no_autoflush:
+                    for i, leg, profile in accepted:
+                        symbol, exchange, action = leg['symbol'], leg['exchange'], leg['action']
+                        quantity, price_type, product = leg['quantity'], leg['price_type'], leg['product']
+                        key = (symbol, exchange, product)
+                        position = positions.get(key)
+
+                        if product == 'MIS':
+                            square_off_time = mis_blocked_since(exchange, square_off_times)
+                            if square_off_time and not _is_reducing(position, action):
+                                results[i] = error(_mis_blocked_message(square_off_time))
+                                continue
+
+                        cnc_sell_rejection_reason = None
+                        if action == 'SELL' and product == 'CNC':
+                            cnc_sell_rejection_reason = _cnc_sell_rejection(symbol, quantity, position,
+                                                                            holdings.get((symbol, exchange), 0))
+
+                        quote = quotes.get((symbol, exchange))
+                        if price_type == 'MARKET':
+                            # Same fallbacks as place_order: last known price, then a sandbox default
+                            margin_calculation_price = Decimal(str(quote['ltp'])) if quote and quote.get('ltp') else None
+                            if not margin_calculation_price:
+                                margin_calculation_price = position.ltp if position and position.ltp else Decimal('100.00')
+                                logger.warning(f"No quote, using price {margin_calculation_price} for {symbol}")
+                        elif price_type == 'LIMIT':
+                            margin_calculation_price = leg['price']
+                        else:
+                            margin_calculation_price = leg['trigger_price']
+
+                        if not margin_calculation_price or margin_calculation_price <= 0:
+                            results[i] = error(f'Invalid price for margin calculation. Please provide valid price/trigger_price for {price_type} order')
+                            continue
+
+                        # Only new exposure needs margin: an opposite position absorbs part of the order
+                        margin_quantity = quantity
+                        if position and position.quantity != 0 and _is_reducing(position, action):
+                            margin_quantity = max(0, quantity - abs(position.quantity))
+                        margin_to_block = Decimal('0')
+                        if margin_quantity and requires_margin(symbol, exchange, product, action):
+                            margin_to_block = profile.margin(margin_quantity, margin_calculation_price, product, action)
+
+                        if margin_to_block > 0:
+                            if not has_funds:
+                                results[i] = error("Funds not initialized")
+                                continue
+                            if state is not None:
+                                blocked, current = state.adjust_funds(self.user_id, available=-margin_to_block,
+                                                                      used=margin_to_block,
+                                                                      require_available=margin_to_block)
+                                available_balance = current['available_balance']
+                            else:
+                                blocked = funds.available_balance >= margin_to_block
+                                available_balance = funds.available_balance
+                            if not blocked:
+                                shortage = margin_to_block - available_balance
+                                results[i] = error(f"Insufficient funds. Required: ₹{margin_to_block}, Available: ₹{available_balance}, Shortage: ₹{shortage}")
+                                continue
+                            if state is not None:
+                                fund_deltas.append((-margin_to_block, margin_to_block, Decimal('0')))
+                            else:
+                                funds.available_balance -= margin_to_block
+                                funds.used_margin += margin_to_block
+                            logger.info(f"Blocked margin ₹{margin_to_block} for {symbol} {action} {quantity} order")
+
+                        orderid = next(order_ids)
+                        now = clock.now()
+                        order = SandboxOrders(
+                            orderid=orderid,
+                            user_id=self.user_id,
+                            strategy=leg['strategy'],
+                            symbol=symbol,
+                            exchange=exchange,
+                            action=action,
+                            quantity=quantity,
+                            # For MARKET orders, store the LTP used for margin calculation as reference price
+                            price=margin_calculation_price if price_type == 'MARKET' else leg['price'],
+                            trigger_price=leg['trigger_price'],
+                            price_type=price_type,
+                            product=product,
+                            order_status='rejected' if cnc_sell_rejection_reason else 'open',
+                            average_price=None,
+                            filled_quantity=0,
+                            pending_quantity=0 if cnc_sell_rejection_reason else quantity,
+                            rejection_reason=cnc_sell_rejection_reason,
+                            margin_blocked=margin_to_block,
+                            order_timestamp=now,
+                            update_timestamp=now
+                        )
+                        new_orders.append(order)
+
+                        if cnc_sell_rejection_reason:
+                            logger.info(f"Order rejected: {orderid} - {symbol} {action} {quantity} - Reason: {cnc_sell_rejection_reason}")
+                            results[i] = error(cnc_sell_rejection_reason, orderid=orderid)
+                            continue
+
+                        # MARKET orders fill right away, and later legs net against the result
+                        if price_type == 'MARKET' and quote and Decimal(str(quote.get('ltp', 0))) > 0:
+                            execution_price = market_execution_price(action, quote)
+                            trades.append(engine._record_fill(order, execution_price, next(trade_ids)))
+                            positions[key] = engine._net_position(order, execution_price, position, release_margin)
+                        else:
+                            still_open.append(order)
+
+                        logger.info(f"Order placed: {orderid} - {symbol} {action} {quantity} @ {price_type}")
+                        results[i] = (True, {'status': 'success', 'orderid': orderid, 'mode': 'analyze'}, 200)
+
+                # Orders and trades go in as one multi-row INSERT each
+                if new_orders:
+                    db_session.execute(insert(SandboxOrders), [_row(order) for order in new_orders])
+                if trades:
+                    db_session.execute(insert(SandboxTrades), [_row(trade) for trade in trades])
+                db_session.commit()
+
+            except Exception as e:
+                db_session.rollback()
+                logger.error(f"Error placing order batch: {e}")
+                for available, used, realized in reversed(fund_deltas):
+                    state.adjust_funds(self.user_id, available=-available, used=-used, realized=-realized)
+                still_open = []
+                for i, _, _ in accepted:
+                    if results[i] is None or results[i][0] or 'orderid' in results[i][1]:
+                        results[i] = error(f'Error placing order: {str(e)}', 500)
+
+        account_state.invalidate([self.user_id])
+        for order in still_open:
+            track_order(order)
+        return results
+
+    def check_basket_margin(self, orders):
+        """
+        Pre-check the margin of a whole basket (or the children of a split
+        order) in one pass, before any leg is placed
+
+        Legs are netted against the user's current positions the way
+        place_order would see them, MARKET legs are priced from one quote
+        snapshot and the margins come from calculate_margin_bulk. Legs with
+        unknown symbols are left to place_order to reject.
+
+        Args:
+            orders: list of order dicts in place_order format
+
+        Returns:
+            tuple: (success: bool, response: dict, status_code: int)
+        """
+        try:
+            from sandbox.quote_provider import fetch_quotes
+
+            legs = []
+            for order in orders:
+                # invalid legs are rejected by place_order with its validation message
+                if not self._validate_order(order)[0]:
+                    continue
+                legs.append({
+                    'symbol': order['symbol'], 'exchange': order['exchange'], 'action': order['action'].upper(),
+                    'quantity': int(order['quantity']), 'price_type': order['price_type'].upper(),
+                    'product': order['product'].upper(), 'price': order.get('price'),
+                    'trigger_price': order.get('trigger_price'),
+                })
+
+            quotes = fetch_quotes({(leg['symbol'], leg['exchange']) for leg in legs if leg['price_type'] == 'MARKET'})
+            positions = {}  # (symbol, exchange, product) -> net quantity as the next leg sees it
+            to_margin = []
+            for leg in legs:
+                key = (leg['symbol'], leg['exchange'], leg['product'])
+                if key not in positions:
+                    position = self._get_position(*key)
+                    positions[key] = (position.quantity if position else 0, position.ltp if position else None)
+                quantity, ltp = positions[key]
+
+                if leg['price_type'] == 'MARKET':
+                    quote = quotes.get((leg['symbol'], leg['exchange'])) or {}
+                    price = quote.get('ltp') or ltp or Decimal('100.00')  # same fallback as place_order
+                elif leg['price_type'] == 'LIMIT':
+                    price = leg['price']
+                else:
+                    price = leg['trigger_price']
+                if not price:
+                    continue
+
+                # Only new exposure needs margin: an opposite position absorbs part of the order
+                margin_quantity = leg['quantity']
+                if (quantity > 0 and leg['action'] == 'SELL') or (quantity < 0 and leg['action'] == 'BUY'):
+                    margin_quantity = max(0, leg['quantity'] - abs(quantity))
+                if margin_quantity and requires_margin(leg['symbol'], leg['exchange'], leg['product'], leg['action']):
+                    to_margin.append(dict(leg, quantity=margin_quantity, price=price))
+
+                # MARKET legs fill on placement, so later legs net against them
+                if leg['price_type'] == 'MARKET':
+                    signed = leg['quantity'] if leg['action'] == 'BUY' else -leg['quantity']
+                    positions[key] = (quantity + signed, ltp)
+
+            margins = self.fund_manager.calculate_margin_bulk(to_margin)
+            required = Decimal(str(round(float(np.nansum(margins)), 2)))
+            funds = self.fund_manager.get_funds()
+            if funds is None:
+                # place_order reports the missing funds per leg
+                return True, {'status': 'success', 'margin_required': float(required), 'mode': 'analyze'}, 200
+
+            available = Decimal(str(funds['availablecash']))
+            if required > available:
+                return False, {
+                    'status': 'error',
+                    'message': f'Insufficient funds for basket. Required: ₹{required}, Available: ₹{available}',
+                    'margin_required': float(required),
+                    'mode': 'analyze'
+                }, 400
+            return True, {'status': 'success', 'margin_required': float(required), 'mode': 'analyze'}, 200
+
+        except Exception as e:
+            logger.error(f"Error checking basket margin: {e}")
+            return False, {
+                'status': 'error',
+                'message': f'Error checking basket margin: {str(e)}',
+                'mode': 'analyze'
+            }, 500
+
     def modify_order(self, orderid, new_data):
         """
         Modify an existing open order
@@ -477,6 +790,8 @@ class OrderManager:
             tuple: (success: bool, response: dict, status_code: int)
         """
         try:
+            account_state.sync()
+
             # Get existing order
             order = SandboxOrders.query.filter_by(
                 orderid=orderid,
@@ -522,9 +837,10 @@ class OrderManager:
             if 'trigger_price' in new_data and new_data['trigger_price']:
                 order.trigger_price = Decimal(str(new_data['trigger_price']))
 
-            order.update_timestamp = datetime.now(pytz.timezone('Asia/Kolkata'))
+            order.update_timestamp = clock.now()
 
             db_session.commit()
+            track_order(order)
 
             logger.info(f"Order modified: {orderid}")
 
@@ -555,6 +871,8 @@ class OrderManager:
             tuple: (success: bool, response: dict, status_code: int)
         """
         try:
+            account_state.sync()
+
             # Get existing order
             order = SandboxOrders.query.filter_by(
                 orderid=orderid,
@@ -577,7 +895,7 @@ class OrderManager:
 
             # Update order status
             order.order_status = 'cancelled'
-            order.update_timestamp = datetime.now(pytz.timezone('Asia/Kolkata'))
+            order.update_timestamp = clock.now()
 
             # Release blocked margin using the exact amount that was blocked
             if hasattr(order, 'margin_blocked') and order.margin_blocked and order.margin_blocked > 0:
@@ -642,6 +960,7 @@ class OrderManager:
                         logger.info(f"No margin to release for cancelled order {orderid} ({order.action} {order.product})")
 
             db_session.commit()
+            untrack_order(orderid)
 
             logger.info(f"Order cancelled: {orderid}")
 
@@ -672,7 +991,7 @@ class OrderManager:
             expiry_hour, expiry_minute = map(int, session_expiry_str.split(':'))
 
             # Get current time
-            now = datetime.now()
+            now = clock.now_local()
             today = now.date()
 
             # Calculate session start time
@@ -689,6 +1008,7 @@ class OrderManager:
                 # Session started today at expiry time
                 session_start = datetime.combine(today, session_expiry_time)
 
+            account_state.sync()
             orders = SandboxOrders.query.filter(
                 SandboxOrders.user_id == self.user_id,
                 SandboxOrders.order_timestamp >= session_start
@@ -740,6 +1060,7 @@ class OrderManager:
     def get_order_status(self, orderid):
         """Get status of a specific order"""
         try:
+            account_state.sync()
             order = SandboxOrders.query.filter_by(
                 orderid=orderid,
                 user_id=self.user_id
@@ -839,25 +1160,51 @@ class OrderManager:
 
         return True, 'Validation passed'
 
+    def _get_position(self, symbol, exchange, product):
+        """Current position (anything with quantity and ltp) or None"""
+        state = account_state.get_engine()
+        if state is not None:
+            return state.position(self.user_id, symbol, exchange, product)
+        return SandboxPositions.query.filter_by(
+            user_id=self.user_id,
+            symbol=symbol,
+            exchange=exchange,
+            product=product
+        ).first()
+
+    def _get_holding_quantity(self, symbol, exchange):
+        state = account_state.get_engine()
+        if state is not None:
+            return state.holding_quantity(self.user_id, symbol, exchange)
+        from database.sandbox_db import SandboxHoldings
+        holdings = SandboxHoldings.query.filter_by(
+            user_id=self.user_id,
+            symbol=symbol,
+            exchange=exchange
+        ).first()
+        return holdings.quantity if holdings else 0
+
+    def _save_order(self, fields, write_through=False):
+        """
+        Persist a new order. With the in-memory account state the row is
+        journaled and written by the background flusher unless
+        ``write_through`` is set.
+        """
+        order = SandboxOrders(**fields)
+        state = account_state.get_engine()
+        if state is not None and not write_through:
+            state.add_order(fields)
+        else:
+            db_session.add(order)
+            db_session.commit()
+        return order
+
     def _generate_order_id(self):
         """
         Generate unique order ID in format: YYMMDD + 8-digit sequence
         Example: 25100100000001 (Year 2025, Oct 1st, sequence 00000001)
         """
-        now = datetime.now(pytz.timezone('Asia/Kolkata'))
-        date_prefix = now.strftime('%y%m%d')  # YYMMDD format
-
-        # Get the count of orders for today to generate sequence number
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        today_orders = SandboxOrders.query.filter(
-            SandboxOrders.user_id == self.user_id,
-            SandboxOrders.order_timestamp >= today_start
-        ).count()
-
-        # Sequence is orders count + 1, padded to 8 digits
-        sequence = str(today_orders + 1).zfill(8)
-
-        return f"{date_prefix}{sequence}"
+        return next_order_id()
 
     def _calculate_order_statistics(self, orders):
         """Calculate order statistics matching broker API format"""
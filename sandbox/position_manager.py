@@ -13,19 +13,22 @@ Features:
 import os
 import sys
 from decimal import Decimal
-from datetime import datetime
-import pytz
+from datetime import timedelta
 import time
 
+import numpy as np
+from sqlalchemy import bindparam, update
+
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.sandbox_db import (
-    SandboxPositions, SandboxTrades, db_session, get_config
+    SandboxFunds, SandboxPositions, SandboxTrades, db_session, get_config
 )
+from sandbox import clock
 from sandbox.fund_manager import FundManager
-from sandbox.holdings_manager import HoldingsManager
-from services.quotes_service import get_quotes
+from sandbox.holdings_manager import settle_cnc_positions
+from sandbox.quote_provider import fetch_quote, fetch_quotes
 from utils.logging import get_logger
 
 logger = get_logger(__name__)
@@ -38,7 +41,7 @@ class PositionManager:
         self.user_id = user_id
         self.fund_manager = FundManager(user_id)
 
-    def get_open_positions(self, update_mtm=True):
+    def get_open_positions(self, update_mtm=True, quotes=None):
         """
         Get all open positions for the user
         - After session expiry, only NRML positions carry forward
@@ -46,34 +49,15 @@ class PositionManager:
 
         Args:
             update_mtm: bool - Whether to update MTM with live prices
+            quotes: dict - Optional {(symbol, exchange): quote} already fetched for this update
 
         Returns:
             tuple: (success: bool, response: dict, status_code: int)
         """
         try:
-            from datetime import datetime, time, timedelta
-            import os
-
-            # Get session expiry time from config (e.g., '03:00')
-            session_expiry_str = os.getenv('SESSION_EXPIRY_TIME', '03:00')
-            expiry_hour, expiry_minute = map(int, session_expiry_str.split(':'))
-
-            # Get current time
-            now = datetime.now()
-            today = now.date()
-
-            # Calculate if we're in a new session
-            session_expiry_time = time(expiry_hour, expiry_minute)
-
-            # Determine last session expiry
-            if now.time() < session_expiry_time:
-                # We're before today's session expiry (e.g., before 3 AM)
-                # Last session expired yesterday at 3 AM
-                last_session_expiry = datetime.combine(today - timedelta(days=1), session_expiry_time)
-            else:
-                # We're after today's session expiry (e.g., after 3 AM)
-                # Last session expired today at 3 AM
-                last_session_expiry = datetime.combine(today, session_expiry_time)
+            # Positions from before the last session expiry (e.g., 3 AM) were settled,
+            # except NRML which carries forward
+            last_session_expiry = _last_session_expiry()
 
             # Get all positions (including zero quantity ones from current session)
             positions_query = SandboxPositions.query.filter(
@@ -97,7 +81,7 @@ class PositionManager:
                 # Skip MIS and CNC positions from previous session
 
             if update_mtm:
-                self._update_positions_mtm(positions)
+                self._update_positions_mtm(positions, quotes)
 
             positions_list = []
             total_unrealized_pnl = Decimal('0.00')  # Only from open positions
@@ -176,7 +160,7 @@ class PositionManager:
             logger.error(f"Error getting position for {symbol}: {e}")
             return None
 
-    def _update_positions_mtm(self, positions):
+    def _update_positions_mtm(self, positions, quotes=None):
         """Update MTM for all positions with live quotes"""
         try:
             if not positions:
@@ -187,12 +171,11 @@ class PositionManager:
             for position in positions:
                 symbols_to_fetch.add((position.symbol, position.exchange))
 
-            # Fetch quotes for all symbols
-            quote_cache = {}
-            for symbol, exchange in symbols_to_fetch:
-                quote = self._fetch_quote(symbol, exchange)
-                if quote:
-                    quote_cache[(symbol, exchange)] = quote
+            # Fetch quotes for all symbols in one request
+            quote_cache = dict(quotes or {})
+            missing = symbols_to_fetch.difference(quote_cache)
+            if missing:
+                quote_cache.update(fetch_quotes(missing))
 
             # Update MTM for each position
             for position in positions:
@@ -302,35 +285,8 @@ class PositionManager:
             return Decimal('0.00')
 
     def _fetch_quote(self, symbol, exchange):
-        """Fetch real-time quote for a symbol using API key"""
-        try:
-            # Get any user's API key for fetching quotes
-            from database.auth_db import ApiKeys, decrypt_token
-            api_key_obj = ApiKeys.query.first()
-
-            if not api_key_obj:
-                logger.warning("No API keys found for fetching quotes")
-                return None
-
-            # Decrypt the API key
-            api_key = decrypt_token(api_key_obj.api_key_encrypted)
-
-            # Use quotes service with API key authentication
-            success, response, status_code = get_quotes(
-                symbol=symbol,
-                exchange=exchange,
-                api_key=api_key
-            )
-
-            if success and 'data' in response:
-                return response['data']
-            else:
-                logger.warning(f"Failed to fetch quote for {symbol}: {response.get('message', 'Unknown error')}")
-                return None
-
-        except Exception as e:
-            logger.error(f"Error fetching quote for {symbol}: {e}")
-            return None
+        """Fetch real-time quote for a symbol from the shared sandbox quote provider"""
+        return fetch_quote(symbol, exchange)
 
     def close_position(self, symbol, exchange, product):
         """
@@ -402,7 +358,7 @@ class PositionManager:
             expiry_hour, expiry_minute = map(int, session_expiry_str.split(':'))
 
             # Get current time
-            now = datetime.now()
+            now = clock.now_local()
             today = now.date()
 
             # Calculate session start time
@@ -471,7 +427,6 @@ class PositionManager:
         This should be called at session expiry time (e.g., 3:00 AM IST)
         """
         try:
-            from datetime import datetime, date
             from database.sandbox_db import SandboxHoldings
             from database import db
             import os
@@ -530,7 +485,7 @@ class PositionManager:
                             exchange=position.exchange,
                             quantity=position.quantity,
                             average_price=position.average_price,
-                            settlement_date=date.today()
+                            settlement_date=clock.now_local().date()
                         )
                         db.session.add(holdings)
 
@@ -559,26 +514,82 @@ class PositionManager:
             }, 500
 
 
+def _last_session_expiry():
+    """Start of the current session: the most recent SESSION_EXPIRY_TIME (naive local time)"""
+    expiry_hour, expiry_minute = map(int, os.getenv('SESSION_EXPIRY_TIME', '03:00').split(':'))
+    now = clock.now_local()
+    expiry = now.replace(hour=expiry_hour, minute=expiry_minute, second=0, microsecond=0)
+    return expiry if now >= expiry else expiry - timedelta(days=1)
+
+
 def update_all_positions_mtm():
-    """Background task to update MTM for all positions"""
+    """
+    Background task to update MTM for all positions
+
+    All positions are read in one query and priced against one quote
+    snapshot with array arithmetic; position P&L and every user's unrealized
+    P&L are written back with bulk UPDATEs in a single commit.
+    """
     try:
-        # Get all unique users with positions
-        positions = SandboxPositions.query.all()
+        rows = db_session.query(
+            SandboxPositions.id, SandboxPositions.user_id, SandboxPositions.symbol, SandboxPositions.exchange,
+            SandboxPositions.product, SandboxPositions.quantity, SandboxPositions.average_price,
+            SandboxPositions.accumulated_realized_pnl, SandboxPositions.pnl, SandboxPositions.updated_at
+        ).all()
 
-        if not positions:
+        if not rows:
             logger.debug("No positions to update")
             return
 
-        users = set(p.user_id for p in positions)
-        logger.info(f"Updating MTM for {len(positions)} positions across {len(users)} users")
-
-        for user_id in users:
-            pm = PositionManager(user_id)
-            pm.get_open_positions(update_mtm=True)
-
+        # Open positions of the current session: touched since the last
+        # session expiry, or NRML carried forward (same rule as get_open_positions)
+        session_start = _last_session_expiry()
+        open_rows = [r for r in rows if r.quantity != 0 and (r.updated_at >= session_start or r.product == 'NRML')]
+        users = sorted({r.user_id for r in rows})
+        logger.info(f"Updating MTM for {len(rows)} positions across {len(users)} users")
+
+        # One quote lookup for every symbol held by any user
+        quotes = fetch_quotes({(r.symbol, r.exchange) for r in open_rows})
+
+        ltp = np.array([float((quotes.get((r.symbol, r.exchange)) or {}).get('ltp') or 0) for r in open_rows])
+        quantity = np.array([r.quantity for r in open_rows], dtype=float)
+        avg_price = np.array([float(r.average_price) for r in open_rows])
+        realized = np.array([float(r.accumulated_realized_pnl or 0) for r in open_rows])
+        stored_pnl = np.array([float(r.pnl or 0) for r in open_rows])
+
+        priced = ltp > 0
+        # (ltp - avg) * qty is the unrealized P&L of longs and shorts alike
+        pnl = np.where(priced, realized + (ltp - avg_price) * quantity, stored_pnl)
+        safe_avg = np.where(avg_price > 0, avg_price, 1.0)
+        pnl_percent = np.where(avg_price > 0, (ltp - avg_price) / safe_avg * 100 * np.sign(quantity), 0.0)
+
+        # Unpriced positions keep their last P&L in the user's total
+        user_index = {user_id: i for i, user_id in enumerate(users)}
+        codes = np.array([user_index[r.user_id] for r in open_rows], dtype=np.int64)
+        unrealized = np.bincount(codes, weights=pnl, minlength=len(users)) if open_rows else np.zeros(len(users))
+
+        position_updates = [
+            {'id': open_rows[i].id, 'ltp': round(float(ltp[i]), 2), 'pnl': round(float(pnl[i]), 2),
+             'pnl_percent': round(float(pnl_percent[i]), 4)}
+            for i in np.flatnonzero(priced)
+        ]
+        if position_updates:
+            db_session.execute(update(SandboxPositions), position_updates)
+
+        funds = SandboxFunds.__table__
+        db_session.execute(
+            funds.update().where(funds.c.user_id == bindparam('uid')).values(
+                unrealized_pnl=bindparam('unrealized'),
+                total_pnl=funds.c.realized_pnl + bindparam('unrealized'),
+            ),
+            [{'uid': user_id, 'unrealized': round(float(unrealized[i]), 2)} for user_id, i in user_index.items()],
+        )
+
+        db_session.commit()
         logger.info("MTM update completed")
 
     except Exception as e:
+        db_session.rollback()
         logger.error(f"Error updating MTM for all positions: {e}")
 
 
@@ -586,37 +597,15 @@ def process_all_users_settlement():
     """
     Process T+1 settlement for all users at midnight (00:00 IST)
     - Moves CNC positions to holdings
-    - Auto squares-off any remaining MIS positions
     - NRML positions carry forward
     """
     try:
-        # Get all unique users with positions
-        positions = SandboxPositions.query.all()
-
-        if not positions:
-            logger.info("No positions to settle")
-            return
-
-        users = set(p.user_id for p in positions)
-        logger.info(f"Processing T+1 settlement for {len(users)} users at midnight")
-
-        for user_id in users:
-            try:
-                holdings_manager = HoldingsManager(user_id)
-                success, message = holdings_manager.process_t1_settlement()
-
-                if success:
-                    logger.info(f"Settlement completed for user {user_id}")
-                else:
-                    logger.error(f"Settlement failed for user {user_id}: {message}")
-
-            except Exception as e:
-                logger.error(f"Error in settlement for user {user_id}: {e}")
-                continue
-
+        logger.info("Processing T+1 settlement for all users at midnight")
+        settle_cnc_positions()
         logger.info("T+1 settlement completed for all users")
 
     except Exception as e:
+        db_session.rollback()
         logger.error(f"Error in T+1 settlement process: {e}")
 
 
@@ -625,43 +614,17 @@ def catchup_missed_settlements():
     Catch-up settlement for positions that should have been settled while app was stopped.
     Runs on startup when analyzer mode is enabled.
 
-    Checks for CNC positions older than 1 day and settles them to holdings.
+    Settles CNC positions older than 1 day to holdings.
     """
     try:
-        ist = pytz.timezone('Asia/Kolkata')
-        today = datetime.now(ist).date()
-        cutoff_time = datetime.combine(today, datetime.min.time())
-
-        cnc_positions = SandboxPositions.query.filter_by(product='CNC').filter(
-            SandboxPositions.quantity != 0,
-            SandboxPositions.created_at < cutoff_time
-        ).all()
-
-        if not cnc_positions:
+        settled = settle_cnc_positions()
+        if settled:
+            logger.info(f"Catch-up settlement moved {settled} CNC positions to holdings")
+        else:
             logger.info("No CNC positions for catch-up settlement")
-            return
-
-        logger.info(f"Found {len(cnc_positions)} CNC positions that need catch-up settlement")
-
-        users = set(p.user_id for p in cnc_positions)
-
-        for user_id in users:
-            try:
-                holdings_manager = HoldingsManager(user_id)
-                success, message = holdings_manager.process_t1_settlement()
-
-                if success:
-                    logger.info(f"Catch-up settlement completed for user {user_id}")
-                else:
-                    logger.error(f"Catch-up settlement failed for user {user_id}: {message}")
-
-            except Exception as e:
-                logger.error(f"Error in catch-up settlement for user {user_id}: {e}")
-                continue
-
-        logger.info("Catch-up settlement process completed")
 
     except Exception as e:
+        db_session.rollback()
         logger.error(f"Error in catch-up settlement: {e}")
 
 
@@ -0,0 +1,240 @@
+# sandbox/quote_provider.py
+"""
+Shared quote source for the sandbox managers
+
+Quotes are served in this order:
+
+1. the live feed cache (MarketDataService) when the symbol ticked recently
+2. a short-lived cache of upstream results
+3. the broker, with every missing symbol of a request fetched in one
+   multi-instrument call (quotes_service.get_multiquotes_with_auth)
+
+Broker credentials are resolved once from the first stored API key and
+reused, so a quote never goes through the Argon2 API-key check. Concurrent
+requests for the same symbol are coalesced: only one thread goes upstream
+and the others wait for its result (single-flight).
+"""
+
+import os
+import threading
+import time
+
+from utils.logging import get_logger
+from utils.metrics import counter
+
+logger = get_logger(__name__)
+
+# A feed tick older than this is not used for sandbox pricing
+FEED_MAX_AGE = float(os.getenv('SANDBOX_QUOTE_FEED_MAX_AGE', '5'))
+# How long an upstream quote is reused across managers and users
+QUOTE_CACHE_TTL = float(os.getenv('SANDBOX_QUOTE_CACHE_TTL', '1'))
+CREDENTIALS_TTL = 300  # seconds before broker credentials are re-read
+INFLIGHT_WAIT = 10  # seconds a coalesced request waits for the leader
+MAX_CACHED_QUOTES = 5000  # expired entries are pruned past this size
+
+QUOTE_REQUESTS = counter('openalgo_sandbox_quote_requests_total', 'Sandbox quote lookups by source', ('source',))
+QUOTE_UPSTREAM_CALLS = counter('openalgo_sandbox_quote_upstream_calls_total', 'Broker quote calls made for the sandbox', ('result',))
+
+
+class _Flight:
+    """An upstream fetch other threads can wait on"""
+
+    __slots__ = ('event', 'quote')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.quote = None
+
+
+class SandboxQuoteProvider:
+    """Feed-first, coalescing quote lookups shared by all sandbox users"""
+
+    def __init__(self, feed_max_age=FEED_MAX_AGE, cache_ttl=QUOTE_CACHE_TTL):
+        self.feed_max_age = feed_max_age
+        self.cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._cache = {}  # (symbol, exchange) -> (quote, expires_at)
+        self._inflight = {}  # (symbol, exchange) -> _Flight
+        self._credentials = None  # (auth_token, feed_token, broker)
+        self._credentials_expiry = 0.0
+        self._credentials_lock = threading.Lock()
+        self.upstream_calls = 0
+
+    def get_quote(self, symbol, exchange):
+        """Quote dict (ltp, open, high, low, ...) for one symbol or None"""
+        return self.get_quotes([(symbol, exchange)]).get((symbol, exchange))
+
+    def get_quotes(self, pairs):
+        """
+        Quotes for many symbols at once
+
+        Args:
+            pairs: Iterable of (symbol, exchange)
+
+        Returns:
+            dict of (symbol, exchange) -> quote for every symbol that could be priced
+        """
+        results = {}
+        missing = []
+        for key in dict.fromkeys(pairs):
+            quote = self._from_feed(*key)
+            if quote:
+                QUOTE_REQUESTS.labels('feed').inc()
+                results[key] = quote
+            else:
+                missing.append(key)
+        if not missing:
+            return results
+
+        owned = {}
+        waiting = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in missing:
+                cached = self._cache.get(key)
+                if cached and cached[1] > now:
+                    QUOTE_REQUESTS.labels('cache').inc()
+                    results[key] = cached[0]
+                elif key in self._inflight:
+                    QUOTE_REQUESTS.labels('coalesced').inc()
+                    waiting[key] = self._inflight[key]
+                else:
+                    QUOTE_REQUESTS.labels('upstream').inc()
+                    owned[key] = self._inflight[key] = _Flight()
+
+        if owned:
+            fetched = {}
+            try:
+                fetched = self._fetch_upstream(list(owned))
+            except Exception as e:
+                logger.error(f"Error fetching quotes for {len(owned)} symbols: {e}")
+            finally:
+                expires_at = time.monotonic() + self.cache_ttl
+                with self._lock:
+                    if len(self._cache) > MAX_CACHED_QUOTES:
+                        self._prune(time.monotonic())
+                    for key, flight in owned.items():
+                        quote = fetched.get(key)
+                        if quote:
+                            self._cache[key] = (quote, expires_at)
+                        flight.quote = quote
+                        self._inflight.pop(key, None)
+                        flight.event.set()
+            results.update((key, quote) for key, quote in fetched.items() if key in owned and quote)
+
+        for key, flight in waiting.items():
+            if flight.event.wait(INFLIGHT_WAIT) and flight.quote:
+                results[key] = flight.quote
+
+        return results
+
+    def clear(self):
+        """Drop cached quotes and credentials (e.g. after a broker re-login)"""
+        with self._lock:
+            self._cache.clear()
+        with self._credentials_lock:
+            self._credentials = None
+            self._credentials_expiry = 0.0
+
+    def _prune(self, now):
+        for key in [key for key, (_, expires_at) in self._cache.items() if expires_at <= now]:
+            del self._cache[key]
+
+    def _from_feed(self, symbol, exchange):
+        if self.feed_max_age <= 0:
+            return None
+        try:
+            from services.market_data_service import get_market_data_service
+            return get_market_data_service().get_fresh_quote(symbol, exchange, self.feed_max_age)
+        except Exception as e:
+            logger.debug(f"Feed cache unavailable for {exchange}:{symbol}: {e}")
+            return None
+
+    def _get_credentials(self):
+        """(auth_token, feed_token, broker) of the first user with an API key, cached"""
+        with self._credentials_lock:
+            if self._credentials and time.monotonic() < self._credentials_expiry:
+                return self._credentials
+
+            from database.auth_db import ApiKeys, Auth, decrypt_token
+
+            api_key_obj = ApiKeys.query.first()
+            if not api_key_obj:
+                logger.warning("No API keys found for fetching quotes")
+                return None
+
+            auth_obj = Auth.query.filter_by(name=api_key_obj.user_id).first()
+            if not auth_obj or auth_obj.is_revoked:
+                logger.warning(f"No valid broker session for user {api_key_obj.user_id}, cannot fetch quotes")
+                return None
+
+            feed_token = decrypt_token(auth_obj.feed_token) if auth_obj.feed_token else None
+            self._credentials = (decrypt_token(auth_obj.auth), feed_token, auth_obj.broker)
+            self._credentials_expiry = time.monotonic() + CREDENTIALS_TTL
+            return self._credentials
+
+    def _fetch_upstream(self, keys):
+        """One multi-instrument broker call for all keys"""
+        credentials = self._get_credentials()
+        if not credentials:
+            return {}
+
+        from services.quotes_service import get_multiquotes_with_auth
+
+        auth_token, feed_token, broker = credentials
+        self.upstream_calls += 1
+        success, response, status_code = get_multiquotes_with_auth(
+            auth_token, feed_token, broker,
+            [{'symbol': symbol, 'exchange': exchange} for symbol, exchange in keys]
+        )
+        if not success:
+            QUOTE_UPSTREAM_CALLS.labels('error').inc()
+            logger.warning(f"Failed to fetch quotes for {len(keys)} symbols: {response.get('message', 'Unknown error')}")
+            # The session may have been revoked or refreshed; re-read it next time
+            with self._credentials_lock:
+                self._credentials = None
+            return {}
+
+        QUOTE_UPSTREAM_CALLS.labels('success').inc()
+        fetched = {}
+        for item in response.get('data') or []:
+            data = item.get('data')
+            if data:
+                fetched[(item.get('symbol'), item.get('exchange'))] = data
+        logger.debug(f"Fetched {len(fetched)}/{len(keys)} quotes in one upstream call")
+        return fetched
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_quote_provider():
+    """Process-wide SandboxQuoteProvider"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = SandboxQuoteProvider()
+    return _provider
+
+
+def set_quote_provider(provider):
+    """
+    Replace the process-wide provider, e.g. with a historical replay source
+    exposing the same get_quote/get_quotes interface. Returns the previous one.
+    """
+    global _provider
+    with _provider_lock:
+        previous, _provider = _provider, provider
+    return previous
+
+
+def fetch_quote(symbol, exchange):
+    """Quote for one symbol from the shared provider"""
+    return get_quote_provider().get_quote(symbol, exchange)
+
+
+def fetch_quotes(pairs):
+    """Quotes for many symbols from the shared provider"""
+    return get_quote_provider().get_quotes(pairs)
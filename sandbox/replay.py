@@ -0,0 +1,408 @@
+# sandbox/replay.py
+"""
+Historical replay (backtest) driver for the sandbox
+
+Streams stored candles or recorded ticks through the regular sandbox code
+paths on a simulated clock, as fast as the CPU allows:
+
+- prices are served to OrderManager / ExecutionEngine through a replay
+  quote provider instead of the broker
+- open orders are matched by the tick engine's trigger books
+- MIS square-off runs when the replayed time passes each exchange's
+  configured square-off time
+- T+1 settlement (and the weekly fund reset, if enabled) runs on every
+  replayed midnight
+
+A strategy is a callable ``strategy(ctx, event)`` called after each event.
+``ctx`` exposes placeorder / cancelorder / positionbook / funds / quotes
+with the same argument names as the REST API (/api/v1/placeorder ...), so
+strategy code written against the API client can be driven unchanged.
+
+Each replay should use its own sandbox database (SANDBOX_DATABASE_URL);
+run_replays() runs independent replays in separate processes, each with
+its own database file.
+"""
+
+import csv
+import heapq
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sandbox import clock
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+Candle = namedtuple('Candle', 'timestamp symbol exchange open high low close volume interval')
+Tick = namedtuple('Tick', 'timestamp symbol exchange ltp bid ask volume')
+
+DEFAULT_INTERVAL = 60  # seconds per candle when the file does not say
+
+
+# ----- event sources ------------------------------------------------------------
+
+def _parse_timestamp(value):
+    """Epoch seconds/milliseconds or ISO-8601 text to an IST-aware datetime"""
+    if isinstance(value, datetime):
+        when = value
+    elif isinstance(value, (int, float)) or str(value).replace('.', '', 1).isdigit():
+        seconds = float(value)
+        if seconds > 1e11:  # milliseconds
+            seconds /= 1000.0
+        return datetime.fromtimestamp(seconds, clock.IST)
+    else:
+        when = datetime.fromisoformat(str(value).strip().replace('T', ' ').replace('Z', '+00:00'))
+    if when.tzinfo is None:
+        return clock.IST.localize(when)
+    return when.astimezone(clock.IST)
+
+
+def load_candles_csv(path, symbol=None, exchange=None, interval=DEFAULT_INTERVAL):
+    """
+    Read candles from a CSV file (as exported by the history API).
+
+    Columns: timestamp (or date + time), open, high, low, close, volume and
+    optionally symbol / exchange, which otherwise come from the arguments.
+    Rows are yielded in file order; sort the file by time.
+    """
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            row = {k.strip().lower(): v for k, v in row.items() if k}
+            if 'timestamp' in row:
+                stamp = row['timestamp']
+            elif 'datetime' in row:
+                stamp = row['datetime']
+            else:
+                stamp = f"{row['date']} {row.get('time', '00:00:00')}".strip()
+            yield Candle(
+                _parse_timestamp(stamp),
+                row.get('symbol') or symbol,
+                row.get('exchange') or exchange,
+                float(row['open']), float(row['high']), float(row['low']), float(row['close']),
+                float(row.get('volume') or 0),
+                interval,
+            )
+
+
+def load_ticks_jsonl(path):
+    """
+    Read recorded ticks, one JSON object per line. Accepts flat records
+    ({timestamp, symbol, exchange, ltp, bid, ask, volume}) and the websocket
+    proxy's market data messages ({symbol, exchange, data: {...}}).
+    """
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            data = record.get('data') if isinstance(record.get('data'), dict) else record
+            stamp = record.get('timestamp') or record.get('ts') or data.get('timestamp')
+            ltp = data.get('ltp')
+            if stamp is None or not ltp:
+                continue
+            yield Tick(
+                _parse_timestamp(stamp),
+                record.get('symbol') or data.get('symbol'),
+                record.get('exchange') or data.get('exchange'),
+                float(ltp),
+                float(data.get('bid') or 0),
+                float(data.get('ask') or 0),
+                float(data.get('volume') or 0),
+            )
+
+
+def merge_events(*sources):
+    """Merge time-sorted event sources into one time-ordered stream"""
+    return heapq.merge(*sources, key=lambda event: event.timestamp)
+
+
+def _candle_path(candle):
+    """
+    Intra-bar price path for a candle: open, the nearer extreme, the other
+    extreme, close; spread evenly over the bar.
+    """
+    if abs(candle.high - candle.open) <= abs(candle.open - candle.low):
+        prices = (candle.open, candle.high, candle.low, candle.close)
+    else:
+        prices = (candle.open, candle.low, candle.high, candle.close)
+    step = timedelta(seconds=candle.interval / 4.0)
+    return [(candle.timestamp + step * i, price) for i, price in enumerate(prices)]
+
+
+# ----- sandbox plumbing ---------------------------------------------------------
+
+class ReplayQuoteProvider:
+    """Serves the last replayed price of each symbol to the sandbox managers"""
+
+    def __init__(self):
+        self.quotes = {}
+
+    def update(self, symbol, exchange, quote):
+        self.quotes[(symbol, exchange)] = quote
+
+    def get_quote(self, symbol, exchange):
+        return self.quotes.get((symbol, exchange))
+
+    def get_quotes(self, pairs):
+        quotes = self.quotes
+        return {key: quotes[key] for key in pairs if key in quotes}
+
+
+class ReplayContext:
+    """What a strategy sees: the sandbox account of one user at replay time"""
+
+    def __init__(self, user_id, quote_provider):
+        from sandbox.fund_manager import FundManager
+        from sandbox.order_manager import OrderManager
+
+        self.user_id = user_id
+        self._quotes = quote_provider
+        self._orders = OrderManager(user_id)
+        self._funds = FundManager(user_id)
+        self._funds.get_funds()  # creates the account on the simulated date
+        self.orders_placed = 0
+
+    @property
+    def now(self):
+        return clock.now()
+
+    def placeorder(self, symbol, action, exchange, price_type='MARKET', product='MIS', quantity=1,
+                   price=0, trigger_price=0, strategy='replay', **kwargs):
+        """Same arguments as /api/v1/placeorder; returns the API response dict"""
+        success, response, status_code = self._orders.place_order({
+            'symbol': symbol,
+            'exchange': exchange,
+            'action': action,
+            'quantity': quantity,
+            'price': price,
+            'trigger_price': trigger_price,
+            'price_type': kwargs.get('pricetype', price_type),
+            'product': product,
+            'strategy': strategy,
+        })
+        if success:
+            self.orders_placed += 1
+        return response
+
+    def cancelorder(self, order_id, **kwargs):
+        return self._orders.cancel_order(order_id)[1]
+
+    def orderstatus(self, order_id, **kwargs):
+        return self._orders.get_order_status(order_id)[1]
+
+    def positionbook(self, **kwargs):
+        from sandbox.position_manager import PositionManager
+
+        return PositionManager(self.user_id).get_open_positions(update_mtm=True)[1]
+
+    def funds(self, **kwargs):
+        return {'status': 'success', 'data': self._funds.get_funds()}
+
+    def quotes(self, symbol, exchange, **kwargs):
+        quote = self._quotes.get_quote(symbol, exchange)
+        if quote is None:
+            return {'status': 'error', 'message': f'No replayed price for {exchange}:{symbol} yet'}
+        return {'status': 'success', 'data': quote}
+
+
+class ReplayDriver:
+    """Runs one replay in the current process"""
+
+    def __init__(self, events, strategy=None, user_id='replay', auto_reset=False):
+        """
+        Args:
+            events: Time-ordered iterable of Candle / Tick
+            strategy: Optional callable(ctx, event) run after each event
+            user_id: Sandbox user the strategy trades as
+            auto_reset: Honour the sandbox's weekly fund reset (off for backtests)
+        """
+        self.events = events
+        self.strategy = strategy
+        self.user_id = user_id
+        self.auto_reset = auto_reset
+        self.quotes = ReplayQuoteProvider()
+        self.stats = {'events': 0, 'price_updates': 0, 'fills': 0, 'square_off_runs': 0, 'settlement_runs': 0}
+
+    def run(self):
+        """Replay every event; returns throughput and account statistics"""
+        from database.sandbox_db import SandboxTrades, get_config, init_db
+        from sandbox.fund_manager import FundManager
+        from sandbox.position_manager import update_all_positions_mtm
+        from sandbox.quote_provider import set_quote_provider
+        from sandbox.squareoff_manager import SquareOffManager
+        from sandbox.tick_engine import TickExecutionEngine, set_tick_engine
+
+        init_db()
+        events = iter(self.events)
+        first = next(events, None)
+        if first is None:
+            logger.warning("Replay has no events")
+            return dict(self.stats, elapsed_seconds=0.0, events_per_second=0.0)
+
+        sim_clock = clock.SimulatedClock(first.timestamp)
+        previous_clock = clock.get_clock()
+        clock.set_clock(sim_clock)
+        previous_provider = set_quote_provider(self.quotes)
+        engine = self._engine = TickExecutionEngine()
+        previous_engine = set_tick_engine(engine)
+        previous_auto_reset, FundManager.auto_reset = FundManager.auto_reset, self.auto_reset
+
+        start = time.perf_counter()
+        try:
+            self._squareoff = SquareOffManager()
+            squareoff_times = sorted(set(self._squareoff.square_off_times.values()))
+            self._reset_day = get_config('reset_day', 'Sunday')
+            ctx = ReplayContext(self.user_id, self.quotes)
+            engine.start(feed=False)
+            day = first.timestamp.date()
+            pending_squareoffs = self._squareoffs_for(day, squareoff_times)
+            for event in itertools.chain((first,), events):
+                when = event.timestamp
+                if when.date() != day:
+                    self._finish_day(pending_squareoffs)
+                    day = self._roll_days(day, when.date())
+                    pending_squareoffs = self._squareoffs_for(day, squareoff_times)
+                while pending_squareoffs and pending_squareoffs[0] <= when:
+                    self._square_off(pending_squareoffs.pop(0))
+
+                if isinstance(event, Candle):
+                    for at, price in _candle_path(event):
+                        self._price(at, event.symbol, event.exchange, {'ltp': price, 'bid': 0, 'ask': 0,
+                                                                      'open': event.open, 'high': event.high,
+                                                                      'low': event.low, 'volume': event.volume})
+                    sim_clock.advance_to(event.timestamp + timedelta(seconds=event.interval))
+                else:
+                    self._price(when, event.symbol, event.exchange, {'ltp': event.ltp, 'bid': event.bid,
+                                                                    'ask': event.ask, 'volume': event.volume})
+                self.stats['events'] += 1
+
+                if self.strategy is not None:
+                    self.strategy(ctx, event)
+
+            self._finish_day(pending_squareoffs)
+            update_all_positions_mtm()
+            # read while the simulated clock is installed (no wall-clock fund reset)
+            funds = ctx.funds()['data'] or {}
+            trades = SandboxTrades.query.filter_by(user_id=self.user_id).count()
+        finally:
+            elapsed = time.perf_counter() - start
+            engine.stop()
+            set_tick_engine(previous_engine)
+            FundManager.auto_reset = previous_auto_reset
+            set_quote_provider(previous_provider)
+            clock.set_clock(previous_clock)
+
+        result = dict(
+            self.stats,
+            orders_placed=ctx.orders_placed,
+            trades=trades,
+            elapsed_seconds=round(elapsed, 3),
+            events_per_second=round(self.stats['events'] / elapsed, 1) if elapsed else 0.0,
+            price_updates_per_second=round(self.stats['price_updates'] / elapsed, 1) if elapsed else 0.0,
+            start=first.timestamp.isoformat(),
+            end=sim_clock.now().isoformat(),
+            funds=funds,
+        )
+        logger.info(f"Replay finished: {result['events']} events in {result['elapsed_seconds']}s "
+                    f"({result['events_per_second']} events/s), {result['fills']} fills")
+        return result
+
+    def _price(self, when, symbol, exchange, quote):
+        clock.get_clock().advance_to(when)
+        self.quotes.update(symbol, exchange, quote)
+        self._engine.on_tick({'symbol': symbol, 'exchange': exchange, 'data': quote})
+        self.stats['price_updates'] += 1
+        self.stats['fills'] += self._engine.drain()
+
+    @staticmethod
+    def _squareoffs_for(day, squareoff_times):
+        return [clock.IST.localize(datetime.combine(day, at)) for at in squareoff_times]
+
+    def _square_off(self, when):
+        clock.get_clock().advance_to(when)
+        self._squareoff.check_and_square_off()
+        self.stats['square_off_runs'] += 1
+
+    def _finish_day(self, pending_squareoffs):
+        """Square-off times left in the day still fire before the day ends"""
+        while pending_squareoffs:
+            self._square_off(pending_squareoffs.pop(0))
+
+    def _roll_days(self, day, new_day):
+        """Run the midnight jobs of every day boundary between day and new_day"""
+        from sandbox.fund_manager import reset_all_user_funds
+        from sandbox.holdings_manager import process_all_t1_settlements
+
+        while day < new_day:
+            day += timedelta(days=1)
+            clock.get_clock().advance_to(clock.IST.localize(datetime.combine(day, datetime.min.time())))
+            process_all_t1_settlements()
+            self.stats['settlement_runs'] += 1
+            if self.auto_reset and day.strftime('%A') == self._reset_day:
+                reset_all_user_funds()
+        return day
+
+
+# ----- running many replays -----------------------------------------------------
+
+def load_strategy(spec):
+    """'package.module:function' to the strategy callable"""
+    if not spec:
+        return None
+    module_name, _, attr = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attr or 'strategy')
+
+
+def build_events(candles=(), ticks=(), interval=DEFAULT_INTERVAL):
+    """
+    Event stream from files. ``candles`` entries are paths or
+    (path, symbol, exchange) tuples; ``ticks`` entries are JSONL paths.
+    """
+    sources = []
+    for entry in candles:
+        path, symbol, exchange = (entry, None, None) if isinstance(entry, str) else entry
+        sources.append(load_candles_csv(path, symbol, exchange, interval))
+    sources.extend(load_ticks_jsonl(path) for path in ticks)
+    return merge_events(*sources)
+
+
+def run_replay_job(job):
+    """
+    Run one replay described by a dict (picklable, for worker processes):
+    candles, ticks, interval, strategy ('module:function'), user_id,
+    auto_reset and sandbox_db (path of this replay's own sandbox database).
+    """
+    if job.get('sandbox_db'):
+        # Must happen before database.sandbox_db is imported in this process
+        os.environ['SANDBOX_DATABASE_URL'] = f"sqlite:///{os.path.abspath(job['sandbox_db'])}"
+    driver = ReplayDriver(
+        build_events(job.get('candles', ()), job.get('ticks', ()), job.get('interval', DEFAULT_INTERVAL)),
+        strategy=load_strategy(job.get('strategy')),
+        user_id=job.get('user_id', 'replay'),
+        auto_reset=job.get('auto_reset', False),
+    )
+    result = driver.run()
+    result['job'] = job.get('name') or job.get('sandbox_db')
+    return result
+
+
+def run_replays(jobs, processes=None):
+    """
+    Run independent replays in separate processes. Every job needs its own
+    ``sandbox_db`` so the replays do not share accounts.
+    """
+    databases = [job.get('sandbox_db') for job in jobs]
+    if None in databases or len(set(databases)) != len(databases):
+        raise ValueError("Every replay job needs its own sandbox_db")
+    # spawn + one job per worker: every replay starts in a clean interpreter and
+    # sets its SANDBOX_DATABASE_URL before the sandbox database module is imported
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=processes or min(len(jobs), os.cpu_count() or 1), maxtasksperchild=1) as pool:
+        return pool.map(run_replay_job, jobs, chunksize=1)
@@ -19,10 +19,13 @@ from decimal import Decimal
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from sqlalchemy import bindparam, update
+
 from database.sandbox_db import (
     SandboxPositions, db_session, get_config
 )
-from sandbox.position_manager import PositionManager
+from sandbox import account_state, clock
+from sandbox.quote_provider import fetch_quotes
 from utils.logging import get_logger
 
 logger = get_logger(__name__)
@@ -61,7 +64,7 @@ class SquareOffManager:
         Should be called frequently (e.g., every minute)
         """
         try:
-            now = datetime.now(self.ist)
+            now = clock.now()
             current_time = now.time()
 
             # Step 1: Cancel all open MIS orders past square-off time
@@ -106,6 +109,7 @@ class SquareOffManager:
             from sandbox.order_manager import OrderManager
 
             # Get all open MIS orders
+            account_state.sync()
             open_orders = SandboxOrders.query.filter_by(
                 product='MIS',
                 order_status='open'
@@ -145,37 +149,113 @@ class SquareOffManager:
             logger.error(f"Error in _cancel_open_mis_orders: {e}")
 
     def _square_off_positions(self, positions):
-        """Square-off a list of positions"""
-        success_count = 0
-        error_count = 0
-
-        for position in positions:
-            try:
-                pm = PositionManager(position.user_id)
-                success, response, status_code = pm.close_position(
-                    position.symbol,
-                    position.exchange,
-                    position.product
-                )
-
-                if success:
-                    logger.info(
-                        f"Auto square-off: {position.symbol} for user {position.user_id} - "
-                        f"OrderID: {response.get('orderid', 'N/A')}"
-                    )
-                    success_count += 1
-                else:
-                    logger.error(
-                        f"Failed to square-off {position.symbol} for user {position.user_id}: "
-                        f"{response.get('message', 'Unknown error')}"
+        """
+        Square-off a list of positions as one batch
+
+        The closing MARKET orders, their trades and the position and fund
+        updates are generated from one quote snapshot and committed together,
+        with the same pricing and margin release as an order placed through
+        OrderManager. Positions without a price are left for the next check.
+        """
+        from database.sandbox_db import SandboxFunds, SandboxOrders, SandboxTrades
+        from sandbox.execution_engine import _execution_lock
+        from sandbox.id_allocator import next_order_ids, next_trade_ids
+        from sandbox.margin_profiles import get_margin_profiles
+
+        if not positions:
+            return
+
+        try:
+            quotes = fetch_quotes({(p.symbol, p.exchange) for p in positions})
+            profiles = get_margin_profiles().get_many({(p.symbol, p.exchange) for p in positions})
+
+            with _execution_lock:
+                # Re-read under the lock so fills applied since the caller's query are seen
+                positions = SandboxPositions.query.filter(
+                    SandboxPositions.id.in_([p.id for p in positions]),
+                    SandboxPositions.quantity != 0
+                ).populate_existing().all()
+
+                now = clock.now()
+                orders, trades, position_updates = [], [], []
+                fund_changes = {}  # user_id -> [margin released, realized P&L]
+                skipped = 0
+
+                for position in positions:
+                    quote = quotes.get((position.symbol, position.exchange)) or {}
+                    ltp = Decimal(str(quote.get('ltp') or 0))
+                    profile = profiles.get((position.symbol, position.exchange))
+                    if ltp <= 0 or profile is None:
+                        logger.error(f"Failed to square-off {position.symbol} for user {position.user_id}: "
+                                     f"{'no price available' if ltp <= 0 else 'symbol not found'}")
+                        skipped += 1
+                        continue
+
+                    # MARKET orders fill at bid (SELL) / ask (BUY), falling back to LTP
+                    action = 'SELL' if position.quantity > 0 else 'BUY'
+                    side_price = Decimal(str(quote.get('bid' if action == 'SELL' else 'ask') or 0))
+                    price = side_price if side_price > 0 else ltp
+                    quantity = abs(position.quantity)
+
+                    if position.quantity > 0:
+                        realized_pnl = (price - position.average_price) * quantity
+                    else:
+                        realized_pnl = (position.average_price - price) * quantity
+
+                    # Release the margin blocked when the position was opened
+                    position_action = 'BUY' if position.quantity > 0 else 'SELL'
+                    margin = profile.margin(quantity, position.average_price, position.product, position_action)
+
+                    orders.append({
+                        'user_id': position.user_id, 'strategy': 'AUTO_SQUARE_OFF',
+                        'symbol': position.symbol, 'exchange': position.exchange, 'action': action,
+                        'quantity': quantity, 'price': ltp, 'trigger_price': None, 'price_type': 'MARKET',
+                        'product': position.product, 'order_status': 'complete', 'average_price': price,
+                        'filled_quantity': quantity, 'pending_quantity': 0, 'rejection_reason': None,
+                        'margin_blocked': Decimal('0'), 'order_timestamp': now, 'update_timestamp': now,
+                    })
+                    trades.append({
+                        'user_id': position.user_id,
+                        'symbol': position.symbol, 'exchange': position.exchange, 'action': action,
+                        'quantity': quantity, 'price': price, 'product': position.product,
+                        'strategy': 'AUTO_SQUARE_OFF', 'trade_timestamp': now,
+                    })
+                    accumulated = (position.accumulated_realized_pnl or Decimal('0')) + realized_pnl
+                    position_updates.append({
+                        'id': position.id, 'quantity': 0, 'ltp': price, 'pnl': accumulated,
+                        'pnl_percent': Decimal('0.00'), 'accumulated_realized_pnl': accumulated,
+                    })
+                    change = fund_changes.setdefault(position.user_id, [Decimal('0'), Decimal('0')])
+                    change[0] += margin
+                    change[1] += realized_pnl
+
+                if orders:
+                    for order, trade, orderid, tradeid in zip(orders, trades, next_order_ids(len(orders)),
+                                                              next_trade_ids(len(trades))):
+                        order['orderid'] = trade['orderid'] = orderid
+                        trade['tradeid'] = tradeid
+                    db_session.execute(SandboxOrders.__table__.insert(), orders)
+                    db_session.execute(SandboxTrades.__table__.insert(), trades)
+                    db_session.execute(update(SandboxPositions), position_updates)
+
+                    funds = SandboxFunds.__table__
+                    db_session.execute(
+                        funds.update().where(funds.c.user_id == bindparam('uid')).values(
+                            used_margin=funds.c.used_margin - bindparam('margin'),
+                            available_balance=funds.c.available_balance + bindparam('margin') + bindparam('pnl'),
+                            realized_pnl=funds.c.realized_pnl + bindparam('pnl'),
+                            total_pnl=funds.c.realized_pnl + bindparam('pnl') + funds.c.unrealized_pnl,
+                        ),
+                        [{'uid': uid, 'margin': margin, 'pnl': pnl} for uid, (margin, pnl) in fund_changes.items()],
                     )
-                    error_count += 1
+                    db_session.commit()
+                    account_state.invalidate(list(fund_changes))
 
-            except Exception as e:
-                logger.error(f"Error squaring-off position {position.symbol}: {e}")
-                error_count += 1
+            logger.info(f"Square-off completed: {len(orders)} successful, {skipped} failed")
 
-        logger.info(f"Square-off completed: {success_count} successful, {error_count} failed")
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error squaring-off positions: {e}")
 
     def force_square_off_all_mis(self):
         """Force square-off all MIS positions immediately"""
@@ -204,7 +284,7 @@ class SquareOffManager:
             if not square_off_time:
                 return None
 
-            now = datetime.now(self.ist)
+            now = clock.now()
             current_time = now.time()
 
             # Create datetime objects for comparison
@@ -224,7 +304,7 @@ class SquareOffManager:
     def get_square_off_status(self):
         """Get status of square-off times for all exchanges"""
         try:
-            now = datetime.now(self.ist)
+            now = clock.now()
             current_time = now.time()
 
             status = {}
@@ -0,0 +1,547 @@
+# sandbox/tick_engine.py
+"""
+Tick-driven order matching for sandbox mode
+
+Open LIMIT / SL / SL-M orders are kept in per-symbol trigger books (price
+sorted heaps). Every tick from MarketDataService is checked against the top
+of the books only, so a tick costs O(log n) for the orders it actually
+crosses instead of a DB + REST round trip for every open order.
+
+Crossed orders are handed to a single fill-writer thread that drains them
+in batches and applies them with the existing ExecutionEngine rules. The
+feed callback never touches the database. Symbols without a recent tick
+are still served by the REST poller in execution_thread.
+
+The books follow order placement, modification, cancellation (including
+the square-off cancels, which go through OrderManager.cancel_order) and
+fills through the track_order / untrack_order hooks; a full reconcile with
+the database runs only every SANDBOX_TICK_SYNC_SECONDS, for orders changed
+by other processes.
+"""
+
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+
+from database.sandbox_db import SandboxOrders, db_session
+from sandbox import account_state
+from utils.logging import get_logger
+from utils.metrics import counter, histogram
+
+logger = get_logger(__name__)
+
+TICK_ENGINE_ENABLED = os.getenv('SANDBOX_TICK_ENGINE', 'True').lower() == 'true'
+# A symbol without a tick for this long is handed back to the REST poller
+TICK_STALE_SECONDS = float(os.getenv('SANDBOX_TICK_STALE_SECONDS', '10'))
+FILL_BATCH_SIZE = 200
+FILL_BATCH_WAIT = 0.02  # seconds to wait for more fills before applying a batch
+FEED_RETRY_SECONDS = 60  # back-off after a user's feed could not be set up
+FULL_SYNC_SECONDS = float(os.getenv('SANDBOX_TICK_SYNC_SECONDS', '60'))  # between full reconciles with the database
+
+TRIGGERED_ORDERS = counter('openalgo_sandbox_triggered_orders_total', 'Sandbox orders whose trigger was crossed by a tick')
+TICK_FILLS = counter('openalgo_sandbox_tick_fills_total', 'Sandbox orders filled from the live feed')
+TICK_TO_FILL_SECONDS = histogram('openalgo_sandbox_tick_to_fill_seconds', 'Time from a crossing tick to the committed fill')
+FILL_BATCH_SECONDS = histogram('openalgo_sandbox_fill_batch_seconds', 'Time to apply one batch of tick-triggered fills')
+
+
+def _symbol_key(exchange, symbol):
+    return f"{exchange}:{symbol}"
+
+
+class TriggerBook:
+    """
+    Open orders of one symbol indexed by the price that makes them fire.
+
+    * BUY LIMIT fires when ltp <= price      (max-heap on price)
+    * SELL LIMIT fires when ltp >= price     (min-heap on price)
+    * BUY SL / SL-M fires when ltp >= trigger  (min-heap on trigger)
+    * SELL SL / SL-M fires when ltp <= trigger (max-heap on trigger)
+    * open MARKET orders fire on any tick
+    * an SL order whose trigger was crossed but whose limit was not is armed
+      on its limit price instead: BUY fires when ltp <= price (max-heap),
+      SELL when ltp >= price (min-heap)
+
+    Removal is lazy: heap entries carry a sequence number and only count
+    while it matches ``live[orderid]``.
+    """
+
+    __slots__ = ('buy_limit', 'sell_limit', 'buy_stop', 'sell_stop', 'buy_armed', 'sell_armed', 'market', 'live')
+
+    _seq = itertools.count()
+
+    def __init__(self):
+        self.buy_limit = []
+        self.sell_limit = []
+        self.buy_stop = []
+        self.sell_stop = []
+        self.buy_armed = []
+        self.sell_armed = []
+        self.market = {}
+        self.live = {}
+
+    def __len__(self):
+        return len(self.live)
+
+    def add(self, orderid, action, price_type, price, trigger_price):
+        self.remove(orderid)
+        seq = next(self._seq)
+        if price_type == 'MARKET':
+            self.market[orderid] = seq
+        elif price_type == 'LIMIT':
+            if action == 'BUY':
+                heapq.heappush(self.buy_limit, (-float(price), seq, orderid))
+            else:
+                heapq.heappush(self.sell_limit, (float(price), seq, orderid))
+        elif price_type in ('SL', 'SL-M'):
+            if action == 'BUY':
+                heapq.heappush(self.buy_stop, (float(trigger_price), seq, orderid))
+            else:
+                heapq.heappush(self.sell_stop, (-float(trigger_price), seq, orderid))
+        else:
+            return
+        self.live[orderid] = seq
+
+    def arm(self, orderid, action, price):
+        """Track a triggered SL order on its limit price"""
+        self.remove(orderid)
+        seq = next(self._seq)
+        if action == 'BUY':
+            heapq.heappush(self.buy_armed, (-float(price), seq, orderid))
+        else:
+            heapq.heappush(self.sell_armed, (float(price), seq, orderid))
+        self.live[orderid] = seq
+
+    def remove(self, orderid):
+        self.live.pop(orderid, None)
+        self.market.pop(orderid, None)
+
+    def _drain(self, heap, crossed, fired):
+        live = self.live
+        while heap and crossed(heap[0][0]):
+            _, seq, orderid = heapq.heappop(heap)
+            if live.get(orderid) == seq:
+                del live[orderid]
+                fired.append(orderid)
+
+    def crossed(self, ltp):
+        """Pop and return the order ids whose trigger is crossed at ``ltp``"""
+        fired = []
+        self._drain(self.buy_limit, lambda key: -key >= ltp, fired)
+        self._drain(self.sell_limit, lambda key: key <= ltp, fired)
+        self._drain(self.buy_stop, lambda key: key <= ltp, fired)
+        self._drain(self.sell_stop, lambda key: -key >= ltp, fired)
+        self._drain(self.buy_armed, lambda key: -key >= ltp, fired)
+        self._drain(self.sell_armed, lambda key: key <= ltp, fired)
+        if self.market:
+            for orderid in self.market:
+                self.live.pop(orderid, None)
+                fired.append(orderid)
+            self.market = {}
+        return fired
+
+
+def _trigger_crossed(order, ltp):
+    """Whether an SL order's trigger is crossed at ltp (ExecutionEngine's activation rule)"""
+    trigger = float(order.trigger_price or 0)
+    return ltp >= trigger if order.action == 'BUY' else ltp <= trigger
+
+
+def _order_entry(order, price_type=None):
+    """Book entry of an order, as tracked by TickExecutionEngine._add"""
+    return (order.orderid, _symbol_key(order.exchange, order.symbol), order.user_id,
+            order.action, price_type or order.price_type, order.price, order.trigger_price)
+
+
+def _quote_from_tick(market_data):
+    """Quote dict in the shape ExecutionEngine._process_order expects"""
+    ltp = market_data.get('ltp') or 0
+    bid = market_data.get('bid') or 0
+    ask = market_data.get('ask') or 0
+    depth = market_data.get('depth') or {}
+    if not bid and depth.get('buy'):
+        bid = depth['buy'][0].get('price') or 0
+    if not ask and depth.get('sell'):
+        ask = depth['sell'][0].get('price') or 0
+    return {'ltp': ltp, 'bid': bid, 'ask': ask}
+
+
+class TickExecutionEngine:
+    """Matches open sandbox orders against live ticks"""
+
+    def __init__(self, executor=None):
+        if executor is None:
+            from sandbox.execution_engine import ExecutionEngine
+            executor = ExecutionEngine()
+        self.executor = executor
+        self.books = {}  # symbol_key -> TriggerBook
+        self.order_keys = {}  # orderid -> symbol_key
+        self.order_users = {}  # orderid -> user_id
+        self.watched = set()  # symbol keys with open orders (also the feed subscriber filter)
+        self.last_tick = {}  # symbol_key -> monotonic time of last tick
+        self._lock = threading.Lock()
+        self._fills = queue.SimpleQueue()
+        self._feed_subscribed = set()  # (user_id, symbol_key)
+        self._feed_users = set()
+        self._feed_failed = {}  # user_id -> monotonic time of last failure
+        self._subscriber_id = None
+        self._writer = None
+        self._running = False
+        self._last_sync = None  # monotonic time of the last full sync
+        self._changes = None  # add/remove calls made while a full sync runs, replayed onto its books
+
+    # ----- order book maintenance -------------------------------------------------
+
+    def add_order(self, order):
+        """Track an open order (call after it is committed)"""
+        if order.order_status != 'open':
+            return
+        self._track(_order_entry(order))
+
+    def arm_order(self, order):
+        """
+        Track an open SL order whose trigger was crossed on its limit price,
+        so it fires again only once a tick reaches the limit
+        """
+        if order.order_status != 'open':
+            return
+        self._track(_order_entry(order, 'ARMED'))
+
+    def remove_order(self, orderid):
+        """Stop tracking an order (cancelled, modified or filled elsewhere)"""
+        with self._lock:
+            self._remove(orderid)
+            if self._changes is not None:
+                self._changes.append(orderid)
+
+    def _track(self, *entries):
+        with self._lock:
+            for entry in entries:
+                self._add(*entry)
+                if self._changes is not None:
+                    self._changes.append(entry)
+
+    def _add(self, orderid, key, user_id, action, price_type, price, trigger_price):
+        book = self.books.get(key)
+        if book is None:
+            book = self.books[key] = TriggerBook()
+        if price_type == 'ARMED':
+            book.arm(orderid, action, price)
+        else:
+            book.add(orderid, action, price_type, price, trigger_price)
+        self.order_keys[orderid] = key
+        self.order_users[orderid] = user_id
+        self.watched.add(key)
+
+    def _remove(self, orderid):
+        key = self.order_keys.pop(orderid, None)
+        self.order_users.pop(orderid, None)
+        if key is None:
+            return
+        book = self.books.get(key)
+        if book is not None:
+            book.remove(orderid)
+
+    def sync(self):
+        """
+        Rebuild the books from the open orders in the database. Picks up
+        orders placed or cancelled by other processes and compacts lazily
+        removed heap entries; orders tracked or removed through the hooks
+        while it runs are kept. The database does not record which SL orders
+        were triggered, so armed orders go back on their trigger price and
+        are re-armed by the next tick that crosses it.
+        """
+        with self._lock:
+            self._changes = []
+        try:
+            account_state.sync()
+            open_orders = SandboxOrders.query.filter_by(order_status='open').all()
+            books, order_keys, order_users = {}, {}, {}
+            for order in open_orders:
+                key = _symbol_key(order.exchange, order.symbol)
+                book = books.get(key)
+                if book is None:
+                    book = books[key] = TriggerBook()
+                book.add(order.orderid, order.action, order.price_type, order.price, order.trigger_price)
+                order_keys[order.orderid] = key
+                order_users[order.orderid] = order.user_id
+            with self._lock:
+                self.books = books
+                self.order_keys = order_keys
+                self.order_users = order_users
+                # mutate in place: the feed subscriber holds a reference to this set
+                self.watched.intersection_update(books.keys())
+                self.watched.update(books.keys())
+                for change in self._changes:
+                    if isinstance(change, tuple):
+                        self._add(*change)
+                    else:
+                        self._remove(change)
+            self._last_sync = time.monotonic()
+            return len(open_orders)
+        finally:
+            with self._lock:
+                self._changes = None
+            db_session.remove()
+
+    def sync_if_due(self):
+        """Run a full sync when the last one is FULL_SYNC_SECONDS old; returns whether it ran"""
+        if self._last_sync is not None and time.monotonic() - self._last_sync < FULL_SYNC_SECONDS:
+            return False
+        self.sync()
+        return True
+
+    def live_symbols(self):
+        """Symbol keys (exchange, symbol) that had a tick within TICK_STALE_SECONDS"""
+        cutoff = time.monotonic() - TICK_STALE_SECONDS
+        live = set()
+        for key, seen in list(self.last_tick.items()):
+            if seen >= cutoff:
+                exchange, _, symbol = key.partition(':')
+                live.add((symbol, exchange))
+        return live
+
+    # ----- feed -------------------------------------------------------------------
+
+    def on_tick(self, data):
+        """MarketDataService callback: runs on the feed thread, never touches the DB"""
+        symbol = data.get('symbol')
+        exchange = data.get('exchange')
+        if not symbol or not exchange:
+            return
+        key = _symbol_key(exchange, symbol)
+        market_data = data.get('data') or {}
+        ltp = market_data.get('ltp')
+        if not ltp:
+            return
+        now = time.monotonic()
+        self.last_tick[key] = now
+        book = self.books.get(key)
+        if book is None:
+            return
+        with self._lock:
+            fired = book.crossed(float(ltp))
+        if fired:
+            TRIGGERED_ORDERS.inc(len(fired))
+            quote = _quote_from_tick(market_data)
+            for orderid in fired:
+                self._fills.put((orderid, quote, now))
+
+    def ensure_feed_subscriptions(self):
+        """
+        Subscribe the order owners' websocket feed to every watched symbol.
+        Best effort: symbols that cannot be subscribed stay on the REST poller.
+        """
+        with self._lock:
+            wanted = {(self.order_users[oid], key) for oid, key in self.order_keys.items()}
+        missing = wanted - self._feed_subscribed
+        if not missing:
+            return
+        from services.market_data_service import get_market_data_service
+        from services.websocket_service import subscribe_to_symbols
+
+        by_user = {}
+        for user_id, key in missing:
+            by_user.setdefault(user_id, []).append(key)
+        service = get_market_data_service()
+        now = time.monotonic()
+        for user_id, keys in by_user.items():
+            if now - self._feed_failed.get(user_id, -FEED_RETRY_SECONDS) < FEED_RETRY_SECONDS:
+                continue
+            try:
+                if user_id not in self._feed_users:
+                    if not service.register_user_callback(user_id):
+                        self._feed_failed[user_id] = now
+                        continue
+                    self._feed_users.add(user_id)
+                symbols = [{'exchange': k.partition(':')[0], 'symbol': k.partition(':')[2]} for k in keys]
+                success, _, _ = subscribe_to_symbols(user_id, 'sandbox', symbols, 'LTP')
+                if success:
+                    self._feed_subscribed.update((user_id, k) for k in keys)
+                else:
+                    self._feed_failed[user_id] = now
+            except Exception as e:
+                self._feed_failed[user_id] = now
+                logger.debug(f"Feed subscription for sandbox user {user_id} failed, REST poller will cover it: {e}")
+
+    # ----- fill writer ------------------------------------------------------------
+
+    def _next_batch(self):
+        """Block for the first fill, then collect more for FILL_BATCH_WAIT; latest quote per order wins"""
+        try:
+            orderid, quote, seen = self._fills.get(timeout=0.5)
+        except queue.Empty:
+            return {}
+        batch = {orderid: (quote, seen)}
+        deadline = time.monotonic() + FILL_BATCH_WAIT
+        while len(batch) < FILL_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                orderid, quote, seen = self._fills.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch[orderid] = (quote, seen)
+        return batch
+
+    def apply_fills(self, batch):
+        """Apply a batch of crossed orders with the ExecutionEngine rules; returns fills"""
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        filled = 0
+        # the crossing tick took the batch's orders off their books; those not yet
+        # applied go back on them if the batch fails
+        unapplied = None
+        try:
+            account_state.sync()
+            orders = SandboxOrders.query.filter(
+                SandboxOrders.orderid.in_(list(batch)),
+                SandboxOrders.order_status == 'open'
+            ).all()
+            unapplied = {order.orderid: _order_entry(order) for order in orders}
+            for order in orders:
+                quote, seen = batch[order.orderid]
+                self.executor._process_order(order, quote)
+                del unapplied[order.orderid]
+                if order.order_status == 'open':
+                    if order.price_type == 'SL' and _trigger_crossed(order, float(quote['ltp'])):
+                        # triggered but LTP beyond the limit: wait for the limit, not the trigger
+                        self.arm_order(order)
+                    else:
+                        self.add_order(order)
+                else:
+                    filled += 1
+                    self.remove_order(order.orderid)
+                    TICK_FILLS.inc()
+                    TICK_TO_FILL_SECONDS.observe(time.monotonic() - seen)
+        except Exception as e:
+            logger.error(f"Error applying tick-triggered fills: {e}")
+            db_session.rollback()
+            if unapplied is None:
+                self._last_sync = None  # the orders were never loaded: the next full sync restores them
+            else:
+                with self._lock:  # not those cancelled meanwhile
+                    restore = [entry for orderid, entry in unapplied.items() if orderid in self.order_keys]
+                self._track(*restore)
+        finally:
+            db_session.remove()
+            FILL_BATCH_SECONDS.observe(time.perf_counter() - start)
+        return filled
+
+    def drain(self):
+        """Apply every queued fill on the calling thread (used when there is no writer thread)"""
+        filled = 0
+        while True:
+            batch = {}
+            try:
+                while len(batch) < FILL_BATCH_SIZE:
+                    orderid, quote, seen = self._fills.get_nowait()
+                    batch[orderid] = (quote, seen)
+            except queue.Empty:
+                pass
+            if not batch:
+                return filled
+            filled += self.apply_fills(batch)
+
+    def _writer_loop(self):
+        while self._running:
+            batch = self._next_batch()
+            if batch:
+                filled = self.apply_fills(batch)
+                logger.debug(f"Applied {len(batch)} triggered orders, {filled} filled")
+
+    # ----- lifecycle --------------------------------------------------------------
+
+    def start(self, feed=True):
+        """
+        Start matching. With feed=False nothing is subscribed and no writer
+        thread is started: the caller feeds on_tick() and calls drain() itself
+        (historical replay).
+        """
+        if self._running:
+            return
+        self._running = True
+        count = self.sync()
+        if not feed:
+            logger.debug(f"Sandbox tick engine attached without feed, {count} open orders")
+            return
+
+        from services.market_data_service import get_market_data_service
+
+        self._subscriber_id = get_market_data_service().subscribe_to_updates('all', self.on_tick, self.watched)
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True, name="SandboxFillWriter")
+        self._writer.start()
+        logger.info(f"Sandbox tick engine started with {count} open orders")
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        if self._subscriber_id is not None:
+            from services.market_data_service import get_market_data_service
+
+            get_market_data_service().unsubscribe_from_updates(self._subscriber_id)
+            self._subscriber_id = None
+        if self._writer is not None:
+            self._writer.join(timeout=2)
+            self._writer = None
+        logger.info("Sandbox tick engine stopped")
+
+    @property
+    def running(self):
+        return self._running
+
+    def get_status(self):
+        with self._lock:
+            return {
+                'running': self._running,
+                'open_orders': len(self.order_keys),
+                'symbols': len(self.books),
+                'live_symbols': len(self.live_symbols()),
+                'pending_fills': self._fills.qsize(),
+            }
+
+
+_tick_engine = None
+_tick_engine_lock = threading.Lock()
+
+
+def get_tick_engine():
+    """Get the process-wide tick engine (created on first use)"""
+    global _tick_engine
+    if _tick_engine is None:
+        with _tick_engine_lock:
+            if _tick_engine is None:
+                _tick_engine = TickExecutionEngine()
+    return _tick_engine
+
+
+def get_tick_engine_status():
+    """Status of the process-wide tick engine, None when it was never created"""
+    engine = _tick_engine
+    return engine.get_status() if engine is not None else None
+
+
+def set_tick_engine(engine):
+    """Install the process-wide tick engine (the replay driver brings its own); returns the previous one"""
+    global _tick_engine
+    with _tick_engine_lock:
+        previous, _tick_engine = _tick_engine, engine
+    return previous
+
+
+def track_order(order):
+    """Hook for order placement/modification: start matching an open order on ticks"""
+    # Only started when SANDBOX_TICK_ENGINE is on (or by a replay)
+    if _tick_engine is not None and _tick_engine.running:
+        _tick_engine.add_order(order)
+
+
+def untrack_order(orderid):
+    """Hook for cancellation: stop matching an order"""
+    if _tick_engine is not None:
+        _tick_engine.remove_order(orderid)
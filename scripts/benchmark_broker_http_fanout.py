@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Parallel order fan-out over the sync and async broker HTTP transports.
+
+Starts a local HTTP/1.1 server that answers each POST after ``--latency``
+milliseconds (a stand-in for a broker order endpoint) and sends ``--orders``
+orders to it, in ``--rounds`` rounds, three ways:
+
+- sync:  ``get_httpx_client()`` called from a thread pool of ``--threads``
+- async: ``request_many()`` on the shared transport's event loop
+- naive: a new ``httpx.Client`` per request (no pooling), for reference
+
+Both pooled modes are capped at ``--concurrency`` requests in flight per
+host. For each mode the script prints the median wall time of a round and
+the number of TCP connections the server accepted in total. The server
+speaks HTTP/1.1 only, so this measures pooling and the per-host cap, not
+HTTP/2 multiplexing.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+class _BrokerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.05
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _BrokerHandler.lock:
+            _BrokerHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        body = b'{"status": "success", "orderid": "1"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _BrokerServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the naive mode opens a connection per order at once
+    request_queue_size = 1024
+
+
+def _start_server(latency_ms: float) -> str:
+    _BrokerHandler.latency = latency_ms / 1000
+    httpd = _BrokerServer(("127.0.0.1", 0), _BrokerHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_address[1]}/orders/regular"
+
+
+def _measure(label: str, rounds: int, send_round) -> None:
+    before = _BrokerHandler.connections
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        send_round()
+        timings.append(time.perf_counter() - start)
+    print(f"{label:<6} round p50 {statistics.median(timings) * 1000:8.1f} ms   "
+          f"min {min(timings) * 1000:8.1f} ms   connections {_BrokerHandler.connections - before:5d}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=200, help="orders per round (default: 200)")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds per mode (default: 5)")
+    parser.add_argument("--latency", type=float, default=50.0, help="server latency in ms (default: 50)")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight per host (default: 32)")
+    parser.add_argument("--threads", type=int, default=32, help="sync mode thread pool size (default: 32)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["BROKER_HTTP_HOST_CONCURRENCY"] = str(args.concurrency)
+    os.environ["BROKER_HTTP_MAX_CONNECTIONS"] = str(args.concurrency)
+    os.environ["BROKER_HTTP_MAX_KEEPALIVE"] = str(args.concurrency)
+
+    import httpx
+
+    from utils.httpx_client import get_httpx_client, pool_stats, request_many
+
+    url = _start_server(args.latency)
+    payload = {"tradingsymbol": "SBIN", "quantity": 1, "transaction_type": "BUY"}
+    print(f"{args.orders} orders per round, {args.latency:g} ms latency, "
+          f"{args.concurrency} in flight per host, floor "
+          f"{-(-args.orders // args.concurrency) * args.latency:.0f} ms\n")
+
+    client = get_httpx_client()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        def sync_round():
+            for response in executor.map(lambda _: client.post(url, json=payload), range(args.orders)):
+                response.raise_for_status()
+
+        def naive_round():
+            def send(_):
+                with httpx.Client(timeout=30.0) as own:
+                    return own.post(url, json=payload)
+            for response in executor.map(send, range(args.orders)):
+                response.raise_for_status()
+
+        _measure("sync", args.rounds, sync_round)
+
+        def async_round():
+            for response in request_many([("POST", url, {"json": payload})] * args.orders):
+                if isinstance(response, Exception):
+                    raise response
+                response.raise_for_status()
+
+        _measure("async", args.rounds, async_round)
+        _measure("naive", args.rounds, naive_round)
+
+    for kind, pools in pool_stats().items():
+        for origin, stats in pools.items():
+            print(f"\n{kind} pool {origin}: {stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""Throughput of the Fyers HSM data feed decoder.
+
+Feeds a session of HSM data feed messages (type 6) through:
+
+- legacy: the previous ``FyersHSMWebSocket._parse_data_feed``, which unpacked
+  every field from its own slice, formatted debug logs per scrip and called
+  back once per changed field of an update
+- decoder: ``HSMFeedDecoder.decode`` with precompiled ``struct.Struct``
+  readers over a memoryview and per-topic value tables (one message per
+  update)
+
+and prints updates/second (scrips decoded) and callbacks/second for each.
+
+The session is either synthesized (default: snapshots for an option chain of
+``--topics`` scrips, then ``--frames`` messages of ``--updates`` updates each,
+changing a few fields the way a busy option chain does) or read from
+``--recording``, a file of raw HSM messages each prefixed with its 4-byte
+big-endian length. Nothing is connected to Fyers.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+NULL = -2147483648
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    # importing the fyers streaming package loads the adapter and its database modules
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class _LegacyParser:
+    """_parse_data_feed and the scrip/index/depth snapshot and update parsers as they were"""
+
+    FIELDS = {
+        "sf": ["ltp", "vol_traded_today", "last_traded_time", "exch_feed_time", "bid_size", "ask_size",
+               "bid_price", "ask_price", "last_traded_qty", "tot_buy_qty", "tot_sell_qty", "avg_trade_price",
+               "OI", "low_price", "high_price", "Yhigh", "Ylow", "lower_ckt", "upper_ckt", "open_price",
+               "prev_close_price", "type", "symbol"],
+        "if": ["ltp", "prev_close_price", "exch_feed_time", "high_price", "low_price", "open_price", "type",
+               "symbol"],
+        "dp": [f"{name}{level}" for name in ("bid_price", "ask_price", "bid_size", "ask_size", "bid_order",
+                                             "ask_order") for level in range(1, 6)] + ["type", "symbol"],
+    }
+
+    def __init__(self, callback):
+        self.logger = logging.getLogger("legacy_hsm")
+        self.callback = callback
+        self.subscriptions = {}
+        self.symbol_mappings = {}
+        self.data = {"sf": {}, "if": {}, "dp": {}}
+
+    def parse(self, data):
+        data = bytearray(data)
+        self.logger.debug(f"Received data feed message (type 6): {len(data)} bytes")
+        scrip_count = struct.unpack("!H", data[7:9])[0]
+        self.logger.debug(f"Data feed contains {scrip_count} scrips")
+        offset = 9
+        for i in range(scrip_count):
+            if offset >= len(data):
+                break
+            data_type = struct.unpack("B", data[offset:offset + 1])[0]
+            offset += 1
+            self.logger.debug(f"Processing scrip {i+1}/{scrip_count}, data_type: {data_type}")
+            if data_type == 83:
+                offset = self._snapshot(data, offset)
+            elif data_type == 85:
+                offset = self._update(data, offset)
+            else:
+                break
+
+    def _snapshot(self, data, offset):
+        topic_id = struct.unpack("H", data[offset:offset + 2])[0]
+        name_len = struct.unpack("B", data[offset + 2:offset + 3])[0]
+        offset += 3
+        name = data[offset:offset + name_len].decode("utf-8")
+        offset += name_len
+        self.subscriptions[topic_id] = name
+        self.logger.debug(f"Mapped topic_id {topic_id} -> {name}")
+        kind = name[:2]
+        fields = self.FIELDS[kind]
+        field_count = struct.unpack("B", data[offset:offset + 1])[0]
+        offset += 1
+        values = {"type": kind}
+        for index in range(field_count):
+            if offset + 4 > len(data):
+                break
+            value = struct.unpack(">i", data[offset:offset + 4])[0]
+            offset += 4
+            if value != NULL and index < len(fields):
+                values[fields[index]] = value
+        if kind != "if":
+            offset += 2
+            values["multiplier"] = struct.unpack(">H", data[offset:offset + 2])[0]
+            offset += 2
+            values["precision"] = struct.unpack("B", data[offset:offset + 1])[0]
+            offset += 1
+            for field in ("exchange", "exchange_token", "symbol"):
+                length = struct.unpack("B", data[offset:offset + 1])[0]
+                offset += 1
+                values[field] = data[offset:offset + length].decode("utf-8", errors="ignore")
+                offset += length
+        if name in self.symbol_mappings:
+            values["original_symbol"] = self.symbol_mappings[name]
+        values["hsm_token"] = name
+        self.data[kind][topic_id] = values
+        self.logger.debug(f"Sending scrip data to callback: {values.get('symbol', 'Unknown')} LTP={values.get('ltp', 'N/A')}")
+        self.logger.debug(f"Complete HSM scrip_data fields: {list(values.keys())}")
+        self.callback(values)
+        return offset
+
+    def _update(self, data, offset):
+        topic_id = struct.unpack("H", data[offset:offset + 2])[0]
+        field_count = struct.unpack("B", data[offset + 2:offset + 3])[0]
+        offset += 3
+        name = self.subscriptions.get(topic_id)
+        if name is None:
+            return offset + field_count * 4
+        kind = name[:2]
+        fields = self.FIELDS[kind]
+        current = self.data[kind][topic_id]
+        for index in range(field_count):
+            if offset + 4 > len(data):
+                break
+            value = struct.unpack(">i", data[offset:offset + 4])[0]
+            offset += 4
+            if value != NULL and index < len(fields):
+                if current.get(fields[index]) != value:
+                    current[fields[index]] = value
+                    update = current.copy()
+                    update["update_type"] = "live"
+                    self.logger.debug(f"Sending live update: {update.get('symbol', 'Unknown')} LTP={update.get('ltp', 'N/A')}")
+                    self.callback(update)
+        return offset
+
+
+def _message(scrips: list[bytes]) -> bytes:
+    return b"\0\0\x06" + b"\0" * 4 + struct.pack(">H", len(scrips)) + b"".join(scrips)
+
+
+def _session(topics: int, frames: int, updates: int) -> tuple[list[bytes], int]:
+    """Snapshot message for ``topics`` option scrips, then ``frames`` update messages"""
+    rng = random.Random(42)
+    snapshots = []
+    for topic_id in range(topics):
+        name = f"sf|nse_fo|{40000 + topic_id}".encode()
+        values = [rng.randint(100, 50000) for _ in range(21)]
+        symbol = f"NIFTY25OCT{24000 + 50 * (topic_id // 2)}{'CE' if topic_id % 2 else 'PE'}".encode()
+        snapshots.append(bytes([83]) + struct.pack("=HB", topic_id, len(name)) + name + bytes([21])
+                         + struct.pack(">21i", *values) + b"\0\0" + struct.pack(">HB", 100, 2)
+                         + b"".join(bytes([len(s)]) + s for s in (b"NSE", name[10:], symbol)))
+    session = [_message(snapshots)]
+    ltp = [20000] * topics
+    for _ in range(frames):
+        scrips = []
+        for topic_id in rng.sample(range(topics), min(updates, topics)):
+            ltp[topic_id] += rng.choice((-5, 5, 10, -10))
+            values = [NULL] * 21
+            # ltp, volume, last trade time, feed time, best bid/ask size and price, last qty
+            for index in (1, 2, 3, 4, 5, 6, 7, 8):
+                values[index] = rng.randint(1, 10 ** 6)
+            values[0] = ltp[topic_id]
+            scrips.append(bytes([85]) + struct.pack("=HB", topic_id, 21) + struct.pack(">21i", *values))
+        session.append(_message(scrips))
+    return session, topics + frames * min(updates, topics)
+
+
+def _recording(path: str) -> tuple[list[bytes], int]:
+    raw = Path(path).read_bytes()
+    session, offset, scrips = [], 0, 0
+    while offset + 4 <= len(raw):
+        length = struct.unpack_from(">I", raw, offset)[0]
+        message = raw[offset + 4:offset + 4 + length]
+        offset += 4 + length
+        if len(message) >= 9 and message[2] == 6:
+            session.append(message)
+            scrips += struct.unpack_from(">H", message, 7)[0]
+    return session, scrips
+
+
+def _rate(parse, session, scrips: int, callbacks: list) -> tuple[float, float]:
+    start = time.perf_counter()
+    for message in session:
+        parse(message)
+    elapsed = time.perf_counter() - start
+    return scrips / elapsed, len(callbacks) / elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", type=int, default=400, help="subscribed option scrips (default: 400)")
+    parser.add_argument("--frames", type=int, default=5000, help="update messages (default: 5000)")
+    parser.add_argument("--updates", type=int, default=40, help="updates per message (default: 40)")
+    parser.add_argument("--recording", help="file of length-prefixed HSM messages to replay instead")
+    args = parser.parse_args()
+
+    _configure_databases(tempfile.mkdtemp(prefix="fyers-hsm-"))
+    import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+    from broker.fyers.streaming.fyers_hsm_decoder import HSMFeedDecoder
+
+    if args.recording:
+        session, scrips = _recording(args.recording)
+        source = args.recording
+    else:
+        session, scrips = _session(args.topics, args.frames, args.updates)
+        source = f"{args.topics} topics, {args.frames} messages x {args.updates} updates"
+    logging.getLogger("legacy_hsm").setLevel(logging.WARNING)
+
+    # the adapter registers every subscribed token before the snapshots arrive
+    mappings = {f"sf|nse_fo|{40000 + topic_id}": f"OPT{topic_id}" for topic_id in range(args.topics)}
+    legacy_out: list = []
+    legacy = _LegacyParser(legacy_out.append)
+    legacy.symbol_mappings.update(mappings)
+    decoder_out: list = []
+    decoder = HSMFeedDecoder(dict(mappings))
+
+    def decode(message):
+        for update in decoder.decode(message):
+            decoder_out.append(update)
+
+    print(f"{source}: {scrips:,} scrips in {len(session):,} messages\n")
+    print(f"{'parser':<8} {'updates/s':>12} {'callbacks/s':>12}")
+    for name, parse, out in (("legacy", legacy.parse, legacy_out), ("decoder", decode, decoder_out)):
+        updates_rate, callback_rate = _rate(parse, session, scrips, out)
+        print(f"{name:<8} {updates_rate:>12,.0f} {callback_rate:>12,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
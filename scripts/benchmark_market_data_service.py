@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Feed and reader throughput of the MarketDataService cache under contention.
+
+One feed thread pushes LTP/quote ticks for ``--symbols`` symbols through
+``process_market_data`` (with one 'all' subscriber, like the sandbox tick
+engine) while ``--readers`` threads poll ``get_ltp`` and
+``get_multiple_ltps`` (``--batch`` symbols) for ``--seconds`` seconds, with:
+
+- legacy: the previous cache, one ``data_lock`` taken by every tick, every
+  lookup and every broadcast
+- slots: the current per-symbol slots with versioned writes and lock-free
+  reads
+
+and prints ticks/second and lookups/second for each. Nothing is connected to
+a broker.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    # services imports the websocket service and, through it, the database modules
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class _LegacyService:
+    """process_market_data / get_ltp / get_multiple_ltps / _broadcast_update as they were"""
+
+    def __init__(self):
+        self.data_lock = threading.Lock()
+        self.market_data_cache = {}
+        self.subscribers = defaultdict(dict)
+        self.metrics = {"total_updates": 0, "cache_hits": 0, "cache_misses": 0}
+
+    def subscribe_to_updates(self, event_type, callback, filter_symbols=None):
+        with self.data_lock:
+            self.subscribers[event_type][len(self.subscribers[event_type]) + 1] = {
+                "callback": callback, "filter": filter_symbols}
+
+    def process_market_data(self, data):
+        symbol_key = f"{data['exchange']}:{data['symbol']}"
+        mode, market_data = data.get("mode"), data.get("data", {})
+        timestamp = int(time.time())
+        with self.data_lock:
+            if symbol_key not in self.market_data_cache:
+                self.market_data_cache[symbol_key] = {"last_update": timestamp}
+            entry = self.market_data_cache[symbol_key]
+            if mode == 2:
+                entry["quote"] = {key: market_data.get(key, 0) for key in ("open", "high", "low", "close", "ltp",
+                                                                             "volume")}
+                entry["quote"]["timestamp"] = market_data.get("timestamp", timestamp)
+            entry["ltp"] = {"value": market_data.get("ltp", 0), "timestamp": market_data.get("timestamp", timestamp),
+                            "volume": market_data.get("volume", 0)}
+            entry["last_update"] = timestamp
+            self.metrics["total_updates"] += 1
+        event_type = {1: "ltp", 2: "quote", 3: "depth"}.get(mode, "all")
+        with self.data_lock:
+            subscribers = list(self.subscribers[event_type].values())
+            all_subscribers = list(self.subscribers["all"].values())
+        for subscriber in subscribers + all_subscribers:
+            if subscriber["filter"] and symbol_key not in subscriber["filter"]:
+                continue
+            subscriber["callback"](data)
+
+    def get_ltp(self, symbol, exchange):
+        symbol_key = f"{exchange}:{symbol}"
+        with self.data_lock:
+            self.metrics["cache_hits"] += 1
+            if symbol_key in self.market_data_cache:
+                return self.market_data_cache[symbol_key].get("ltp")
+        self.metrics["cache_misses"] += 1
+        return None
+
+    def get_multiple_ltps(self, symbols):
+        result = {}
+        with self.data_lock:
+            for info in symbols:
+                symbol_key = f"{info['exchange']}:{info['symbol']}"
+                if symbol_key in self.market_data_cache:
+                    ltp_data = self.market_data_cache[symbol_key].get("ltp")
+                    if ltp_data:
+                        result[symbol_key] = ltp_data
+        return result
+
+
+def _ticks(symbols: int, count: int) -> list[dict]:
+    rng = random.Random(42)
+    ticks = []
+    for i in range(count):
+        price = round(rng.uniform(100, 5000), 2)
+        ticks.append({"symbol": f"SYM{i % symbols}", "exchange": "NSE", "mode": 2 if i % 4 == 0 else 1,
+                      "data": {"ltp": price, "open": price, "high": price + 1, "low": price - 1, "close": price,
+                               "volume": i}})
+    return ticks
+
+
+def _run(service, ticks, symbols: int, readers: int, batch: int, seconds: float) -> tuple[float, float]:
+    service.subscribe_to_updates("all", lambda data: None)
+    for tick in ticks[:symbols]:
+        service.process_market_data(tick)
+
+    done = threading.Event()
+    lookups = [0] * readers
+    written = [0]
+
+    def feed():
+        while not done.is_set():
+            for tick in ticks:
+                service.process_market_data(tick)
+            written[0] += len(ticks)
+
+    def reader(index):
+        rng = random.Random(index)
+        request = [{"symbol": f"SYM{rng.randrange(symbols)}", "exchange": "NSE"} for _ in range(batch)]
+        count = 0
+        while not done.is_set():
+            for info in request:
+                service.get_ltp(info["symbol"], "NSE")
+            service.get_multiple_ltps(request)
+            count += 2 * batch
+        lookups[index] = count
+
+    threads = [threading.Thread(target=feed)] + [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    done.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return written[0] / elapsed, sum(lookups) / elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=500, help="streamed symbols (default: 500)")
+    parser.add_argument("--readers", type=int, default=4, help="reader threads (default: 4)")
+    parser.add_argument("--batch", type=int, default=20, help="symbols per reader request (default: 20)")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each run (default: 3)")
+    args = parser.parse_args()
+
+    _configure_databases(tempfile.mkdtemp(prefix="market-data-"))
+    from services.market_data_service import get_market_data_service
+
+    service = get_market_data_service()
+    ticks = _ticks(args.symbols, 10 * args.symbols)
+    print(f"{args.symbols} symbols, {args.readers} readers x {args.batch} symbols, {args.seconds:g}s per run\n")
+    print(f"{'cache':<8} {'ticks/s':>12} {'lookups/s':>12}")
+    for name, cache in (("legacy", _LegacyService()), ("slots", service)):
+        tick_rate, lookup_rate = _run(cache, ticks, args.symbols, args.readers, args.batch, args.seconds)
+        print(f"{name:<8} {tick_rate:>12,.0f} {lookup_rate:>12,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
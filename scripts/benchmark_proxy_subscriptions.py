@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Time to subscribe and unsubscribe a whole option chain through the WebSocket proxy.
+
+For ``--symbols`` symbols, subscribed in one request and then unsubscribed
+in one request by a client of the proxy (with a no-op broker adapter):
+
+- legacy: the previous protocol, one adapter call and one JSON subscription
+  string per symbol, unsubscribes matched by re-parsing every stored string
+- batched: the current keyed subscription records and one ``subscribe_many`` /
+  ``unsubscribe_many`` batch per request
+
+and, for the Zerodha adapter (with a stub client, tokens from memory), the
+time until every token has been handed to the client when subscribing
+symbol by symbol (through the batch timer) versus with ``subscribe_many``.
+Nothing is connected to a broker.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    # websocket_proxy imports the broker adapters and, through them, the database modules
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class _Adapter:
+    """Accepts every subscription"""
+
+    def subscribe(self, symbol, exchange, mode=2, depth_level=5):
+        return {"status": "success", "message": "ok", "actual_depth": depth_level}
+
+    def unsubscribe(self, symbol, exchange, mode=2):
+        return {"status": "success", "message": "ok"}
+
+    def subscribe_many(self, instruments, mode=2, depth_level=5):
+        return [self.subscribe(symbol, exchange, mode, depth_level) for symbol, exchange in instruments]
+
+    def unsubscribe_many(self, instruments, mode=2):
+        return [self.unsubscribe(symbol, exchange, mode) for symbol, exchange in instruments]
+
+
+class _LegacyProxy:
+    """subscribe_client / unsubscribe_client bookkeeping as it was (JSON strings in a set)"""
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.subscriptions = {1: set()}
+
+    def subscribe(self, client_id, symbols, mode, depth_level=5):
+        responses = []
+        for info in symbols:
+            response = self.adapter.subscribe(info["symbol"], info["exchange"], mode, depth_level)
+            if response.get("status") == "success":
+                self.subscriptions[client_id].add(json.dumps({"symbol": info["symbol"], "exchange": info["exchange"],
+                                                              "mode": mode, "depth_level": depth_level,
+                                                              "broker": "zerodha"}))
+            responses.append(response)
+        return responses
+
+    def unsubscribe(self, client_id, symbols):
+        responses = []
+        for info in symbols:
+            symbol, exchange, mode = info["symbol"], info["exchange"], info.get("mode", 2)
+            response = self.adapter.unsubscribe(symbol, exchange, mode)
+            if response.get("status") == "success":
+                remove = []
+                for sub_key in self.subscriptions[client_id]:
+                    sub = json.loads(sub_key)
+                    if sub.get("symbol") == symbol and sub.get("exchange") == exchange and sub.get("mode") == mode:
+                        remove.append(sub_key)
+                for sub_key in remove:
+                    self.subscriptions[client_id].discard(sub_key)
+            responses.append(response)
+        return responses
+
+
+def _proxy_run(symbols: list[dict]) -> tuple[tuple[float, float], tuple[float, float]]:
+    from websocket_proxy import server
+
+    legacy = _LegacyProxy(_Adapter())
+    start = time.perf_counter()
+    legacy.subscribe(1, symbols, 1)
+    subscribed = time.perf_counter()
+    legacy.unsubscribe(1, [{**info, "mode": 1} for info in symbols])
+    legacy_times = (subscribed - start, time.perf_counter() - subscribed)
+
+    proxy = server.WebSocketProxy.__new__(server.WebSocketProxy)
+    proxy.clients, proxy.subscriptions, proxy.broker_adapters = {}, {1: {}}, {"alice": _Adapter()}
+    proxy.user_mapping, proxy.user_broker_mapping = {1: "alice"}, {"alice": "zerodha"}
+
+    async def send_message(client_id, message):
+        return True
+
+    proxy.send_message = send_message
+
+    async def session():
+        start = time.perf_counter()
+        await proxy.subscribe_client(1, {"symbols": symbols, "mode": "LTP"})
+        subscribed = time.perf_counter()
+        await proxy.unsubscribe_client(1, {"symbols": [{**info, "mode": 1} for info in symbols]})
+        return subscribed - start, time.perf_counter() - subscribed
+
+    return legacy_times, asyncio.run(session())
+
+
+class _Client:
+    """Stands in for ZerodhaWebSocket: connected, counts the tokens handed to it"""
+
+    def __init__(self):
+        self.tokens = 0
+
+    def is_connected(self):
+        return True
+
+    def set_token_exchange_mapping(self, mapping):
+        pass
+
+    def subscribe_tokens(self, tokens, mode):
+        self.tokens += len(tokens)
+
+
+def _zerodha_run(symbols: list[dict], batched: bool) -> float:
+    from broker.zerodha.streaming import zerodha_adapter
+
+    tokens = {(info["symbol"], info["exchange"]): str(100000 + i) for i, info in enumerate(symbols)}
+    zerodha_adapter.get_token = lambda symbol, exchange: tokens.get((symbol, exchange))
+    zerodha_adapter.get_tokens_bulk = lambda pairs: [tokens.get(pair) for pair in pairs]
+
+    adapter = zerodha_adapter.ZerodhaWebSocketAdapter()
+    client = adapter.ws_client = _Client()
+    adapter.running = True
+    try:
+        start = time.perf_counter()
+        if batched:
+            adapter.subscribe_many([(info["symbol"], info["exchange"]) for info in symbols], 1)
+        else:
+            for info in symbols:
+                adapter.subscribe(info["symbol"], info["exchange"], 1)
+        while client.tokens < len(symbols):
+            time.sleep(0.001)
+        return time.perf_counter() - start
+    finally:
+        if adapter.batch_timer:
+            adapter.batch_timer.cancel()
+        adapter.ws_client = None
+        adapter.cleanup_zmq()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=1000, help="symbols in the chain (default: 1000)")
+    args = parser.parse_args()
+
+    _configure_databases(tempfile.mkdtemp(prefix="proxy-subscriptions-"))
+    import websocket_proxy  # noqa: F401  (registers the adapters)
+
+    symbols = [{"symbol": f"NIFTY25JAN{20000 + 50 * i}{'CE' if i % 2 else 'PE'}", "exchange": "NFO"}
+               for i in range(args.symbols)]
+
+    legacy, batched = _proxy_run(symbols)
+    print(f"{args.symbols} symbols, LTP mode\n")
+    print(f"{'proxy':<10} {'subscribe ms':>14} {'unsubscribe ms':>16}")
+    for name, (subscribe, unsubscribe) in (("legacy", legacy), ("batched", batched)):
+        print(f"{name:<10} {subscribe * 1000:>14,.1f} {unsubscribe * 1000:>16,.1f}")
+
+    print(f"\n{'zerodha':<10} {'tokens to client ms':>20}")
+    for name, batched_path in (("per-symbol", False), ("batched", True)):
+        print(f"{name:<10} {_zerodha_run(symbols, batched_path) * 1000:>20,.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Sandbox split order: one child at a time versus one batch.
+
+Places ``--splits`` split orders of ``--children`` NRML MARKET children each
+on an NFO future, priced from a fixed in-memory quote snapshot, first with
+``OrderManager.place_order`` per child (the old analyze-mode loop) and then
+with ``OrderManager.place_orders`` for the whole split, and prints the mean
+time per split and the number of SQL statements each took. Every second
+split sells, so children fill against (and net) the position.
+
+All databases are created in a temporary directory, so the script never
+touches the real ``db/`` files.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+SYMBOL = 'NIFTY25JANFUT'
+LOT_SIZE = 75
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ["SANDBOX_DATABASE_URL"] = f"sqlite:///{tmp_dir}/sandbox.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class _SnapshotQuotes:
+    def __init__(self, quotes):
+        self.quotes = quotes
+
+    def get_quote(self, symbol, exchange):
+        return self.quotes.get((symbol, exchange))
+
+    def get_quotes(self, pairs):
+        return {key: self.quotes[key] for key in pairs if key in self.quotes}
+
+
+def _seed() -> None:
+    from sqlalchemy import insert
+
+    from database.sandbox_db import SandboxFunds, db_session, init_db
+    from database.symbol import Base, SymToken, db_session as symbol_session, engine
+
+    init_db()
+    Base.metadata.create_all(engine)
+    symbol_session.execute(insert(SymToken), [
+        {'symbol': SYMBOL, 'brsymbol': SYMBOL, 'name': 'NIFTY', 'exchange': 'NFO', 'brexchange': 'NFO',
+         'token': '1', 'expiry': '30-JAN-25', 'strike': -1, 'lotsize': LOT_SIZE, 'instrumenttype': 'FUTIDX',
+         'tick_size': 0.05}
+    ])
+    symbol_session.commit()
+    db_session.execute(insert(SandboxFunds), [
+        {'user_id': user_id, 'total_capital': Decimal('1000000000'), 'available_balance': Decimal('1000000000'),
+         'used_margin': Decimal('0'), 'realized_pnl': Decimal('0'), 'unrealized_pnl': Decimal('0'),
+         'total_pnl': Decimal('0')}
+        for user_id in ('sequential', 'batch')
+    ])
+    db_session.commit()
+
+
+def _children(split: int, children: int) -> list:
+    action = 'BUY' if split % 2 == 0 else 'SELL'
+    return [{'symbol': SYMBOL, 'exchange': 'NFO', 'action': action, 'quantity': LOT_SIZE * 10,
+             'price_type': 'MARKET', 'product': 'NRML'}] * children
+
+
+def _run(label: str, place, splits: int, children: int) -> None:
+    from sqlalchemy import event
+
+    from database.sandbox_db import engine
+
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    timings = []
+    for split in range(splits):
+        orders = _children(split, children)
+        start = time.perf_counter()
+        results = place(orders)
+        timings.append(time.perf_counter() - start)
+        failed = [response for ok, response, _ in results if not ok]
+        if failed:
+            raise SystemExit(f"{label}: child rejected: {failed[0]}")
+    event.remove(engine, "before_cursor_execute", count)
+
+    print(f"{label:<11} mean {statistics.mean(timings) * 1000:8.2f} ms/split   "
+          f"p50 {statistics.median(timings) * 1000:8.2f} ms   "
+          f"{statements[0] / splits:7.1f} SQL statements/split")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--splits", type=int, default=20, help="split orders per mode (default: 20)")
+    parser.add_argument("--children", type=int, default=40, help="children per split (default: 40)")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="sandbox-batch-")
+    _configure_databases(tmp_dir)
+    _seed()
+
+    from database.sandbox_db import SandboxTrades
+    from sandbox.order_manager import OrderManager
+    from sandbox.quote_provider import set_quote_provider
+
+    set_quote_provider(_SnapshotQuotes({(SYMBOL, 'NFO'): {'ltp': 24000.0, 'bid': 23999.5, 'ask': 24000.5}}))
+
+    sequential = OrderManager('sequential')
+    _run("sequential", lambda orders: [sequential.place_order(order) for order in orders],
+         args.splits, args.children)
+    batch = OrderManager('batch')
+    _run("batch", batch.place_orders, args.splits, args.children)
+
+    print(f"\n{SandboxTrades.query.count()} trades in {tmp_dir}/sandbox.db")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Timing for the sandbox background jobs on a large book.
+
+Seeds ``--positions`` positions (MIS, CNC from yesterday and NRML in equal
+parts) spread over ``--users`` users and ``--symbols`` symbols, prices them
+from a fixed in-memory quote snapshot and times:
+
+* ``mtm``        - ``update_all_positions_mtm``
+* ``square-off`` - ``SquareOffManager._square_off_positions`` for every MIS position
+* ``settlement`` - ``process_all_t1_settlements`` for every CNC position
+
+All databases are created in a temporary directory, so the script never
+touches the real ``db/`` files.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ["SANDBOX_DATABASE_URL"] = f"sqlite:///{tmp_dir}/sandbox.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class _SnapshotQuotes:
+    def __init__(self, quotes):
+        self.quotes = quotes
+
+    def get_quote(self, symbol, exchange):
+        return self.quotes.get((symbol, exchange))
+
+    def get_quotes(self, pairs):
+        return {key: self.quotes[key] for key in pairs if key in self.quotes}
+
+
+def _seed(positions: int, users: int, symbols: int) -> None:
+    from sqlalchemy import insert
+
+    from database.sandbox_db import SandboxFunds, SandboxPositions, db_session, init_db
+    from database.symbol import Base, SymToken, db_session as symbol_session, engine
+
+    init_db()
+    Base.metadata.create_all(engine)
+    symbol_session.execute(insert(SymToken), [
+        {'symbol': f"SYM{i}", 'brsymbol': f"SYM{i}", 'name': f"SYM{i}", 'exchange': 'NSE', 'brexchange': 'NSE',
+         'token': str(i), 'expiry': '', 'strike': -1, 'lotsize': 1, 'instrumenttype': 'EQ', 'tick_size': 0.05}
+        for i in range(symbols)
+    ])
+    symbol_session.commit()
+
+    db_session.execute(insert(SandboxFunds), [
+        {'user_id': f"user{u}", 'total_capital': Decimal('10000000'), 'available_balance': Decimal('5000000'),
+         'used_margin': Decimal('5000000'), 'realized_pnl': Decimal('0'), 'unrealized_pnl': Decimal('0'),
+         'total_pnl': Decimal('0')}
+        for u in range(users)
+    ])
+    yesterday = datetime.now() - timedelta(days=1)
+    rows = []
+    for i in range(positions):
+        product = ('MIS', 'CNC', 'NRML')[i % 3]
+        rows.append({
+            'user_id': f"user{i % users}", 'symbol': f"SYM{(i // users) % symbols}", 'exchange': 'NSE',
+            'product': product,
+            'quantity': 10 if i % 2 else -10, 'average_price': Decimal('100'), 'ltp': Decimal('100'),
+            'pnl': Decimal('0'), 'pnl_percent': Decimal('0'), 'accumulated_realized_pnl': Decimal('0'),
+            'created_at': yesterday if product == 'CNC' else datetime.now(),
+        })
+    db_session.execute(insert(SandboxPositions), rows)
+    db_session.commit()
+
+
+def _timed(label: str, fn) -> None:
+    start = time.perf_counter()
+    fn()
+    print(f"{label:<12} {time.perf_counter() - start:>9.3f}s")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--positions", type=int, default=10000, help="positions to seed (default: 10000)")
+    parser.add_argument("--users", type=int, default=100, help="sandbox users (default: 100)")
+    parser.add_argument("--symbols", type=int, default=500,
+                        help="distinct symbols (default: 500; positions must not exceed users x symbols)")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="sandbox-bulk-")
+    _configure_databases(tmp_dir)
+
+    from database.sandbox_db import SandboxPositions
+    from sandbox.holdings_manager import process_all_t1_settlements
+    from sandbox.position_manager import update_all_positions_mtm
+    from sandbox.quote_provider import set_quote_provider
+    from sandbox.squareoff_manager import SquareOffManager
+
+    _seed(args.positions, args.users, args.symbols)
+    set_quote_provider(_SnapshotQuotes({
+        (f"SYM{i}", 'NSE'): {'ltp': 100 + i % 7, 'bid': 99.95 + i % 7, 'ask': 100.05 + i % 7}
+        for i in range(args.symbols)
+    }))
+
+    counts = {product: SandboxPositions.query.filter_by(product=product).count() for product in ('MIS', 'CNC', 'NRML')}
+    print(f"{sum(counts.values())} positions ({', '.join(f'{k} {v}' for k, v in counts.items())}), "
+          f"{args.users} users, {args.symbols} symbols\n")
+
+    _timed("mtm", update_all_positions_mtm)
+    _timed("square-off", lambda: SquareOffManager()._square_off_positions(
+        SandboxPositions.query.filter_by(product='MIS').filter(SandboxPositions.quantity != 0).all()))
+    _timed("settlement", process_all_t1_settlements)
+
+    print(f"\nsandbox database: {tmp_dir}/sandbox.db")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
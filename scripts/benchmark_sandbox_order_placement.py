@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Per-order latency of sandbox ``OrderManager.place_order``.
+
+Places ``--orders`` CNC LIMIT orders (no quote fetch, no immediate fill)
+spread over ``--users`` users, first against the database directly and then
+with the in-memory account state (``SANDBOX_MEMORY_STATE``), and prints the
+mean, median and p99 time spent inside ``place_order``. The journal flush
+runs on its background thread and is not part of the measured time.
+
+All databases are created in a temporary directory, so the script never
+touches the real ``db/`` files.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ["SANDBOX_DATABASE_URL"] = f"sqlite:///{tmp_dir}/sandbox.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def _seed(users: int, symbols: int) -> None:
+    from sqlalchemy import insert
+
+    from database.sandbox_db import SandboxFunds, db_session, init_db
+    from database.symbol import Base, SymToken, db_session as symbol_session, engine
+
+    init_db()
+    Base.metadata.create_all(engine)
+    symbol_session.execute(insert(SymToken), [
+        {'symbol': f"SYM{i}", 'brsymbol': f"SYM{i}", 'name': f"SYM{i}", 'exchange': 'NSE', 'brexchange': 'NSE',
+         'token': str(i), 'expiry': '', 'strike': -1, 'lotsize': 1, 'instrumenttype': 'EQ', 'tick_size': 0.05}
+        for i in range(symbols)
+    ])
+    symbol_session.commit()
+    db_session.execute(insert(SandboxFunds), [
+        {'user_id': f"user{u}", 'total_capital': Decimal('1000000000'), 'available_balance': Decimal('1000000000'),
+         'used_margin': Decimal('0'), 'realized_pnl': Decimal('0'), 'unrealized_pnl': Decimal('0'),
+         'total_pnl': Decimal('0')}
+        for u in range(users)
+    ])
+    db_session.commit()
+
+
+def _run(label: str, orders: int, users: int, symbols: int) -> None:
+    from sandbox.order_manager import OrderManager
+
+    timings = []
+    for i in range(orders):
+        order = {'symbol': f"SYM{i % symbols}", 'exchange': 'NSE', 'action': 'BUY', 'quantity': 1,
+                 'price': 100 + i % 10, 'price_type': 'LIMIT', 'product': 'CNC'}
+        manager = OrderManager(f"user{i % users}")
+        start = time.perf_counter()
+        success, response, _ = manager.place_order(order)
+        timings.append(time.perf_counter() - start)
+        if not success:
+            raise SystemExit(f"order rejected: {response}")
+
+    timings.sort()
+    print(f"{label:<10} mean {statistics.mean(timings) * 1000:7.3f} ms   "
+          f"p50 {timings[len(timings) // 2] * 1000:7.3f} ms   "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1000:7.3f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2000, help="orders per mode (default: 2000)")
+    parser.add_argument("--users", type=int, default=10, help="sandbox users (default: 10)")
+    parser.add_argument("--symbols", type=int, default=50, help="distinct symbols (default: 50)")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="sandbox-placement-")
+    _configure_databases(tmp_dir)
+    _seed(args.users, args.symbols)
+
+    from database.sandbox_db import SandboxOrders
+    from sandbox import account_state
+
+    _run("database", args.orders, args.users, args.symbols)
+
+    state = account_state.AccountStateEngine(f"{tmp_dir}/journal.jsonl")
+    state.start()
+    account_state.set_engine(state)
+    # warm the per-user accounts so the timed loop measures steady state
+    for u in range(args.users):
+        state.account(f"user{u}")
+    _run("memory", args.orders, args.users, args.symbols)
+    state.stop()
+
+    print(f"\n{SandboxOrders.query.count()} orders in {tmp_dir}/sandbox.db")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Load test for HTTP traffic logging overhead.
+
+Drives a minimal Flask app through the WSGI test client from several threads
+and reports requests/sec with traffic logging:
+
+* ``off``          - no traffic middleware
+* ``sync``         - one INSERT + COMMIT per request (previous behaviour)
+* ``write-behind`` - ``TrafficLoggerMiddleware`` with the batched log sink
+
+All databases are created in a temporary directory, so the script never
+touches the real ``db/`` files.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ["LOGS_DATABASE_URL"] = f"sqlite:///{tmp_dir}/logs.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def _build_app(mode: str):
+    from flask import Flask, request
+
+    from database.traffic_db import TrafficLog, init_logs_db, logs_session
+    from utils.traffic_logger import TrafficLoggerMiddleware
+
+    init_logs_db()
+
+    app = Flask(__name__)
+
+    @app.route("/api/v1/ping", methods=["POST"])
+    def ping():
+        return {"status": "success"}
+
+    if mode == "write-behind":
+        app.wsgi_app = TrafficLoggerMiddleware(app.wsgi_app)
+    elif mode == "sync":
+        @app.after_request
+        def log_sync(response):
+            TrafficLog.log_request(
+                client_ip="127.0.0.1",
+                method=request.method,
+                path=request.path,
+                status_code=response.status_code,
+                duration_ms=0.0,
+                host=request.host,
+            )
+            logs_session.remove()
+            return response
+
+    return app
+
+
+def _run(app, threads: int, requests_per_thread: int) -> float:
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        client = app.test_client()
+        barrier.wait()
+        for _ in range(requests_per_thread):
+            client.post("/api/v1/ping", json={"apikey": "x"})
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return (threads * requests_per_thread) / elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _configure_databases(tmp_dir)
+
+        from database.write_behind import flush_all, get_write_behind_stats
+
+        results = {}
+        for mode in ("off", "sync", "write-behind"):
+            app = _build_app(mode)
+            results[mode] = _run(app, args.threads, args.requests)
+
+        flush_all()
+        sink_stats = get_write_behind_stats().get("traffic_logs", {})
+
+    total = args.threads * args.requests
+    print(f"Traffic logging load test ({args.threads} threads x {args.requests} requests = {total})")
+    print("-" * 60)
+    for mode, rps in results.items():
+        overhead = (1 - rps / results["off"]) * 100 if results["off"] else 0.0
+        print(f"{mode:>14}: {rps:10.1f} req/s  (overhead vs off: {overhead:5.1f}%)")
+    print("-" * 60)
+    print(
+        "write-behind sink: written={written} flushes={flushes} dropped={dropped} "
+        "avg_flush_ms={avg_flush_ms} max_flush_ms={max_flush_ms}".format(**sink_stats)
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
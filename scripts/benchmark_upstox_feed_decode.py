@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Decode throughput of Upstox V3 FeedResponse payloads.
+
+Decodes every payload and extracts the published tick for each subscribed
+mode with:
+
+- legacy: ``ParseFromString`` + ``MessageToDict`` and the previous dict-based
+  ``_extract_*_data`` helpers of the Upstox adapter
+- direct: ``ParseFromString`` and the adapter's current helpers, which read
+  the fields straight off the protobuf (depth only for depth subscribers)
+
+and prints feeds/second for each subscription set. The payloads are either
+synthesized (``--messages`` full_d5 responses of ``--instruments`` feeds with
+OHLC candles, 5 depth levels and option greeks, plus matching ltpc responses)
+or read from ``--capture``, a file of raw FeedResponse payloads each prefixed
+with its 4-byte big-endian length. Nothing is connected to Upstox.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+MODE_SETS = {"ltp": (1,), "quote": (2,), "depth": (3,), "quote+depth": (2, 3)}
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    # importing the upstox streaming package loads the adapter and its database modules
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class _LegacyExtractor:
+    """_extract_ltp_data / _extract_quote_data / _extract_depth_data on MessageToDict output, as they were"""
+
+    def __init__(self):
+        self.logger = logging.getLogger("legacy_upstox")
+
+    def extract(self, feed_data, mode, base_data, current_ts):
+        if mode == 1:
+            market_data = base_data.copy()
+            if "ltpc" in feed_data:
+                ltpc = feed_data["ltpc"]
+                market_data.update({"ltp": float(ltpc.get("ltp", 0)), "ltq": int(ltpc.get("ltq", 0)),
+                                    "ltt": int(ltpc.get("ltt", 0)), "cp": float(ltpc.get("cp", 0))})
+            return market_data
+        if "fullFeed" not in feed_data:
+            return {}
+        full_feed = feed_data["fullFeed"]
+        ff = full_feed.get("marketFF") or full_feed.get("indexFF", {})
+        if mode == 2:
+            self.logger.debug(f"Full feed structure for quote extraction: {list(ff.keys())}")
+            ltpc = ff.get("ltpc", {})
+            ohlc_list = ff.get("marketOHLC", {}).get("ohlc", [])
+            ohlc = next((o for o in ohlc_list if o.get("interval") == "1d"), ohlc_list[0] if ohlc_list else {})
+            market_level = ff.get("marketLevel", {})
+            self.logger.debug(f"Market level keys: {list(market_level.keys()) if market_level else 'None'}")
+            self.logger.debug(f"OHLC keys: {list(ohlc.keys()) if ohlc else 'None'}")
+            if "optionGreeks" in ff:
+                self.logger.debug(f"Option Greeks keys: {list(ff['optionGreeks'].keys())}")
+            market_data = base_data.copy()
+            market_data.update({
+                "open": float(ohlc.get("open", 0)), "high": float(ohlc.get("high", 0)),
+                "low": float(ohlc.get("low", 0)), "close": float(ohlc.get("close", 0)),
+                "ltp": float(ltpc.get("ltp", 0)), "last_trade_quantity": int(ltpc.get("ltq", 0)),
+                "volume": int(ohlc.get("vol", 0) if ohlc else 0), "average_price": float(ff.get("atp", 0)),
+                "total_buy_quantity": int(ff.get("tbq", 0)), "total_sell_quantity": int(ff.get("tsq", 0)),
+                "timestamp": int(ohlc.get("ts", current_ts))})
+            return market_data
+        buy, sell = [], []
+        for level in ff.get("marketLevel", {}).get("bidAskQuote", []):
+            if float(level.get("bidP", 0)) > 0:
+                buy.append({'price': float(level.get("bidP", 0)), 'quantity': int(float(level.get("bidQ", 0))),
+                            'orders': 0})
+            if float(level.get("askP", 0)) > 0:
+                sell.append({'price': float(level.get("askP", 0)), 'quantity': int(float(level.get("askQ", 0))),
+                             'orders': 0})
+        buy = sorted(buy, key=lambda x: x['price'], reverse=True)
+        sell = sorted(sell, key=lambda x: x['price'])
+        buy.extend([{'price': 0.0, 'quantity': 0, 'orders': 0}] * (5 - len(buy)))
+        sell.extend([{'price': 0.0, 'quantity': 0, 'orders': 0}] * (5 - len(sell)))
+        depth = {'buy': buy[:5], 'sell': sell[:5], 'timestamp': current_ts,
+                 'ltp': float(ff.get("ltpc", {}).get("ltp", 0))}
+        depth.update(base_data)
+        return depth
+
+
+def _payloads(pb, messages: int, instruments: int) -> tuple[list[bytes], list[bytes]]:
+    """(full_d5 payloads, ltpc payloads)"""
+    rng = random.Random(42)
+    keys = [f"NSE_FO|{40000 + i}" for i in range(instruments)]
+    full, ltpc = [], []
+    for _ in range(messages):
+        response = pb.FeedResponse(type=pb.live_feed, currentTs=1700000000000 + rng.randrange(10 ** 6))
+        ltp_response = pb.FeedResponse(type=pb.live_feed, currentTs=response.currentTs)
+        for key in keys:
+            price = rng.uniform(10, 500)
+            ff = response.feeds[key].fullFeed.marketFF
+            ff.ltpc.ltp, ff.ltpc.ltt, ff.ltpc.ltq, ff.ltpc.cp = price, 1700000000000, rng.randint(1, 500), price
+            ff.atp, ff.vtt, ff.oi, ff.iv = price, rng.randint(0, 10 ** 7), rng.randint(0, 10 ** 6), 0.15
+            ff.tbq, ff.tsq = rng.randint(0, 10 ** 6), rng.randint(0, 10 ** 6)
+            ff.optionGreeks.delta, ff.optionGreeks.theta, ff.optionGreeks.gamma = 0.5, -3.2, 0.001
+            ff.optionGreeks.vega, ff.optionGreeks.rho = 9.1, 0.4
+            for interval in ("1d", "I1"):
+                ff.marketOHLC.ohlc.add(interval=interval, open=price, high=price + 5, low=price - 5, close=price,
+                                       vol=rng.randint(0, 10 ** 6), ts=1700000000000)
+            for step in range(1, 6):
+                ff.marketLevel.bidAskQuote.add(bidQ=rng.randint(1, 5000), bidP=price - step * 0.05,
+                                               askQ=rng.randint(1, 5000), askP=price + step * 0.05)
+            ltp_feed = ltp_response.feeds[key].ltpc
+            ltp_feed.ltp, ltp_feed.ltt, ltp_feed.ltq, ltp_feed.cp = price, 1700000000000, 1, price
+        full.append(response.SerializeToString())
+        ltpc.append(ltp_response.SerializeToString())
+    return full, ltpc
+
+
+def _capture(path: str) -> list[bytes]:
+    raw = Path(path).read_bytes()
+    payloads, offset = [], 0
+    while offset + 4 <= len(raw):
+        length = struct.unpack_from(">I", raw, offset)[0]
+        payloads.append(raw[offset + 4:offset + 4 + length])
+        offset += 4 + length
+    return payloads
+
+
+def _rate(decode, payloads) -> float:
+    start = time.perf_counter()
+    feeds = 0
+    for payload in payloads:
+        feeds += decode(payload)
+    return feeds / (time.perf_counter() - start)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500, help="FeedResponse messages (default: 500)")
+    parser.add_argument("--instruments", type=int, default=50, help="feeds per message (default: 50)")
+    parser.add_argument("--capture", help="file of length-prefixed FeedResponse payloads to decode instead")
+    args = parser.parse_args()
+
+    _configure_databases(tempfile.mkdtemp(prefix="upstox-decode-"))
+    from google.protobuf.internal import api_implementation
+    from google.protobuf.json_format import MessageToDict
+
+    import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+    from broker.upstox.streaming import MarketDataFeedV3_pb2 as pb
+    from broker.upstox.streaming.upstox_adapter import UpstoxWebSocketAdapter
+
+    logging.getLogger("legacy_upstox").setLevel(logging.WARNING)
+    adapter = UpstoxWebSocketAdapter()
+    legacy = _LegacyExtractor()
+
+    if args.capture:
+        full = ltpc = _capture(args.capture)
+        source = f"{args.capture}: {len(full):,} payloads"
+    else:
+        full, ltpc = _payloads(pb, args.messages, args.instruments)
+        source = f"{args.messages} messages x {args.instruments} feeds"
+
+    def legacy_decode(modes):
+        def decode(payload):
+            response = pb.FeedResponse()
+            response.ParseFromString(payload)
+            data = MessageToDict(response)
+            current_ts = data.get("currentTs", 0)
+            feeds = data.get("feeds", {})
+            for key, feed_data in feeds.items():
+                base = {"symbol": key, "exchange": "NFO", "token": key}
+                for mode in modes:
+                    legacy.extract(feed_data, mode, base, current_ts)
+            return len(feeds)
+        return decode
+
+    def direct_decode(modes):
+        subscriptions = [{"symbol": None, "exchange": "NFO", "token": None, "mode": mode} for mode in modes]
+
+        def decode(payload):
+            response = pb.FeedResponse()
+            response.ParseFromString(payload)
+            current_ts = response.currentTs
+            feeds = response.feeds
+            for key, feed in feeds.items():
+                for sub_info in subscriptions:
+                    sub_info["symbol"] = sub_info["token"] = key
+                    adapter._extract_market_data(feed, sub_info, current_ts)
+            return len(feeds)
+        return decode
+
+    print(f"{source}, protobuf backend: {api_implementation.Type()}, feeds/second\n")
+    print(f"{'modes':<12} {'legacy':>11} {'direct':>11}")
+    try:
+        for name, modes in MODE_SETS.items():
+            payloads = ltpc if modes == (1,) else full
+            rates = [_rate(legacy_decode(modes), payloads), _rate(direct_decode(modes), payloads)]
+            print(f"{name:<12} " + " ".join(f"{rate:>11,.0f}" for rate in rates))
+    finally:
+        adapter.cleanup_zmq()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Throughput of the Zerodha binary frame parser.
+
+Builds ``--frames`` binary frames of ``--packets`` packets each for three
+feeds (quote-mode, full-mode and a mix of both), in the exact wire layout of
+Zerodha's ticker, and decodes every frame with:
+
+- legacy: the previous ``_parse_binary_message``, which sliced each field
+  into a bytes copy, unpacked it with a format string and took the client
+  lock per packet
+- struct: ``decode_frame`` with precompiled ``struct.Struct`` readers over a
+  memoryview
+- numpy:  ``decode_frame(..., use_numpy=True)`` (applies only to frames made
+  entirely of full packets; others fall back to struct)
+
+and prints packets/second for each. Nothing is connected to Zerodha.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    # importing the zerodha streaming package loads the adapter and its database modules
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class _LegacyParser:
+    """_parse_binary_message / _parse_packet / _parse_market_depth as they were"""
+
+    def __init__(self, mode_map, exchange_map):
+        self.lock = threading.Lock()
+        self.mode_map = mode_map
+        self.token_exchange_map = exchange_map
+
+    def parse(self, data):
+        if len(data) < 4:
+            return []
+        num_packets = struct.unpack('>H', data[0:2])[0]
+        packets = []
+        offset = 2
+        for _ in range(num_packets):
+            if offset + 2 > len(data):
+                break
+            packet_length = struct.unpack('>H', data[offset:offset + 2])[0]
+            offset += 2
+            if offset + packet_length > len(data):
+                break
+            tick = self._parse_packet(data[offset:offset + packet_length])
+            if tick:
+                packets.append(tick)
+            offset += packet_length
+        return packets
+
+    def _parse_packet(self, packet):
+        if len(packet) < 8:
+            return None
+        instrument_token = struct.unpack('>I', packet[0:4])[0]
+        last_price = struct.unpack('>i', packet[4:8])[0] / 100.0
+        if len(packet) == 8:
+            mode = 'ltp'
+        elif len(packet) == 44:
+            mode = 'quote'
+        elif len(packet) >= 184:
+            mode = 'full'
+        else:
+            mode = self.mode_map.get(instrument_token, 'quote')
+        with self.lock:
+            exchange = self.token_exchange_map.get(instrument_token)
+        tick = {'instrument_token': instrument_token, 'last_traded_price': last_price, 'last_price': last_price,
+                'mode': mode, 'timestamp': int(time.time() * 1000)}
+        if exchange:
+            tick['source_exchange'] = exchange
+        if len(packet) >= 44:
+            fields = struct.unpack('>11i', packet[0:44])
+            tick.update({
+                'instrument_token': fields[0], 'last_traded_price': fields[1] / 100.0,
+                'last_price': fields[1] / 100.0, 'last_traded_quantity': fields[2],
+                'average_traded_price': fields[3] / 100.0, 'average_price': fields[3] / 100.0,
+                'volume_traded': fields[4], 'volume': fields[4], 'total_buy_quantity': fields[5],
+                'total_sell_quantity': fields[6], 'open_price': fields[7] / 100.0, 'high_price': fields[8] / 100.0,
+                'low_price': fields[9] / 100.0, 'close_price': fields[10] / 100.0,
+                'ohlc': {'open': fields[7] / 100.0, 'high': fields[8] / 100.0, 'low': fields[9] / 100.0,
+                         'close': fields[10] / 100.0}})
+        if len(packet) >= 64:
+            extended_fields = struct.unpack('>iiiii', packet[44:64])
+            tick.update({'last_traded_timestamp': extended_fields[0], 'open_interest': extended_fields[1],
+                         'oi': extended_fields[1], 'exchange_timestamp': extended_fields[4]})
+        if len(packet) >= 184:
+            depth = self._parse_market_depth(packet[64:184])
+            if depth:
+                tick['depth'] = depth
+        return tick
+
+    def _parse_market_depth(self, depth_data):
+        depth = {'buy': [], 'sell': []}
+        for side, base in (('buy', 0), ('sell', 60)):
+            for i in range(5):
+                offset = base + i * 12
+                quantity, price, orders = struct.unpack('>iih', depth_data[offset:offset + 10])
+                if price > 0:
+                    depth[side].append({'quantity': quantity, 'price': price / 100.0, 'orders': orders})
+        return depth if (depth['buy'] or depth['sell']) else None
+
+
+def _packet(rng: random.Random, token: int, full: bool) -> bytes:
+    price = rng.randint(10000, 500000)
+    quote = struct.pack('>I10i', token, price, rng.randint(1, 500), price, rng.randint(0, 10 ** 7),
+                        rng.randint(0, 10 ** 6), rng.randint(0, 10 ** 6), price, price + 500, price - 500, price)
+    if not full:
+        return quote
+    extended = struct.pack('>5i', 1700000000, rng.randint(0, 10 ** 6), 0, 0, 1700000000)
+    levels = b''.join(struct.pack('>iih2x', rng.randint(1, 5000), price + step * 5, rng.randint(1, 50))
+                      for step in (-1, -2, -3, -4, -5, 1, 2, 3, 4, 5))
+    return quote + extended + levels
+
+
+def _frames(count: int, packets: int, full_share: float, tokens: int) -> list[bytes]:
+    rng = random.Random(42)
+    frames = []
+    for _ in range(count):
+        body = [_packet(rng, 100000 + rng.randrange(tokens), rng.random() < full_share) for _ in range(packets)]
+        frames.append(struct.pack('>H', len(body)) + b''.join(struct.pack('>H', len(p)) + p for p in body))
+    return frames
+
+
+def _rate(parse, frames) -> float:
+    start = time.perf_counter()
+    parsed = 0
+    for frame in frames:
+        parsed += len(parse(frame))
+    return parsed / (time.perf_counter() - start)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=2000, help="frames per feed (default: 2000)")
+    parser.add_argument("--packets", type=int, default=50, help="packets per frame (default: 50)")
+    parser.add_argument("--tokens", type=int, default=1000, help="distinct instrument tokens (default: 1000)")
+    args = parser.parse_args()
+
+    _configure_databases(tempfile.mkdtemp(prefix="zerodha-parser-"))
+    import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+    from broker.zerodha.streaming import zerodha_decoder
+    from broker.zerodha.streaming.zerodha_decoder import decode_frame
+
+    mode_map = {}
+    exchange_map = {100000 + i: 'NSE' if i % 2 else 'NFO' for i in range(args.tokens)}
+    legacy = _LegacyParser(mode_map, exchange_map)
+
+    print(f"{args.frames} frames x {args.packets} packets, packets/second"
+          f"{'' if zerodha_decoder.np is not None else ' (numpy not installed)'}\n")
+    print(f"{'feed':<6} {'legacy':>11} {'struct':>11} {'numpy':>11}")
+    for feed, full_share in (('quote', 0.0), ('full', 1.0), ('mixed', 0.3)):
+        frames = _frames(args.frames, args.packets, full_share, args.tokens)
+        rates = [
+            _rate(legacy.parse, frames),
+            _rate(lambda f: decode_frame(f, mode_map, exchange_map, use_numpy=False), frames),
+            _rate(lambda f: decode_frame(f, mode_map, exchange_map, use_numpy=True), frames),
+        ]
+        print(f"{feed:<6} " + " ".join(f"{rate:>11,.0f}" for rate in rates))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
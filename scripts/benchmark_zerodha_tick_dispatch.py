@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Tick dispatch throughput of ``ZerodhaWebSocketAdapter._handle_ticks``.
+
+Records ``--ticks`` quote/full ticks for ``--subscriptions`` instruments by
+encoding Zerodha binary frames and parsing them with the real
+``ZerodhaWebSocket`` parser, then replays them through the adapter's tick
+handler twice:
+
+- before: the previous handler, which scanned every subscription under the
+  adapter lock for each tick and copied the tick per published mode
+- after:  the token-indexed ``tick_routes`` table
+
+and prints ticks/second for each subscription count. Publishing goes to the
+adapter's real ZeroMQ PUB socket with no subscriber, so both runs include
+the same JSON serialization and send cost. No real database is touched.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    # the adapter imports the token and auth database modules
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def _legacy_handle_ticks(adapter, ticks):
+    """_handle_ticks as it was before the token-indexed routes"""
+    for tick in ticks:
+        transformed_tick = adapter._transform_tick(tick)
+        if transformed_tick:
+            symbol = transformed_tick['symbol']
+            token = tick.get('instrument_token')
+            original_tick_mode = transformed_tick.get('mode', 'ltp')
+            subscription_exchange = None
+            subscribed_modes = set()
+            with adapter.lock:
+                for key, sub_info in adapter.subscribed_symbols.items():
+                    if sub_info['token'] == token:
+                        subscription_exchange = sub_info['exchange']
+                        subscribed_modes.add(sub_info['mode'])
+            if not subscription_exchange:
+                continue
+            data_exchange = adapter._map_data_exchange(subscription_exchange)
+            transformed_tick['exchange'] = data_exchange
+            if original_tick_mode == 'full':
+                depth_tick = transformed_tick.copy()
+                depth_tick['mode'] = 'full'
+                depth_topic = adapter._generate_topic(symbol, subscription_exchange, 'DEPTH')
+                adapter.logger.debug(f"📊 Publishing DEPTH data to topic: {depth_topic}")
+                adapter.publish_market_data(depth_topic, depth_tick)
+                if 2 in subscribed_modes:
+                    quote_tick = transformed_tick.copy()
+                    quote_tick.pop('depth', None)
+                    quote_tick['mode'] = 'quote'
+                    quote_topic = adapter._generate_topic(symbol, subscription_exchange, 'QUOTE')
+                    adapter.logger.debug(f"📊 Publishing QUOTE data to topic: {quote_topic}")
+                    adapter.publish_market_data(quote_topic, quote_tick)
+            else:
+                mode_str = {'ltp': 'LTP', 'quote': 'QUOTE', 'full': 'DEPTH'}.get(original_tick_mode, 'LTP')
+                topic = adapter._generate_topic(symbol, subscription_exchange, mode_str)
+                adapter.logger.debug(f"📊 Publishing to topic: {topic}")
+                adapter.logger.debug(f"📊 Data structure: {transformed_tick}")
+                adapter.publish_market_data(topic, transformed_tick)
+
+
+def _packet(token: int, i: int, full: bool) -> bytes:
+    price = 100000 + i % 500
+    quote = struct.pack('>11i', token, price, 10, price, 1000 + i, 500, 600, price, price + 50, price - 50, price)
+    if not full:
+        return quote
+    extended = struct.pack('>5i', 1700000000, 1234, 0, 0, 1700000000)
+    depth = b''.join(struct.pack('>iihxx', 100 + level, price - level * 5, 3) for level in range(5))
+    depth += b''.join(struct.pack('>iihxx', 100 + level, price + level * 5, 3) for level in range(5))
+    return quote + extended + depth
+
+
+def _record(tokens: list[int], count: int, full_every: int) -> list[list[dict]]:
+    """Encode binary frames of 50 packets and parse them back as the live client would"""
+    from broker.zerodha.streaming.zerodha_websocket import ZerodhaWebSocket
+
+    parser = ZerodhaWebSocket('bench', 'bench')
+    batches = []
+    for start in range(0, count, 50):
+        packets = [_packet(tokens[i % len(tokens)], i, full_every and i % full_every == 0)
+                   for i in range(start, min(start + 50, count))]
+        frame = struct.pack('>H', len(packets)) + b''.join(struct.pack('>H', len(p)) + p for p in packets)
+        batches.append(parser._parse_binary_message(frame))
+    return batches
+
+
+def _replay(handle, batches) -> float:
+    start = time.perf_counter()
+    for ticks in batches:
+        handle(ticks)
+    return sum(len(ticks) for ticks in batches) / (time.perf_counter() - start)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscriptions", type=int, nargs="+", default=[10, 100, 1000, 3000],
+                        help="subscription counts to measure (default: 10 100 1000 3000)")
+    parser.add_argument("--ticks", type=int, default=20000, help="ticks replayed per run (default: 20000)")
+    parser.add_argument("--full-every", type=int, default=10,
+                        help="every Nth tick is a full (depth) tick, 0 for none (default: 10)")
+    args = parser.parse_args()
+
+    _configure_databases(tempfile.mkdtemp(prefix="zerodha-dispatch-"))
+    import websocket_proxy  # noqa: F401  (registers the adapters; avoids a circular import)
+    from broker.zerodha.streaming.zerodha_adapter import ZerodhaWebSocketAdapter
+
+    print(f"{args.ticks} ticks per run, every {args.full_every or 'no'}th tick full\n")
+    print(f"{'subscriptions':>13} {'before ticks/s':>15} {'after ticks/s':>14} {'speedup':>8}")
+    for count in args.subscriptions:
+        adapter = ZerodhaWebSocketAdapter()
+        tokens = [1000000 + i for i in range(count)]
+        for i, token in enumerate(tokens):
+            adapter._track_subscription(f"SYM{i}", 'NFO' if i % 2 else 'NSE', token, 3 if i % 5 == 0 else 2)
+        batches = _record(tokens, args.ticks, args.full_every)
+
+        before = _replay(lambda ticks: _legacy_handle_ticks(adapter, ticks), batches)
+        after = _replay(adapter._handle_ticks, batches)
+        print(f"{count:>13} {before:>15,.0f} {after:>14,.0f} {after / before:>7.1f}x")
+        adapter.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
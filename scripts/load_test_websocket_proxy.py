@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Ticks/second the WebSocket proxy delivers to many clients, per worker count.
+
+For each ``--workers`` count, starts the proxy in scale-out mode
+(WEBSOCKET_WORKERS) on a scratch database with one API key, fed by the
+``replay`` adapter looping a synthetic recording of ``--symbols`` LTP ticks
+at ``--speed``. ``--clients`` WebSocket clients, spread over
+``--client-procs`` processes, authenticate, subscribe to every symbol and
+count the market_data messages they receive for ``--seconds`` seconds.
+
+Prints ticks/second delivered (summed over clients) for each worker count.
+Nothing is connected to a broker; the replay adapter runs in the feed owner
+process, whose bus every worker listens to.
+
+Example::
+
+    python scripts/load_test_websocket_proxy.py --workers 1 2 4 --clients 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+API_KEY = "load-test-api-key"
+
+
+def _configure_databases(tmp_dir: str) -> None:
+    # Workers are spawned and inherit these, so they must be set before any worker starts
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/openalgo.db"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("APP_KEY", "load-test-app-key")
+    os.environ.setdefault("API_KEY_PEPPER", "load-test-pepper-0123456789abcdef0123456789abcdef")
+
+
+def _write_recording(directory: str, symbols: list[str], ticks: int) -> None:
+    from websocket_proxy.tick_recorder import TickRecorder
+
+    recorder = TickRecorder(directory)
+    start_ns = time.time_ns()
+    for i in range(ticks):
+        symbol = symbols[i % len(symbols)]
+        payload = {"symbol": symbol, "exchange": "NSE", "mode": 1, "ltp": 1000 + i % 100, "ltt": i}
+        recorder.write(f"NSE_{symbol}_LTP".encode(), json.dumps(payload).encode(), start_ns + i * 1000)
+    recorder.close()
+
+
+async def _client(url: str, symbols: list[str], ready: float, deadline: float) -> int:
+    import websockets
+
+    received = 0
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"action": "authenticate", "api_key": API_KEY}))
+        await ws.send(json.dumps({"action": "subscribe", "mode": "LTP",
+                                  "symbols": [{"symbol": symbol, "exchange": "NSE"} for symbol in symbols]}))
+        try:
+            while True:
+                message = await asyncio.wait_for(ws.recv(), max(deadline - time.monotonic(), 0.001))
+                if time.monotonic() >= ready and '"market_data"' in message:
+                    received += 1
+        except asyncio.TimeoutError:
+            pass
+    return received
+
+
+def _client_process(url: str, symbols: list[str], connections: int, warmup: float, seconds: float, results) -> None:
+    async def run():
+        ready = time.monotonic() + warmup
+        deadline = ready + seconds
+        counts = await asyncio.gather(*(_client(url, symbols, ready, deadline) for _ in range(connections)),
+                                      return_exceptions=True)
+        return sum(count for count in counts if isinstance(count, int)), \
+            sum(1 for count in counts if isinstance(count, BaseException))
+
+    results.put(asyncio.run(run()))
+
+
+def _run(workers: int, args: argparse.Namespace, symbols: list[str]) -> tuple[float, int]:
+    from websocket_proxy.workers import start_workers, stop_workers
+
+    url = f"ws://{args.host}:{args.port}"
+    processes = start_workers(workers, args.host, args.port)
+    try:
+        time.sleep(args.startup)
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        procs = min(args.client_procs, args.clients)
+        clients = []
+        for index in range(procs):
+            connections = args.clients // procs + (1 if index < args.clients % procs else 0)
+            clients.append(context.Process(target=_client_process,
+                                           args=(url, symbols, connections, args.warmup, args.seconds, results)))
+        for client in clients:
+            client.start()
+        totals = [results.get(timeout=args.warmup + args.seconds + 60) for _ in clients]
+        for client in clients:
+            client.join()
+    finally:
+        stop_workers(processes)
+    return sum(received for received, _ in totals) / args.seconds, sum(failed for _, failed in totals)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument("--clients", type=int, default=100, help="WebSocket clients (default: 100)")
+    parser.add_argument("--client-procs", type=int, default=max((os.cpu_count() or 2) // 2, 1),
+                        help="processes the clients are spread over (default: half the CPUs)")
+    parser.add_argument("--symbols", type=int, default=20, help="symbols each client subscribes to (default: 20)")
+    parser.add_argument("--ticks", type=int, default=20_000, help="ticks in the looped recording (default: 20000)")
+    parser.add_argument("--speed", default="max", help="replay speed, e.g. 1, 50x or max (default: max)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="measured seconds per run (default: 10)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds before counting starts (default: 2)")
+    parser.add_argument("--startup", type=float, default=3.0, help="seconds to let the workers start (default: 3)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18765, help="WebSocket port (default: 18765)")
+    parser.add_argument("--zmq-port", type=int, default=5545, help="ZeroMQ bus port (default: 5545)")
+    parser.add_argument("--control-port", type=int, default=5544, help="feed owner request port (default: 5544)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _configure_databases(tmp_dir)
+        symbols = [f"SYM{i}" for i in range(args.symbols)]
+        _write_recording(os.path.join(tmp_dir, "ticks"), symbols, args.ticks)
+        os.environ.update({
+            "TICK_REPLAY_PATH": os.path.join(tmp_dir, "ticks"),
+            "TICK_REPLAY_SPEED": args.speed,
+            "TICK_REPLAY_LOOP": "True",
+            "ZMQ_HOST": "127.0.0.1",
+            "ZMQ_PORT": str(args.zmq_port),
+            "WEBSOCKET_FEED_CONTROL_PORT": str(args.control_port),
+        })
+        os.environ.pop("TICK_RECORD_DIR", None)
+
+        from database.auth_db import init_db, upsert_api_key
+
+        init_db()
+        upsert_api_key("loadtest", API_KEY)
+
+        print(f"{args.clients} clients x {args.symbols} symbols, replay speed {args.speed}, "
+              f"{args.seconds:g}s per run")
+        print(f"{'workers':>8}  {'ticks/s delivered':>18}  {'failed clients':>14}")
+        for workers in args.workers:
+            rate, failed = _run(workers, args, symbols)
+            print(f"{workers:>8}  {rate:>18,.0f}  {failed:>14}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
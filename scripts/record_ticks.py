@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Record the ZeroMQ tick stream of a running WebSocket proxy.
+
+Examples::
+
+    # everything the adapters publish, into db/ticks/ticks-YYYYMMDD.bin
+    python scripts/record_ticks.py --dir db/ticks
+
+    # only NSE and NFO topics, from another host's bus
+    python scripts/record_ticks.py --endpoint tcp://10.0.0.5:5555 --topic NSE_ --topic NFO_
+
+Segments rotate per day and are replayed by the ``replay`` broker adapter
+(TICK_REPLAY_PATH). The proxy can record in-process instead with
+TICK_RECORD_DIR.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def main() -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv(PROJECT_ROOT / ".env")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=os.getenv("TICK_RECORD_DIR") or "db/ticks",
+                        help="segment directory (default: TICK_RECORD_DIR or db/ticks)")
+    parser.add_argument("--endpoint", help="ZeroMQ endpoint (default: tcp://ZMQ_HOST:ZMQ_PORT)")
+    parser.add_argument("--topic", action="append", default=[],
+                        help="record only topics starting with this prefix (repeatable)")
+    parser.add_argument("--stats", type=float, default=60.0, help="seconds between progress lines (default: 60)")
+    args = parser.parse_args()
+
+    from websocket_proxy.tick_recorder import TickRecorder
+
+    topics = [topic.encode() for topic in args.topic] or [b""]
+    recorder = TickRecorder(args.dir, args.endpoint, topics)
+    recorder.start()
+    print(f"Recording {recorder.endpoint} into {args.dir} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(args.stats)
+            print(f"{recorder.records:,} ticks recorded, writing {recorder.path}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.stop()
+    print(f"{recorder.records:,} ticks recorded")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
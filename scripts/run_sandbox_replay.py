@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Replay stored candles / recorded ticks through the sandbox (backtest).
+
+Examples::
+
+    # one replay, 1-minute candles, strategy function in strategies/my_bt.py
+    python scripts/run_sandbox_replay.py --candles data/SBIN.csv:SBIN:NSE \\
+        --strategy strategies.my_bt:on_event
+
+    # several independent replays in parallel processes
+    python scripts/run_sandbox_replay.py --jobs replays.json --processes 4
+
+``--jobs`` takes a JSON list of job dicts with the keys accepted by
+``sandbox.replay.run_replay_job`` (candles, ticks, interval, strategy,
+user_id, auto_reset, sandbox_db, name). Jobs without ``sandbox_db`` get a
+fresh database in ``--db-dir``, so the real ``db/sandbox.db`` is never used.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _candle_source(value: str):
+    path, _, rest = value.partition(':')
+    if not rest:
+        return path
+    symbol, _, exchange = rest.partition(':')
+    return [path, symbol, exchange or 'NSE']
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candles", action="append", default=[], type=_candle_source,
+                        help="candle CSV as PATH or PATH:SYMBOL:EXCHANGE (repeatable)")
+    parser.add_argument("--ticks", action="append", default=[], help="recorded ticks JSONL (repeatable)")
+    parser.add_argument("--interval", type=int, default=60, help="candle interval in seconds (default: 60)")
+    parser.add_argument("--strategy", help="strategy callable as package.module:function")
+    parser.add_argument("--user", default="replay", help="sandbox user the strategy trades as")
+    parser.add_argument("--auto-reset", action="store_true", help="apply the weekly sandbox fund reset")
+    parser.add_argument("--jobs", help="JSON file with a list of replay jobs")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes for --jobs")
+    parser.add_argument("--db-dir", help="directory for the per-replay sandbox databases (default: temp dir)")
+    args = parser.parse_args()
+
+    if args.jobs:
+        jobs = json.loads(Path(args.jobs).read_text())
+    elif args.candles or args.ticks:
+        jobs = [{
+            'name': 'replay',
+            'candles': args.candles,
+            'ticks': args.ticks,
+            'interval': args.interval,
+            'strategy': args.strategy,
+            'user_id': args.user,
+            'auto_reset': args.auto_reset,
+        }]
+    else:
+        parser.error("give --candles/--ticks or --jobs")
+
+    db_dir = args.db_dir or tempfile.mkdtemp(prefix="sandbox-replay-")
+    os.makedirs(db_dir, exist_ok=True)
+    for i, job in enumerate(jobs):
+        job.setdefault('sandbox_db', os.path.join(db_dir, f"replay-{i}.db"))
+        job.setdefault('name', f"replay-{i}")
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from sandbox.replay import run_replay_job, run_replays
+
+    start = time.perf_counter()
+    results = run_replays(jobs, args.processes) if len(jobs) > 1 else [run_replay_job(jobs[0])]
+    wall = time.perf_counter() - start
+
+    print(f"{'job':<16} {'events':>10} {'prices':>10} {'trades':>8} {'seconds':>9} {'events/s':>12}  simulated")
+    for result in results:
+        print(f"{result['job']:<16} {result['events']:>10} {result['price_updates']:>10} {result.get('trades', 0):>8} "
+              f"{result['elapsed_seconds']:>9.2f} {result['events_per_second']:>12.1f}  "
+              f"{result.get('start', '')[:10]} .. {result.get('end', '')[:10]}")
+    total = sum(result['events'] for result in results)
+    print(f"\n{len(results)} replay(s), {total} events in {wall:.2f}s wall: {total / wall if wall else 0:.1f} events/s")
+    print(f"sandbox databases: {db_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -199,7 +199,7 @@ def process_basket_order_with_auth(
     
     # If in analyze mode, route each order to sandbox
     if get_analyze_mode():
-        from services.sandbox_service import sandbox_place_order
+        from services.sandbox_service import sandbox_check_basket_margin, sandbox_place_orders
 
         analyze_results = []
         total_orders = len(basket_data['orders'])
@@ -209,6 +209,13 @@ def process_basket_order_with_auth(
         sell_orders = [order for order in basket_data['orders'] if order.get('action', '').upper() == 'SELL']
         sorted_orders = buy_orders + sell_orders
 
+        # Reject the whole basket up front if its combined margin does not fit
+        margin_ok, margin_response, margin_status = sandbox_check_basket_margin(sorted_orders, api_key)
+        if not margin_ok:
+            return False, emit_analyzer_error(original_data, margin_response['message']), margin_status
+
+        # Validate every leg, then place the valid ones in one sandbox batch
+        valid_orders = []  # (slot in analyze_results, index in basket, order)
         for i, order in enumerate(sorted_orders):
             # Create order data with common fields from basket order
             order_with_auth = order.copy()
@@ -224,28 +231,29 @@ def process_basket_order_with_auth(
                     'message': error_message
                 })
                 continue
-
-            # Place order in sandbox
-            success, response, status_code = sandbox_place_order(
-                order_with_auth,
-                api_key,
-                {'apikey': api_key, 'order_type': 'basket'}
-            )
-
+            valid_orders.append((len(analyze_results), i, order_with_auth))
+            analyze_results.append(None)
+
+        placed = sandbox_place_orders(
+            [order for _, _, order in valid_orders],
+            api_key,
+            {'apikey': api_key, 'order_type': 'basket'}
+        )
+        for (slot, i, order), (success, response, status_code) in zip(valid_orders, placed):
             if success:
-                analyze_results.append({
+                analyze_results[slot] = {
                     'symbol': order.get('symbol', 'Unknown'),
                     'status': 'success',
                     'orderid': response.get('orderid'),
                     'batch_order': True,
                     'is_last_order': i == total_orders - 1
-                })
+                }
             else:
-                analyze_results.append({
+                analyze_results[slot] = {
                     'symbol': order.get('symbol', 'Unknown'),
                     'status': 'error',
                     'message': response.get('message', 'Order placement failed')
-                })
+                }
 
         response_data = {
             'mode': 'analyze',
@@ -3,17 +3,87 @@ Market data service for handling real-time streaming data.
 Provides caching, transformation, and broadcasting capabilities.
 """
 
+import os
 import threading
 import time
-from typing import Dict, List, Any, Optional, Callable, Set
+from typing import Dict, List, Any, Optional, Callable, Set, Tuple
 from collections import defaultdict
 from datetime import datetime
 from utils.logging import get_logger
+from utils.metrics import counter, register_collector
 from .websocket_service import register_market_data_callback, get_websocket_connection
 
 # Initialize logger
 logger = get_logger(__name__)
 
+# Ticks kept per symbol for get_recent_ticks (0 keeps none)
+TICK_HISTORY = int(os.getenv('MARKET_DATA_TICK_HISTORY', '0'))
+
+MARKET_DATA_UPDATES = counter('openalgo_market_data_updates_total', 'Market data updates processed by MarketDataService')
+CACHE_LOOKUPS = counter('openalgo_market_data_cache_lookups_total', 'MarketDataService cache lookups by result',
+                        ('result',))
+_CACHE_HITS = CACHE_LOOKUPS.labels('hit')
+_CACHE_MISSES = CACHE_LOOKUPS.labels('miss')
+
+
+class _SymbolSlot:
+    """
+    Latest market data of one symbol, written by the feed and read without locks.
+
+    Writers serialize on the slot's lock and bracket every update with two
+    increments of ``version``, seqlock style: the version is odd while a write
+    is in progress. Each field holds a dict that is built before the write and
+    never mutated after it is published, so reading one field is always
+    consistent on its own; readers of several fields (or of the tick history)
+    retry until they saw the same even version before and after.
+
+    ``ticks`` is a preallocated ring of (timestamp_ms, ltp, volume) tuples when
+    tick history is enabled, with ``tick_count`` ticks written so far.
+    """
+
+    __slots__ = ('version', 'ltp', 'quote', 'depth', 'last_update', 'ticks', 'tick_count', 'lock')
+
+    def __init__(self, history: int = 0):
+        self.version = 0
+        self.ltp = None
+        self.quote = None
+        self.depth = None
+        self.last_update = 0
+        self.ticks = [None] * history if history > 0 else None
+        self.tick_count = 0
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> Tuple[Optional[Dict], Optional[Dict], Optional[Dict], int]:
+        """(ltp, quote, depth, last_update) as published by a single update"""
+        while True:
+            version = self.version
+            if not version & 1:
+                fields = (self.ltp, self.quote, self.depth, self.last_update)
+                if self.version == version:
+                    return fields
+            time.sleep(0)
+
+    def recent_ticks(self, limit: Optional[int] = None) -> List[Tuple[int, Any, Any]]:
+        """Ticks in the history ring, oldest first"""
+        if self.ticks is None:
+            return []
+        while True:
+            version = self.version
+            if not version & 1:
+                ticks, count = self.ticks[:], self.tick_count
+                if self.version == version:
+                    break
+            time.sleep(0)
+
+        size = len(ticks)
+        if count > size:
+            start = count % size
+            ticks = ticks[start:] + ticks[:start]
+        else:
+            ticks = ticks[:count]
+        return ticks[-limit:] if limit else ticks
+
+
 class MarketDataService:
     """
     Singleton service for managing market data across the application.
@@ -38,20 +108,21 @@ class MarketDataService:
         self._initialized = True
         self.data_lock = threading.Lock()
         
-        # Market data cache structure:
-        # {
-        #   'NSE:RELIANCE': {
-        #     'ltp': {'value': 2500.50, 'timestamp': 1234567890},
-        #     'quote': {'open': 2490, 'high': 2510, ...},
-        #     'depth': {'buy': [...], 'sell': [...]},
-        #     'last_update': 1234567890
-        #   }
-        # }
-        self.market_data_cache = {}
+        # Market data cache: one _SymbolSlot per 'EXCHANGE:SYMBOL', e.g. for 'NSE:RELIANCE'
+        #   ltp:   {'value': 2500.50, 'timestamp': 1234567890123, 'volume': ...}
+        #   quote: {'open': 2490, 'high': 2510, ...}
+        #   depth: {'buy': [...], 'sell': [...], ...}
+        #   last_update: 1234567890123 (milliseconds)
+        # Slots are only added and removed under data_lock; readers look them up without it
+        self.market_data_cache: Dict[str, _SymbolSlot] = {}
+        self.tick_history = TICK_HISTORY
         
         # Subscribers for real-time updates
         # {event_type: {callback_id: callback_function}}
         self.subscribers = defaultdict(dict)
+        # Per event type tuple of subscribers, replaced (never mutated) on subscribe/unsubscribe
+        # so broadcasts read it without the lock
+        self._subscriber_snapshots: Dict[str, tuple] = {}
         self.subscriber_id_counter = 0
         
         # User-specific data tracking
@@ -60,9 +131,6 @@ class MarketDataService:
         
         # Performance metrics
         self.metrics = {
-            'total_updates': 0,
-            'cache_hits': 0,
-            'cache_misses': 0,
             'last_cleanup': time.time()
         }
         
@@ -72,6 +140,23 @@ class MarketDataService:
         
         logger.info("MarketDataService initialized")
     
+    def _slot(self, symbol_key: str) -> _SymbolSlot:
+        slot = self.market_data_cache.get(symbol_key)
+        if slot is None:
+            with self.data_lock:
+                slot = self.market_data_cache.get(symbol_key)
+                if slot is None:
+                    slot = self.market_data_cache[symbol_key] = _SymbolSlot(self.tick_history)
+        return slot
+    
+    def _lookup(self, symbol: str, exchange: str) -> Optional[_SymbolSlot]:
+        slot = self.market_data_cache.get(f"{exchange}:{symbol}")
+        if slot is None:
+            _CACHE_MISSES.inc()
+        else:
+            _CACHE_HITS.inc()
+        return slot
+    
     def process_market_data(self, data: Dict[str, Any]) -> None:
         """
         Process incoming market data from WebSocket
@@ -89,50 +174,58 @@ class MarketDataService:
                 return
                 
             symbol_key = f"{exchange}:{symbol}"
-            timestamp = int(time.time())
+            now = int(time.time() * 1000)
+            timestamp = market_data.get('timestamp', now)
+            ltp_value = market_data.get('ltp', 0)
             
-            with self.data_lock:
-                # Initialize cache entry if needed
-                if symbol_key not in self.market_data_cache:
-                    self.market_data_cache[symbol_key] = {
-                        'last_update': timestamp
-                    }
-                
-                cache_entry = self.market_data_cache[symbol_key]
-                
-                # Update based on mode
-                if mode == 1:  # LTP
-                    cache_entry['ltp'] = {
-                        'value': market_data.get('ltp', 0),
-                        'timestamp': market_data.get('timestamp', timestamp),
-                        'volume': market_data.get('volume', 0)
-                    }
-                elif mode == 2:  # Quote
-                    cache_entry['quote'] = {
-                        'open': market_data.get('open', 0),
-                        'high': market_data.get('high', 0),
-                        'low': market_data.get('low', 0),
-                        'close': market_data.get('close', 0),
-                        'ltp': market_data.get('ltp', 0),
-                        'volume': market_data.get('volume', 0),
-                        'timestamp': market_data.get('timestamp', timestamp)
-                    }
-                    # Also update LTP from quote
-                    cache_entry['ltp'] = {
-                        'value': market_data.get('ltp', 0),
-                        'timestamp': market_data.get('timestamp', timestamp),
-                        'volume': market_data.get('volume', 0)
-                    }
-                elif mode == 3:  # Depth
-                    cache_entry['depth'] = {
-                        'buy': market_data.get('depth', {}).get('buy', []),
-                        'sell': market_data.get('depth', {}).get('sell', []),
-                        'ltp': market_data.get('ltp', 0),
-                        'timestamp': market_data.get('timestamp', timestamp)
-                    }
-                
-                cache_entry['last_update'] = timestamp
-                self.metrics['total_updates'] += 1
+            # Build the records before taking the slot so the write itself is a few stores
+            ltp = quote = depth = None
+            if mode == 1:  # LTP
+                ltp = {
+                    'value': ltp_value,
+                    'timestamp': timestamp,
+                    'volume': market_data.get('volume', 0)
+                }
+            elif mode == 2:  # Quote
+                quote = {
+                    'open': market_data.get('open', 0),
+                    'high': market_data.get('high', 0),
+                    'low': market_data.get('low', 0),
+                    'close': market_data.get('close', 0),
+                    'ltp': ltp_value,
+                    'volume': market_data.get('volume', 0),
+                    'timestamp': timestamp
+                }
+                # Also update LTP from quote
+                ltp = {
+                    'value': ltp_value,
+                    'timestamp': timestamp,
+                    'volume': quote['volume']
+                }
+            elif mode == 3:  # Depth
+                depth_levels = market_data.get('depth', {})
+                depth = {
+                    'buy': depth_levels.get('buy', []),
+                    'sell': depth_levels.get('sell', []),
+                    'ltp': ltp_value,
+                    'timestamp': timestamp
+                }
+            
+            slot = self._slot(symbol_key)
+            with slot.lock:
+                slot.version += 1
+                if ltp is not None:
+                    slot.ltp = ltp
+                if quote is not None:
+                    slot.quote = quote
+                if depth is not None:
+                    slot.depth = depth
+                slot.last_update = now
+                if slot.ticks is not None:
+                    slot.ticks[slot.tick_count % len(slot.ticks)] = (timestamp, ltp_value, market_data.get('volume', 0))
+                    slot.tick_count += 1
+                slot.version += 1
+            MARKET_DATA_UPDATES.inc()
             
             # Broadcast to subscribers
             self._broadcast_update(symbol_key, mode, data)
@@ -151,15 +244,8 @@ class MarketDataService:
         Returns:
             LTP data dictionary or None
         """
-        symbol_key = f"{exchange}:{symbol}"
-        
-        with self.data_lock:
-            self.metrics['cache_hits'] += 1
-            if symbol_key in self.market_data_cache:
-                return self.market_data_cache[symbol_key].get('ltp')
-            
-        self.metrics['cache_misses'] += 1
-        return None
+        slot = self._lookup(symbol, exchange)
+        return slot.ltp if slot else None
     
     def get_quote(self, symbol: str, exchange: str) -> Optional[Dict[str, Any]]:
         """
@@ -172,15 +258,8 @@ class MarketDataService:
         Returns:
             Quote data dictionary or None
         """
-        symbol_key = f"{exchange}:{symbol}"
-        
-        with self.data_lock:
-            self.metrics['cache_hits'] += 1
-            if symbol_key in self.market_data_cache:
-                return self.market_data_cache[symbol_key].get('quote')
-            
-        self.metrics['cache_misses'] += 1
-        return None
+        slot = self._lookup(symbol, exchange)
+        return slot.quote if slot else None
     
     def get_market_depth(self, symbol: str, exchange: str) -> Optional[Dict[str, Any]]:
         """
@@ -193,16 +272,49 @@ class MarketDataService:
         Returns:
             Market depth data dictionary or None
         """
-        symbol_key = f"{exchange}:{symbol}"
-        
-        with self.data_lock:
-            self.metrics['cache_hits'] += 1
-            if symbol_key in self.market_data_cache:
-                return self.market_data_cache[symbol_key].get('depth')
-            
-        self.metrics['cache_misses'] += 1
-        return None
+        slot = self._lookup(symbol, exchange)
+        return slot.depth if slot else None
     
+    def get_fresh_quote(self, symbol: str, exchange: str, max_age: float) -> Optional[Dict[str, Any]]:
+        """
+        Get a quotes-API shaped snapshot for a symbol if the feed updated it recently
+
+        Args:
+            symbol: Trading symbol
+            exchange: Exchange name
+            max_age: Maximum age in seconds of the last feed update
+
+        Returns:
+            Dict with ltp (plus ohlc/volume/bid/ask when streamed) or None if missing or stale
+        """
+        slot = self.market_data_cache.get(f"{exchange}:{symbol}")
+        if slot is not None:
+            ltp, quote, depth, last_update = slot.snapshot()
+        if slot is None or time.time() * 1000 - last_update > max_age * 1000:
+            _CACHE_MISSES.inc()
+            return None
+        _CACHE_HITS.inc()
+        ltp = ltp or {}
+        quote = quote or {}
+        depth = depth or {}
+
+        ltp_value = ltp.get('value') or quote.get('ltp') or depth.get('ltp')
+        if not ltp_value:
+            return None
+
+        buy = depth.get('buy') or [{}]
+        sell = depth.get('sell') or [{}]
+        return {
+            'ltp': ltp_value,
+            'open': quote.get('open', 0),
+            'high': quote.get('high', 0),
+            'low': quote.get('low', 0),
+            'prev_close': quote.get('close', 0),
+            'volume': quote.get('volume', ltp.get('volume', 0)),
+            'bid': buy[0].get('price', 0),
+            'ask': sell[0].get('price', 0)
+        }
+
     def get_all_data(self, symbol: str, exchange: str) -> Dict[str, Any]:
         """
         Get all available data for a symbol
@@ -214,13 +326,37 @@ class MarketDataService:
         Returns:
             All market data for the symbol
         """
-        symbol_key = f"{exchange}:{symbol}"
+        slot = self.market_data_cache.get(f"{exchange}:{symbol}")
+        if slot is None:
+            return {}
         
-        with self.data_lock:
-            if symbol_key in self.market_data_cache:
-                return dict(self.market_data_cache[symbol_key])
+        ltp, quote, depth, last_update = slot.snapshot()
+        data = {'last_update': last_update}
+        for name, value in (('ltp', ltp), ('quote', quote), ('depth', depth)):
+            if value is not None:
+                data[name] = value
+        return data
+    
+    def get_recent_ticks(self, symbol: str, exchange: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get the last ticks of a symbol, oldest first
+        
+        Only available when MARKET_DATA_TICK_HISTORY is set; holds at most that
+        many ticks per symbol.
+        
+        Args:
+            symbol: Trading symbol
+            exchange: Exchange name
+            limit: Return only the newest ``limit`` ticks (optional)
             
-        return {}
+        Returns:
+            List of {'timestamp', 'ltp', 'volume'} dictionaries
+        """
+        slot = self.market_data_cache.get(f"{exchange}:{symbol}")
+        if slot is None:
+            return []
+        return [{'timestamp': timestamp, 'ltp': ltp, 'volume': volume}
+                for timestamp, ltp, volume in slot.recent_ticks(limit)]
     
     def get_multiple_ltps(self, symbols: List[Dict[str, str]]) -> Dict[str, Any]:
         """
@@ -233,20 +369,25 @@ class MarketDataService:
             Dictionary mapping symbol_key to LTP data
         """
         result = {}
+        cache = self.market_data_cache
         
-        with self.data_lock:
-            for symbol_info in symbols:
-                symbol = symbol_info.get('symbol')
-                exchange = symbol_info.get('exchange')
-                if symbol and exchange:
-                    symbol_key = f"{exchange}:{symbol}"
-                    if symbol_key in self.market_data_cache:
-                        ltp_data = self.market_data_cache[symbol_key].get('ltp')
-                        if ltp_data:
-                            result[symbol_key] = ltp_data
+        for symbol_info in symbols:
+            symbol = symbol_info.get('symbol')
+            exchange = symbol_info.get('exchange')
+            if symbol and exchange:
+                symbol_key = f"{exchange}:{symbol}"
+                slot = cache.get(symbol_key)
+                if slot is not None:
+                    ltp_data = slot.ltp
+                    if ltp_data:
+                        result[symbol_key] = ltp_data
         
         return result
     
+    def _publish_subscribers(self, event_type: str) -> None:
+        """Replace the broadcast snapshot of one event type; call with data_lock held"""
+        self._subscriber_snapshots[event_type] = tuple(self.subscribers[event_type].values())
+    
     def subscribe_to_updates(self, event_type: str, callback: Callable, filter_symbols: Optional[Set[str]] = None) -> int:
         """
         Subscribe to market data updates
@@ -267,6 +408,7 @@ class MarketDataService:
                 'callback': callback,
                 'filter': filter_symbols
             }
+            self._publish_subscribers(event_type)
             
         logger.info(f"Added subscriber {subscriber_id} for {event_type} updates")
         return subscriber_id
@@ -285,6 +427,7 @@ class MarketDataService:
             for event_type in self.subscribers:
                 if subscriber_id in self.subscribers[event_type]:
                     del self.subscribers[event_type][subscriber_id]
+                    self._publish_subscribers(event_type)
                     logger.info(f"Removed subscriber {subscriber_id}")
                     return True
         
@@ -325,18 +468,27 @@ class MarketDataService:
     
     def get_cache_metrics(self) -> Dict[str, Any]:
         """Get performance metrics"""
-        with self.data_lock:
-            total_requests = self.metrics['cache_hits'] + self.metrics['cache_misses']
-            hit_rate = (self.metrics['cache_hits'] / total_requests * 100) if total_requests > 0 else 0
-            
-            return {
-                'total_symbols': len(self.market_data_cache),
-                'total_updates': self.metrics['total_updates'],
-                'cache_hits': self.metrics['cache_hits'],
-                'cache_misses': self.metrics['cache_misses'],
-                'hit_rate': round(hit_rate, 2),
-                'total_subscribers': sum(len(subs) for subs in self.subscribers.values())
-            }
+        cache_hits = _CACHE_HITS.get()
+        cache_misses = _CACHE_MISSES.get()
+        total_requests = cache_hits + cache_misses
+        hit_rate = (cache_hits / total_requests * 100) if total_requests > 0 else 0
+        
+        return {
+            'total_symbols': len(self.market_data_cache),
+            'total_updates': MARKET_DATA_UPDATES.get(),
+            'cache_hits': cache_hits,
+            'cache_misses': cache_misses,
+            'hit_rate': round(hit_rate, 2),
+            'total_subscribers': sum(len(subs) for subs in self._subscriber_snapshots.values())
+        }
+    
+    def collect_metrics(self):
+        """Export cache metrics to the metrics registry"""
+        metrics = self.get_cache_metrics()
+        yield ('openalgo_market_data_symbols', 'gauge', 'Symbols held in the MarketDataService cache',
+               [({}, metrics['total_symbols'])])
+        yield ('openalgo_market_data_subscribers', 'gauge', 'Registered MarketDataService subscribers',
+               [({}, metrics['total_subscribers'])])
     
     def clear_cache(self, symbol: Optional[str] = None, exchange: Optional[str] = None) -> None:
         """
@@ -369,11 +521,10 @@ class MarketDataService:
         event_type = mode_to_event.get(mode, 'all')
         
         # Broadcast to specific event subscribers
-        with self.data_lock:
-            subscribers = list(self.subscribers[event_type].values())
-            all_subscribers = list(self.subscribers['all'].values())
+        snapshots = self._subscriber_snapshots
+        subscribers = snapshots.get(event_type, ()) + snapshots.get('all', ())
         
-        for subscriber in subscribers + all_subscribers:
+        for subscriber in subscribers:
             try:
                 # Check filter
                 if subscriber['filter'] and symbol_key not in subscriber['filter']:
@@ -392,12 +543,13 @@ class MarketDataService:
                 
                 current_time = time.time()
                 stale_threshold = 3600  # 1 hour
+                stale_before = (current_time - stale_threshold) * 1000
                 
                 with self.data_lock:
                     # Clean up stale market data
                     stale_symbols = []
-                    for symbol_key, data in self.market_data_cache.items():
-                        if current_time - data.get('last_update', 0) > stale_threshold:
+                    for symbol_key, slot in self.market_data_cache.items():
+                        if slot.last_update < stale_before:
                             stale_symbols.append(symbol_key)
                     
                     for symbol_key in stale_symbols:
@@ -428,6 +580,7 @@ class MarketDataService:
 
 # Global instance
 _market_data_service = MarketDataService()
+register_collector('market_data_service', _market_data_service.collect_metrics)
 
 # Convenience functions
 def get_market_data_service() -> MarketDataService:
@@ -446,6 +599,10 @@ def get_market_depth(symbol: str, exchange: str) -> Optional[Dict[str, Any]]:
     """Get market depth for a symbol"""
     return _market_data_service.get_market_depth(symbol, exchange)
 
+def get_recent_ticks(symbol: str, exchange: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Get the last ticks of a symbol (needs MARKET_DATA_TICK_HISTORY)"""
+    return _market_data_service.get_recent_ticks(symbol, exchange, limit)
+
 def subscribe_to_market_updates(event_type: str, callback: Callable, filter_symbols: Optional[Set[str]] = None) -> int:
     """Subscribe to market data updates"""
     return _market_data_service.subscribe_to_updates(event_type, callback, filter_symbols)
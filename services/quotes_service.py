@@ -1,6 +1,6 @@
 import importlib
 import traceback
-from typing import Tuple, Dict, Any, Optional, Union
+from typing import Tuple, Dict, Any, List, Optional, Union
 from database.auth_db import get_auth_token_broker
 from utils.logging import get_logger
 
@@ -25,6 +25,27 @@ def import_broker_module(broker_name: str) -> Optional[Any]:
         logger.error(f"Error importing broker module '{module_path}': {error}")
         return None
 
+def create_data_handler(broker_module: Any, auth_token: str, feed_token: Optional[str]) -> Any:
+    """
+    Initialize the broker's data handler based on the broker's requirements.
+    
+    Args:
+        broker_module: Imported broker data module
+        auth_token: Authentication token for the broker API
+        feed_token: Feed token for market data (if required by broker)
+        
+    Returns:
+        The broker's BrokerData instance
+    """
+    if hasattr(broker_module.BrokerData.__init__, '__code__'):
+        # Check number of parameters the broker's __init__ accepts
+        param_count = broker_module.BrokerData.__init__.__code__.co_argcount
+        if param_count > 2:  # More than self and auth_token
+            return broker_module.BrokerData(auth_token, feed_token)
+        return broker_module.BrokerData(auth_token)
+    # Fallback to just auth token if we can't inspect
+    return broker_module.BrokerData(auth_token)
+
 def get_quotes_with_auth(auth_token: str, feed_token: Optional[str], broker: str, symbol: str, exchange: str) -> Tuple[bool, Dict[str, Any], int]:
     """
     Get real-time quotes for a symbol using provided auth tokens.
@@ -50,18 +71,7 @@ def get_quotes_with_auth(auth_token: str, feed_token: Optional[str], broker: str
         }, 404
 
     try:
-        # Initialize broker's data handler based on broker's requirements
-        if hasattr(broker_module.BrokerData.__init__, '__code__'):
-            # Check number of parameters the broker's __init__ accepts
-            param_count = broker_module.BrokerData.__init__.__code__.co_argcount
-            if param_count > 2:  # More than self and auth_token
-                data_handler = broker_module.BrokerData(auth_token, feed_token)
-            else:
-                data_handler = broker_module.BrokerData(auth_token)
-        else:
-            # Fallback to just auth token if we can't inspect
-            data_handler = broker_module.BrokerData(auth_token)
-            
+        data_handler = create_data_handler(broker_module, auth_token, feed_token)
         quotes = data_handler.get_quotes(symbol, exchange)
         
         if quotes is None:
@@ -82,6 +92,58 @@ def get_quotes_with_auth(auth_token: str, feed_token: Optional[str], broker: str
             'message': str(e)
         }, 500
 
+def get_multiquotes_with_auth(auth_token: str, feed_token: Optional[str], broker: str, symbols: List[Dict[str, str]]) -> Tuple[bool, Dict[str, Any], int]:
+    """
+    Get real-time quotes for several symbols using provided auth tokens.
+    Uses the broker's multi-instrument endpoint (BrokerData.get_multiquotes) when
+    available and falls back to one get_quotes call per symbol otherwise.
+    
+    Args:
+        auth_token: Authentication token for the broker API
+        feed_token: Feed token for market data (if required by broker)
+        broker: Name of the broker
+        symbols: List of dicts with 'symbol' and 'exchange'
+        
+    Returns:
+        Tuple containing:
+        - Success status (bool)
+        - Response data (dict) with 'data' as a list of {'symbol', 'exchange', 'data'}
+        - HTTP status code (int)
+    """
+    broker_module = import_broker_module(broker)
+    if broker_module is None:
+        return False, {
+            'status': 'error',
+            'message': 'Broker-specific module not found'
+        }, 404
+
+    try:
+        data_handler = create_data_handler(broker_module, auth_token, feed_token)
+        if hasattr(data_handler, 'get_multiquotes'):
+            results = data_handler.get_multiquotes(symbols)
+        else:
+            results = []
+            for item in symbols:
+                try:
+                    quote = data_handler.get_quotes(item['symbol'], item['exchange'])
+                except Exception as e:
+                    logger.warning(f"Failed to fetch quote for {item['exchange']}:{item['symbol']}: {e}")
+                    continue
+                if quote is not None:
+                    results.append({'symbol': item['symbol'], 'exchange': item['exchange'], 'data': quote})
+
+        return True, {
+            'status': 'success',
+            'data': results
+        }, 200
+    except Exception as e:
+        logger.error(f"Error in broker_module.get_multiquotes: {e}")
+        traceback.print_exc()
+        return False, {
+            'status': 'error',
+            'message': str(e)
+        }, 500
+
 def get_quotes(
     symbol: str, 
     exchange: str, 
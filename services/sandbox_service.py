@@ -8,7 +8,7 @@ virtual trading environment instead of the live broker.
 """
 
 import copy
-from typing import Tuple, Dict, Any, Optional
+from typing import Tuple, Dict, Any, List, Optional
 from database.settings_db import get_analyze_mode
 from database.auth_db import verify_api_key
 from database.apilog_db import async_log_order, executor
@@ -41,6 +41,60 @@ def get_user_id_from_apikey(api_key: str) -> Optional[str]:
         return None
 
 
+def _to_sandbox_order(order_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert API order data to sandbox format"""
+    # API uses 'pricetype' and 'product', sandbox uses 'price_type' and 'product'
+    return {
+        'symbol': order_data.get('symbol'),
+        'exchange': order_data.get('exchange'),
+        'action': order_data.get('action'),
+        'quantity': order_data.get('quantity'),
+        'price': order_data.get('price', 0),
+        'trigger_price': order_data.get('trigger_price', 0),
+        'price_type': order_data.get('pricetype') or order_data.get('price_type', 'MARKET'),
+        'product': order_data.get('product') or order_data.get('product_type', 'MIS'),
+        'strategy': order_data.get('strategy', '')
+    }
+
+
+def sandbox_check_basket_margin(
+    orders: List[Dict[str, Any]],
+    api_key: str
+) -> Tuple[bool, Dict[str, Any], int]:
+    """
+    Pre-check the combined margin of basket legs or split children
+    before any of them is placed
+
+    Args:
+        orders: Orders in API format
+        api_key: MarvelQuant API key
+
+    Returns:
+        Tuple containing:
+        - Success status (bool)
+        - Response data (dict) with margin_required
+        - HTTP status code (int)
+    """
+    try:
+        user_id = get_user_id_from_apikey(api_key)
+        if not user_id:
+            return False, {
+                'status': 'error',
+                'message': 'Invalid API key',
+                'mode': 'analyze'
+            }, 403
+
+        return OrderManager(user_id).check_basket_margin([_to_sandbox_order(order) for order in orders])
+
+    except Exception as e:
+        logger.error(f"Error in sandbox_check_basket_margin: {e}")
+        return False, {
+            'status': 'error',
+            'message': f'Sandbox margin check error: {str(e)}',
+            'mode': 'analyze'
+        }, 500
+
+
 def sandbox_place_order(
     order_data: Dict[str, Any],
     api_key: str,
@@ -73,22 +127,8 @@ def sandbox_place_order(
         # Initialize order manager for user
         order_manager = OrderManager(user_id)
 
-        # Convert order_data to sandbox format
-        # API uses 'pricetype' and 'product', sandbox uses 'price_type' and 'product'
-        sandbox_order_data = {
-            'symbol': order_data.get('symbol'),
-            'exchange': order_data.get('exchange'),
-            'action': order_data.get('action'),
-            'quantity': order_data.get('quantity'),
-            'price': order_data.get('price', 0),
-            'trigger_price': order_data.get('trigger_price', 0),
-            'price_type': order_data.get('pricetype') or order_data.get('price_type', 'MARKET'),
-            'product': order_data.get('product') or order_data.get('product_type', 'MIS'),
-            'strategy': order_data.get('strategy', '')
-        }
-
         # Place order in sandbox
-        success, response, status_code = order_manager.place_order(sandbox_order_data)
+        success, response, status_code = order_manager.place_order(_to_sandbox_order(order_data))
 
         # Prepare logging data
         log_request = copy.deepcopy(original_data)
@@ -119,6 +159,57 @@ def sandbox_place_order(
         }, 500
 
 
+def sandbox_place_orders(
+    orders: List[Dict[str, Any]],
+    api_key: str,
+    original_data: Dict[str, Any]
+) -> List[Tuple[bool, Dict[str, Any], int]]:
+    """
+    Place basket legs or split children in sandbox mode as one batch
+
+    Each order is logged to the analyzer like sandbox_place_order; the
+    Telegram alert is left to the caller, which sends one for the batch.
+
+    Args:
+        orders: Validated orders in API format
+        api_key: MarvelQuant API key
+        original_data: Original request data for logging
+
+    Returns:
+        List of (success, response, status_code) tuples, one per order
+    """
+    try:
+        user_id = get_user_id_from_apikey(api_key)
+        if not user_id:
+            return [(False, {
+                'status': 'error',
+                'message': 'Invalid API key',
+                'mode': 'analyze'
+            }, 403)] * len(orders)
+
+        results = OrderManager(user_id).place_orders([_to_sandbox_order(order) for order in orders])
+
+        log_request = {k: v for k, v in original_data.items() if k != 'apikey'}
+        log_request['api_type'] = 'placeorder'
+        for order, (_, response, _) in zip(orders, results):
+            leg_request = dict(log_request, **{k: v for k, v in order.items() if k != 'apikey'})
+            executor.submit(async_log_analyzer, leg_request, response, 'placeorder')
+            socketio.emit('analyzer_update', {
+                'request': leg_request,
+                'response': response
+            })
+
+        return results
+
+    except Exception as e:
+        logger.error(f"Error in sandbox_place_orders: {e}")
+        return [(False, {
+            'status': 'error',
+            'message': f'Sandbox order placement error: {str(e)}',
+            'mode': 'analyze'
+        }, 500)] * len(orders)
+
+
 def sandbox_modify_order(
     order_data: Dict[str, Any],
     api_key: str,
@@ -1,8 +1,8 @@
 import importlib
 import traceback
 import copy
+import uuid
 from typing import Tuple, Dict, Any, Optional, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from database.auth_db import get_auth_token_broker
 from database.apilog_db import async_log_order, executor as log_executor
@@ -18,6 +18,7 @@ from utils.constants import (
     REQUIRED_ORDER_FIELDS
 )
 from utils.logging import get_logger
+from utils.order_scheduler import get_rate_budget, run_child_orders
 from services.telegram_alert_service import telegram_alert_service
 
 # Initialize logger
@@ -26,6 +27,9 @@ logger = get_logger(__name__)
 # Maximum number of orders allowed
 MAX_ORDERS = 100
 
+# Longest a time-sliced split may take from first to last child (seconds)
+MAX_SLICE_SPAN = 300
+
 def emit_analyzer_error(request_data: Dict[str, Any], error_message: str) -> Dict[str, Any]:
     """
     Helper function to emit analyzer error events
@@ -194,6 +198,16 @@ def split_order_with_auth(
             log_executor.submit(async_log_order, 'splitorder', original_data, error_response)
             return False, error_response, 400
 
+        # Time-sliced children are placed within the request, so bound its duration
+        slice_span = float(split_data.get('slice_interval') or 0) * (total_orders - 1)
+        if slice_span > MAX_SLICE_SPAN:
+            error_message = f'Slice interval would spread the orders over {slice_span:g} seconds (maximum {MAX_SLICE_SPAN})'
+            if get_analyze_mode():
+                return False, emit_analyzer_error(original_data, error_message), 400
+            error_response = {'status': 'error', 'message': error_message}
+            log_executor.submit(async_log_order, 'splitorder', original_data, error_response)
+            return False, error_response, 400
+
     except ValueError:
         error_message = 'Invalid quantity or split size'
         if get_analyze_mode():
@@ -204,65 +218,36 @@ def split_order_with_auth(
     
     # If in analyze mode, route to sandbox for virtual trading
     if get_analyze_mode():
-        from services.sandbox_service import sandbox_place_order
+        from services.sandbox_service import sandbox_check_basket_margin, sandbox_place_orders
 
         api_key = original_data.get('apikey')
         if not api_key:
             return False, emit_analyzer_error(original_data, 'API key required for sandbox mode'), 400
 
-        analyze_results = []
-
-        # Place full-size orders in sandbox
-        for i in range(num_full_orders):
-            order_data = copy.deepcopy(split_data)
-            order_data['quantity'] = str(split_size)
-            order_data['apikey'] = api_key
+        # Reject the split up front if all children together do not fit the margin
+        children = [dict(split_data, quantity=split_size)] * num_full_orders
+        if remaining_qty > 0:
+            children.append(dict(split_data, quantity=remaining_qty))
+        margin_ok, margin_response, margin_status = sandbox_check_basket_margin(children, api_key)
+        if not margin_ok:
+            return False, emit_analyzer_error(original_data, margin_response['message']), margin_status
 
-            # Place order in sandbox
-            success, response, status_code = sandbox_place_order(
-                order_data,
-                api_key,
-                {'apikey': api_key, 'order_type': 'split'}
-            )
+        # Place all children in one sandbox batch
+        placed = sandbox_place_orders(children, api_key, {'apikey': api_key, 'order_type': 'split'})
 
+        analyze_results = []
+        for i, (child, (success, response, status_code)) in enumerate(zip(children, placed)):
             if success:
                 analyze_results.append({
                     'order_num': i + 1,
-                    'quantity': split_size,
+                    'quantity': child['quantity'],
                     'status': 'success',
                     'orderid': response.get('orderid')
                 })
             else:
                 analyze_results.append({
                     'order_num': i + 1,
-                    'quantity': split_size,
-                    'status': 'error',
-                    'message': response.get('message', 'Order placement failed')
-                })
-
-        # Place remaining quantity order if any
-        if remaining_qty > 0:
-            order_data = copy.deepcopy(split_data)
-            order_data['quantity'] = str(remaining_qty)
-            order_data['apikey'] = api_key
-
-            success, response, status_code = sandbox_place_order(
-                order_data,
-                api_key,
-                {'apikey': api_key, 'order_type': 'split'}
-            )
-
-            if success:
-                analyze_results.append({
-                    'order_num': num_full_orders + 1,
-                    'quantity': remaining_qty,
-                    'status': 'success',
-                    'orderid': response.get('orderid')
-                })
-            else:
-                analyze_results.append({
-                    'order_num': num_full_orders + 1,
-                    'quantity': remaining_qty,
+                    'quantity': child['quantity'],
                     'status': 'error',
                     'message': response.get('message', 'Order placement failed')
                 })
@@ -302,65 +287,52 @@ def split_order_with_auth(
         log_executor.submit(async_log_order, 'splitorder', original_data, error_response)
         return False, error_response, 404
 
-    # Process orders concurrently
-    results = []
-    
-    # Create a ThreadPoolExecutor for concurrent order placement
-    with ThreadPoolExecutor(max_workers=10) as order_executor:
-        # Prepare orders for concurrent execution
-        futures = []
-        
-        # Submit full-size orders
-        for i in range(num_full_orders):
-            order_data = copy.deepcopy(split_data)
-            order_data['quantity'] = str(split_size)
-            futures.append(
-                order_executor.submit(
-                    place_single_order,
-                    order_data,
-                    broker_module,
-                    auth_token,
-                    i + 1,
-                    total_orders
-                )
-            )
-
-        # Submit remaining quantity order if any
-        if remaining_qty > 0:
-            order_data = copy.deepcopy(split_data)
-            order_data['quantity'] = str(remaining_qty)
-            futures.append(
-                order_executor.submit(
-                    place_single_order,
-                    order_data,
-                    broker_module,
-                    auth_token,
-                    total_orders,
-                    total_orders
-                )
-            )
-
-        # Collect results as they complete
-        for future in as_completed(futures):
-            result = future.result()
-            results.append(result)
-
-        # Sort results by order_num to maintain order in response
-        results.sort(key=lambda x: x['order_num'])
-
-        # Log the split order results
-        response_data = {
-            'status': 'success',
-            'total_quantity': total_quantity,
-            'split_size': split_size,
-            'results': results
-        }
-        log_executor.submit(async_log_order, 'splitorder', split_request_data, response_data)
+    # Children are placed concurrently within the broker's order rate budget,
+    # optionally spaced slice_interval seconds apart (TWAP style)
+    slice_interval = float(split_data.get('slice_interval') or 0)
+    child_data = {k: v for k, v in split_data.items() if k != 'slice_interval'}
+    children = [dict(child_data, quantity=str(split_size)) for _ in range(num_full_orders)]
+    if remaining_qty > 0:
+        children.append(dict(child_data, quantity=str(remaining_qty)))
+
+    split_id = uuid.uuid4().hex
+
+    def stream_result(result, completed):
+        # Per-child progress for the UI, in completion order
+        socketio.emit('split_order_update', {
+            'split_id': split_id,
+            'symbol': split_data['symbol'],
+            'action': split_data['action'],
+            'total_orders': total_orders,
+            'completed': completed,
+            'result': result
+        })
 
-        # Send Telegram alert for live mode
-        telegram_alert_service.send_order_alert('splitorder', split_data, response_data, split_data.get('apikey'))
+    results = run_child_orders(
+        children,
+        lambda child, order_num: place_single_order(child, broker_module, auth_token, order_num, total_orders),
+        get_rate_budget(broker),
+        slice_interval=slice_interval,
+        on_result=stream_result
+    )
+
+    placed = [r for r in results if r['status'] == 'success']
+    response_data = {
+        'status': 'success',
+        'total_quantity': total_quantity,
+        'split_size': split_size,
+        'split_id': split_id,
+        'placed_orders': len(placed),
+        'placed_quantity': sum(r['quantity'] for r in placed),
+        'failed_orders': len(results) - len(placed),
+        'results': results
+    }
+    log_executor.submit(async_log_order, 'splitorder', split_request_data, response_data)
 
-        return True, response_data, 200
+    # Send Telegram alert for live mode
+    telegram_alert_service.send_order_alert('splitorder', split_data, response_data, split_data.get('apikey'))
+
+    return True, response_data, 200
 
 def split_order(
     split_data: Dict[str, Any],
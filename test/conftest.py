@@ -0,0 +1,37 @@
+"""
+Shared collection setup for the tests in this directory.
+
+Some test modules elsewhere in the tree (broker/jainam_prop) replace the
+database and utils packages with mocks in sys.modules at import time, and
+test/sandbox can shadow the sandbox package. Before each test module here is
+imported, drop those entries so it imports the real project modules.
+"""
+
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(TEST_DIR)
+SANDBOX_DIR = os.path.join(PROJECT_ROOT, 'sandbox')
+PROJECT_PACKAGES = ('database', 'utils', 'services', 'blueprints', 'sandbox')
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+def _is_stale(name, module):
+    top = name.split('.')[0]
+    if top not in PROJECT_PACKAGES:
+        return False
+    path = getattr(module, '__file__', None)
+    if not isinstance(path, str):
+        return True  # a mock, not the project module
+    return top == 'sandbox' and not path.startswith(SANDBOX_DIR)
+
+
+def pytest_collectstart(collector):
+    if isinstance(collector, pytest.Module) and os.path.dirname(str(collector.path)) == TEST_DIR:
+        for name in [name for name, module in sys.modules.items() if _is_stale(name, module)]:
+            del sys.modules[name]
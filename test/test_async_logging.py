@@ -0,0 +1,110 @@
+"""
+Tests for the queue-based logging pipeline in utils.logging
+
+Covers:
+- Records are delivered through the background listener
+- Overflow drops records without blocking and reports a summary warning
+- Per-logger sampling of DEBUG/INFO records
+"""
+
+import logging
+import os
+import queue
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logging import (
+    DroppingQueueHandler,
+    LogSamplingFilter,
+    get_logging_stats,
+    parse_sample_rules,
+    setup_logging,
+)
+
+
+class _CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_queue_handler_drops_when_full():
+    log_queue = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(log_queue)
+    logger = logging.getLogger('test.async_logging.drop')
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(5):
+            logger.warning("message %d", i)
+    finally:
+        logger.removeHandler(handler)
+
+    assert handler.enqueued == 2
+    assert handler.dropped == 3
+
+    # Drain and enqueue again - a single overflow notice follows the record
+    while not log_queue.empty():
+        log_queue.get_nowait()
+    logger.addHandler(handler)
+    try:
+        logger.warning("after drain")
+    finally:
+        logger.removeHandler(handler)
+
+    first = log_queue.get_nowait()
+    notice = log_queue.get_nowait()
+    assert first.getMessage() == "after drain"
+    assert "dropped 3 records" in notice.getMessage()
+
+
+def test_records_are_formatted_lazily():
+    log_queue = queue.Queue()
+    handler = DroppingQueueHandler(log_queue)
+    record = logging.LogRecord('x', logging.INFO, __file__, 1, "value=%s", ([1, 2],), None)
+    handler.handle(record)
+
+    queued = log_queue.get_nowait()
+    assert queued.msg == "value=%s"
+    assert queued.args == ([1, 2],)
+
+
+def test_sampling_filter_keeps_one_in_n():
+    sampler = LogSamplingFilter({'feed': 10})
+
+    def make(name, level=logging.DEBUG):
+        return logging.LogRecord(name, level, __file__, 1, "tick", None, None)
+
+    kept = sum(sampler.filter(make('feed.zerodha')) for _ in range(100))
+    assert kept == 10
+    assert sampler.sampled_out == 90
+
+    # Unrelated loggers and warnings are never sampled
+    assert all(sampler.filter(make('feedback')) for _ in range(10))
+    assert all(sampler.filter(make('feed.zerodha', logging.WARNING)) for _ in range(10))
+
+
+def test_parse_sample_rules():
+    rules = parse_sample_rules("broker.zerodha.streaming=0.01, websocket_proxy=5,bad,x=abc")
+    assert rules == {'broker.zerodha.streaming': 100, 'websocket_proxy': 5}
+
+
+def test_setup_logging_async_pipeline(monkeypatch):
+    monkeypatch.setenv('LOG_ASYNC', 'True')
+    monkeypatch.setenv('LOG_TO_FILE', 'False')
+    setup_logging()
+    try:
+        root = logging.getLogger()
+        assert len(root.handlers) == 1
+        assert isinstance(root.handlers[0], DroppingQueueHandler)
+
+        stats = get_logging_stats()
+        assert stats['async'] is True
+        assert stats['queue_capacity'] == 10000
+    finally:
+        monkeypatch.delenv('LOG_ASYNC')
+        setup_logging()
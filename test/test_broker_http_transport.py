@@ -0,0 +1,100 @@
+"""
+Tests for the per-host pooled broker HTTP transport (utils/httpx_client.py)
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from utils.httpx_client import BrokerTransport, broker_origins
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.active -= 1
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _SlowHandler.active = _SlowHandler.peak = 0
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _SlowHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def transport():
+    transport = BrokerTransport(http2=False, timeout=10.0, concurrency=3)
+    yield transport
+    transport.close()
+
+
+def test_sync_requests_respect_the_host_concurrency_cap(server, transport):
+    def fetch(i):
+        assert transport.client.get(f"{server}/order/{i}").text == f"/order/{i}"
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert _SlowHandler.peak == 3
+    stats = transport.stats()['sync']
+    (origin, host), = stats.items()
+    assert origin == server
+    assert (host['requests'], host['in_flight'], host['peak_in_flight']) == (9, 0, 3)
+    assert host['queued'] >= 6
+    assert 1 <= host['connections'] <= 3
+
+
+def test_request_many_fans_out_in_order(server, transport):
+    responses = transport.request_many([('GET', f"{server}/leg/{i}", {}) for i in range(6)])
+    assert [r.text for r in responses] == [f"/leg/{i}" for i in range(6)]
+    assert _SlowHandler.peak == 3
+    assert transport.stats()['async'] != {}
+
+
+def test_async_request_from_a_foreign_event_loop(server, transport):
+    async def run():
+        return await asyncio.gather(*(transport.async_request('GET', f"{server}/q/{i}") for i in range(4)))
+
+    responses = asyncio.run(run())
+    assert [r.status_code for r in responses] == [200] * 4
+    assert responses[2].text == '/q/2'
+
+
+def test_broker_origins(monkeypatch):
+    assert broker_origins('zerodha') == ['https://api.kite.trade']
+    monkeypatch.setenv('BROKER_HTTP_PREWARM_ZERODHA', 'https://a.example, https://b.example')
+    assert broker_origins('zerodha') == ['https://a.example', 'https://b.example']
+    assert broker_origins('no_such_broker') == []
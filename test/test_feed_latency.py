@@ -0,0 +1,98 @@
+"""
+Tests for sampled feed latency tracing (utils/feed_latency.py) through the
+adapter publish and the proxy's ZeroMQ listener
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import zmq
+import zmq.asyncio
+
+import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+from utils import feed_latency
+from websocket_proxy import server
+from websocket_proxy.broker_factory import create_broker_adapter
+
+
+@pytest.fixture(autouse=True)
+def tracing():
+    feed_latency.reset()
+    yield
+    feed_latency.set_sample_rate(0)
+    feed_latency.reset()
+
+
+def test_sampling_rate_and_hops():
+    assert feed_latency.trace_frame('zerodha') is None
+
+    feed_latency.set_sample_rate(1)
+    feed_latency.mark_frame()
+    frame_ns, publish_ns = feed_latency.TRACE.unpack_from(feed_latency.trace_frame('zerodha'))
+    feed_latency.observe(feed_latency.TRACE.pack(frame_ns, frame_ns + 2_000_000) + b'zerodha',
+                         frame_ns + 2_500_000, frame_ns + 4_000_000)
+
+    # a thread whose client never marks frames samples each tick, without the adapter hop
+    traces = []
+    thread = threading.Thread(target=lambda: traces.append(feed_latency.trace_frame('dhan')))
+    thread.start()
+    thread.join()
+    assert feed_latency.TRACE.unpack_from(traces[0])[0] == 0
+    feed_latency.observe(traces[0], feed_latency.TRACE.unpack_from(traces[0])[1] + 1_000_000, None)
+
+    stats = feed_latency.get_feed_latency_stats()
+    assert set(stats['zerodha']) == {'adapter', 'zmq', 'proxy', 'total'}
+    assert stats['zerodha']['adapter']['p50'] == pytest.approx(2.0, rel=0.02)
+    assert stats['zerodha']['total']['max'] == pytest.approx(4.0)
+    assert set(stats['dhan']) == {'zmq'}
+
+    feed_latency.set_sample_rate(0.0)
+    feed_latency.mark_frame()
+    assert feed_latency.trace_frame('zerodha') is None
+
+
+def test_trace_frame_rides_through_the_proxy():
+    feed_latency.set_sample_rate(1)
+    adapter = create_broker_adapter('replay')
+    adapter.broker_name = 'zerodha'
+
+    proxy = server.WebSocketProxy.__new__(server.WebSocketProxy)
+    proxy.subscriptions = {1: {('RELIANCE', 'NSE', 1): server.Subscription('RELIANCE', 'NSE', 1, 5, 'zerodha')}}
+    proxy.user_mapping, proxy.user_broker_mapping = {1: 'alice'}, {'alice': 'zerodha'}
+    proxy.broker_adapters = {}
+    proxy.sent = []
+
+    async def send_message(client_id, message):
+        proxy.sent.append(message)
+        proxy.running = False
+        return True
+
+    proxy.send_message = send_message
+
+    async def session():
+        proxy.context = zmq.asyncio.Context.instance()
+        proxy.socket = proxy.context.socket(zmq.SUB)
+        proxy.socket.setsockopt(zmq.SUBSCRIBE, b'')
+        proxy.socket.connect(f'tcp://127.0.0.1:{adapter.zmq_port}')
+        proxy.running = True
+        listener = asyncio.ensure_future(proxy.zmq_listener())
+        await asyncio.sleep(0.2)
+        while proxy.running:
+            feed_latency.mark_frame()
+            adapter.publish_market_data('NSE_RELIANCE_LTP', {'ltp': 2500.5})
+            await asyncio.sleep(0.05)
+        await asyncio.wait_for(listener, 5)
+        proxy.socket.close(linger=0)
+
+    try:
+        asyncio.run(session())
+    finally:
+        adapter.cleanup_zmq()
+
+    assert proxy.sent[0]['data'] == {'ltp': 2500.5}
+    assert set(feed_latency.get_feed_latency_stats()['zerodha']) == {'adapter', 'zmq', 'proxy', 'total'}
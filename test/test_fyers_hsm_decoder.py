@@ -0,0 +1,82 @@
+"""
+Tests for the Fyers HSM data feed decoder (broker/fyers/streaming/fyers_hsm_decoder.py)
+"""
+
+import base64
+import json
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+from broker.fyers.streaming.fyers_hsm_decoder import NULL_VALUE, HSMFeedDecoder
+from broker.fyers.streaming.fyers_hsm_websocket import FyersHSMWebSocket
+
+TOKEN = 'sf|nse_fo|35003'
+
+
+def _snapshot(topic_id, name, values, strings=(b'NSE', b'35003', b'NIFTY25OCT25000CE')):
+    packet = (bytes([83]) + struct.pack('=HB', topic_id, len(name)) + name.encode()
+              + bytes([len(values)]) + struct.pack(f'>{len(values)}i', *values))
+    if not name.startswith('if|'):
+        packet += b'\0\0' + struct.pack('>HB', 100, 2) + b''.join(bytes([len(s)]) + s for s in strings)
+    return packet
+
+
+def _update(topic_id, values):
+    return bytes([85]) + struct.pack('=HB', topic_id, len(values)) + struct.pack(f'>{len(values)}i', *values)
+
+
+def _feed(*scrips):
+    return b'\0\0\x06' + b'\0' * 4 + struct.pack('>H', len(scrips)) + b''.join(scrips)
+
+
+def _fields(**values):
+    fields = [NULL_VALUE] * 21
+    for index, value in values.items():
+        fields[int(index[1:])] = value
+    return fields
+
+
+def test_snapshot_then_update_applies_the_deltas_once():
+    decoder = HSMFeedDecoder({TOKEN: 'NIFTY25OCT25000CE'})
+    snapshot, = decoder.decode(_feed(_snapshot(7, TOKEN, _fields(f0=12050, f1=900, f19=11800))))
+    assert snapshot == {'type': 'sf', 'ltp': 12050, 'vol_traded_today': 900, 'open_price': 11800,
+                        'multiplier': 100, 'precision': 2, 'exchange': 'NSE', 'exchange_token': '35003',
+                        'symbol': 'NIFTY25OCT25000CE', 'original_symbol': 'NIFTY25OCT25000CE', 'hsm_token': TOKEN}
+
+    # three changed fields, one unchanged and the rest marked as not sent
+    update, = decoder.decode(_feed(_update(7, _fields(f0=12060, f1=950, f8=25, f19=11800))))
+    assert update['update_type'] == 'live'
+    assert (update['ltp'], update['vol_traded_today'], update['last_traded_qty']) == (12060, 950, 25)
+    assert update['symbol'] == 'NIFTY25OCT25000CE'
+
+    assert decoder.decode(_feed(_update(7, _fields(f0=12060)))) == []
+
+
+def test_updates_for_unknown_topics_are_skipped():
+    decoder = HSMFeedDecoder()
+    index = [2450050, 2440000, 1700000000, NULL_VALUE, 2430000, 2445000]
+    messages = decoder.decode(_feed(_update(3, _fields(f0=1)), _snapshot(4, 'if|nse_cm|Nifty 50', index),
+                                    _update(4, [2450100] + [NULL_VALUE] * 5)))
+    assert [(m['type'], m['ltp'], m.get('update_type')) for m in messages] == \
+        [('if', 2450050, None), ('if', 2450100, 'live')]
+    assert 'high_price' not in messages[0] and 'symbol' not in messages[0]
+
+
+def test_client_passes_each_message_to_the_callback():
+    payload = base64.urlsafe_b64encode(json.dumps({'hsm_key': 'key', 'exp': time.time() + 3600}).encode())
+    client = FyersHSMWebSocket(f"APPID:h.{payload.decode().rstrip('=')}.s")
+    received = []
+    client.set_callbacks(on_message=received.append)
+    client.symbol_mappings[TOKEN] = 'NIFTY25OCT25000CE'
+
+    client._on_ws_message(None, _feed(_snapshot(9, TOKEN, _fields(f0=500)), _update(9, _fields(f0=505))))
+    assert [(m['ltp'], m['original_symbol']) for m in received] == [(500, 'NIFTY25OCT25000CE'),
+                                                                   (505, 'NIFTY25OCT25000CE')]
+
+    client.force_cleanup()
+    assert client.decoder.topics == {} and client.symbol_mappings == {}
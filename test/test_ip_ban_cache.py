@@ -0,0 +1,148 @@
+"""
+Tests for the in-memory IP ban table and security event trackers
+(database/traffic_db.py)
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from database import settings_db, traffic_db
+from database.traffic_db import (
+    Error404Tracker,
+    IPBan,
+    InvalidAPIKeyTracker,
+    ban_cache,
+    error_404_events,
+    invalid_api_key_events,
+    logs_session,
+)
+
+
+@pytest.fixture(autouse=True)
+def logs_db():
+    settings_db.init_db()
+    traffic_db.init_logs_db()
+    yield
+    logs_session.remove()
+
+
+def test_ban_check_does_not_query_database(monkeypatch):
+    ip = '203.0.113.10'
+    IPBan.unban_ip(ip)
+    assert IPBan.ban_ip(ip, 'test ban', duration_hours=1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("ban check must not hit the database")
+
+    monkeypatch.setattr(IPBan, 'query', property(fail), raising=False)
+    monkeypatch.setattr(logs_session, 'query', fail)
+    assert IPBan.is_ip_banned(ip) is True
+    assert IPBan.is_ip_banned('203.0.113.11') is False
+    monkeypatch.undo()
+
+    assert IPBan.unban_ip(ip)
+    assert IPBan.is_ip_banned(ip) is False
+
+
+def test_cache_reload_reflects_database():
+    ip = '203.0.113.20'
+    IPBan.unban_ip(ip)
+    IPBan.ban_ip(ip, 'permanent ban', permanent=True)
+
+    ban_cache._bans = {}
+    IPBan.load_ban_cache()
+    assert IPBan.is_ip_banned(ip) is True
+    IPBan.unban_ip(ip)
+
+
+def test_reload_keeps_bans_made_while_it_read_the_table(monkeypatch):
+    cache = traffic_db.BanCache()
+    cache.set('203.0.113.40', True, None)
+
+    class _Session:
+        """Table snapshot taken before the ban below was committed"""
+
+        def query(self, *columns):
+            return self
+
+        def all(self):
+            cache.set('203.0.113.41', True, None)
+            cache.remove('203.0.113.40')
+            return [('203.0.113.40', True, None)]
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(traffic_db, 'sessionmaker', lambda bind: _Session)
+    cache.load()
+
+    assert cache.is_banned('203.0.113.41') is True
+    assert cache.is_banned('203.0.113.40') is False
+
+
+def test_expired_ban_is_not_enforced():
+    ip = '203.0.113.30'
+    ban_cache.set(ip, False, datetime.utcnow() - timedelta(seconds=1))
+    assert IPBan.is_ip_banned(ip) is False
+
+
+def test_404_tracking_is_buffered_then_persisted():
+    ip = '198.51.100.7'
+    error_404_events.flush()
+    error_404_events.clear(ip)
+    existing = Error404Tracker.query.filter_by(ip_address=ip).first()
+    if existing:
+        logs_session.delete(existing)
+        logs_session.commit()
+
+    for path in ['/wp-admin', '/.env', '/wp-admin']:
+        assert Error404Tracker.track_404(ip, path)
+
+    assert error_404_events.get_count(ip) == 3
+    assert Error404Tracker.query.filter_by(ip_address=ip).first() is None
+
+    error_404_events.flush()
+    tracker = Error404Tracker.query.filter_by(ip_address=ip).first()
+    assert tracker.error_count == 3
+    assert sorted(json.loads(tracker.paths_attempted)) == ['/.env', '/wp-admin']
+
+    Error404Tracker.track_404(ip, '/admin')
+    error_404_events.flush()
+    logs_session.expire_all()
+    tracker = Error404Tracker.query.filter_by(ip_address=ip).first()
+    assert tracker.error_count == 4
+
+
+def test_events_are_kept_when_persisting_fails():
+    written, failures = [], [RuntimeError('database is locked')]
+
+    def persist(pending):
+        if failures:
+            raise failures.pop()
+        written.append({ip: (events.count, list(events.items)) for ip, events in pending.items()})
+
+    tracker = traffic_db.SecurityEventTracker('test', persist, max_items=2)
+    tracker.record('198.51.100.9', '/a')
+    tracker.record('198.51.100.9', '/b')
+    assert tracker.flush() == 0
+
+    tracker.record('198.51.100.9', '/c')
+    tracker.record('198.51.100.10')
+    assert tracker.flush() == 2
+    assert written == [{'198.51.100.9': (3, ['/b', '/c']), '198.51.100.10': (1, [])}]
+
+
+def test_invalid_api_key_tracking_is_persisted():
+    ip = '198.51.100.8'
+    invalid_api_key_events.clear(ip)
+    assert InvalidAPIKeyTracker.track_invalid_api_key(ip, 'abc123')
+    assert InvalidAPIKeyTracker.track_invalid_api_key(ip, 'abc123')
+
+    users = {t.ip_address: t for t in InvalidAPIKeyTracker.get_suspicious_api_users(min_attempts=1)}
+    assert users[ip].attempt_count >= 2
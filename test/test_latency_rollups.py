@@ -0,0 +1,99 @@
+"""
+Tests for streaming latency histograms and rollups
+(utils/latency_histogram.py, database/latency_db.py)
+"""
+
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.latency_histogram import LatencyHistogram
+from database import latency_db
+from database.latency_db import LatencyRollup, OrderLatency, _cover_window, latency_session
+
+
+def test_histogram_percentiles_within_precision():
+    rng = random.Random(7)
+    samples = [rng.lognormvariate(3, 0.8) for _ in range(20000)]
+    hist = LatencyHistogram()
+    for value in samples:
+        hist.record(value)
+
+    samples.sort()
+    for pct in (50, 90, 99):
+        exact = samples[int(len(samples) * pct / 100) - 1]
+        assert abs(hist.percentile(pct) - exact) / exact < 0.02
+
+    assert hist.count == len(samples)
+    assert abs(hist.mean - sum(samples) / len(samples)) < 1e-6
+
+
+def test_histogram_merge_matches_single_histogram():
+    combined, left, right = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i in range(1, 1001):
+        combined.record(i / 10)
+        (left if i % 2 else right).record(i / 10)
+
+    merged = LatencyHistogram().merge(left).merge(right)
+    assert merged.buckets == combined.buckets
+    assert merged.percentile(99) == combined.percentile(99)
+    assert (merged.min, merged.max) == (combined.min, combined.max)
+
+
+def test_cover_window_uses_coarsest_rollups():
+    start = datetime(2025, 1, 1, 9, 15, 30)
+    end = datetime(2025, 1, 4, 15, 30)
+    segments = _cover_window(start, end)
+
+    assert ('d', datetime(2025, 1, 2), datetime(2025, 1, 4)) in segments
+    assert ('h', datetime(2025, 1, 1, 10), datetime(2025, 1, 2)) in segments
+    assert ('h', datetime(2025, 1, 4), datetime(2025, 1, 4, 15)) in segments
+    assert ('m', datetime(2025, 1, 1, 9, 15), datetime(2025, 1, 1, 10)) in segments
+    assert ('m', datetime(2025, 1, 4, 15), datetime(2025, 1, 4, 15, 30)) in segments
+
+
+def test_stats_served_from_rollups():
+    latency_db.init_latency_db()
+    latency_session.query(LatencyRollup).delete()
+    latency_session.commit()
+
+    for i in range(100):
+        OrderLatency.log_latency(
+            order_id=f'o{i}', user_id=1, broker='testbroker', symbol='SBIN', order_type='PLACE',
+            latencies={'rtt': 10 + i, 'validation': 1, 'broker_request': 10 + i,
+                       'broker_response': 2, 'overhead': 3, 'total': 13 + i},
+            request_body={}, response_body={}, status='FAILED' if i < 5 else 'SUCCESS'
+        )
+
+    stats = OrderLatency.get_latency_stats(start=datetime.utcnow() - timedelta(minutes=5))
+    assert stats['total_orders'] == 100
+    assert stats['failed_orders'] == 5
+    assert abs(stats['avg_rtt'] - 59.5) < 1e-6
+    assert abs(stats['p99_rtt'] - 108) / 108 < 0.02
+    assert stats['broker_stats']['testbroker']['total_orders'] == 100
+    assert stats['stage_stats']['validation']['p50'] == 1
+
+    hist = OrderLatency.get_histogram('rtt', broker='testbroker')
+    assert hist.count == 100
+    latency_session.remove()
+
+
+def test_dashboard_histograms_follow_the_stats_window():
+    from blueprints.latency import get_histogram_data
+
+    latency_db.init_latency_db()
+    latency_session.query(LatencyRollup).delete()
+    latency_session.commit()
+    OrderLatency.log_latency(
+        order_id='w1', user_id=1, broker='testbroker', symbol='SBIN', order_type='PLACE',
+        latencies={'rtt': 20, 'overhead': 3, 'total': 23},
+        request_body={}, response_body={}, status='SUCCESS'
+    )
+
+    assert sum(get_histogram_data('testbroker')['counts']) == 1
+    later = datetime.utcnow() + timedelta(minutes=5)
+    assert get_histogram_data('testbroker', start=later)['counts'] == []
+    latency_session.remove()
@@ -0,0 +1,83 @@
+"""
+Tests for the per-symbol slot store of MarketDataService (services/market_data_service.py)
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from services.market_data_service import get_market_data_service
+
+
+@pytest.fixture
+def service():
+    service = get_market_data_service()
+    yield service
+    service.tick_history = 0
+    service.clear_cache('SLOTTEST', 'NSE')
+
+
+def _tick(mode, **data):
+    return {'symbol': 'SLOTTEST', 'exchange': 'NSE', 'mode': mode, 'data': data}
+
+
+def test_latest_records_and_millisecond_stamps(service):
+    before = int(time.time() * 1000)
+    service.process_market_data(_tick(2, ltp=101.5, open=100, high=102, low=99, close=98, volume=700))
+    service.process_market_data(_tick(3, ltp=101.6, depth={'buy': [{'price': 101.5, 'quantity': 10}],
+                                                           'sell': [{'price': 101.7, 'quantity': 5}]}))
+
+    assert service.get_ltp('SLOTTEST', 'NSE')['value'] == 101.5
+    assert service.get_ltp('SLOTTEST', 'NSE')['timestamp'] >= before
+    assert service.get_quote('SLOTTEST', 'NSE')['high'] == 102
+    assert service.get_market_depth('SLOTTEST', 'NSE')['sell'][0]['price'] == 101.7
+
+    data = service.get_all_data('SLOTTEST', 'NSE')
+    assert set(data) == {'ltp', 'quote', 'depth', 'last_update'} and data['last_update'] >= before
+    assert service.get_fresh_quote('SLOTTEST', 'NSE', max_age=5) == {
+        'ltp': 101.5, 'open': 100, 'high': 102, 'low': 99, 'prev_close': 98, 'volume': 700,
+        'bid': 101.5, 'ask': 101.7}
+
+    service.market_data_cache['NSE:SLOTTEST'].last_update -= 10_000
+    assert service.get_fresh_quote('SLOTTEST', 'NSE', max_age=5) is None
+    assert service.get_ltp('MISSING', 'NSE') is None
+
+
+def test_recent_ticks_keep_the_newest_in_order(service):
+    assert service.get_recent_ticks('SLOTTEST', 'NSE') == []
+    service.tick_history = 3
+    for i in range(5):
+        service.process_market_data(_tick(1, ltp=100 + i, volume=i, timestamp=1_700_000_000_000 + i))
+
+    assert [tick['ltp'] for tick in service.get_recent_ticks('SLOTTEST', 'NSE')] == [102, 103, 104]
+    assert service.get_recent_ticks('SLOTTEST', 'NSE', limit=1) == [
+        {'timestamp': 1_700_000_000_004, 'ltp': 104, 'volume': 4}]
+
+
+def test_readers_never_see_a_torn_update(service):
+    done = threading.Event()
+    torn = []
+
+    def reader():
+        while not done.is_set():
+            data = service.get_all_data('SLOTTEST', 'NSE')
+            if data and data['ltp']['value'] != data['quote']['ltp']:
+                torn.append(data)
+
+    service.process_market_data(_tick(2, ltp=0))
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in readers:
+        thread.start()
+    for i in range(20000):
+        service.process_market_data(_tick(2, ltp=i))
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    assert torn == []
+    assert service.get_ltp('SLOTTEST', 'NSE')['value'] == 19999
@@ -0,0 +1,176 @@
+"""
+Tests for the metrics registry and /metrics endpoint (utils/metrics.py)
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask
+
+from utils import metrics
+from utils.metrics import MAX_CHILDREN, OVERFLOW_LABEL, MetricsRegistry
+
+
+def test_counter_is_exact_across_threads():
+    registry = MetricsRegistry()
+    requests = registry.counter('test_requests_total', 'Requests', ('status',))
+    ok = requests.labels('ok')
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        for _ in range(20000):
+            ok.inc()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert ok.get() == 160000
+    assert requests.labels(status='ok') is ok
+
+
+def test_ended_threads_leave_no_cells_behind():
+    registry = MetricsRegistry()
+    ticks = registry.counter('test_ticks_total', 'Ticks')
+    latency = registry.histogram('test_latency_seconds', 'Latency', buckets=(0.1, 1.0))
+
+    def worker():
+        ticks.inc()
+        latency.observe(0.5)
+
+    for _ in range(200):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+    assert ticks._default._cells._cells == {}
+    assert ticks._default.get() == 200
+    assert latency._default.get() == ([0, 200, 200], 100.0, 200)
+
+
+def test_counter_rejects_negative_increment():
+    registry = MetricsRegistry()
+    with pytest.raises(ValueError):
+        registry.counter('test_total', 'Test').inc(-1)
+
+
+def test_histogram_exposition_is_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram('test_latency_seconds', 'Latency', ('stage',), buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.05, 0.05, 0.5, 5.0):
+        latency.labels('rtt').observe(value)
+
+    text = registry.generate_latest()
+
+    assert '# TYPE test_latency_seconds histogram' in text
+    assert 'test_latency_seconds_bucket{stage="rtt",le="0.01"} 1' in text
+    assert 'test_latency_seconds_bucket{stage="rtt",le="0.1"} 3' in text
+    assert 'test_latency_seconds_bucket{stage="rtt",le="1"} 4' in text
+    assert 'test_latency_seconds_bucket{stage="rtt",le="+Inf"} 5' in text
+    assert 'test_latency_seconds_count{stage="rtt"} 5' in text
+    assert 'test_latency_seconds_sum{stage="rtt"} 5.605' in text
+
+
+def test_gauge_set_inc_and_function():
+    registry = MetricsRegistry()
+    depth = registry.gauge('test_depth', 'Depth')
+    depth.set(10)
+    depth.inc(5)
+    depth.dec(2)
+    assert depth.get() == 13
+    depth.set_function(lambda: 42)
+    assert 'test_depth 42' in registry.generate_latest()
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter('test_escape_total', 'Escaping', ('path',)).labels('a"b\\c\nd').inc()
+    assert 'test_escape_total{path="a\\"b\\\\c\\nd"} 1' in registry.generate_latest()
+
+
+def test_label_cardinality_is_capped():
+    registry = MetricsRegistry()
+    family = registry.counter('test_capped_total', 'Capped', ('client',))
+    for i in range(MAX_CHILDREN + 10):
+        family.labels(str(i)).inc()
+    assert len(family._children) == MAX_CHILDREN + 1
+    assert family.labels(OVERFLOW_LABEL).get() == 10
+
+
+def test_registry_returns_existing_metric_and_rejects_conflicts():
+    registry = MetricsRegistry()
+    first = registry.counter('test_shared_total', 'Shared', ('a',))
+    assert registry.counter('test_shared_total', 'Shared', ('a',)) is first
+    with pytest.raises(ValueError):
+        registry.gauge('test_shared_total', 'Shared', ('a',))
+
+
+def test_failing_collector_does_not_break_scrape():
+    registry = MetricsRegistry()
+    registry.counter('test_ok_total', 'Ok').inc()
+
+    def broken():
+        raise RuntimeError('boom')
+        yield  # pragma: no cover
+
+    def working():
+        yield ('test_collected', 'gauge', 'Collected', [({'sink': 'x'}, 3)])
+
+    registry.register_collector('broken', broken)
+    registry.register_collector('working', working)
+
+    text = registry.generate_latest()
+    assert 'test_ok_total 1' in text
+    assert 'test_collected{sink="x"} 3' in text
+
+
+def test_endpoint_label_collapses_ids():
+    from utils.httpx_client import endpoint_label
+
+    assert endpoint_label('/orders/250101000012345') == '/orders/:id'
+    assert endpoint_label('/quotes/NSE:SBIN-EQ') == '/quotes/:id'
+    assert endpoint_label('/rest/secure/order/v1/placeOrder') == '/rest/secure/order/v1/placeOrder'
+
+
+@pytest.fixture
+def metrics_client(monkeypatch):
+    from blueprints.metrics import metrics_bp
+
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.register_blueprint(metrics_bp)
+    metrics.counter('openalgo_test_scrapes_total', 'Test counter').inc()
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    monkeypatch.delenv('METRICS_ENABLED', raising=False)
+    return app.test_client()
+
+
+def test_metrics_endpoint_serves_localhost(metrics_client):
+    response = metrics_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    assert 'openalgo_test_scrapes_total' in response.get_data(as_text=True)
+
+
+def test_metrics_endpoint_rejects_forwarded_requests_without_token(metrics_client):
+    response = metrics_client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.9'})
+    assert response.status_code == 403
+
+
+def test_metrics_endpoint_requires_token_when_configured(metrics_client, monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 'secret')
+    assert metrics_client.get('/metrics').status_code == 403
+    response = metrics_client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+
+
+def test_metrics_endpoint_can_be_disabled(metrics_client, monkeypatch):
+    monkeypatch.setenv('METRICS_ENABLED', 'False')
+    assert metrics_client.get('/metrics').status_code == 404
@@ -0,0 +1,189 @@
+"""
+Tests for the batched subscribe/unsubscribe path of the WebSocket proxy
+(websocket_proxy/server.py) and the Zerodha adapter's batch overrides
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+from broker.zerodha.streaming import zerodha_adapter
+from websocket_proxy import server
+from websocket_proxy.base_adapter import BaseBrokerWebSocketAdapter
+
+
+class _Adapter(BaseBrokerWebSocketAdapter):
+    """Accepts every symbol but 'BAD' and records the upstream batches"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.subscribed = set()
+
+    def initialize(self, broker_name, user_id, auth_data=None):
+        pass
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def subscribe(self, symbol, exchange, mode=2, depth_level=5):
+        if symbol == 'BAD':
+            return self._create_error_response('TOKEN_NOT_FOUND', f'Token not found for {symbol}')
+        self.subscribed.add((symbol, exchange, mode))
+        return self._create_success_response('ok', actual_depth=depth_level)
+
+    def unsubscribe(self, symbol, exchange, mode=2):
+        self.subscribed.discard((symbol, exchange, mode))
+        return self._create_success_response('ok')
+
+    def subscribe_many(self, instruments, mode=2, depth_level=5):
+        self.batches.append(('subscribe', len(instruments), mode))
+        return super().subscribe_many(instruments, mode, depth_level)
+
+    def unsubscribe_many(self, instruments, mode=2):
+        self.batches.append(('unsubscribe', len(instruments), mode))
+        return super().unsubscribe_many(instruments, mode)
+
+
+@pytest.fixture
+def proxy():
+    adapter = _Adapter()
+    proxy = server.WebSocketProxy.__new__(server.WebSocketProxy)
+    proxy.clients, proxy.subscriptions, proxy.broker_adapters = {}, {1: {}}, {'alice': adapter}
+    proxy.user_mapping, proxy.user_broker_mapping = {1: 'alice'}, {'alice': 'zerodha'}
+    proxy.sent = []
+
+    async def send_message(client_id, message):
+        proxy.sent.append(message)
+        return True
+
+    proxy.send_message = send_message
+    proxy.adapter = adapter
+    yield proxy
+    adapter.cleanup_zmq()
+
+
+def test_bulk_subscribe_and_unsubscribe(proxy):
+    adapter = proxy.adapter
+    chain = [{'symbol': f'NIFTY25JAN{strike}CE', 'exchange': 'NFO'} for strike in range(20000, 25000, 5)]
+
+    async def session():
+        await proxy.subscribe_client(1, {'symbols': chain + [{'symbol': 'BAD', 'exchange': 'NFO'}], 'mode': 'LTP'})
+        await proxy.subscribe_client(1, {'symbol': 'RELIANCE', 'exchange': 'NSE', 'mode': 'Quote'})
+        await proxy.unsubscribe_client(1, {'symbols': [{**sub, 'mode': 1} for sub in chain[:500]]})
+        await proxy.unsubscribe_client(1, {'action': 'unsubscribe_all'})
+        await proxy.cleanup_client(1)
+
+    asyncio.run(session())
+
+    subscribed, quote, unsubscribed, unsubscribed_all = proxy.sent
+    assert subscribed['status'] == 'partial'
+    assert [sub['status'] for sub in subscribed['subscriptions']] == ['success'] * 1000 + ['error']
+    assert quote['status'] == 'success'
+    assert len(unsubscribed['successful']) == 500
+    assert sorted((sub['symbol'], sub['exchange']) for sub in unsubscribed_all['successful']) == \
+        sorted([(sub['symbol'], sub['exchange']) for sub in chain[500:]] + [('RELIANCE', 'NSE')])
+
+    # one upstream batch per request (and per mode when unsubscribing everything)
+    assert adapter.batches[:3] == [('subscribe', 1001, 1), ('subscribe', 1, 2), ('unsubscribe', 500, 1)]
+    assert sorted(adapter.batches[3:]) == [('unsubscribe', 1, 2), ('unsubscribe', 500, 1)]
+    assert adapter.subscribed == set() and 1 not in proxy.subscriptions
+
+
+def test_subscriptions_are_keyed_records(proxy):
+    async def session():
+        await proxy.subscribe_client(1, {'symbols': [{'symbol': 'TCS', 'exchange': 'NSE'}], 'mode': 'Depth', 'depth': 20})
+        await proxy.subscribe_client(1, {'symbols': [{'symbol': 'TCS', 'exchange': 'NSE'}], 'mode': 'LTP'})
+        await proxy.unsubscribe_client(1, {'symbol': 'TCS', 'exchange': 'NSE', 'mode': 3})
+
+    asyncio.run(session())
+    assert proxy.subscriptions[1] == {('TCS', 'NSE', 1): server.Subscription('TCS', 'NSE', 1, 5, 'zerodha')}
+
+
+class _Client:
+    """Stands in for ZerodhaWebSocket, recording subscribe and unsubscribe calls"""
+
+    def __init__(self):
+        self.subscribed, self.unsubscribed, self.exchanges = [], [], {}
+        self.subscribed_tokens = set()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def is_connected(self):
+        return True
+
+    def set_token_exchange_mapping(self, mapping):
+        self.exchanges.update(mapping)
+
+    def subscribe_tokens(self, tokens, mode):
+        self.subscribed.append((tokens, mode))
+
+    async def unsubscribe(self, tokens):
+        self.unsubscribed.append(tokens)
+        return True
+
+
+def test_zerodha_subscribes_many_symbols_in_one_pass(monkeypatch):
+    lookups = []
+
+    def get_tokens_bulk(pairs):
+        lookups.append(len(pairs))
+        return [None if symbol == 'MISSING' else f'{1000 + index}::::{index}' for index, (symbol, _) in enumerate(pairs)]
+
+    monkeypatch.setattr(zerodha_adapter, 'get_tokens_bulk', get_tokens_bulk)
+    adapter = zerodha_adapter.ZerodhaWebSocketAdapter()
+    client = adapter.ws_client = _Client()
+    adapter.running = True
+    try:
+        instruments = [(f'SYM{i}', 'NFO') for i in range(450)] + [('MISSING', 'NFO')]
+        responses = adapter.subscribe_many(instruments, mode=1)
+        assert lookups == [451]
+        assert [response['status'] for response in responses] == ['success'] * 450 + ['error']
+        (tokens, mode), = client.subscribed
+        assert (len(tokens), mode) == (450, 'ltp')
+        assert adapter.tick_routes[1449].topics['LTP'] == b'NFO_SYM449_LTP'
+
+        responses = adapter.unsubscribe_many(instruments[:420] + [('SYM0', 'NFO')])
+        assert [response['status'] for response in responses] == ['success'] * 420 + ['error']
+        deadline = time.monotonic() + 5
+        while len(client.unsubscribed) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)  # the unsubscribes run on the client's loop
+        assert [len(batch) for batch in client.unsubscribed] == [200, 200, 20]
+        assert sorted(adapter.tick_routes) == list(range(1420, 1450))
+    finally:
+        client.loop.call_soon_threadsafe(client.loop.stop)
+        adapter.ws_client = None
+        adapter.cleanup_zmq()
+
+
+def test_zerodha_refuses_symbols_beyond_the_connection_limit(monkeypatch):
+    monkeypatch.setattr(zerodha_adapter, 'get_tokens_bulk', lambda pairs: [f'{symbol[3:]}::::0' for symbol, _ in pairs])
+    monkeypatch.setattr(zerodha_adapter.ZerodhaWebSocket, 'MAX_INSTRUMENTS_PER_CONNECTION', 5)
+    adapter = zerodha_adapter.ZerodhaWebSocketAdapter()
+    client = adapter.ws_client = _Client()
+    client.subscribed_tokens = {900, 901}  # subscribed on the connection before this adapter tracked them
+    adapter.running = True
+    try:
+        responses = adapter.subscribe_many([(f'SYM{i}', 'NSE') for i in range(5)], mode=1)
+        assert [response['status'] for response in responses] == ['success'] * 3 + ['error'] * 2
+        assert client.subscribed[-1][0] == [0, 1, 2]
+
+        # a mode change or an already subscribed token takes no new slot
+        responses = adapter.subscribe_many([('SYM1', 'NSE'), ('SYM900', 'NSE'), ('SYM3', 'NSE')], mode=2)
+        assert [response['status'] for response in responses] == ['success', 'success', 'error']
+        assert client.subscribed[-1] == ([1, 900], 'quote')
+        assert 3 not in adapter.tick_routes
+    finally:
+        client.loop.call_soon_threadsafe(client.loop.stop)
+        adapter.ws_client = None
+        adapter.cleanup_zmq()
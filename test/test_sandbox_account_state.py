@@ -0,0 +1,142 @@
+"""
+Tests for the in-memory sandbox account state and its write-ahead journal
+(sandbox/account_state.py)
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from database.sandbox_db import SandboxFunds, SandboxOrders, db_session, init_db
+from sandbox import account_state
+from sandbox.account_state import AccountStateEngine, Journal
+
+
+@pytest.fixture
+def user():
+    init_db()
+    user_id = f"mem-{uuid.uuid4().hex[:8]}"
+    db_session.add(SandboxFunds(user_id=user_id, total_capital=Decimal('100000'), available_balance=Decimal('100000'),
+                                used_margin=Decimal('0'), realized_pnl=Decimal('0'), unrealized_pnl=Decimal('0'),
+                                total_pnl=Decimal('0')))
+    db_session.commit()
+    yield user_id
+    for model in (SandboxOrders, SandboxFunds):
+        model.query.filter_by(user_id=user_id).delete()
+    db_session.commit()
+    db_session.remove()
+
+
+@pytest.fixture
+def state(tmp_path):
+    # the background flusher never fires on its own during a test
+    engine = AccountStateEngine(str(tmp_path / 'journal.jsonl'), flush_interval=3600)
+    engine.start()
+    previous = account_state.set_engine(engine)
+    yield engine
+    account_state.set_engine(previous)
+    engine.stop()
+
+
+def _funds(user_id):
+    db_session.expire_all()
+    return SandboxFunds.query.filter_by(user_id=user_id).one()
+
+
+def test_limit_order_is_journaled_and_flushed(user, state):
+    from sandbox.margin_profiles import get_margin_profiles
+    from sandbox.order_manager import OrderManager
+
+    get_margin_profiles().add('MEMTEST', 'NSE', 1)
+    success, response, _ = OrderManager(user).place_order({
+        'symbol': 'MEMTEST', 'exchange': 'NSE', 'action': 'BUY', 'quantity': 10,
+        'price': 100, 'price_type': 'LIMIT', 'product': 'CNC'})
+    assert success
+
+    # answered from memory: nothing in the database yet, the journal has it
+    assert SandboxOrders.query.filter_by(orderid=response['orderid']).first() is None
+    assert state.funds(user)['available_balance'] == Decimal('99000')
+    assert len(state.journal.pending()) == 2
+
+    assert state.flush() == 2
+    order = SandboxOrders.query.filter_by(orderid=response['orderid']).one()
+    assert (order.order_status, order.margin_blocked) == ('open', Decimal('1000'))
+    funds = _funds(user)
+    assert (funds.available_balance, funds.used_margin) == (Decimal('99000'), Decimal('1000'))
+    assert os.path.getsize(state.journal.path) == 0
+
+
+def test_insufficient_funds_leave_state_and_journal_untouched(user, state):
+    applied, funds = state.adjust_funds(user, available=Decimal('-200000'), used=Decimal('200000'),
+                                        require_available=Decimal('200000'))
+    assert not applied
+    assert funds['available_balance'] == Decimal('100000')
+    assert state.journal.pending() == []
+
+
+def test_journal_is_replayed_exactly_once_after_a_crash(user, tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    crashed = AccountStateEngine(path, flush_interval=3600)
+    crashed.start()
+    crashed.adjust_funds(user, available=Decimal('-500'), used=Decimal('500'))
+    crashed.add_order({'orderid': f"J{uuid.uuid4().hex[:12]}", 'user_id': user, 'symbol': 'MEMTEST',
+                       'exchange': 'NSE', 'action': 'BUY', 'quantity': 5, 'price': Decimal('100'),
+                       'trigger_price': None, 'price_type': 'LIMIT', 'product': 'CNC', 'order_status': 'open',
+                       'pending_quantity': 5, 'margin_blocked': Decimal('500'),
+                       'order_timestamp': datetime(2025, 1, 2, 10, 0)})
+    # process dies without flushing: only the journal file has the changes
+    crashed.journal.close()
+    with open(path) as f:
+        journal = f.read()
+    assert SandboxOrders.query.filter_by(user_id=user).count() == 0
+
+    recovered = AccountStateEngine(path, flush_interval=3600)
+    recovered.start()
+    recovered.stop()
+    assert SandboxOrders.query.filter_by(user_id=user).count() == 1
+    assert _funds(user).used_margin == Decimal('500')
+
+    # a crash after the database commit but before the file was truncated
+    with open(path, 'w') as f:
+        f.write(journal)
+    again = AccountStateEngine(path, flush_interval=3600)
+    again.start()
+    again.stop()
+    assert SandboxOrders.query.filter_by(user_id=user).count() == 1
+    assert _funds(user).used_margin == Decimal('500')
+
+
+def test_journal_cuts_off_a_torn_line_before_appending(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    with open(path, 'w') as f:
+        f.write('{"op": "funds", "seq": 1}\n{"op": "fu')  # crash mid-write of entry 2
+
+    journal = Journal(path)
+    assert journal.open(checkpoint=1) == 0
+    journal.append({'op': 'funds'})
+    journal.append({'op': 'funds'})
+    journal.close()
+
+    assert journal.open(checkpoint=1) == 2
+    journal.close()
+    assert [entry['seq'] for entry in journal.read()] == [1, 2, 3]
+
+
+def test_journal_is_compacted_while_entries_are_pending(tmp_path, monkeypatch):
+    monkeypatch.setattr(account_state, 'JOURNAL_COMPACT_BYTES', 200)
+    journal = Journal(str(tmp_path / 'journal.jsonl'))
+    journal.open(checkpoint=0)
+    for _ in range(20):
+        journal.append({'op': 'funds', 'user_id': 'steady'})
+    journal.mark_flushed(18)  # the flusher never catches up completely
+    journal.append({'op': 'funds', 'user_id': 'steady'})
+    journal.close()
+
+    assert [entry['seq'] for entry in journal.read()] == [19, 20, 21]
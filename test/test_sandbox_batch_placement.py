@@ -0,0 +1,141 @@
+"""
+Tests for batch placement of sandbox basket legs and split children
+(OrderManager.place_orders)
+"""
+
+import os
+import sys
+import uuid
+from decimal import Decimal
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from database.sandbox_db import SandboxFunds, SandboxOrders, SandboxPositions, SandboxTrades, db_session, init_db
+
+QUOTE = {'ltp': 100.0, 'bid': 99.5, 'ask': 100.5}
+
+
+class _FixedQuotes:
+    def get_quote(self, symbol, exchange):
+        return dict(QUOTE)
+
+    def get_quotes(self, pairs):
+        return {key: dict(QUOTE) for key in pairs}
+
+
+@pytest.fixture
+def users():
+    from sandbox.margin_profiles import get_margin_profiles
+    from sandbox.quote_provider import set_quote_provider
+
+    init_db()
+    get_margin_profiles().add('BATCHA', 'NSE', 1)
+    get_margin_profiles().add('BATCHB', 'NSE', 1)
+    previous_provider = set_quote_provider(_FixedQuotes())
+
+    created = []
+
+    def make(capital='100000'):
+        user_id = f"batch-{uuid.uuid4().hex[:8]}"
+        db_session.add(SandboxFunds(user_id=user_id, total_capital=Decimal(capital),
+                                    available_balance=Decimal(capital), used_margin=Decimal('0'),
+                                    realized_pnl=Decimal('0'), unrealized_pnl=Decimal('0'), total_pnl=Decimal('0')))
+        db_session.commit()
+        created.append(user_id)
+        return user_id
+
+    yield make
+    set_quote_provider(previous_provider)
+    for user_id in created:
+        for model in (SandboxTrades, SandboxPositions, SandboxOrders, SandboxFunds):
+            model.query.filter_by(user_id=user_id).delete()
+    db_session.commit()
+    db_session.remove()
+
+
+def _state(user_id):
+    db_session.expire_all()
+    funds = SandboxFunds.query.filter_by(user_id=user_id).one()
+    positions = {(p.symbol, p.product): (p.quantity, p.average_price)
+                 for p in SandboxPositions.query.filter_by(user_id=user_id)}
+    statuses = [o.order_status for o in SandboxOrders.query.filter_by(user_id=user_id).order_by(SandboxOrders.orderid)]
+    return funds.available_balance, funds.used_margin, funds.realized_pnl, positions, statuses
+
+
+def test_batch_ends_in_the_same_state_as_one_order_at_a_time(users):
+    from sandbox.order_manager import OrderManager
+
+    leg = {'exchange': 'NSE', 'price_type': 'MARKET', 'product': 'NRML', 'action': 'BUY'}
+    orders = [
+        dict(leg, symbol='BATCHA', quantity=10),
+        dict(leg, symbol='BATCHA', quantity=10),
+        dict(leg, symbol='BATCHA', action='SELL', quantity=15),  # nets against the two fills above
+        dict(leg, symbol='BATCHB', price_type='LIMIT', price=90, product='CNC', quantity=5),
+        dict(leg, symbol='BATCHB', action='SELL', product='CNC', quantity=5),  # no holdings: rejected
+        dict(leg, symbol='BATCHA', quantity=0),  # invalid
+    ]
+
+    sequential, batch = users(), users()
+    one_by_one = [OrderManager(sequential).place_order(order) for order in orders]
+    batched = OrderManager(batch).place_orders(orders)
+
+    assert [r[0] for r in batched] == [r[0] for r in one_by_one] == [True, True, True, True, False, False]
+    assert [r[1]['message'] for r in batched[4:]] == [r[1]['message'] for r in one_by_one[4:]]
+    assert 'orderid' in batched[4][1]
+    assert _state(batch) == _state(sequential)
+    assert SandboxTrades.query.filter_by(user_id=batch).count() == 3
+
+
+def test_margin_comes_out_of_a_running_balance(users):
+    from sandbox.order_manager import OrderManager
+
+    user_id = users('2500')
+    leg = {'symbol': 'BATCHB', 'exchange': 'NSE', 'action': 'BUY', 'price_type': 'LIMIT', 'price': 100,
+           'product': 'CNC'}
+    results = OrderManager(user_id).place_orders([dict(leg, quantity=20), dict(leg, quantity=10),
+                                                  dict(leg, quantity=5)])
+
+    assert [ok for ok, _, _ in results] == [True, False, True]
+    assert results[1][1]['message'].startswith('Insufficient funds')
+    available, used, _, _, statuses = _state(user_id)
+    assert (available, used) == (Decimal('0'), Decimal('2500'))
+    assert statuses == ['open', 'open']
+
+
+
+def test_batch_blocks_margin_through_the_account_state(users, tmp_path, monkeypatch):
+    from sandbox import account_state, order_manager
+    from sandbox.account_state import AccountStateEngine
+    from sandbox.fund_manager import FundManager
+    from sandbox.order_manager import OrderManager
+
+    user_id = users('2500')
+    state = AccountStateEngine(str(tmp_path / 'journal.jsonl'), flush_interval=3600)
+    state.start()
+    previous = account_state.set_engine(state)
+    legs_seen, concurrent = [], []
+    requires_margin = order_manager.requires_margin
+
+    def requires_margin_meanwhile(*args):
+        # a single order placed between the legs sees the margin the first leg blocked
+        if legs_seen:
+            concurrent.append(FundManager(user_id).block_margin(Decimal('1000'))[0])
+        legs_seen.append(args)
+        return requires_margin(*args)
+
+    monkeypatch.setattr(order_manager, 'requires_margin', requires_margin_meanwhile)
+    try:
+        leg = {'symbol': 'BATCHB', 'exchange': 'NSE', 'action': 'BUY', 'price_type': 'LIMIT', 'price': 100,
+               'product': 'CNC'}
+        results = OrderManager(user_id).place_orders([dict(leg, quantity=20), dict(leg, quantity=5)])
+        assert [ok for ok, _, _ in results] == [True, True]
+        assert concurrent == [False]
+        state.flush()
+        available, used, _, _, _ = _state(user_id)
+        assert (available, used) == (Decimal('0'), Decimal('2500'))
+    finally:
+        account_state.set_engine(previous)
+        state.stop()
@@ -0,0 +1,139 @@
+"""
+Tests for the set-based sandbox background jobs: MTM, T+1 settlement and
+MIS square-off
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from database.sandbox_db import (
+    SandboxFunds, SandboxHoldings, SandboxOrders, SandboxPositions, SandboxTrades, db_session, init_db
+)
+from sandbox import quote_provider
+
+
+class _Quotes:
+    """Fixed quote snapshot with the provider's get_quote/get_quotes interface"""
+
+    def __init__(self, quotes):
+        self.quotes = quotes
+
+    def get_quote(self, symbol, exchange):
+        return self.quotes.get((symbol, exchange))
+
+    def get_quotes(self, pairs):
+        return {key: self.quotes[key] for key in pairs if key in self.quotes}
+
+
+@pytest.fixture
+def user():
+    init_db()
+    user_id = f"bulk-{uuid.uuid4().hex[:8]}"
+    db_session.add(SandboxFunds(user_id=user_id, total_capital=Decimal('100000'), available_balance=Decimal('90000'),
+                                used_margin=Decimal('10000'), realized_pnl=Decimal('0'), unrealized_pnl=Decimal('0'),
+                                total_pnl=Decimal('0')))
+    db_session.commit()
+    yield user_id
+    for model in (SandboxTrades, SandboxOrders, SandboxPositions, SandboxHoldings, SandboxFunds):
+        model.query.filter_by(user_id=user_id).delete()
+    db_session.commit()
+    db_session.remove()
+
+
+def _position(user_id, symbol, product, quantity, average_price, **kwargs):
+    db_session.add(SandboxPositions(user_id=user_id, symbol=symbol, exchange='NSE', product=product, quantity=quantity,
+                                    average_price=Decimal(str(average_price)), accumulated_realized_pnl=Decimal('0'),
+                                    **kwargs))
+
+
+def test_mtm_updates_positions_and_user_pnl_in_one_pass(user, monkeypatch):
+    from sandbox.position_manager import update_all_positions_mtm
+
+    _position(user, 'LONG', 'NRML', 10, 100)
+    _position(user, 'SHORT', 'NRML', -5, 200)
+    _position(user, 'NOQUOTE', 'NRML', 1, 50, pnl=Decimal('7'))
+    db_session.commit()
+    monkeypatch.setattr(quote_provider, '_provider', _Quotes({
+        ('LONG', 'NSE'): {'ltp': 110}, ('SHORT', 'NSE'): {'ltp': 190}}))
+
+    update_all_positions_mtm()
+    db_session.expire_all()
+
+    long_position = SandboxPositions.query.filter_by(user_id=user, symbol='LONG').one()
+    short_position = SandboxPositions.query.filter_by(user_id=user, symbol='SHORT').one()
+    assert (long_position.ltp, long_position.pnl, long_position.pnl_percent) == (110, 100, 10)
+    assert (short_position.pnl, short_position.pnl_percent) == (50, 5)
+    funds = SandboxFunds.query.filter_by(user_id=user).one()
+    assert funds.unrealized_pnl == Decimal('157')  # unpriced position keeps its last P&L
+    assert funds.total_pnl == Decimal('157')
+
+
+def test_t1_settlement_moves_cnc_positions_to_holdings(user):
+    from sandbox.holdings_manager import settle_cnc_positions
+
+    yesterday = datetime.now() - timedelta(days=1)
+    db_session.add(SandboxHoldings(user_id=user, symbol='HELD', exchange='NSE', quantity=10,
+                                   average_price=Decimal('100'), settlement_date=yesterday.date()))
+    _position(user, 'NEW', 'CNC', 5, 200, created_at=yesterday)
+    _position(user, 'HELD', 'CNC', -4, 120, created_at=yesterday)
+    _position(user, 'TODAY', 'CNC', 3, 10)
+    db_session.commit()
+
+    assert settle_cnc_positions(user) == 2
+    db_session.expire_all()
+
+    holdings = {h.symbol: h for h in SandboxHoldings.query.filter_by(user_id=user)}
+    assert (holdings['NEW'].quantity, holdings['NEW'].average_price) == (5, 200)
+    assert holdings['HELD'].quantity == 6
+    assert [p.symbol for p in SandboxPositions.query.filter_by(user_id=user)] == ['TODAY']
+    funds = SandboxFunds.query.filter_by(user_id=user).one()
+    assert funds.used_margin == Decimal('9000')  # 5 x 200 moved into holdings
+    assert funds.available_balance == Decimal('90480')  # 4 x 120 sale proceeds
+
+
+def test_square_off_closes_positions_as_one_batch(user, monkeypatch):
+    from database.symbol import Base, SymToken, db_session as symbol_session, engine
+    from sandbox.squareoff_manager import SquareOffManager
+
+    Base.metadata.create_all(engine)
+    symbols = [f"SQ{uuid.uuid4().hex[:6].upper()}" for _ in range(2)]
+    for symbol in symbols:
+        symbol_session.add(SymToken(symbol=symbol, brsymbol=symbol, name=symbol, exchange='NSE', brexchange='NSE',
+                                    token=symbol, expiry='', strike=-1, lotsize=1, instrumenttype='EQ', tick_size=0.05))
+    symbol_session.commit()
+    _position(user, symbols[0], 'MIS', 10, 100)
+    _position(user, symbols[1], 'MIS', -10, 50)
+    db_session.commit()
+    monkeypatch.setattr(quote_provider, '_provider', _Quotes({
+        (symbols[0], 'NSE'): {'ltp': 110, 'bid': 109.5, 'ask': 110.5},
+        (symbols[1], 'NSE'): {'ltp': 45}}))
+
+    try:
+        SquareOffManager()._square_off_positions(
+            SandboxPositions.query.filter_by(user_id=user, product='MIS').all())
+        db_session.expire_all()
+
+        trades = {t.symbol: t for t in SandboxTrades.query.filter_by(user_id=user)}
+        assert (trades[symbols[0]].action, trades[symbols[0]].price) == ('SELL', Decimal('109.5'))
+        assert (trades[symbols[1]].action, trades[symbols[1]].price) == ('BUY', Decimal('45'))
+        orders = SandboxOrders.query.filter_by(user_id=user).all()
+        assert {o.order_status for o in orders} == {'complete'} and len(orders) == 2
+        assert all(p.quantity == 0 for p in SandboxPositions.query.filter_by(user_id=user))
+
+        funds = SandboxFunds.query.filter_by(user_id=user).one()
+        # margin at 5x MIS leverage: 200 + 100 released; realized 95 + 50
+        assert funds.used_margin == Decimal('9700')
+        assert funds.realized_pnl == Decimal('145')
+        assert funds.available_balance == Decimal('90445')
+    finally:
+        SymToken.query.filter(SymToken.symbol.in_(symbols)).delete(synchronize_session=False)
+        symbol_session.commit()
+        symbol_session.remove()
@@ -0,0 +1,72 @@
+"""
+Tests for the sandbox order/trade ID allocator (sandbox/id_allocator.py)
+"""
+
+import os
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from database.sandbox_db import SandboxOrders, SandboxSequences, db_session, init_db
+from sandbox import clock, id_allocator
+from sandbox.id_allocator import SequenceAllocator
+
+
+@pytest.fixture(autouse=True)
+def sandbox_db():
+    init_db()
+    yield
+    db_session.remove()
+
+
+def test_50_concurrent_allocations_across_processes_are_unique():
+    scope = f"test-{uuid.uuid4().hex[:8]}"
+    # Two allocators stand in for two worker processes sharing the database
+    allocators = [SequenceAllocator(block_size=4), SequenceAllocator(block_size=4)]
+    barrier = threading.Barrier(50)
+    issued = []
+
+    def place(i):
+        barrier.wait()
+        issued.append(allocators[i % 2].next(scope, '20250102'))
+
+    threads = [threading.Thread(target=place, args=(i,)) for i in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    try:
+        assert len(issued) == 50
+        assert len(set(issued)) == 50
+        assert min(issued) == 1
+        assert max(issued) <= 56  # 7 blocks of 4 per allocator
+    finally:
+        SandboxSequences.query.filter_by(scope=scope).delete()
+        db_session.commit()
+
+
+def test_order_ids_continue_after_ids_issued_before_the_counter_existed():
+    day = datetime(2031, 1, 2, 10, 0)
+    SandboxSequences.query.filter_by(scope='order', day='20310102').delete()
+    db_session.add(SandboxOrders(orderid='31010200000041', user_id='id-test', symbol='SBIN', exchange='NSE',
+                                 action='BUY', quantity=1, price_type='MARKET', product='MIS', pending_quantity=1))
+    db_session.commit()
+    id_allocator.get_allocator().reset()
+    clock.set_clock(clock.SimulatedClock(day))
+    try:
+        assert id_allocator.next_order_id() == '31010200000042'
+        assert id_allocator.next_order_id() == '31010200000043'
+        assert id_allocator.next_trade_id().startswith('TRADE-20310102-')
+    finally:
+        clock.set_clock(None)
+        id_allocator.get_allocator().reset()
+        SandboxOrders.query.filter_by(user_id='id-test').delete()
+        SandboxSequences.query.filter(SandboxSequences.day == '20310102').delete()
+        db_session.commit()
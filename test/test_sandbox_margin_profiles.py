@@ -0,0 +1,107 @@
+"""
+Tests for the per-instrument sandbox margin profiles and the basket
+margin pre-check
+"""
+
+import os
+import sys
+import uuid
+from decimal import Decimal
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import numpy as np
+import pytest
+
+from database.sandbox_db import SandboxFunds, db_session, get_config, init_db, set_config
+from sandbox.margin_profiles import MarginProfiles
+
+
+@pytest.fixture
+def profiles():
+    init_db()
+    profiles = MarginProfiles()
+    profiles.load([('RELIANCE', 'NSE', 1), ('NIFTY25JANFUT', 'NFO', 75), ('NIFTY25JAN24000CE', 'NFO', 75)])
+    yield profiles
+    db_session.remove()
+
+
+def test_profiles_follow_the_leverage_config(profiles):
+    future = profiles.get('NIFTY25JANFUT', 'NFO')
+    option = profiles.get('NIFTY25JAN24000CE', 'NFO')
+    equity = profiles.get('RELIANCE', 'NSE')
+    assert (future.lot_size, future.is_future, option.is_option) == (75, True, True)
+    assert equity.leverage_for('MIS', 'SELL') == Decimal(get_config('equity_mis_leverage', '5'))
+    assert equity.leverage_for('NRML', 'BUY') == Decimal(get_config('equity_cnc_leverage', '1'))
+
+    previous = get_config('futures_leverage', '10')
+    try:
+        set_config('futures_leverage', '12')
+        assert profiles.get('NIFTY25JANFUT', 'NFO').leverage_for('NRML', 'BUY') == Decimal('12')
+    finally:
+        set_config('futures_leverage', previous)
+    assert profiles.get('NIFTY25JANFUT', 'NFO').leverage_for('NRML', 'BUY') == Decimal(previous)
+
+
+def test_calculate_margin_bulk_matches_single_calculation(monkeypatch):
+    from database.symbol import Base, engine
+    from sandbox import fund_manager
+    from sandbox.fund_manager import FundManager
+
+    profiles = MarginProfiles()
+    profiles.load([('RELIANCE', 'NSE', 1), ('NIFTY25JANFUT', 'NFO', 75)])
+    monkeypatch.setattr(fund_manager, 'get_margin_profiles', lambda: profiles)
+    monkeypatch.setattr(fund_manager, 'get_profile', profiles.get)
+    # the third leg is looked up in an (empty of it) master contract
+    Base.metadata.create_all(engine)
+
+    legs = [
+        {'symbol': 'RELIANCE', 'exchange': 'NSE', 'product': 'MIS', 'action': 'BUY', 'quantity': 10, 'price': 2500},
+        {'symbol': 'NIFTY25JANFUT', 'exchange': 'NFO', 'product': 'NRML', 'action': 'SELL', 'quantity': 75,
+         'price': 24000},
+        {'symbol': 'UNKNOWN', 'exchange': 'NSE', 'product': 'CNC', 'action': 'BUY', 'quantity': 1, 'price': 10},
+    ]
+    fm = FundManager('bulk-test')
+    margins = fm.calculate_margin_bulk(legs)
+
+    for leg, margin in zip(legs[:2], margins[:2]):
+        single, _ = fm.calculate_margin_required(leg['symbol'], leg['exchange'], leg['product'], leg['quantity'],
+                                                 leg['price'], leg['action'])
+        assert margin == pytest.approx(float(single))
+    assert np.isnan(margins[2])
+
+
+def test_basket_precheck_rejects_baskets_that_do_not_fit(monkeypatch):
+    from sandbox import fund_manager
+    from sandbox.order_manager import OrderManager
+
+    init_db()
+    profiles = MarginProfiles()
+    profiles.load([('BASKETA', 'NSE', 1), ('BASKETB', 'NSE', 1)])
+    monkeypatch.setattr(fund_manager, 'get_margin_profiles', lambda: profiles)
+    user_id = f"basket-{uuid.uuid4().hex[:8]}"
+    db_session.add(SandboxFunds(user_id=user_id, total_capital=Decimal('10000'), available_balance=Decimal('10000'),
+                                used_margin=Decimal('0'), realized_pnl=Decimal('0'), unrealized_pnl=Decimal('0'),
+                                total_pnl=Decimal('0')))
+    db_session.commit()
+    leg = {'exchange': 'NSE', 'action': 'BUY', 'price_type': 'LIMIT', 'product': 'CNC'}
+    try:
+        manager = OrderManager(user_id)
+        ok, response, _ = manager.check_basket_margin([
+            dict(leg, symbol='BASKETA', quantity=40, price=100),
+            dict(leg, symbol='BASKETB', quantity=50, price=100),
+        ])
+        assert ok and response['margin_required'] == 9000
+
+        ok, response, status = manager.check_basket_margin([
+            dict(leg, symbol='BASKETA', quantity=60, price=100),
+            dict(leg, symbol='BASKETB', quantity=50, price=100),
+            dict(leg, symbol='BASKETB', action='SELL', quantity=50, price=100),  # CNC sell: no margin
+        ])
+        assert (ok, status) == (False, 400)
+        assert response['margin_required'] == 11000
+    finally:
+        SandboxFunds.query.filter_by(user_id=user_id).delete()
+        db_session.commit()
+        db_session.remove()
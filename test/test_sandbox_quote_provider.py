@@ -0,0 +1,114 @@
+"""
+Tests for the shared sandbox quote provider (sandbox/quote_provider.py)
+"""
+
+import os
+import sys
+import threading
+import uuid
+from decimal import Decimal
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from sandbox import quote_provider
+from sandbox.quote_provider import SandboxQuoteProvider
+
+
+class _FakeUpstream:
+    """Stands in for quotes_service.get_multiquotes_with_auth and counts calls"""
+
+    def __init__(self, release=None):
+        self.calls = []
+        self.release = release
+
+    def __call__(self, auth_token, feed_token, broker, symbols):
+        self.calls.append([(item['symbol'], item['exchange']) for item in symbols])
+        if self.release is not None:
+            self.release.wait(5)
+        data = [{'symbol': item['symbol'], 'exchange': item['exchange'], 'data': {'ltp': 100 + len(item['symbol'])}}
+                for item in symbols]
+        return True, {'status': 'success', 'data': data}, 200
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = _FakeUpstream()
+    monkeypatch.setattr('services.quotes_service.get_multiquotes_with_auth', fake)
+    monkeypatch.setattr(SandboxQuoteProvider, '_get_credentials', lambda self: ('token', None, 'zerodha'))
+    return fake
+
+
+def test_misses_are_fetched_in_one_call_and_cached(upstream):
+    provider = SandboxQuoteProvider(feed_max_age=0, cache_ttl=60)
+    pairs = [(f"SYM{i}", 'NSE') for i in range(50)]
+
+    quotes = provider.get_quotes(pairs + pairs[:5])
+
+    assert len(quotes) == 50
+    assert quotes[('SYM7', 'NSE')]['ltp'] == 104
+    assert len(upstream.calls) == 1
+    assert len(upstream.calls[0]) == 50
+
+    assert provider.get_quote('SYM7', 'NSE')['ltp'] == 104
+    assert len(upstream.calls) == 1
+
+
+def test_concurrent_requests_for_a_symbol_are_coalesced(upstream):
+    upstream.release = threading.Event()
+    provider = SandboxQuoteProvider(feed_max_age=0, cache_ttl=0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(provider.get_quote('SBIN', 'NSE'))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    while not upstream.calls:
+        pass
+    upstream.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(upstream.calls) == 1
+    assert [quote['ltp'] for quote in results] == [104] * 10
+
+
+def test_live_feed_is_used_before_the_broker(upstream):
+    from services.market_data_service import get_market_data_service
+
+    symbol = f"FEED{uuid.uuid4().hex[:6].upper()}"
+    get_market_data_service().process_market_data(
+        {'symbol': symbol, 'exchange': 'NSE', 'mode': 1, 'data': {'ltp': 321.5}})
+    provider = SandboxQuoteProvider(feed_max_age=5)
+
+    assert provider.get_quote(symbol, 'NSE')['ltp'] == 321.5
+    assert upstream.calls == []
+
+
+def test_mtm_for_200_positions_across_20_users_needs_one_upstream_call(upstream, monkeypatch):
+    from database.sandbox_db import SandboxPositions, db_session, init_db
+    from sandbox.position_manager import update_all_positions_mtm
+
+    init_db()
+    monkeypatch.setattr(quote_provider, '_provider', SandboxQuoteProvider(feed_max_age=0))
+
+    prefix = f"MTM-{uuid.uuid4().hex[:6]}"
+    for user in range(20):
+        for i in range(10):
+            db_session.add(SandboxPositions(
+                user_id=f"{prefix}-{user}", symbol=f"SYM{(user * 2 + i) % 40}", exchange='NSE',
+                product='NRML', quantity=10, average_price=Decimal('100'), accumulated_realized_pnl=Decimal('0')))
+    db_session.commit()
+
+    try:
+        update_all_positions_mtm()
+
+        assert len(upstream.calls) == 1
+        assert {(f"SYM{i}", 'NSE') for i in range(40)} <= set(upstream.calls[0])
+        position = db_session.query(SandboxPositions).filter_by(user_id=f"{prefix}-3", symbol='SYM6').first()
+        assert position.ltp == Decimal('104')
+        assert position.pnl == Decimal('40')
+    finally:
+        db_session.query(SandboxPositions).filter(SandboxPositions.user_id.like(f"{prefix}-%")).delete(synchronize_session=False)
+        db_session.commit()
+        db_session.remove()
@@ -0,0 +1,117 @@
+"""
+Tests for the sandbox historical replay driver (sandbox/replay.py)
+"""
+
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from sandbox import clock
+from sandbox.replay import (
+    Candle, ReplayDriver, _candle_path, build_events, load_candles_csv, load_ticks_jsonl, merge_events
+)
+
+
+def _at(hour, minute, day=2):
+    return clock.IST.localize(datetime(2025, 1, day, hour, minute))
+
+
+def test_simulated_clock_drives_sandbox_time():
+    sim = clock.SimulatedClock(datetime(2025, 1, 2, 9, 15))
+    clock.set_clock(sim)
+    try:
+        assert clock.now() == _at(9, 15)
+        sim.advance_to(_at(9, 20))
+        sim.advance_to(_at(9, 16))  # never moves backwards
+        assert clock.now() == _at(9, 20)
+        assert clock.now_local() == datetime(2025, 1, 2, 9, 20)
+    finally:
+        clock.set_clock(None)
+    assert clock.now().year >= 2025 and clock.get_clock() is None
+
+
+def test_candle_path_visits_nearer_extreme_first():
+    up = Candle(_at(9, 15), 'SBIN', 'NSE', 100, 101, 95, 99, 0, 60)
+    assert [price for _, price in _candle_path(up)] == [100, 101, 95, 99]
+    down = Candle(_at(9, 15), 'SBIN', 'NSE', 100, 110, 99, 105, 0, 60)
+    path = _candle_path(down)
+    assert [price for _, price in path] == [100, 99, 110, 105]
+    assert path[-1][0] == _at(9, 15) + timedelta(seconds=45)
+
+
+def test_loaders_merge_candles_and_ticks_in_time_order(tmp_path):
+    candles = tmp_path / 'sbin.csv'
+    candles.write_text("timestamp,open,high,low,close,volume\n"
+                       "2025-01-02 09:15:00,100,101,99,100.5,10\n"
+                       "2025-01-02 09:17:00,100.5,102,100,101,12\n")
+    ticks = tmp_path / 'infy.jsonl'
+    ticks.write_text(json.dumps({'symbol': 'INFY', 'exchange': 'NSE', 'data': {
+        'ltp': 1500.5, 'timestamp': int(_at(9, 16).timestamp() * 1000)}}) + "\n")
+
+    assert next(load_candles_csv(candles, 'SBIN', 'NSE')).close == 100.5
+    assert next(load_ticks_jsonl(ticks)).timestamp == _at(9, 16)
+
+    events = list(merge_events(load_candles_csv(candles, 'SBIN', 'NSE'), load_ticks_jsonl(ticks)))
+    assert [event.symbol for event in events] == ['SBIN', 'INFY', 'SBIN']
+
+
+@pytest.fixture
+def replay_symbol():
+    from database.symbol import Base, SymToken, db_session as symbol_session, engine
+
+    Base.metadata.create_all(engine)
+    symbol = f"RPL{uuid.uuid4().hex[:6].upper()}"
+    symbol_session.add(SymToken(symbol=symbol, brsymbol=symbol, name=symbol, exchange='NSE', brexchange='NSE',
+                                token=symbol, expiry='', strike=-1, lotsize=1, instrumenttype='EQ', tick_size=0.05))
+    symbol_session.commit()
+    yield symbol
+    SymToken.query.filter_by(symbol=symbol).delete()
+    symbol_session.commit()
+    symbol_session.remove()
+
+
+def test_replay_fills_limit_orders_and_squares_off_mis(replay_symbol, tmp_path):
+    from database.sandbox_db import SandboxOrders, SandboxPositions, SandboxTrades
+
+    user = f"replay-{uuid.uuid4().hex[:8]}"
+    rows = ["timestamp,open,high,low,close,volume"]
+    start = datetime(2025, 1, 2, 9, 15)
+    for minute in range(10):
+        rows.append(f"{start + timedelta(minutes=minute)},100,100.5,99.5,100,1")
+    rows.append("2025-01-02 09:25:00,100,100.2,97.5,98,1")  # dips through the limit
+    rows.append("2025-01-02 15:20:00,99,99,99,99,1")  # square-off at 15:15 uses the last price
+    candles = tmp_path / 'candles.csv'
+    candles.write_text("\n".join(rows) + "\n")
+
+    def strategy(ctx, event):
+        if event.timestamp == _at(9, 20):
+            ctx.placeorder(symbol=replay_symbol, exchange='NSE', action='BUY', price_type='LIMIT',
+                           price=98, product='MIS', quantity=10)
+
+    result = ReplayDriver(build_events([(str(candles), replay_symbol, 'NSE')]), strategy, user_id=user).run()
+
+    try:
+        assert result['events'] == 12
+        assert result['price_updates'] == 48
+        assert result['fills'] == 1
+        assert result['events_per_second'] > 0
+        trades = SandboxTrades.query.filter_by(user_id=user).order_by(SandboxTrades.trade_timestamp).all()
+        assert [(t.action, float(t.price)) for t in trades] == [('BUY', 97.5), ('SELL', 98.0)]
+        assert trades[0].trade_timestamp.date() == datetime(2025, 1, 2).date()
+        position = SandboxPositions.query.filter_by(user_id=user, symbol=replay_symbol).first()
+        assert position.quantity == 0
+        assert clock.get_clock() is None
+    finally:
+        from database.sandbox_db import SandboxFunds, db_session
+
+        for model in (SandboxTrades, SandboxOrders, SandboxPositions, SandboxFunds):
+            model.query.filter_by(user_id=user).delete()
+        db_session.commit()
+        db_session.remove()
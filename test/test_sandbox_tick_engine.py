@@ -0,0 +1,226 @@
+"""
+Tests for the tick-driven sandbox matching engine (sandbox/tick_engine.py)
+"""
+
+import os
+import sys
+import uuid
+from decimal import Decimal
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from database.sandbox_db import SandboxOrders, db_session, init_db
+from sandbox import tick_engine
+from sandbox.tick_engine import TickExecutionEngine, TriggerBook
+
+
+def test_trigger_book_fires_only_crossed_orders():
+    book = TriggerBook()
+    book.add('B1', 'BUY', 'LIMIT', 100, None)
+    book.add('B2', 'BUY', 'LIMIT', 98, None)
+    book.add('S1', 'SELL', 'LIMIT', 105, None)
+    book.add('BS', 'BUY', 'SL-M', None, 104)
+    book.add('SS', 'SELL', 'SL', 95, 97)
+
+    assert book.crossed(101) == []
+    assert book.crossed(99.5) == ['B1']
+    assert sorted(book.crossed(104)) == ['BS']
+    assert sorted(book.crossed(106)) == ['S1']
+    assert sorted(book.crossed(96)) == ['B2', 'SS']
+    assert len(book) == 0
+
+
+def test_trigger_book_remove_and_readd_are_lazy():
+    book = TriggerBook()
+    book.add('B1', 'BUY', 'LIMIT', 100, None)
+    book.remove('B1')
+    assert book.crossed(90) == []
+
+    # modify: re-adding replaces the old price
+    book.add('B2', 'BUY', 'LIMIT', 100, None)
+    book.add('B2', 'BUY', 'LIMIT', 90, None)
+    assert book.crossed(95) == []
+    assert book.crossed(90) == ['B2']
+
+
+def test_trigger_book_market_orders_fire_on_any_tick():
+    book = TriggerBook()
+    book.add('M1', 'BUY', 'MARKET', None, None)
+    assert book.crossed(123.4) == ['M1']
+    assert book.crossed(123.4) == []
+
+
+class _Order:
+    def __init__(self, orderid, action, price_type, price=None, trigger_price=None, symbol='SBIN', exchange='NSE'):
+        self.orderid = orderid
+        self.user_id = 'tick-test'
+        self.symbol = symbol
+        self.exchange = exchange
+        self.action = action
+        self.price_type = price_type
+        self.price = price
+        self.trigger_price = trigger_price
+        self.order_status = 'open'
+
+
+def _tick(ltp, symbol='SBIN', exchange='NSE'):
+    return {'symbol': symbol, 'exchange': exchange, 'mode': 1, 'data': {'ltp': ltp}}
+
+
+def test_on_tick_queues_crossed_orders_with_quote():
+    engine = TickExecutionEngine(executor=object())
+    engine.add_order(_Order('B1', 'BUY', 'LIMIT', Decimal('100')))
+    engine.add_order(_Order('X1', 'BUY', 'LIMIT', Decimal('100'), symbol='INFY'))
+
+    engine.on_tick(_tick(101))
+    assert engine._fills.qsize() == 0
+
+    engine.on_tick(_tick(99.5))
+    batch = engine._next_batch()
+    assert list(batch) == ['B1']
+    assert batch['B1'][0]['ltp'] == 99.5
+    assert ('SBIN', 'NSE') in engine.live_symbols()
+    assert ('INFY', 'NSE') not in engine.live_symbols()
+
+
+def test_cancelled_order_is_not_triggered():
+    engine = TickExecutionEngine(executor=object())
+    engine.add_order(_Order('B1', 'BUY', 'LIMIT', Decimal('100')))
+    engine.remove_order('B1')
+    engine.on_tick(_tick(90))
+    assert engine._fills.qsize() == 0
+
+
+class _FakeExecutor:
+    """Fills LIMIT orders, leaves SL orders open (limit not reachable)"""
+
+    def __init__(self):
+        self.calls = []
+
+    def _process_order(self, order, quote):
+        self.calls.append((order.orderid, quote['ltp']))
+        if order.price_type == 'LIMIT':
+            order.order_status = 'complete'
+            db_session.commit()
+
+
+@pytest.fixture
+def sandbox_orders():
+    init_db()
+    prefix = f"TICK-{uuid.uuid4().hex[:8]}"
+    created = []
+
+    def make(suffix, action, price_type, price=None, trigger_price=None):
+        order = SandboxOrders(
+            orderid=f"{prefix}-{suffix}", user_id='tick-test', symbol='SBIN', exchange='NSE',
+            action=action, quantity=1, price=price, trigger_price=trigger_price,
+            price_type=price_type, product='MIS', order_status='open', pending_quantity=1,
+        )
+        db_session.add(order)
+        db_session.commit()
+        created.append(order.orderid)
+        return order
+
+    yield make
+    SandboxOrders.query.filter(SandboxOrders.orderid.in_(created)).delete(synchronize_session=False)
+    db_session.commit()
+    db_session.remove()
+
+
+def test_apply_fills_executes_and_keeps_unfilled_orders_tracked(sandbox_orders):
+    limit = sandbox_orders('L', 'BUY', 'LIMIT', price=Decimal('100'))
+    stop = sandbox_orders('S', 'BUY', 'SL', price=Decimal('101'), trigger_price=Decimal('99'))
+    executor = _FakeExecutor()
+    engine = TickExecutionEngine(executor=executor)
+    engine.add_order(limit)
+    engine.add_order(stop)
+    limit_id, stop_id = limit.orderid, stop.orderid
+    db_session.remove()
+
+    engine.on_tick(_tick(99.5))
+    filled = engine.apply_fills(engine._next_batch())
+
+    assert filled == 1
+    assert sorted(call[0] for call in executor.calls) == sorted([limit_id, stop_id])
+    assert limit_id not in engine.order_keys
+    assert stop_id in engine.order_keys  # SL still open: back in the book
+    assert SandboxOrders.query.filter_by(orderid=limit_id).first().order_status == 'complete'
+
+    # the already filled order is not processed again even if it is re-queued
+    executor.calls.clear()
+    engine._fills.put((limit_id, {'ltp': 99.0, 'bid': 0, 'ask': 0}, 0.0))
+    engine.apply_fills(engine._next_batch())
+    assert executor.calls == []
+
+
+def test_books_follow_the_hooks_between_full_syncs(sandbox_orders, monkeypatch):
+    placed = sandbox_orders('P', 'BUY', 'LIMIT', price=Decimal('100'))
+    engine = TickExecutionEngine(executor=_FakeExecutor())
+    assert engine.sync_if_due()
+    assert placed.orderid in engine.order_keys
+
+    queries = []
+    monkeypatch.setattr(tick_engine.account_state, 'sync', lambda: queries.append(1))
+    assert not engine.sync_if_due()  # within SANDBOX_TICK_SYNC_SECONDS: no database round trip
+    assert queries == []
+
+    # an order tracked while a full sync runs survives the swap to the rebuilt books
+    late = _Order('LATE', 'SELL', 'LIMIT', Decimal('110'))
+    monkeypatch.setattr(tick_engine.account_state, 'sync', lambda: engine.add_order(late))
+    monkeypatch.setattr(tick_engine, 'FULL_SYNC_SECONDS', 0)
+    assert engine.sync_if_due()
+    assert {placed.orderid, 'LATE'} <= set(engine.order_keys)
+
+
+def test_triggered_sl_order_waits_for_its_limit(sandbox_orders):
+    stop = sandbox_orders('A', 'BUY', 'SL', price=Decimal('101'), trigger_price=Decimal('100'))
+    executor = _FakeExecutor()
+    engine = TickExecutionEngine(executor=executor)
+    engine.add_order(stop)
+    stop_id = stop.orderid
+    db_session.remove()
+
+    def tick(ltp):
+        executor.calls.clear()
+        engine.on_tick(_tick(ltp))
+        engine.drain()
+        return [call[1] for call in executor.calls]
+
+    assert tick(102) == [102]  # triggered, LTP above the limit: armed on the limit
+    assert tick(103) == [] and tick(102.5) == []
+    assert tick(101) == [101]
+    assert tick(99) == [99]  # back below the trigger: waits for the trigger again
+    assert tick(99.5) == []
+    assert tick(100) == [100]
+    assert stop_id in engine.order_keys
+
+
+def test_failed_batch_puts_its_orders_back_on_the_books(sandbox_orders):
+    first = sandbox_orders('F', 'BUY', 'LIMIT', price=Decimal('100'))
+    second = sandbox_orders('G', 'BUY', 'LIMIT', price=Decimal('100'))
+
+    class _BrokenExecutor:
+        def _process_order(self, order, quote):
+            raise RuntimeError('database is locked')
+
+    engine = TickExecutionEngine(executor=_BrokenExecutor())
+    engine.add_order(first)
+    engine.add_order(second)
+    orderids = sorted([first.orderid, second.orderid])
+    db_session.remove()
+
+    engine.on_tick(_tick(99))
+    assert engine.apply_fills(engine._next_batch()) == 0
+
+    # the next crossing tick fires both again
+    engine.on_tick(_tick(99))
+    assert sorted(engine._next_batch()) == orderids
+
+
+def test_status_does_not_create_the_tick_engine(monkeypatch):
+    monkeypatch.setattr(tick_engine, '_tick_engine', None)
+    assert tick_engine.get_tick_engine_status() is None
+    assert tick_engine._tick_engine is None
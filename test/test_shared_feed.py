@@ -0,0 +1,187 @@
+"""
+Tests for the shared-feed mode of the WebSocket proxy (websocket_proxy/shared_feed.py)
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+from websocket_proxy import server
+from websocket_proxy.shared_feed import SharedFeed
+
+
+class _Adapter:
+    """Records upstream calls"""
+
+    def __init__(self):
+        self.calls = []
+
+    def initialize(self, broker_name, user_id):
+        self.calls.append(('initialize', user_id))
+
+    def connect(self):
+        return {'status': 'success'}
+
+    def subscribe(self, symbol, exchange, mode=2, depth_level=5):
+        self.calls.append(('subscribe', symbol, mode))
+        return {'status': 'success', 'message': 'ok', 'actual_depth': 5}
+
+    def unsubscribe(self, symbol, exchange, mode=2):
+        self.calls.append(('unsubscribe', symbol, mode))
+        return {'status': 'success', 'message': 'ok'}
+
+    def subscribe_many(self, instruments, mode=2, depth_level=5):
+        return [self.subscribe(symbol, exchange, mode, depth_level) for symbol, exchange in instruments]
+
+    def unsubscribe_many(self, instruments, mode=2):
+        return [self.unsubscribe(symbol, exchange, mode) for symbol, exchange in instruments]
+
+    def disconnect(self):
+        self.calls.append(('disconnect',))
+
+
+def test_upstream_subscription_follows_the_first_and_last_holder():
+    adapter = _Adapter()
+    feed = SharedFeed('zerodha', adapter)
+
+    assert feed.subscribe('c1', 'NIFTY', 'NSE_INDEX', 1)['status'] == 'success'
+    assert feed.subscribe('c2', 'NIFTY', 'NSE_INDEX', 1)['status'] == 'success'
+    assert feed.subscribe('c2', 'NIFTY', 'NSE_INDEX', 1)['status'] == 'success'
+    assert adapter.calls == [('subscribe', 'NIFTY', 1)]
+
+    assert feed.unsubscribe('c1', 'NIFTY', 'NSE_INDEX', 1)['status'] == 'success'
+    assert feed.unsubscribe('c1', 'NIFTY', 'NSE_INDEX', 1)['code'] == 'NOT_SUBSCRIBED'
+    assert adapter.calls == [('subscribe', 'NIFTY', 1)]
+    feed.unsubscribe('c2', 'NIFTY', 'NSE_INDEX', 1)
+    assert adapter.calls[-1] == ('unsubscribe', 'NIFTY', 1)
+    assert feed.holders == {} and feed.upstream_modes == {}
+
+
+def test_upstream_mode_is_the_highest_mode_held():
+    adapter = _Adapter()
+    feed = SharedFeed('zerodha', adapter)
+
+    feed.subscribe('c1', 'NIFTY', 'NSE_INDEX', 1)
+    assert feed.subscribe('c2', 'NIFTY', 'NSE_INDEX', 3)['actual_depth'] == 5  # upgrades
+    feed.subscribe('c3', 'NIFTY', 'NSE_INDEX', 2)  # never downgrades
+    assert adapter.calls == [('subscribe', 'NIFTY', 1), ('subscribe', 'NIFTY', 3)]
+
+    feed.unsubscribe('c1', 'NIFTY', 'NSE_INDEX', 1)  # not the upstream mode
+    assert len(adapter.calls) == 2
+    feed.unsubscribe('c2', 'NIFTY', 'NSE_INDEX', 3)
+    assert adapter.calls[-1] == ('subscribe', 'NIFTY', 2)
+    feed.unsubscribe('c3', 'NIFTY', 'NSE_INDEX', 2)
+    assert adapter.calls[-1] == ('unsubscribe', 'NIFTY', 2)
+
+    # batches group the upstream changes by mode
+    chain = [('NIFTY25JAN24000CE', 'NFO'), ('NIFTY25JAN24100CE', 'NFO')]
+    feed.subscribe_many('c1', chain, 1)
+    feed.subscribe_many('c2', chain[:1], 3)
+    feed.subscribe_many('c2', chain, 2)
+    del adapter.calls[:]
+    assert [r['status'] for r in feed.unsubscribe_many('c2', chain, 2)] == ['success', 'success']
+    assert adapter.calls == [('subscribe', 'NIFTY25JAN24100CE', 1)]
+    feed.unsubscribe_many('c2', chain, 3)
+    assert adapter.calls[1:] == [('subscribe', 'NIFTY25JAN24000CE', 1)]
+    feed.unsubscribe_many('c1', chain, 1)
+    assert adapter.calls[2:] == [('unsubscribe', 'NIFTY25JAN24000CE', 1), ('unsubscribe', 'NIFTY25JAN24100CE', 1)]
+    assert feed.holders == {}
+
+
+@pytest.fixture
+def proxy(monkeypatch):
+    adapters = []
+
+    def create_broker_adapter(broker_name):
+        adapters.append(_Adapter())
+        return adapters[-1]
+
+    monkeypatch.setattr(server, 'verify_api_key', lambda api_key: api_key.split('-')[0])
+    monkeypatch.setattr(server, 'get_broker_name', lambda api_key: 'zerodha')
+    monkeypatch.setattr(server, 'create_broker_adapter', create_broker_adapter)
+    monkeypatch.setenv('WEBSOCKET_SHARED_FEED_ACCOUNT_ZERODHA', 'feed')
+    monkeypatch.setenv('WEBSOCKET_SHARED_FEED_USERS_ZERODHA', 'alice, bob')
+
+    # the proxy without its listening socket and ZeroMQ subscriber
+    proxy = server.WebSocketProxy.__new__(server.WebSocketProxy)
+    proxy.clients, proxy.subscriptions, proxy.broker_adapters = {}, {}, {}
+    proxy.user_mapping, proxy.user_broker_mapping = {}, {}
+    proxy.shared_feed, proxy.shared_feeds = True, {}
+    proxy.feed_owner = None
+    proxy.replay = False
+    proxy.auth_executor = None
+    proxy.sent = []
+
+    async def send_message(client_id, message):
+        proxy.sent.append((client_id, message))
+        return True
+
+    proxy.send_message = send_message
+    proxy.adapters = adapters
+    return proxy
+
+
+def test_entitled_users_share_the_feed_account_adapter(proxy):
+    async def session():
+        for client_id, api_key in ((1, 'alice-key'), (2, 'bob-key'), (3, 'carol-key')):
+            proxy.subscriptions[client_id] = {}
+            await proxy.authenticate_client(client_id, {'api_key': api_key})
+            await proxy.subscribe_client(client_id, {'symbols': [{'symbol': 'NIFTY', 'exchange': 'NSE_INDEX'}],
+                                                     'mode': 'LTP'})
+
+        adapter, own = proxy.adapters  # carol is not entitled to the feed account
+        assert adapter.calls[0] == ('initialize', 'feed') and own.calls[0] == ('initialize', 'carol')
+        assert proxy.broker_adapters['alice'] is proxy.broker_adapters['bob'] is proxy.shared_feeds[('zerodha', 'feed')]
+        assert proxy.broker_adapters['carol'] is own
+        assert [call for call in adapter.calls if call[0] == 'subscribe'] == [('subscribe', 'NIFTY', 1)]
+
+        await proxy.cleanup_client(1)
+        assert adapter.calls[-1] == ('subscribe', 'NIFTY', 1)
+        assert list(proxy.shared_feeds[('zerodha', 'feed')].users) == ['bob']
+
+        await proxy.cleanup_client(2)
+        assert adapter.calls[-2:] == [('unsubscribe', 'NIFTY', 1), ('disconnect',)]
+        assert proxy.shared_feeds == {} and list(proxy.broker_adapters) == ['carol']
+        await proxy.cleanup_client(3)
+
+    asyncio.run(session())
+
+
+class _Bus:
+    """Stands in for the proxy's ZeroMQ subscriber: hands out frames, then stops the listener"""
+
+    def __init__(self, proxy, frames):
+        self.proxy, self.frames = proxy, list(frames)
+
+    async def recv_multipart(self):
+        if self.frames:
+            return self.frames.pop(0)
+        self.proxy.running = False
+        await asyncio.sleep(1)
+
+
+def test_lower_mode_holders_get_ticks_of_the_upgraded_feed(proxy):
+    async def session():
+        for client_id, api_key, mode in ((1, 'alice-key', 'LTP'), (2, 'bob-key', 'Depth')):
+            proxy.subscriptions[client_id] = {}
+            await proxy.authenticate_client(client_id, {'api_key': api_key})
+            await proxy.subscribe_client(client_id, {'symbols': [{'symbol': 'NIFTY', 'exchange': 'NSE_INDEX'}],
+                                                     'mode': mode})
+        adapter, = proxy.adapters
+        assert [call for call in adapter.calls if call[0] == 'subscribe'] == [('subscribe', 'NIFTY', 1),
+                                                                                ('subscribe', 'NIFTY', 3)]
+        del proxy.sent[:]
+
+        # the adapter now publishes the DEPTH topic only
+        proxy.socket = _Bus(proxy, [[b'NSE_INDEX_NIFTY_DEPTH', b'{"ltp": 23500.5, "depth": {}}']])
+        proxy.running = True
+        await proxy.zmq_listener()
+
+    asyncio.run(session())
+    assert sorted((client_id, message['mode']) for client_id, message in proxy.sent) == [(1, 1), (2, 3)]
+    assert all(message['data']['ltp'] == 23500.5 for _, message in proxy.sent)
@@ -0,0 +1,124 @@
+"""
+Tests for the tick recorder (websocket_proxy/tick_recorder.py) and the replay
+adapter (websocket_proxy/replay_adapter.py)
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import zmq
+
+import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+from websocket_proxy.broker_factory import create_broker_adapter
+from websocket_proxy.replay_adapter import parse_speed
+from websocket_proxy.tick_recorder import TickRecorder, read_segment, segment_files
+
+NS = 1_000_000_000
+
+
+def _ns(*args):
+    return int(datetime(*args).timestamp()) * NS
+
+
+def test_segments_rotate_per_day_and_skip_a_torn_tail(tmp_path):
+    recorder = TickRecorder(tmp_path)
+    recorder.write(b'NSE_RELIANCE_LTP', b'{"ltp": 1}', _ns(2025, 3, 3, 15, 29))
+    recorder.write(b'NSE_RELIANCE_LTP', b'{"ltp": 2}', _ns(2025, 3, 3, 23, 59, 59) + 999)
+    recorder.write(b'NSE_TCS_QUOTE', b'{"ltp": 3}', _ns(2025, 3, 4, 9, 15))
+    recorder.close()
+
+    first, second = segment_files(tmp_path)
+    assert (first.name, second.name) == ('ticks-20250303.bin', 'ticks-20250304.bin')
+    assert [payload for _, _, payload in read_segment(first)] == [b'{"ltp": 1}', b'{"ltp": 2}']
+
+    # a restarted recorder appends to the day's segment; a half-written record is dropped on read
+    recorder = TickRecorder(tmp_path)
+    recorder.write(b'NSE_TCS_LTP', b'{"ltp": 4}', _ns(2025, 3, 4, 9, 16))
+    recorder.close()
+    with open(second, 'ab') as f:
+        f.write(b'\0\0\0')
+    assert list(read_segment(second)) == [(_ns(2025, 3, 4, 9, 15), b'NSE_TCS_QUOTE', b'{"ltp": 3}'),
+                                          (_ns(2025, 3, 4, 9, 16), b'NSE_TCS_LTP', b'{"ltp": 4}')]
+
+
+def test_restarted_recorder_cuts_off_a_torn_record(tmp_path):
+    ticks = [(_ns(2025, 3, 4, 9, 15, second), b'NSE_INFY_LTP', b'{"ltp": %d}' % second) for second in range(4)]
+    recorder = TickRecorder(tmp_path)
+    for tick in ticks[:2]:
+        recorder.write(tick[1], tick[2], tick[0])
+    recorder.close()
+    with open(recorder.path, 'r+b') as f:
+        f.truncate(f.seek(0, os.SEEK_END) - 4)  # crash halfway through the second record
+
+    recorder = TickRecorder(tmp_path)
+    for tick in ticks[2:]:
+        recorder.write(tick[1], tick[2], tick[0])
+    recorder.close()
+    assert list(read_segment(recorder.path)) == [ticks[0]] + ticks[2:]
+
+
+def _receive(socket, count, timeout=5.0):
+    frames = []
+    deadline = time.monotonic() + timeout
+    while len(frames) < count and time.monotonic() < deadline:
+        if socket.poll(100):
+            frames.append(socket.recv_multipart())
+    return frames
+
+
+def test_recorded_bus_replays_subscribed_topics(tmp_path):
+    context = zmq.Context.instance()
+    publisher = context.socket(zmq.PUB)
+    port = publisher.bind_to_random_port('tcp://127.0.0.1')
+    recorder = TickRecorder(tmp_path, f'tcp://127.0.0.1:{port}')
+    recorder.start()
+    try:
+        # wait out the subscriber's connection before publishing the session
+        while recorder.records == 0:
+            publisher.send_multipart([b'warmup', b'{}'])
+            time.sleep(0.02)
+        for i in range(20):
+            publisher.send_multipart([b'zerodha_NSE_RELIANCE_LTP', json.dumps({'ltp': 2500 + i}).encode()])
+            publisher.send_multipart([b'NSE_TCS_LTP', json.dumps({'ltp': 3900 + i}).encode()])
+        deadline = time.monotonic() + 5
+        while recorder.records < 41 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        recorder.stop()
+        publisher.close(linger=0)
+
+    adapter = create_broker_adapter('replay')
+    subscriber = context.socket(zmq.SUB)
+    subscriber.setsockopt(zmq.SUBSCRIBE, b'')
+    subscriber.connect(f'tcp://127.0.0.1:{adapter.zmq_port}')
+    try:
+        assert adapter.initialize('replay', 'tester', {'path': str(tmp_path), 'speed': 'max'}) == {'success': True}
+        adapter.connect()
+        time.sleep(0.2)
+        assert adapter.subscribe('RELIANCE', 'NSE', 1)['status'] == 'success'
+
+        frames = _receive(subscriber, 20)
+        assert {topic for topic, _ in frames} == {b'zerodha_NSE_RELIANCE_LTP'}
+        assert [json.loads(payload)['ltp'] for _, payload in frames] == list(range(2500, 2520))
+        assert _receive(subscriber, 1, timeout=0.3) == []
+    finally:
+        adapter.disconnect()
+        subscriber.close(linger=0)
+
+
+def test_replay_configuration(tmp_path):
+    assert (parse_speed('1'), parse_speed('10x'), parse_speed('max'), parse_speed(0)) == (1.0, 10.0, 0.0, 0.0)
+    with pytest.raises(ValueError):
+        parse_speed('-2')
+
+    adapter = create_broker_adapter('replay')
+    try:
+        assert adapter.initialize('replay', 'tester', {'path': str(tmp_path)})['success'] is False
+    finally:
+        adapter.cleanup_zmq()
@@ -0,0 +1,83 @@
+"""
+Tests for reading Upstox V3 FeedResponse protobufs in the streaming adapter
+(broker/upstox/streaming/upstox_adapter.py)
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+from broker.upstox.streaming import MarketDataFeedV3_pb2 as pb
+from broker.upstox.streaming.upstox_adapter import UpstoxWebSocketAdapter
+from broker.upstox.streaming.upstox_client import UpstoxWebSocketClient
+
+KEY = 'NSE_EQ|INE002A01018'
+
+
+@pytest.fixture
+def adapter():
+    adapter = UpstoxWebSocketAdapter()
+    adapter.published = []
+    adapter.publish_market_data = lambda topic, data: adapter.published.append((topic, data))
+    for mode in (1, 2, 3):
+        adapter.subscriptions[f'RELIANCE_NSE_{mode}'] = {
+            'symbol': 'RELIANCE', 'exchange': 'NSE', 'mode': mode, 'depth_level': 5,
+            'token': 'INE002A01018', 'instrument_key': KEY}
+    yield adapter
+    adapter.cleanup_zmq()
+
+
+def _full_feed_payload():
+    response = pb.FeedResponse(type=pb.live_feed, currentTs=1700000005000)
+    ff = response.feeds[KEY].fullFeed.marketFF
+    ff.ltpc.ltp, ff.ltpc.ltq, ff.ltpc.cp = 2501.5, 10, 2490.0
+    ff.atp, ff.tbq, ff.tsq = 2498.25, 12000.0, 9000.0
+    ff.optionGreeks.delta = 0.5
+    ff.marketOHLC.ohlc.add(interval='I1', open=2500, high=2502, low=2499, close=2501, vol=100, ts=1700000000000)
+    ff.marketOHLC.ohlc.add(interval='1d', open=2480, high=2510, low=2475, close=2501.5, vol=500000,
+                           ts=1699920000000)
+    ff.marketLevel.bidAskQuote.add(bidQ=50, bidP=2501.0, askQ=40, askP=2502.0)
+    ff.marketLevel.bidAskQuote.add(bidQ=70, bidP=2500.5, askQ=0, askP=0)
+    return response.SerializeToString()
+
+
+def test_full_feed_is_read_for_each_subscribed_mode(adapter):
+    client = UpstoxWebSocketClient('x' * 20)
+    client.callbacks['on_message'] = adapter._on_market_data
+    asyncio.run(client._process_binary_message(_full_feed_payload()))
+
+    published = dict(adapter.published)
+    assert published['NSE_RELIANCE_LTP'] == {'symbol': 'RELIANCE', 'exchange': 'NSE', 'token': 'INE002A01018',
+                                             'ltp': 2501.5, 'ltq': 10, 'ltt': 0, 'cp': 2490.0}
+    quote = published['NSE_RELIANCE_QUOTE']
+    assert (quote['open'], quote['high'], quote['volume'], quote['timestamp']) == (2480, 2510, 500000, 1699920000000)
+    assert (quote['average_price'], quote['total_buy_quantity'], quote['total_sell_quantity']) == (2498.25, 12000, 9000)
+
+    depth = published['NSE_RELIANCE_DEPTH']
+    assert depth['ltp'] == 2501.5 and depth['depth']['timestamp'] == 1700000005000
+    assert [level['price'] for level in depth['depth']['buy']] == [2501.0, 2500.5, 0.0, 0.0, 0.0]
+    assert depth['depth']['sell'][0] == {'price': 2502.0, 'quantity': 40, 'orders': 0}
+
+
+def test_ltpc_feed_has_no_quote(adapter):
+    response = pb.FeedResponse(type=pb.live_feed, currentTs=1700000005000)
+    response.feeds[KEY].ltpc.ltp = 2499.0
+    asyncio.run(adapter._on_market_data(response))
+
+    # quote needs a full feed; depth still goes out, without levels
+    (ltp_topic, ltp), (depth_topic, depth) = adapter.published
+    assert (ltp_topic, ltp['ltp']) == ('NSE_RELIANCE_LTP', 2499.0)
+    assert (depth_topic, depth['depth']['buy'], depth['ltp']) == ('NSE_RELIANCE_DEPTH', [], 0)
+
+
+def test_market_info_updates_the_market_status(adapter):
+    response = pb.FeedResponse(type=pb.market_info)
+    response.marketInfo.segmentStatus['NSE_EQ'] = pb.NORMAL_OPEN
+    asyncio.run(adapter._on_market_data(response))
+    assert adapter.market_status == {'segmentStatus': {'NSE_EQ': 'NORMAL_OPEN'}}
+    assert adapter.published == []
@@ -0,0 +1,215 @@
+"""
+Tests for the WebSocket proxy's scale-out mode (websocket_proxy/workers.py)
+and its off-loop client authentication
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import threading
+
+import zmq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from concurrent.futures import ThreadPoolExecutor
+
+import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+from websocket_proxy import feed_owner, server, workers
+from websocket_proxy import base_adapter
+from websocket_proxy.base_adapter import BaseBrokerWebSocketAdapter
+
+
+def test_worker_count(monkeypatch):
+    for value, expected in (('4', 4), ('0', 1), ('many', 1)):
+        monkeypatch.setenv('WEBSOCKET_WORKERS', value)
+        assert workers.worker_count() == expected
+    monkeypatch.delenv('WEBSOCKET_WORKERS')
+    assert workers.worker_count() == 1
+
+    monkeypatch.setenv('WEBSOCKET_WORKERS', '4')
+    monkeypatch.delattr(socket, 'SO_REUSEPORT', raising=False)
+    assert workers.worker_count() == 1
+
+
+def test_feed_owner_ports_are_never_picked_at_random(monkeypatch):
+    monkeypatch.setenv('ZMQ_PORT', '47001')
+    monkeypatch.setenv('WEBSOCKET_FEED_CONTROL_PORT', '47002')
+    monkeypatch.setenv('ZMQ_RESERVED_PORTS', ','.join(map(str, workers.feed_ports())))
+    monkeypatch.setattr(base_adapter.random, 'randint', lambda low, high: 47002)
+    assert base_adapter.find_free_zmq_port(47001, max_attempts=2) is None
+    assert base_adapter.find_free_zmq_port(47001, max_attempts=3) == 47003
+
+
+def test_workers_start_as_proxy_subprocesses(monkeypatch):
+    started = []
+    monkeypatch.setenv('ZMQ_RESERVED_PORTS', '')  # start_workers sets it for the children
+    monkeypatch.setattr(workers, 'is_port_in_use', lambda host, port, wait_time: False)
+    monkeypatch.setattr(workers.subprocess, 'Popen', lambda args, cwd: started.append(args[1:]))
+    workers.start_workers(2, '127.0.0.1', 8765)
+    # fresh interpreters that import the proxy alone, never the caller's main module (app.py)
+    assert started == [['-m', 'websocket_proxy', 'feed-owner'],
+                       ['-m', 'websocket_proxy', 'worker', '0', '127.0.0.1', '8765'],
+                       ['-m', 'websocket_proxy', 'worker', '1', '127.0.0.1', '8765']]
+
+
+def test_authentication_runs_off_the_event_loop(monkeypatch):
+    lookups, release = [], threading.Event()
+
+    def verify_api_key(api_key):
+        lookups.append(threading.current_thread().name)
+        release.wait(5)
+        return 'alice'
+
+    monkeypatch.setattr(server, 'verify_api_key', verify_api_key)
+    monkeypatch.setattr(server, 'get_broker_name', lambda api_key: None)
+
+    proxy = server.WebSocketProxy.__new__(server.WebSocketProxy)
+    proxy.subscriptions, proxy.user_mapping = {1: {}, 2: {}}, {}
+    proxy.replay = False
+    proxy.auth_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ws-auth')
+    proxy.errors = []
+
+    async def send_error(client_id, code, message):
+        proxy.errors.append((client_id, code))
+
+    proxy.send_error = send_error
+
+    async def session():
+        pending = [asyncio.ensure_future(proxy.authenticate_client(client_id, {'api_key': 'alice-key'}))
+                   for client_id in (1, 2)]
+        # the loop keeps running while both verifications block
+        while len(lookups) < 2:
+            await asyncio.sleep(0.01)
+        del proxy.subscriptions[2]  # client 2 disconnects mid-authentication
+        release.set()
+        await asyncio.gather(*pending)
+
+    try:
+        asyncio.run(session())
+    finally:
+        proxy.auth_executor.shutdown()
+
+    assert all(name.startswith('ws-auth') for name in lookups)
+    assert proxy.user_mapping == {1: 'alice'}
+    assert proxy.errors == [(1, 'BROKER_ERROR')]
+
+
+def test_feed_owner_requests_run_off_the_event_loop(monkeypatch):
+    requests, release = [], threading.Event()
+
+    class _SlowOwner:
+        def request(self, op, timeout_ms=None, **fields):
+            requests.append((op, threading.current_thread().name))
+            release.wait(5)
+            return {'status': 'success', 'responses': [{'status': 'success'}] * len(fields.get('instruments', ()))}
+
+    monkeypatch.setattr(server, 'verify_api_key', lambda api_key: 'alice')
+    monkeypatch.setattr(server, 'get_broker_name', lambda api_key: 'zerodha')
+
+    proxy = server.WebSocketProxy.__new__(server.WebSocketProxy)
+    proxy.subscriptions, proxy.user_mapping, proxy.user_broker_mapping = {1: {}}, {}, {}
+    proxy.broker_adapters, proxy.shared_feeds, proxy.shared_feed = {}, {}, False
+    proxy.replay = False
+    proxy.feed_owner = _SlowOwner()
+    proxy.auth_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ws-auth')
+    proxy.feed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ws-feed')
+    proxy.sent = []
+
+    async def send_message(client_id, message):
+        proxy.sent.append((client_id, message))
+        return True
+
+    proxy.send_message = send_message
+
+    async def session():
+        pending = asyncio.ensure_future(proxy.authenticate_client(1, {'api_key': 'alice-key'}))
+        # the loop keeps running while the feed owner takes its time to answer
+        while not requests:
+            await asyncio.sleep(0.01)
+        assert not pending.done()
+        release.set()
+        await pending
+        await proxy.subscribe_client(1, {'symbols': [{'symbol': 'TCS', 'exchange': 'NSE'}], 'mode': 'LTP'})
+
+    try:
+        asyncio.run(session())
+    finally:
+        proxy.auth_executor.shutdown()
+        proxy.feed_executor.shutdown()
+
+    assert requests == [('attach', 'ws-feed_0'), ('subscribe_many', 'ws-feed_0')]
+    assert isinstance(proxy.broker_adapters['alice'], feed_owner.RemoteFeed)
+    assert ('TCS', 'NSE', 1) in proxy.subscriptions[1]
+
+
+class _Adapter(BaseBrokerWebSocketAdapter):
+    """Publishes one LTP tick per subscription and records upstream calls"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def initialize(self, broker_name, user_id, auth_data=None):
+        self.calls.append(('initialize', user_id))
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        self.calls.append(('disconnect',))
+        self.cleanup_zmq()
+
+    def subscribe(self, symbol, exchange, mode=2, depth_level=5):
+        self.calls.append(('subscribe', symbol, mode))
+        self.publish_market_data(f'{exchange}_{symbol}_LTP', {'ltp': 1})
+        return self._create_success_response('ok')
+
+    def unsubscribe(self, symbol, exchange, mode=2):
+        self.calls.append(('unsubscribe', symbol, mode))
+        return self._create_success_response('ok')
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_workers_share_the_feed_owners_adapters_and_bus(monkeypatch):
+    adapters = []
+    monkeypatch.setattr(feed_owner, 'create_broker_adapter', lambda broker_name: adapters.append(_Adapter()) or adapters[-1])
+
+    owner = feed_owner.FeedOwner(f'tcp://127.0.0.1:{_free_port()}', f'tcp://127.0.0.1:{_free_port()}')
+    owner.start_bus()
+    serving = threading.Thread(target=owner.serve, daemon=True)
+    serving.start()
+    bus = zmq.Context.instance().socket(zmq.SUB)
+    bus.setsockopt(zmq.SUBSCRIBE, b'')
+    bus.connect(owner.bus)
+    clients = [feed_owner.FeedClient(index, owner.control, timeout=5) for index in (0, 1)]
+    try:
+        feeds = [feed_owner.RemoteFeed(client, 'zerodha', 'alice') for client in clients]
+        assert [feed.attach('alice')['status'] for feed in feeds] == ['success', 'success']
+        adapter, = adapters  # one broker connection for the user's clients in both workers
+        assert adapter.calls == [('initialize', 'alice')]
+
+        # the subscription is held for clients in both workers; its tick reaches the bus once
+        while not bus.poll(50):
+            feeds[0].subscribe_many(1, [('TCS', 'NSE')], 1)
+        assert bus.recv_multipart()[0] == b'NSE_TCS_LTP'
+        assert feeds[1].subscribe(1, 'TCS', 'NSE', 1)['status'] == 'success'
+        assert adapter.calls[1:] == [('subscribe', 'TCS', 1)]
+
+        clients[1].close()  # worker 1 shuts down, releasing its client and user
+        assert feeds[0].unsubscribe(1, 'TCS', 'NSE', 1)['status'] == 'success'
+        assert adapter.calls[-1] == ('unsubscribe', 'TCS', 1)
+        assert feeds[0].detach('alice')
+        assert adapter.calls[-1] == ('disconnect',) and owner.feeds == {}
+    finally:
+        owner.stop()
+        serving.join()
+        owner.close()
+        clients[0].socket.close()
+        bus.close()
@@ -0,0 +1,70 @@
+"""
+Tests for the Zerodha binary frame decoder (broker/zerodha/streaming/zerodha_decoder.py)
+"""
+
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+from broker.zerodha.streaming import zerodha_decoder
+from broker.zerodha.streaming.zerodha_decoder import decode_frame
+from broker.zerodha.streaming.zerodha_websocket import ZerodhaWebSocket
+
+
+def _quote(token, price):
+    return struct.pack('>I10i', token, price, 7, price - 10, 1000, 40, 60, 250000, 251000, 249000, 250500)
+
+
+def _full(token, price):
+    levels = [(10, price - 5, 2), (20, price - 10, 3), (0, 0, 0), (0, 0, 0), (0, 0, 0),
+              (15, price + 5, 1), (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0)]
+    return (_quote(token, price) + struct.pack('>5i', 1700000001, 5000, 0, 0, 1700000002)
+            + b''.join(struct.pack('>iih2x', *level) for level in levels))
+
+
+def _frame(*packets):
+    return struct.pack('>H', len(packets)) + b''.join(struct.pack('>H', len(p)) + p for p in packets)
+
+
+def test_frame_with_every_packet_kind():
+    frame = _frame(struct.pack('>Ii', 256265, 2450050), _quote(738561, 250050), _full(5633, 99900))
+    ltp, quote, full = decode_frame(frame, {}, {738561: 'NSE', 5633: 'NFO'})
+
+    assert (ltp['instrument_token'], ltp['mode'], ltp['last_price']) == (256265, 'ltp', 24500.5)
+    assert 'source_exchange' not in ltp
+    assert (quote['mode'], quote['source_exchange'], quote['volume'], quote['ohlc']['high']) == \
+        ('quote', 'NSE', 1000, 2510.0)
+    assert 'oi' not in quote
+    assert (full['mode'], full['oi'], full['exchange_timestamp']) == ('full', 5000, 1700000002)
+    assert full['depth'] == {'buy': [{'quantity': 10, 'price': 998.95, 'orders': 2},
+                                     {'quantity': 20, 'price': 998.9, 'orders': 3}],
+                             'sell': [{'quantity': 15, 'price': 999.05, 'orders': 1}]}
+    assert ltp['timestamp'] == quote['timestamp'] == full['timestamp']
+
+
+def test_truncated_frame_keeps_the_complete_packets():
+    frame = _frame(_quote(1, 100), _quote(2, 200))
+    assert [t['instrument_token'] for t in decode_frame(frame[:-1], {}, {})] == [1]
+    assert decode_frame(frame[:3], {}, {}) == []
+
+
+@pytest.mark.skipif(zerodha_decoder.np is None, reason='numpy not installed')
+def test_numpy_path_matches_struct_path():
+    frame = _frame(*(_full(1000 + i, 50000 + i) for i in range(20)))
+    with_numpy = decode_frame(frame, {}, {1003: 'NSE'}, use_numpy=True)
+    with_struct = decode_frame(frame, {}, {1003: 'NSE'})
+    for tick in with_numpy + with_struct:
+        del tick['timestamp']
+    assert with_numpy == with_struct
+
+
+def test_maps_are_replaced_not_mutated():
+    client = ZerodhaWebSocket('key', 'token')
+    before = client.token_exchange_map
+    client.set_token_exchange_mapping({738561: 'NSE'})
+    assert before == {} and client.token_exchange_map == {738561: 'NSE'}
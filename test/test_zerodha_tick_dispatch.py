@@ -0,0 +1,72 @@
+"""
+Tests for the token-indexed tick dispatch of the Zerodha streaming adapter
+(broker/zerodha/streaming/zerodha_adapter.py)
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import websocket_proxy  # noqa: F401  (imports the adapters in their usual order)
+from broker.zerodha.streaming.zerodha_adapter import ZerodhaWebSocketAdapter
+
+TOKEN = 738561
+
+
+@pytest.fixture
+def adapter():
+    adapter = ZerodhaWebSocketAdapter()
+    adapter.published = []
+    # keep what would have been serialized at publish time
+    adapter.publish_market_data = lambda topic, data: adapter.published.append((topic, json.loads(json.dumps(data))))
+    yield adapter
+    adapter.cleanup()
+
+
+def _tick(mode):
+    tick = {'instrument_token': TOKEN, 'last_traded_price': 2500.5, 'last_price': 2500.5, 'mode': mode,
+            'timestamp': 1700000000000, 'volume_traded': 100, 'ohlc': {'open': 1, 'high': 2, 'low': 1, 'close': 2}}
+    if mode == 'full':
+        tick['depth'] = {'buy': [{'price': 2500.0, 'quantity': 10, 'orders': 1}],
+                         'sell': [{'price': 2501.0, 'quantity': 5, 'orders': 2}]}
+    return tick
+
+
+def test_quote_tick_goes_to_the_quote_topic(adapter):
+    adapter._track_subscription('RELIANCE', 'NSE', TOKEN, 2)
+    adapter._handle_ticks([_tick('quote'), {'instrument_token': 1, 'mode': 'quote'}])
+
+    (topic, data), = adapter.published
+    assert topic == b'NSE_RELIANCE_QUOTE'
+    assert (data['symbol'], data['exchange'], data['ltp'], data['mode']) == ('RELIANCE', 'NSE', 2500.5, 'quote')
+
+
+def test_full_tick_is_published_for_each_subscribed_mode(adapter):
+    adapter._track_subscription('RELIANCE', 'NSE', TOKEN, 2)
+    adapter._handle_ticks([_tick('full')])
+
+    (depth_topic, depth), (quote_topic, quote) = adapter.published
+    assert (depth_topic, depth['mode'], depth['depth']['sell'][0]['quantity']) == (b'NSE_RELIANCE_DEPTH', 'full', 5)
+    assert (quote_topic, quote['mode']) == (b'NSE_RELIANCE_QUOTE', 'quote')
+    assert 'depth' not in quote
+
+    adapter.published.clear()
+    adapter._track_subscription('RELIANCE', 'NSE', TOKEN, 1)
+    adapter._handle_ticks([_tick('full')])
+    assert [topic for topic, _ in adapter.published] == [b'NSE_RELIANCE_DEPTH', b'NSE_RELIANCE_LTP']
+    assert adapter.published[1][1] == {'symbol': 'RELIANCE', 'exchange': 'NSE', 'mode': 'ltp', 'ltp': 2500.5,
+                                       'timestamp': 1700000000000}
+
+
+def test_unsubscribe_removes_the_route(adapter):
+    adapter._track_subscription('NIFTY', 'NSE_INDEX', TOKEN, 1)
+    assert adapter.tick_routes[TOKEN].topics['LTP'] == b'NSE_INDEX_NIFTY_LTP'
+
+    assert adapter.unsubscribe('NIFTY', 'NSE_INDEX')['status'] == 'success'
+    assert TOKEN not in adapter.tick_routes
+    adapter._handle_ticks([_tick('ltp')])
+    assert adapter.published == []
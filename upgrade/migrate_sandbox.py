@@ -181,6 +181,16 @@ def create_all_tables(conn):
         )
     """))
 
+    # 7. SandboxSequences table
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS sandbox_sequences (
+            scope VARCHAR(50) NOT NULL,
+            day VARCHAR(8) NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (scope, day)
+        )
+    """))
+
     conn.commit()
     logger.info("✅ All sandbox tables created successfully")
 
@@ -333,7 +343,8 @@ def status():
 
         required_tables = [
             'sandbox_orders', 'sandbox_trades', 'sandbox_positions',
-            'sandbox_holdings', 'sandbox_funds', 'sandbox_config'
+            'sandbox_holdings', 'sandbox_funds', 'sandbox_config',
+            'sandbox_sequences'
         ]
 
         with engine.connect() as conn:
@@ -6,6 +6,7 @@ from database.auth_db import upsert_auth, get_feed_token as db_get_feed_token
 from database.master_contract_status_db import init_broker_status, update_status
 import importlib
 from utils.logging import get_logger
+from utils.httpx_client import prewarm_broker
 
 logger = get_logger(__name__)
 
@@ -112,6 +113,11 @@ def handle_auth_success(auth_token, user_session_key, broker, feed_token=None, u
         init_broker_status(broker)
         thread = Thread(target=async_master_contract_download, args=(broker,))
         thread.start()
+        # Open broker API connections now so the first order skips the TLS handshake
+        try:
+            prewarm_broker(broker)
+        except Exception as e:
+            logger.warning(f"Could not pre-warm broker connections for {broker}: {e}")
         return redirect(url_for('dashboard_bp.dashboard'))
     else:
         logger.error(f"Failed to upsert auth token for user {user_session_key}")
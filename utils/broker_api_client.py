@@ -21,9 +21,16 @@ from typing import Any, Callable, Dict, Optional
 import httpx
 from utils.httpx_client import get_httpx_client
 from utils.logging import get_logger
+from utils.metrics import counter
 
 logger = get_logger(__name__)
 
+BROKER_API_REQUESTS = counter(
+    'openalgo_broker_api_requests_total',
+    'BrokerAPIClient requests by broker and result',
+    ('broker', 'result')
+)
+
 
 class ErrorCode(Enum):
     """Standardized error codes for broker API responses."""
@@ -449,6 +456,7 @@ class BrokerAPIClient:
                     f"rejecting request"
                 )
                 self.error_count += 1
+                BROKER_API_REQUESTS.labels(self.broker_name, 'circuit_open').inc()
                 return self._create_error_response(
                     ErrorCode.CIRCUIT_OPEN,
                     f"Endpoint {endpoint} is currently unavailable (circuit breaker open)",
@@ -471,11 +479,13 @@ class BrokerAPIClient:
             # Track errors and manage circuit breaker manually
             if isinstance(result, dict) and result.get('status') == 'error':
                 self.error_count += 1
+                BROKER_API_REQUESTS.labels(self.broker_name, 'error').inc()
 
                 # Manually track failure in circuit breaker for error responses
                 if circuit_breaker:
                     circuit_breaker._on_failure()
             else:
+                BROKER_API_REQUESTS.labels(self.broker_name, 'success').inc()
                 # Success - reset circuit breaker
                 if circuit_breaker:
                     circuit_breaker._on_success()
@@ -485,6 +495,7 @@ class BrokerAPIClient:
         except Exception as e:
             logger.exception(f"[{correlation_id}] Circuit breaker call failed: {e}")
             self.error_count += 1
+            BROKER_API_REQUESTS.labels(self.broker_name, 'error').inc()
             return self._create_error_response(
                 ErrorCode.CIRCUIT_OPEN,
                 str(e),
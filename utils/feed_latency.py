@@ -0,0 +1,131 @@
+"""
+Sampled tick latency tracing through the streaming feed path.
+
+A traced tick is stamped with ``time.monotonic_ns()`` at each hop:
+
+- frame:   the broker frame carrying it arrived in the adapter's client
+           (only for clients that call ``mark_frame``)
+- publish: the adapter published it to ZeroMQ
+- proxy:   ``WebSocketProxy.zmq_listener`` received it
+- send:    the proxy finished writing it to its subscribed clients
+
+The frame and publish stamps, followed by the adapter's broker name, travel
+as an extra ZeroMQ frame after the JSON payload (``[topic, payload, trace]``),
+so the payload clients receive is unchanged. The proxy turns the stamps into
+per-broker, per-hop latencies (adapter = frame -> publish, zmq = publish ->
+proxy, proxy = proxy -> send, total = first stamp -> send), recorded in the
+``openalgo_feed_hop_latency_seconds`` histogram and in mergeable histograms
+read by the latency dashboard.
+
+Sampling is per broker frame (or per tick for adapters that do not mark
+frames) at FEED_TRACE_SAMPLE_RATE; at 0 tracing costs one attribute check per
+frame and per publish.
+"""
+
+import os
+import random
+import struct
+import threading
+import time
+from typing import Dict, Optional
+
+from utils.latency_histogram import LatencyHistogram
+from utils.metrics import histogram
+
+TRACE = struct.Struct('>qq')  # frame_ns (0 when the adapter does not mark frames), publish_ns; then the broker name
+HOPS = ('adapter', 'zmq', 'proxy', 'total')
+
+FEED_HOP_LATENCY = histogram('openalgo_feed_hop_latency_seconds',
+                             'Latency of sampled ticks per hop of the feed path', ('broker', 'hop'),
+                             buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                                      0.025, 0.05, 0.1, 0.25, 1.0))
+
+
+def _rate_from_env() -> float:
+    try:
+        return min(max(float(os.getenv('FEED_TRACE_SAMPLE_RATE', '0')), 0.0), 1.0)
+    except ValueError:
+        return 0.0
+
+
+_sample_rate = _rate_from_env()
+_local = threading.local()
+_hist_lock = threading.Lock()
+_histograms: Dict[tuple, LatencyHistogram] = {}
+
+
+def set_sample_rate(rate: float) -> None:
+    """Fraction of frames (0-1) to trace; 0 turns tracing off"""
+    global _sample_rate
+    _sample_rate = min(max(float(rate), 0.0), 1.0)
+
+
+def get_sample_rate() -> float:
+    return _sample_rate
+
+
+def mark_frame() -> None:
+    """Called by a broker client when a frame arrives, before its ticks are published"""
+    if _sample_rate:
+        _local.frame_ns = time.monotonic_ns() if random.random() < _sample_rate else 0
+
+
+def trace_frame(broker: str) -> Optional[bytes]:
+    """Trace frame for a tick about to be published, or None if it is not traced"""
+    if not _sample_rate:
+        return None
+    frame_ns = getattr(_local, 'frame_ns', None)
+    if frame_ns is None:
+        # The adapter's client does not mark frames: sample the tick itself
+        if random.random() >= _sample_rate:
+            return None
+        frame_ns = 0
+    elif not frame_ns:
+        return None
+    return TRACE.pack(frame_ns, time.monotonic_ns()) + broker.encode('utf-8')
+
+
+def observe(trace: bytes, proxy_ns: int, send_ns: Optional[int]) -> None:
+    """Record the hop latencies of one traced tick (send_ns is None when no client got it)"""
+    try:
+        frame_ns, publish_ns = TRACE.unpack_from(trace)
+    except struct.error:
+        return
+    broker = trace[TRACE.size:].decode('utf-8', 'replace') or 'unknown'
+    latencies = []
+    if frame_ns:
+        latencies.append(('adapter', publish_ns - frame_ns))
+    latencies.append(('zmq', proxy_ns - publish_ns))
+    if send_ns is not None:
+        latencies.append(('proxy', send_ns - proxy_ns))
+        latencies.append(('total', send_ns - (frame_ns or publish_ns)))
+
+    with _hist_lock:
+        for hop, ns in latencies:
+            key = (broker, hop)
+            hist = _histograms.get(key)
+            if hist is None:
+                hist = _histograms[key] = LatencyHistogram()
+            hist.record(ns / 1e6)
+    for hop, ns in latencies:
+        FEED_HOP_LATENCY.labels(broker, hop).observe(ns / 1e9)
+
+
+def get_feed_latency_stats() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """{broker: {hop: {count, avg, p50, p90, p99, max}}} in milliseconds since start (or reset)"""
+    with _hist_lock:
+        snapshot = {key: LatencyHistogram().merge(hist) for key, hist in _histograms.items()}
+    stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for (broker, hop), hist in sorted(snapshot.items()):
+        stats.setdefault(broker, {})[hop] = {
+            'count': hist.count,
+            'avg': hist.mean,
+            **hist.percentiles((50, 90, 99)),
+            'max': hist.max or 0.0,
+        }
+    return stats
+
+
+def reset() -> None:
+    with _hist_lock:
+        _histograms.clear()
@@ -0,0 +1,134 @@
+"""
+Mergeable log-bucketed latency histogram.
+
+Values are counted in logarithmic buckets (HDR-histogram style) with a fixed
+layout, so histograms recorded anywhere can be merged by adding bucket
+counts and any percentile can be read back with a bounded relative error
+(~1% at the default precision) without keeping the raw samples.
+"""
+
+import json
+import math
+
+# Bucket layout shared by every histogram (changing it invalidates stored rollups)
+MIN_VALUE_MS = 0.01
+PRECISION = 0.02  # relative bucket width
+_LOG_BASE = math.log1p(PRECISION)
+
+
+def bucket_index(value_ms):
+    """Bucket index for a value in milliseconds (values <= MIN_VALUE_MS share bucket 0)"""
+    if value_ms <= MIN_VALUE_MS:
+        return 0
+    return int(math.log(value_ms / MIN_VALUE_MS) / _LOG_BASE) + 1
+
+
+def bucket_value(index):
+    """Representative value (geometric midpoint) of a bucket"""
+    if index <= 0:
+        return MIN_VALUE_MS
+    lower = MIN_VALUE_MS * math.exp((index - 1) * _LOG_BASE)
+    return lower * math.sqrt(1 + PRECISION)
+
+
+class LatencyHistogram:
+    """Sparse histogram of latency samples with count/sum/min/max"""
+
+    __slots__ = ('buckets', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value_ms, count=1):
+        """Record a sample (negative or None values are ignored)"""
+        if value_ms is None or value_ms < 0:
+            return
+        index = bucket_index(value_ms)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value_ms * count
+        if self.min is None or value_ms < self.min:
+            self.min = value_ms
+        if self.max is None or value_ms > self.max:
+            self.max = value_ms
+
+    def merge(self, other):
+        """Add another histogram's counts into this one"""
+        if not other.count:
+            return self
+        buckets = self.buckets
+        for index, count in other.buckets.items():
+            buckets[index] = buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if self.min is None or (other.min is not None and other.min < self.min):
+            self.min = other.min
+        if self.max is None or (other.max is not None and other.max > self.max):
+            self.max = other.max
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        """Value at the given percentile (0-100), clamped to the observed min/max"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * pct / 100.0))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                value = bucket_value(index)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentiles(self, pcts=(50, 90, 99)):
+        return {f'p{p:g}': self.percentile(p) for p in pcts}
+
+    def linear_bins(self, bin_count=30):
+        """
+        Re-bin into ``bin_count`` equal-width bins between min and max, for
+        charting. Returns (bin_edges, counts).
+        """
+        if not self.count:
+            return [], []
+        low, high = self.min, self.max
+        width = (high - low) / bin_count if high > low else 1.0
+        counts = [0] * bin_count
+        for index, count in self.buckets.items():
+            value = min(max(bucket_value(index), low), high)
+            position = min(int((value - low) / width), bin_count - 1)
+            counts[position] += count
+        edges = [low + width * i for i in range(bin_count + 1)]
+        return edges, counts
+
+    def to_dict(self):
+        return {
+            'buckets': self.buckets,
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    def to_json(self):
+        """Compact JSON of the bucket counts only (count/sum/min/max are stored as columns)"""
+        return json.dumps(self.buckets, separators=(',', ':'))
+
+    @classmethod
+    def from_parts(cls, buckets_json, count, total, min_value, max_value):
+        """Rebuild a histogram from a persisted rollup row"""
+        hist = cls()
+        if buckets_json:
+            hist.buckets = {int(k): v for k, v in json.loads(buckets_json).items()}
+        hist.count = count or 0
+        hist.total = total or 0.0
+        hist.min = min_value
+        hist.max = max_value
+        return hist
@@ -4,10 +4,21 @@ from flask import g, request
 from database.latency_db import OrderLatency, latency_session, init_latency_db
 from database.auth_db import get_broker_name
 from utils.logging import get_logger
+from utils.metrics import counter, histogram
 from flask_restx import Resource
 
 logger = get_logger(__name__)
 
+API_REQUESTS = counter('openalgo_api_requests_total', 'REST API requests by API type and outcome', ('api_type', 'status'))
+API_STAGE_SECONDS = histogram('openalgo_api_stage_seconds', 'REST API latency per order pipeline stage', ('api_type', 'stage'))
+
+def record_request_metrics(api_type, status, stage_times, total_ms):
+    """Count the request and observe per-stage latencies (stage times in ms)"""
+    API_REQUESTS.labels(api_type, status).inc()
+    for stage, duration_ms in stage_times.items():
+        API_STAGE_SECONDS.labels(api_type, stage).observe(duration_ms / 1000.0)
+    API_STAGE_SECONDS.labels(api_type, 'total').observe(total_ms / 1000.0)
+
 class LatencyTracker:
     """Helper class to track latencies across different stages of order execution"""
     
@@ -105,6 +116,9 @@ def track_latency(api_type):
                 overhead = tracker.get_overhead()
                 total = rtt + overhead
                 
+                status = 'SUCCESS' if status_code < 400 else 'FAILED'
+                record_request_metrics(api_type, status, tracker.stage_times, total)
+                
                 # Log the latency data
                 # Handle the case where orderid might be null in the response
                 order_id = response_data.get('orderid')
@@ -125,13 +139,14 @@ def track_latency(api_type):
                     latencies={
                         'rtt': rtt,  # Round-trip time (comparable to Postman/Bruno)
                         'validation': tracker.stage_times.get('validation', 0),
+                        'broker_request': tracker.stage_times.get('broker_request', 0),
                         'broker_response': tracker.stage_times.get('broker_response', 0),
                         'overhead': overhead,
                         'total': total
                     },
                     request_body=request_data,
                     response_body=response_data,
-                    status='SUCCESS' if status_code < 400 else 'FAILED',
+                    status=status,
                     error=response_data.get('message') if status_code >= 400 else None
                 )
                 
@@ -142,6 +157,7 @@ def track_latency(api_type):
                 total_time = tracker.get_total_time()
                 rtt = tracker.get_rtt()
                 overhead = tracker.get_overhead()
+                record_request_metrics(api_type, 'ERROR', tracker.stage_times, total_time)
                 
                 # Get broker name from auth_db using API key if available
                 broker_name = None
@@ -157,6 +173,7 @@ def track_latency(api_type):
                     latencies={
                         'rtt': rtt,
                         'validation': tracker.stage_times.get('validation', 0),
+                        'broker_request': tracker.stage_times.get('broker_request', 0),
                         'broker_response': 0,
                         'overhead': overhead,
                         'total': total_time
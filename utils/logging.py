@@ -1,9 +1,12 @@
+import atexit
 import logging
 import os
+import queue
 import re
 import sys
+import threading
 from datetime import datetime, timedelta
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 from pathlib import Path
 from typing import Optional
 
@@ -185,6 +188,185 @@ class ColoredFormatter(logging.Formatter):
         return original_format
 
 
+class LogSamplingFilter(logging.Filter):
+    """
+    Keep only 1 in N low-severity records for high-frequency loggers.
+
+    Rules are matched by logger name prefix (longest prefix wins). WARNING and
+    above are never sampled so errors always reach the handlers.
+    """
+
+    def __init__(self, rules: Optional[dict] = None):
+        super().__init__()
+        # Longest prefixes first so 'broker.zerodha.streaming' beats 'broker'
+        self.rules = sorted(
+            ((prefix, max(1, int(every))) for prefix, every in (rules or {}).items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+        self._every_by_logger = {}
+        self._counters = {}
+        self.sampled_out = 0
+
+    def _every_for(self, name: str) -> int:
+        every = self._every_by_logger.get(name)
+        if every is None:
+            every = 1
+            for prefix, rule_every in self.rules:
+                if name == prefix or name.startswith(prefix + '.'):
+                    every = rule_every
+                    break
+            self._every_by_logger[name] = every
+        return every
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rules:
+            return True
+
+        every = self._every_for(record.name)
+        if every == 1:
+            return True
+
+        # Counter races between threads only shift which record is kept
+        count = self._counters.get(record.name, 0)
+        self._counters[record.name] = count + 1
+        if count % every == 0:
+            return True
+
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the calling thread.
+
+    Records are enqueued unformatted; message interpolation, redaction,
+    colouring and file I/O all happen on the listener thread. When the bounded
+    queue is full the record is dropped and counted, and a single summary
+    warning is emitted once the queue has room again.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+        self._reported_drops = 0
+
+    def prepare(self, record):
+        # Listener and handlers live in this process, so the record can be
+        # passed through as-is and formatted lazily on the listener thread.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+
+        self.enqueued += 1
+        if self.dropped != self._reported_drops:
+            self._report_drops()
+
+    def _report_drops(self):
+        dropped_since = self.dropped - self._reported_drops
+        self._reported_drops = self.dropped
+        notice = logging.LogRecord(
+            name=__name__,
+            level=logging.WARNING,
+            pathname=__file__,
+            lineno=0,
+            msg="Log queue overflow: dropped %d records (total dropped: %d)",
+            args=(dropped_since, self.dropped),
+            exc_info=None,
+        )
+        try:
+            self.queue.put_nowait(notice)
+        except queue.Full:
+            # Still saturated; report again on the next successful enqueue
+            self._reported_drops -= dropped_since
+
+
+# Active async pipeline (populated by setup_logging when LOG_ASYNC is enabled)
+_queue_handler: Optional[DroppingQueueHandler] = None
+_queue_listener: Optional[QueueListener] = None
+_sampling_filter: Optional[LogSamplingFilter] = None
+_listener_lock = threading.Lock()
+
+
+def parse_sample_rules(spec: str) -> dict:
+    """
+    Parse LOG_SAMPLE_RATES into {logger_prefix: keep_every_n}.
+
+    Format: comma separated ``logger.prefix=rate`` pairs where rate is either
+    a fraction (``0.01`` keeps 1%) or an integer N (keep 1 in N).
+    """
+    rules = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        prefix, _, rate = item.partition('=')
+        prefix = prefix.strip()
+        rate = rate.strip()
+        if not prefix or not rate:
+            continue
+        try:
+            value = float(rate)
+        except ValueError:
+            continue
+        if value <= 0:
+            continue
+        every = round(1 / value) if value < 1 else int(value)
+        rules[prefix] = max(1, every)
+    return rules
+
+
+def _stop_queue_listener():
+    """Flush queued records and stop the listener thread."""
+    global _queue_listener, _queue_handler, _sampling_filter
+    with _listener_lock:
+        if _queue_listener is not None:
+            try:
+                _queue_listener.stop()
+            except Exception:
+                pass
+            for handler in _queue_listener.handlers:
+                try:
+                    handler.flush()
+                    handler.close()
+                except Exception:
+                    pass
+        _queue_listener = None
+        _queue_handler = None
+        _sampling_filter = None
+
+
+atexit.register(_stop_queue_listener)
+
+
+def get_logging_stats() -> dict:
+    """
+    Get counters for the async logging pipeline.
+
+    Returns:
+        Dictionary with async flag, queue depth/capacity, and enqueued,
+        dropped and sampled-out record counts
+    """
+    handler = _queue_handler
+    if handler is None:
+        return {'async': False}
+
+    return {
+        'async': True,
+        'queue_depth': handler.queue.qsize(),
+        'queue_capacity': handler.queue.maxsize,
+        'enqueued': handler.enqueued,
+        'dropped': handler.dropped,
+        'sampled_out': _sampling_filter.sampled_out if _sampling_filter else 0,
+    }
+
+
 def cleanup_old_logs(log_dir: Path, retention_days: int):
     """Remove log files older than retention_days."""
     if not log_dir.exists():
@@ -212,7 +394,13 @@ def setup_logging():
     log_format = os.getenv('LOG_FORMAT', '[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
     log_retention = int(os.getenv('LOG_RETENTION', '14'))
     log_colors = os.getenv('LOG_COLORS', 'True').lower() == 'true'
-    
+    log_async = os.getenv('LOG_ASYNC', 'True').lower() == 'true'
+    log_queue_size = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    log_sample_rates = os.getenv('LOG_SAMPLE_RATES', '')
+
+    # Flush and stop any pipeline left over from a previous call
+    _stop_queue_listener()
+
     # Configure root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, log_level, logging.INFO))
@@ -229,11 +417,15 @@ def setup_logging():
     # Add sensitive data filter
     sensitive_filter = SensitiveDataFilter()
     
+    # Output handlers (attached to the root logger directly, or driven by the
+    # queue listener thread in async mode)
+    output_handlers = []
+
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(console_formatter)
     console_handler.addFilter(sensitive_filter)
-    root_logger.addHandler(console_handler)
+    output_handlers.append(console_handler)
     
     # File handler (if enabled)
     if log_to_file:
@@ -254,7 +446,23 @@ def setup_logging():
         )
         file_handler.setFormatter(file_formatter)
         file_handler.addFilter(sensitive_filter)
-        root_logger.addHandler(file_handler)
+        output_handlers.append(file_handler)
+
+    if log_async:
+        # Request, order and feed threads only pay for a non-blocking
+        # put_nowait; formatting and disk/console I/O run on the listener
+        global _queue_handler, _queue_listener, _sampling_filter
+        with _listener_lock:
+            log_queue = queue.Queue(maxsize=max(1, log_queue_size))
+            _sampling_filter = LogSamplingFilter(parse_sample_rules(log_sample_rates))
+            _queue_handler = DroppingQueueHandler(log_queue)
+            _queue_handler.addFilter(_sampling_filter)
+            _queue_listener = QueueListener(log_queue, *output_handlers, respect_handler_level=True)
+            _queue_listener.start()
+        root_logger.addHandler(_queue_handler)
+    else:
+        for handler in output_handlers:
+            root_logger.addHandler(handler)
     
     # Suppress noisy third-party loggers
     logging.getLogger('werkzeug').setLevel(logging.WARNING)
@@ -367,6 +575,9 @@ def get_logger(name: str) -> logging.Logger:
         LOG_DIR: Directory for log files (default: log)
         LOG_FORMAT: Custom log format string
         LOG_RETENTION: Days to retain log files (default: 14)
+        LOG_ASYNC: Route records through a background queue listener (default: True)
+        LOG_QUEUE_SIZE: Bounded queue capacity before records are dropped (default: 10000)
+        LOG_SAMPLE_RATES: Per-logger sampling, e.g. 'broker.zerodha.streaming=0.01'
     """
     return logging.getLogger(name)
 
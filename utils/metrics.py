@@ -0,0 +1,488 @@
+"""
+Process-wide metrics registry with Prometheus/OpenMetrics text exposition.
+
+Counters, gauges and histograms are recorded on hot paths (order API, auth,
+feed fan-out, broker HTTP, sandbox engine) and scraped from ``/metrics``.
+
+Recording never takes a lock: every metric keeps one cell per thread
+(in thread-local storage), the owning thread is the only writer of its cell,
+and a scrape sums the cells. A slow scrape therefore can never stall an
+order or a tick. Locks are only taken when a new labelled child is created
+and when a thread records into a metric for the first time or ends.
+
+Existing ad-hoc statistics (symbol cache, market data service, write-behind
+sinks, ...) are exported through collectors: callables registered with
+``register_collector`` that are evaluated at scrape time.
+"""
+
+import bisect
+import math
+import re
+import threading
+import time
+import weakref
+
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Default latency buckets in seconds (0.5 ms .. 10 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Guard against unbounded label cardinality (e.g. a path used as a label)
+MAX_CHILDREN = 1000
+OVERFLOW_LABEL = '__overflow__'
+
+_NAME_RE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+_LABEL_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + '}'
+
+
+class _CellOwner:
+    """Held in a thread's local storage; its finalizer retires the thread's cell"""
+
+    __slots__ = ('__weakref__',)
+
+
+class _ThreadCells:
+    """
+    Per-thread numeric cells. ``add`` only touches the calling thread's cell
+    (held in thread-local storage), so increments from different threads
+    never contend; ``value`` sums them. When a thread (or, with eventlet, a
+    greenlet) ends, its cell is folded into a retired total, so short-lived
+    threads neither lose counts nor leave cells behind.
+    """
+
+    __slots__ = ('_local', '_cells', '_retired', '_lock', '_width')
+
+    def __init__(self, width=1):
+        self._local = threading.local()
+        self._cells = {}  # id(owner) -> cell of a live thread
+        self._retired = [0] * width
+        self._lock = threading.RLock()  # new and ending threads, scrapes (a finalizer may run inside); never taken to record
+        self._width = width
+
+    def cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            return self._new_cell()
+
+    def add(self, amount=1, index=0):
+        self.cell()[index] += amount
+
+    def _new_cell(self):
+        cell = [0] * self._width
+        owner = _CellOwner()
+        with self._lock:
+            self._cells[id(owner)] = cell
+        self._local.cell, self._local.owner = cell, owner
+        weakref.finalize(owner, self._retire, id(owner))
+        return cell
+
+    def _retire(self, key):
+        with self._lock:
+            cell = self._cells.pop(key, None)
+            if cell is not None:
+                for i, value in enumerate(cell):
+                    self._retired[i] += value
+
+    def snapshot(self):
+        """Column sums over all threads"""
+        with self._lock:
+            totals = list(self._retired)
+            for cell in list(self._cells.values()):
+                for i, value in enumerate(cell):
+                    totals[i] += value
+        return totals
+
+    def value(self):
+        return self.snapshot()[0]
+
+    def reset(self):
+        with self._lock:
+            self._local = threading.local()
+            self._cells = {}
+            self._retired = [0] * self._width
+
+
+class _CounterChild:
+    __slots__ = ('_cells',)
+
+    def __init__(self):
+        self._cells = _ThreadCells()
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError('Counters can only be incremented')
+        self._cells.add(amount)
+
+    def get(self):
+        return self._cells.value()
+
+
+class _GaugeChild:
+    __slots__ = ('_base', '_cells', '_function')
+
+    def __init__(self):
+        self._base = 0
+        self._cells = _ThreadCells()
+        self._function = None
+
+    def inc(self, amount=1):
+        self._cells.add(amount)
+
+    def dec(self, amount=1):
+        self._cells.add(-amount)
+
+    def set(self, value):
+        self._base = value - self._cells.value()
+
+    def set_function(self, function):
+        """Evaluate ``function()`` at scrape time instead of a stored value"""
+        self._function = function
+
+    def get(self):
+        if self._function is not None:
+            return self._function()
+        return self._base + self._cells.value()
+
+
+class _HistogramChild:
+    __slots__ = ('_bounds', '_cells')
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        # one slot per bucket, +Inf, then sum and count
+        self._cells = _ThreadCells(len(bounds) + 3)
+
+    def observe(self, value):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self._bounds, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def get(self):
+        """Returns (cumulative bucket counts incl. +Inf, sum, count)"""
+        totals = self._cells.snapshot()
+        cumulative = []
+        running = 0
+        for count in totals[:-2]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-2], totals[-1]
+
+
+class _Timer:
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _MetricFamily:
+    """A named metric with zero or more label dimensions"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        if not _NAME_RE.match(name):
+            raise ValueError(f'Invalid metric name: {name}')
+        for label in labelnames:
+            if not _LABEL_RE.match(label) or label.startswith('__'):
+                raise ValueError(f'Invalid label name: {label}')
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._overflow_warned = False
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        """Child metric for the given label values (positional or by name)"""
+        if kwargs:
+            values = tuple(kwargs[label] for label in self.labelnames)
+        key = tuple('' if v is None else str(v) for v in values)
+        child = self._children.get(key)
+        if child is not None:
+            return child
+        if len(key) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {key}')
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                if len(self._children) >= MAX_CHILDREN:
+                    if not self._overflow_warned:
+                        logger.warning(f"Metric {self.name} exceeded {MAX_CHILDREN} label sets; folding new ones into '{OVERFLOW_LABEL}'")
+                        self._overflow_warned = True
+                    key = (OVERFLOW_LABEL,) * len(self.labelnames)
+                    child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        """Drop a labelled child (e.g. a disconnected client)"""
+        key = tuple('' if v is None else str(v) for v in values)
+        with self._lock:
+            self._children.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._children = {}
+            if not self.labelnames:
+                self._default = self._children[()] = self._new_child()
+
+    def _child_items(self):
+        for key, child in list(self._children.items()):
+            yield dict(zip(self.labelnames, key)), child
+
+    def samples(self):
+        """Yields (sample_name, labels, value)"""
+        for labels, child in self._child_items():
+            yield self.name, labels, child.get()
+
+
+class Counter(_MetricFamily):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def get(self):
+        return self._default.get()
+
+
+class Gauge(_MetricFamily):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+    def get(self):
+        return self._default.get()
+
+    def samples(self):
+        for labels, child in self._child_items():
+            try:
+                value = child.get()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+                continue
+            yield self.name, labels, value
+
+
+class Histogram(_MetricFamily):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(float(b) for b in buckets if b != float('inf')))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def samples(self):
+        upper = [_format_value(b) for b in self.bounds] + ['+Inf']
+        for labels, child in self._child_items():
+            cumulative, total, count = child.get()
+            for le, value in zip(upper, cumulative):
+                yield f'{self.name}_bucket', {**labels, 'le': le}, value
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class MetricsRegistry:
+    """Holds metric families and scrape-time collectors"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        if not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f'Metric {name} already registered with a different type or labels')
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def register_collector(self, name, collector):
+        """
+        Register (or replace) a scrape-time collector. ``collector()`` returns an
+        iterable of ``(metric_name, type, documentation, samples)`` where samples
+        is a list of ``(labels_dict, value)``.
+        """
+        with self._lock:
+            self._collectors[name] = collector
+
+    def unregister_collector(self, name):
+        with self._lock:
+            self._collectors.pop(name, None)
+
+    def collect(self):
+        """Yields (name, type, documentation, [(sample_name, labels, value), ...])"""
+        for metric in list(self._metrics.values()):
+            yield metric.name, metric.type_name, metric.documentation, list(metric.samples())
+        for collector_name, collector in list(self._collectors.items()):
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector '{collector_name}' failed: {e}")
+                continue
+            for name, type_name, documentation, samples in families:
+                yield name, type_name, documentation, [(name, labels, value) for labels, value in samples]
+
+    def generate_latest(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for name, type_name, documentation, samples in self.collect():
+            lines.append(f'# HELP {name} {_escape_help(documentation)}')
+            lines.append(f'# TYPE {name} {type_name}')
+            for sample_name, labels, value in samples:
+                lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name, documentation, labelnames=()):
+    """Get or create a counter on the default registry"""
+    return REGISTRY.counter(name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    """Get or create a gauge on the default registry"""
+    return REGISTRY.gauge(name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Get or create a histogram on the default registry"""
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
+
+
+def register_collector(name, collector):
+    REGISTRY.register_collector(name, collector)
+
+
+def unregister_collector(name):
+    REGISTRY.unregister_collector(name)
+
+
+def generate_latest():
+    return REGISTRY.generate_latest()
+
+
+# Process-level metrics
+_PROCESS_START = time.time()
+
+
+def _collect_process():
+    yield ('openalgo_process_start_time_seconds', 'gauge',
+           'Unix time the process started', [({}, _PROCESS_START)])
+    yield ('openalgo_process_threads', 'gauge',
+           'Number of live Python threads', [({}, threading.active_count())])
+
+
+def _collect_logging():
+    from utils.logging import get_logging_stats
+    stats = get_logging_stats()
+    if not stats.get('async'):
+        return
+    yield ('openalgo_log_queue_depth', 'gauge',
+           'Records waiting in the async log queue', [({}, stats['queue_depth'])])
+    yield ('openalgo_log_records_dropped_total', 'counter',
+           'Log records dropped because the async log queue was full', [({}, stats['dropped'])])
+    yield ('openalgo_log_records_sampled_out_total', 'counter',
+           'DEBUG/INFO log records skipped by LOG_SAMPLE_RATES', [({}, stats['sampled_out'])])
+
+
+register_collector('process', _collect_process)
+register_collector('logging', _collect_logging)
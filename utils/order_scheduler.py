@@ -0,0 +1,132 @@
+"""
+Rate-budgeted scheduler for child orders (split order slices)
+
+Every broker gets one process-wide orders/second budget, shared by all
+requests sending orders to it, so two concurrent split orders cannot
+together exceed the broker's order rate. ``run_child_orders`` hands the
+children out in order, each on the next free slot of the budget (and
+optionally no earlier than ``slice_interval`` seconds after the previous
+slice, TWAP style), places them concurrently on a thread pool and reports
+each result the moment it completes.
+
+The budget comes from ``ORDER_RATE_LIMIT_<BROKER>`` (e.g.
+``ORDER_RATE_LIMIT_ZERODHA="10 per second"``) and falls back to
+``ORDER_RATE_LIMIT``.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_ORDER_RATE_LIMIT = '10 per second'
+
+_PERIODS = {'second': 1.0, 'minute': 60.0, 'hour': 3600.0}
+
+
+def parse_rate_limit(value):
+    """Orders per second of a flask-limiter style limit such as '10 per second'"""
+    try:
+        count, _, period = value.strip().lower().split()[:3]
+        return float(count) / _PERIODS[period.rstrip('s')]
+    except (AttributeError, ValueError, KeyError):
+        logger.warning(f"Invalid order rate limit '{value}', using {DEFAULT_ORDER_RATE_LIMIT}")
+        return parse_rate_limit(DEFAULT_ORDER_RATE_LIMIT)
+
+
+class RateBudget:
+    """Orders/second budget of one broker; slots are handed out in request order"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, not_before=0.0):
+        """Reserve the next send slot and return it as a time.monotonic() value"""
+        with self._lock:
+            slot = max(time.monotonic(), self._next, not_before)
+            self._next = slot + self.interval
+            return slot
+
+    def wait(self, not_before=0.0):
+        """Block until the next slot is due"""
+        delay = self.reserve(not_before) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+def get_rate_budget(broker):
+    """The process-wide budget of a broker (created on first use)"""
+    budget = _budgets.get(broker)
+    if budget is None:
+        with _budgets_lock:
+            budget = _budgets.get(broker)
+            if budget is None:
+                limit = (os.getenv(f'ORDER_RATE_LIMIT_{broker.upper()}')
+                         or os.getenv('ORDER_RATE_LIMIT', DEFAULT_ORDER_RATE_LIMIT))
+                budget = _budgets[broker] = RateBudget(parse_rate_limit(limit))
+                logger.info(f"Order rate budget for {broker}: {budget.rate:g} orders/second")
+    return budget
+
+
+def run_child_orders(children, place, budget, slice_interval=0.0, max_workers=10, on_result=None):
+    """
+    Place child orders concurrently within a rate budget
+
+    Args:
+        children: child order payloads, placed in this order
+        place: ``place(child, order_num)`` -> result dict; order_num counts from 1
+        budget: RateBudget the sends are paced by
+        slice_interval: minimum seconds between consecutive slices (0 for none)
+        max_workers: child orders in flight at once
+        on_result: optional ``on_result(result, completed)`` called from the
+            worker thread as each child finishes
+
+    Returns:
+        list of result dicts in child order
+    """
+    results = [None] * len(children)
+    if not children:
+        return results
+
+    completed = [0]
+    completed_lock = threading.Lock()
+    # a slot is only reserved once a worker is free, so queued children
+    # can never be sent in a burst behind a slow one
+    free_workers = threading.Semaphore(max_workers)
+
+    def run(index, child):
+        try:
+            result = place(child, index + 1)
+        except Exception as e:
+            logger.error(f"Error placing child order {index + 1}: {e}")
+            result = {'order_num': index + 1, 'status': 'error', 'message': str(e)}
+        finally:
+            free_workers.release()
+        results[index] = result
+        if on_result is not None:
+            with completed_lock:
+                completed[0] += 1
+                done = completed[0]
+            try:
+                on_result(result, done)
+            except Exception as e:
+                logger.error(f"Error reporting child order {index + 1}: {e}")
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(children))) as executor:
+        for index, child in enumerate(children):
+            free_workers.acquire()
+            budget.wait(start + index * slice_interval)
+            executor.submit(run, index, child)
+    return results
@@ -1,5 +1,5 @@
 from flask import request, g, has_request_context
-from database.traffic_db import TrafficLog, logs_session
+from database.traffic_db import TrafficLog
 import time
 from utils.logging import get_logger
 from utils.ip_helper import get_real_ip
@@ -16,8 +16,10 @@ class TrafficLoggerMiddleware:
         # Skip logging for:
         # 1. Static files and favicon
         # 2. Traffic monitoring endpoints themselves
+        # 3. Metrics scrapes
         if (path_info.startswith('/static/') or 
             path_info == '/favicon.ico' or 
+            path_info == '/metrics' or
             path_info.startswith('/api/v1/latency/logs') or
             path_info.startswith('/traffic/') or
             path_info.startswith('/traffic/api/')):
@@ -32,7 +34,7 @@ class TrafficLoggerMiddleware:
                 
             try:
                 duration_ms = (time.time() - start_time) * 1000
-                TrafficLog.log_request(
+                TrafficLog.log_request_async(
                     client_ip=get_real_ip(),
                     method=request.method,
                     path=request.path,
@@ -44,8 +46,6 @@ class TrafficLoggerMiddleware:
                 )
             except Exception as e:
                 logger.error(f"Error logging traffic: {e}")
-            finally:
-                logs_session.remove()
         
         # Store the original start_response to intercept the status code
         def custom_start_response(status, headers, exc_info=None):
@@ -0,0 +1,33 @@
+"""
+Entry point of the WebSocket proxy's scale-out processes, started by
+workers.start_workers:
+
+    python -m websocket_proxy feed-owner
+    python -m websocket_proxy worker INDEX HOST PORT
+"""
+
+import argparse
+
+from .feed_owner import run_feed_owner
+from .workers import run_worker
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m websocket_proxy', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('feed-owner', help='run the feed owner process')
+    worker = commands.add_parser('worker', help='run proxy worker INDEX on HOST:PORT')
+    worker.add_argument('index', type=int)
+    worker.add_argument('host')
+    worker.add_argument('port', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'feed-owner':
+        run_feed_owner()
+    else:
+        run_worker(args.index, args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
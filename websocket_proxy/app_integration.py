@@ -7,6 +7,7 @@ import signal
 import atexit
 
 from .server import main as websocket_main
+from .workers import worker_count, start_workers, stop_workers
 from utils.logging import get_logger, highlight_url
 
 # Set the correct event loop policy for Windows to avoid ZeroMQ warnings
@@ -18,6 +19,7 @@ if platform.system() == 'Windows':
 _websocket_server_started = False
 _websocket_proxy_instance = None
 _websocket_thread = None
+_websocket_workers = []  # Worker processes in scale-out mode (WEBSOCKET_WORKERS > 1)
 
 logger = get_logger(__name__)
 
@@ -44,11 +46,15 @@ def should_start_websocket():
 
 def cleanup_websocket_server():
     """Clean up WebSocket server resources - cross-platform compatible"""
-    global _websocket_proxy_instance, _websocket_thread
+    global _websocket_proxy_instance, _websocket_thread, _websocket_workers
     
     try:
         logger.info("Cleaning up WebSocket server...")
         
+        if _websocket_workers:
+            stop_workers(_websocket_workers)
+            _websocket_workers = []
+        
         if _websocket_proxy_instance:
             # For Windows compatibility, set a shutdown flag instead of trying to 
             # manipulate the event loop from a different thread
@@ -109,7 +115,23 @@ def start_websocket_server():
     Start the WebSocket proxy server in a separate thread.
     This function should be called when the Flask app starts.
     """
-    global _websocket_proxy_instance, _websocket_thread
+    global _websocket_proxy_instance, _websocket_thread, _websocket_workers
+    
+    workers = worker_count()
+    if workers > 1:
+        # Scale-out mode: the proxy runs in worker processes sharing the port instead of a thread here
+        from dotenv import load_dotenv
+        
+        load_dotenv()
+        ws_host = os.getenv('WEBSOCKET_HOST', '127.0.0.1')
+        ws_port = int(os.getenv('WEBSOCKET_PORT', '8765'))
+        try:
+            _websocket_workers = start_workers(workers, ws_host, ws_port)
+        except Exception as e:
+            logger.exception(f"Failed to start WebSocket proxy workers: {e}")
+            return None
+        atexit.register(cleanup_websocket_server)
+        return _websocket_workers
     
     logger.info("Starting WebSocket proxy server in a separate thread")
     
@@ -6,6 +6,8 @@ import socket
 import os
 from abc import ABC, abstractmethod
 from utils.logging import get_logger
+from utils.feed_latency import trace_frame
+from utils.metrics import counter
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -23,7 +25,19 @@ def is_port_available(port):
     except socket.error:
         return False
 
-def find_free_zmq_port(start_port=5556, max_attempts=50):
+# Ports picked at random start here; fixed ports (ZMQ_PORT, the feed owner's) are configured below it
+RANDOM_PORT_START = 5556
+
+
+def reserved_ports():
+    """
+    Ports adapters must never pick at random, from ZMQ_RESERVED_PORTS
+    (comma separated; set by workers.start_workers for the feed owner's ports)
+    """
+    return {int(port) for port in os.getenv('ZMQ_RESERVED_PORTS', '').split(',') if port.strip().isdigit()}
+
+
+def find_free_zmq_port(start_port=RANDOM_PORT_START, max_attempts=50):
     """
     Find an available port starting from start_port that's not already bound
     
@@ -49,15 +63,18 @@ def find_free_zmq_port(start_port=5556, max_attempts=50):
             logger.info(f"Port {port} removed from bound ports registry")
     
     # Now find a new free port
+    reserved = reserved_ports()
     for _ in range(max_attempts):
         # Try a sequential port first, then random if that fails
         if (start_port not in BaseBrokerWebSocketAdapter._bound_ports and 
+            start_port not in reserved and
             is_port_available(start_port)):
             return start_port
             
         # Try a random port between start_port and 65535
         random_port = random.randint(start_port, 65535)
         if (random_port not in BaseBrokerWebSocketAdapter._bound_ports and 
+            random_port not in reserved and
             is_port_available(random_port)):
             return random_port
             
@@ -67,6 +84,10 @@ def find_free_zmq_port(start_port=5556, max_attempts=50):
     logger.error("Failed to find an available port after maximum attempts")
     return None
 
+FEED_TICKS_PUBLISHED = counter('openalgo_feed_ticks_published_total', 'Ticks published to ZeroMQ by broker adapters', ('broker',))
+FEED_PUBLISH_ERRORS = counter('openalgo_feed_publish_errors_total', 'Ticks a broker adapter failed to publish', ('broker',))
+
+
 class BaseBrokerWebSocketAdapter(ABC):
     """
     Base class for all broker-specific WebSocket adapters that implements
@@ -74,9 +95,10 @@ class BaseBrokerWebSocketAdapter(ABC):
     """
     # Class variable to track bound ports across instances
     _bound_ports = set()
-    _port_lock = threading.Lock()
+    _port_lock = threading.RLock()  # find_free_zmq_port takes it again while _bind_to_available_port holds it
     _shared_context = None
     _context_lock = threading.Lock()
+    _bus_endpoint = None  # set in the feed owner process, where adapters publish into its bus forwarder
     
     def __init__(self):
         self.logger = get_logger("broker_adapter")
@@ -86,10 +108,14 @@ class BaseBrokerWebSocketAdapter(ABC):
             # Initialize shared ZeroMQ context
             self._initialize_shared_context()
             
-            # Create socket and bind to port
+            # Create socket and bind to port (or join the feed owner's bus, see feed_owner.py)
             self.socket = self._create_socket()
-            self.zmq_port = self._bind_to_available_port()
-            os.environ["ZMQ_PORT"] = str(self.zmq_port)
+            if self._bus_endpoint:
+                self.socket.connect(self._bus_endpoint)
+                self.zmq_port = None
+            else:
+                self.zmq_port = self._bind_to_available_port()
+                os.environ["ZMQ_PORT"] = str(self.zmq_port)
             
             # Initialize instance variables
             self.subscriptions = {}
@@ -101,16 +127,30 @@ class BaseBrokerWebSocketAdapter(ABC):
             self.logger.error(f"Error in BaseBrokerWebSocketAdapter init: {e}")
             raise
     
-    def _initialize_shared_context(self):
+    @classmethod
+    def shared_context(cls):
         """
-        Initialize shared ZeroMQ context if not already created
+        The ZeroMQ context shared by all adapters, created on first use
         """
-        with self._context_lock:
+        with cls._context_lock:
             if not BaseBrokerWebSocketAdapter._shared_context:
-                self.logger.info("Creating shared ZMQ context")
+                logger.info("Creating shared ZMQ context")
                 BaseBrokerWebSocketAdapter._shared_context = zmq.Context()
-        
-        self.context = BaseBrokerWebSocketAdapter._shared_context
+            return BaseBrokerWebSocketAdapter._shared_context
+    
+    @classmethod
+    def publish_to(cls, endpoint):
+        """
+        Make adapters created from now on connect their PUB socket to endpoint
+        (in the shared context) instead of binding a port of their own
+        """
+        BaseBrokerWebSocketAdapter._bus_endpoint = endpoint
+    
+    def _initialize_shared_context(self):
+        """
+        Initialize shared ZeroMQ context if not already created
+        """
+        self.context = self.shared_context()
     
     def _create_socket(self):
         """
@@ -131,6 +171,7 @@ class BaseBrokerWebSocketAdapter(ABC):
             default_port = int(os.getenv('ZMQ_PORT', '5555'))
             
             if (default_port not in self._bound_ports and 
+                default_port not in reserved_ports() and
                 is_port_available(default_port)):
                 try:
                     self.socket.bind(f"tcp://*:{default_port}")
@@ -142,7 +183,7 @@ class BaseBrokerWebSocketAdapter(ABC):
             
             # Find random available port
             for attempt in range(5):
-                port = find_free_zmq_port(start_port=5556 + random.randint(0, 1000))
+                port = find_free_zmq_port(start_port=RANDOM_PORT_START + random.randint(0, 1000))
                 
                 if not port:
                     self.logger.warning(f"Failed to find free port on attempt {attempt+1}")
@@ -201,7 +242,37 @@ class BaseBrokerWebSocketAdapter(ABC):
             dict: Response with status
         """
         pass
-        
+
+    def subscribe_many(self, instruments, mode=2, depth_level=5):
+        """
+        Subscribe to market data for many instruments at once
+
+        Adapters whose broker accepts several instruments per request override
+        this to resolve all tokens in one pass and send one request per batch.
+
+        Args:
+            instruments: List of (symbol, exchange) pairs
+            mode: Subscription mode - 1:LTP, 2:Quote, 3:Depth
+            depth_level: Market depth level
+
+        Returns:
+            list: One response dict per instrument, in order
+        """
+        return [self.subscribe(symbol, exchange, mode, depth_level) for symbol, exchange in instruments]
+
+    def unsubscribe_many(self, instruments, mode=2):
+        """
+        Unsubscribe from market data for many instruments at once
+
+        Args:
+            instruments: List of (symbol, exchange) pairs
+            mode: Subscription mode
+
+        Returns:
+            list: One response dict per instrument, in order
+        """
+        return [self.unsubscribe(symbol, exchange, mode) for symbol, exchange in instruments]
+
     @abstractmethod
     def connect(self):
         """
@@ -222,7 +293,7 @@ class BaseBrokerWebSocketAdapter(ABC):
         """
         try:
             # Release the port from the bound ports set
-            if hasattr(self, 'zmq_port'):
+            if getattr(self, 'zmq_port', None):
                 with self._port_lock:
                     self._bound_ports.discard(self.zmq_port)
                     self.logger.info(f"Released port {self.zmq_port}")
@@ -251,15 +322,24 @@ class BaseBrokerWebSocketAdapter(ABC):
         Publish market data to ZeroMQ subscribers
         
         Args:
-            topic: Topic string for subscriber filtering (e.g., 'NSE_RELIANCE_LTP')
+            topic: Topic string for subscriber filtering (e.g., 'NSE_RELIANCE_LTP'),
+                or the same already encoded as bytes
             data: Market data dictionary
         """
         try:
-            self.socket.send_multipart([
-                topic.encode('utf-8'),
+            frames = [
+                topic if isinstance(topic, bytes) else topic.encode('utf-8'),
                 json.dumps(data).encode('utf-8')
-            ])
+            ]
+            broker = getattr(self, 'broker_name', None) or 'unknown'
+            # Sampled ticks carry their latency trace stamps in a trailing frame (utils/feed_latency.py)
+            trace = trace_frame(broker)
+            if trace is not None:
+                frames.append(trace)
+            self.socket.send_multipart(frames)
+            FEED_TICKS_PUBLISHED.labels(broker).inc()
         except Exception as e:
+            FEED_PUBLISH_ERRORS.labels(getattr(self, 'broker_name', None) or 'unknown').inc()
             self.logger.exception(f"Error publishing market data: {e}")
     
     def _create_success_response(self, message, **kwargs):
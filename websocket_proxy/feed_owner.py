@@ -0,0 +1,314 @@
+"""
+Feed owner of the WebSocket proxy's scale-out mode (see workers.py).
+
+With WEBSOCKET_WORKERS > 1 the broker adapters do not run in the worker
+processes but in one feed owner process, so a user (or a configured feed
+account, see ``shared_feed.feed_account``) holds a single broker connection
+however many workers serve its clients, and per-API-key connection caps hold.
+
+The owner keeps one ``SharedFeed`` per feed, holding subscriptions for
+``(worker, client)`` pairs and users as ``(worker, user)`` pairs, so they are
+reference-counted across every worker. Its adapters publish into an
+in-process forwarder that fans the ticks out on one ZeroMQ bus (XPUB on
+ZMQ_PORT); every worker's SUB socket listens to that bus.
+
+Workers ask the owner to attach users and to subscribe or unsubscribe over a
+REQ socket (``FeedClient``) connected to the owner's ROUTER socket on
+WEBSOCKET_FEED_CONTROL_PORT. Requests and replies are JSON objects with an
+``op`` field; ``RemoteFeed`` is the worker-side stand-in for an owner feed.
+"""
+
+import json
+import os
+import signal
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import zmq
+
+from utils.logging import get_logger
+
+from .base_adapter import BaseBrokerWebSocketAdapter
+from .broker_factory import create_broker_adapter
+from .shared_feed import SharedFeed
+from .tick_recorder import TickRecorder
+
+logger = get_logger("websocket_proxy")
+
+BUS_FORWARDER_ENDPOINT = 'inproc://feed-bus'
+BUS_CONTROL_ENDPOINT = 'inproc://feed-bus-control'
+KEEP_ALIVE_BROKERS = ('flattrade', 'shoonya')  # brokers whose connection outlives their last user
+
+
+def control_endpoint() -> str:
+    return f"tcp://{os.getenv('ZMQ_HOST', '127.0.0.1')}:{os.getenv('WEBSOCKET_FEED_CONTROL_PORT', '5554')}"
+
+
+def bus_endpoint() -> str:
+    return f"tcp://{os.getenv('ZMQ_HOST', '127.0.0.1')}:{os.getenv('ZMQ_PORT', '5555')}"
+
+
+def _error(code: str, message: str) -> Dict[str, Any]:
+    return {'status': 'error', 'code': code, 'message': message}
+
+
+class FeedOwner:
+    """Runs the broker adapters of every worker and serves their requests"""
+
+    def __init__(self, control: str, bus: str):
+        self.control = control
+        self.bus = bus
+        self.feeds: Dict[Tuple[str, str], SharedFeed] = {}
+        self._stop = threading.Event()
+        self._forwarder = None
+        self._forwarder_control = None
+
+    def start_bus(self) -> None:
+        """Bind the bus and forward everything the adapters of this process publish onto it"""
+        context = BaseBrokerWebSocketAdapter.shared_context()
+        frontend = context.socket(zmq.XSUB)
+        frontend.bind(BUS_FORWARDER_ENDPOINT)
+        backend = context.socket(zmq.XPUB)
+        backend.setsockopt(zmq.LINGER, 0)
+        backend.bind(self.bus)
+        control = context.socket(zmq.PAIR)
+        control.bind(BUS_CONTROL_ENDPOINT)
+        self._forwarder_control = context.socket(zmq.PAIR)
+        self._forwarder_control.connect(BUS_CONTROL_ENDPOINT)
+        BaseBrokerWebSocketAdapter.publish_to(BUS_FORWARDER_ENDPOINT)
+
+        def forward():
+            try:
+                zmq.proxy_steerable(frontend, backend, None, control)
+            except zmq.ContextTerminated:
+                pass
+            finally:
+                for socket in (frontend, backend, control):
+                    socket.close(linger=0)
+
+        self._forwarder = threading.Thread(target=forward, name='feed-bus', daemon=True)
+        self._forwarder.start()
+        logger.info(f"Feed owner publishing on {self.bus}")
+
+    def serve(self) -> None:
+        """Answer worker requests until ``stop`` is called"""
+        context = zmq.Context.instance()
+        socket = context.socket(zmq.ROUTER)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.bind(self.control)
+        logger.info(f"Feed owner serving workers on {self.control}")
+        try:
+            while not self._stop.is_set():
+                if not socket.poll(200):
+                    continue
+                identity, empty, payload = socket.recv_multipart()
+                try:
+                    reply = self.handle(json.loads(payload))
+                except Exception as e:
+                    logger.exception(f"Error handling feed request: {e}")
+                    reply = _error('FEED_OWNER_ERROR', str(e))
+                socket.send_multipart([identity, empty, json.dumps(reply, default=str).encode('utf-8')])
+        finally:
+            socket.close()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def close(self) -> None:
+        """Disconnect every feed and stop the bus"""
+        for feed in self.feeds.values():
+            try:
+                feed.disconnect()
+            except Exception as e:
+                logger.error(f"Error disconnecting the {feed.broker_name} feed: {e}")
+        self.feeds.clear()
+        if self._forwarder is not None:
+            self._forwarder_control.send(b'TERMINATE')
+            self._forwarder.join(timeout=5)
+            self._forwarder_control.close(linger=0)
+            self._forwarder = self._forwarder_control = None
+            BaseBrokerWebSocketAdapter.publish_to(None)
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get('op')
+        worker = request.get('worker')
+        if op == 'detach_worker':
+            self._detach_worker(worker)
+            return {'status': 'success'}
+
+        key = tuple(request.get('feed') or ())
+        if op == 'attach':
+            return self._attach(key, request.get('account'), (worker, request['user']))
+
+        feed = self.feeds.get(key)
+        if feed is None:
+            return _error('FEED_NOT_FOUND', f"No feed for {'/'.join(map(str, key))}")
+        if op == 'detach':
+            if feed.detach((worker, request['user'])):
+                self._release(key, feed)
+            return {'status': 'success'}
+
+        client = (worker, request['client'])
+        instruments = [tuple(instrument) for instrument in request['instruments']]
+        if op == 'subscribe_many':
+            responses = feed.subscribe_many(client, instruments, request['mode'], request.get('depth', 5))
+        elif op == 'unsubscribe_many':
+            responses = feed.unsubscribe_many(client, instruments, request['mode'])
+        else:
+            return _error('INVALID_ACTION', f"Invalid feed request: {op}")
+        return {'status': 'success', 'responses': responses}
+
+    def _attach(self, key: Tuple[str, str], account: Optional[str], user: Tuple[int, Hashable]) -> Dict[str, Any]:
+        feed = self.feeds.get(key)
+        if feed is None:
+            broker_name, feed_user = key
+            adapter = create_broker_adapter(broker_name)
+            if not adapter:
+                return _error('BROKER_ERROR', f"Failed to create adapter for broker: {broker_name}")
+
+            result = adapter.initialize(broker_name, feed_user)
+            if result and not result.get('success', True):
+                return _error('BROKER_INIT_ERROR', result.get('error', 'Failed to initialize broker adapter'))
+            result = adapter.connect()
+            if result and not result.get('success', True):
+                return _error('BROKER_CONNECTION_ERROR', result.get('error', 'Failed to connect to broker'))
+
+            feed = self.feeds[key] = SharedFeed(broker_name, adapter, account)
+            logger.info(f"Feed owner connected the {broker_name} feed of {feed_user}")
+        feed.attach(user)
+        return {'status': 'success'}
+
+    def _release(self, key: Tuple[str, str], feed: SharedFeed) -> None:
+        """Handle a feed whose last user (in any worker) left"""
+        if feed.broker_name in KEEP_ALIVE_BROKERS and hasattr(feed.adapter, 'unsubscribe_all'):
+            logger.info(f"Last user of the {feed.broker_name} feed of {key[1]} left. Unsubscribing all symbols instead of disconnecting.")
+            feed.unsubscribe_all()
+        else:
+            logger.info(f"Last user of the {feed.broker_name} feed of {key[1]} left. Disconnecting the adapter.")
+            feed.disconnect()
+            del self.feeds[key]
+
+    def _detach_worker(self, worker) -> None:
+        """Drop every subscription and user a worker holds (it is shutting down)"""
+        for key, feed in list(self.feeds.items()):
+            for (symbol, exchange), modes in list(feed.holders.items()):
+                for mode, clients in list(modes.items()):
+                    for client in [client for client in clients if client[0] == worker]:
+                        feed.unsubscribe(client, symbol, exchange, mode)
+            for user in [user for user in feed.users if user[0] == worker]:
+                if feed.detach(user):
+                    self._release(key, feed)
+
+
+class FeedClient:
+    """A worker's connection to the feed owner (one request at a time, from the worker's feed thread)"""
+
+    def __init__(self, worker: int, endpoint: Optional[str] = None, timeout: float = None):
+        self.worker = worker
+        self.endpoint = endpoint or control_endpoint()
+        self.timeout_ms = int((timeout or float(os.getenv('WEBSOCKET_FEED_TIMEOUT', '30'))) * 1000)
+        self.context = zmq.Context.instance()
+        self.lock = threading.Lock()
+        self.socket = None
+        self._connect()
+
+    def _connect(self) -> None:
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(self.endpoint)
+
+    def request(self, op: str, timeout_ms: Optional[int] = None, **fields) -> Dict[str, Any]:
+        """Send one request to the feed owner and wait for its reply"""
+        with self.lock:
+            self.socket.send(json.dumps({'op': op, 'worker': self.worker, **fields}).encode('utf-8'))
+            if self.socket.poll(timeout_ms or self.timeout_ms):
+                return json.loads(self.socket.recv())
+            # A REQ socket cannot send again before its reply arrives, so start over on a new one
+            logger.error(f"Feed owner did not answer {op} in time")
+            self.socket.close()
+            self._connect()
+            return _error('FEED_OWNER_TIMEOUT', 'The feed owner did not answer in time')
+
+    def close(self) -> None:
+        """Release this worker's subscriptions and users in the owner"""
+        self.request('detach_worker', timeout_ms=1000)
+        self.socket.close()
+
+
+class RemoteFeed:
+    """
+    Worker-side stand-in for a feed held by the feed owner, with the
+    client-keyed interface of ``SharedFeed``. ``account`` is the feed's
+    account, or the user it belongs to when it is not shared.
+    """
+
+    def __init__(self, client: FeedClient, broker_name: str, account: str):
+        self.client = client
+        self.broker_name = broker_name
+        self.account = account
+        self.users = set()
+
+    @property
+    def status(self):
+        return 'connected'
+
+    def attach(self, user_id) -> Dict[str, Any]:
+        response = self.client.request('attach', feed=[self.broker_name, self.account], account=self.account,
+                                       user=user_id)
+        if response.get('status') == 'success':
+            self.users.add(user_id)
+        return response
+
+    def detach(self, user_id) -> bool:
+        """Unregister a user; True when no user of this worker is left on the feed"""
+        self.users.discard(user_id)
+        self.client.request('detach', feed=[self.broker_name, self.account], user=user_id)
+        return not self.users
+
+    def subscribe(self, client_id, symbol: str, exchange: str, mode: int = 2, depth_level: int = 5) -> Dict[str, Any]:
+        return self.subscribe_many(client_id, [(symbol, exchange)], mode, depth_level)[0]
+
+    def unsubscribe(self, client_id, symbol: str, exchange: str, mode: int = 2) -> Dict[str, Any]:
+        return self.unsubscribe_many(client_id, [(symbol, exchange)], mode)[0]
+
+    def subscribe_many(self, client_id, instruments: List[Tuple[str, str]], mode: int = 2,
+                       depth_level: int = 5) -> List[Dict[str, Any]]:
+        return self._many('subscribe_many', client_id, instruments, mode=mode, depth=depth_level)
+
+    def unsubscribe_many(self, client_id, instruments: List[Tuple[str, str]], mode: int = 2) -> List[Dict[str, Any]]:
+        return self._many('unsubscribe_many', client_id, instruments, mode=mode)
+
+    def disconnect(self):
+        """Forget the worker's users; the owner drops their holds when the worker's FeedClient closes"""
+        self.users.clear()
+
+    def _many(self, op, client_id, instruments, **fields) -> List[Dict[str, Any]]:
+        response = self.client.request(op, feed=[self.broker_name, self.account], client=client_id,
+                                       instruments=[list(instrument) for instrument in instruments], **fields)
+        if response.get('status') != 'success':
+            return [response for _ in instruments]
+        return response['responses']
+
+
+def run_feed_owner() -> None:
+    """Entry point of the feed owner process"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    owner = FeedOwner(control_endpoint(), bus_endpoint())
+    signal.signal(signal.SIGTERM, lambda signum, frame: owner.stop())
+    owner.start_bus()
+
+    # Record the bus once here rather than in every worker
+    record_dir = os.getenv('TICK_RECORD_DIR')
+    recorder = TickRecorder(record_dir, owner.bus) if record_dir else None
+    if recorder:
+        recorder.start()
+    try:
+        owner.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        owner.close()
+        if recorder:
+            recorder.stop()
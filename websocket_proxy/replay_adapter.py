@@ -0,0 +1,159 @@
+"""
+Broker adapter that publishes recorded ticks instead of a live broker feed.
+
+Plays back the segment files written by ``TickRecorder`` onto the ZeroMQ bus
+exactly as they were recorded, paced by their receive timestamps: at 1x
+(real time), Nx, or as fast as possible (speed 0). Only the topics clients
+subscribed to are published, so the proxy sees what a live adapter would
+have sent for the same subscriptions.
+
+Configuration comes from ``auth_data`` passed to ``initialize`` (keys
+``path``, ``speed``, ``loop``) or from TICK_REPLAY_PATH, TICK_REPLAY_SPEED
+and TICK_REPLAY_LOOP.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from utils.logging import get_logger
+
+from .base_adapter import BaseBrokerWebSocketAdapter, FEED_PUBLISH_ERRORS, FEED_TICKS_PUBLISHED
+from .tick_recorder import read_segments, segment_files
+
+MODE_NAMES = {1: 'LTP', 2: 'QUOTE', 3: 'DEPTH'}
+
+
+def parse_speed(value) -> float:
+    """Replay speed factor; 0 (or 'max') publishes without pacing"""
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ('max', ''):
+            return 0.0
+        value = value[:-1] if value.endswith('x') else value
+    speed = float(value)
+    if speed < 0:
+        raise ValueError(f"Replay speed must be positive or 0, got {value}")
+    return speed
+
+
+class ReplayWebSocketAdapter(BaseBrokerWebSocketAdapter):
+    """Replays recorded ZeroMQ tick segments as if they came from a broker"""
+
+    def __init__(self):
+        super().__init__()
+        self.logger = get_logger("replay_adapter")
+        self.broker_name = 'replay'
+        self.user_id = None
+        self.segments = []
+        self.speed = 1.0
+        self.loop = False
+        self.published = 0
+
+        # 'EXCHANGE_SYMBOL_MODE' topics (as bytes) clients are subscribed to
+        self.subscriptions: Dict[bytes, Dict] = {}
+        # Recorded topic -> whether it is subscribed; reset when subscriptions change
+        self._topic_matches: Dict[bytes, bool] = {}
+        self._subscribed = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def initialize(self, broker_name, user_id, auth_data=None):
+        config = auth_data or {}
+        self.user_id = user_id
+        path = config.get('path') or os.getenv('TICK_REPLAY_PATH', '')
+        if not path:
+            return {'success': False, 'error': 'No tick recording to replay (set TICK_REPLAY_PATH)'}
+
+        self.segments = segment_files(path)
+        if not self.segments:
+            return {'success': False, 'error': f'No tick segments found at {path}'}
+        try:
+            self.speed = parse_speed(config.get('speed', os.getenv('TICK_REPLAY_SPEED', '1')))
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}
+        loop = config.get('loop', os.getenv('TICK_REPLAY_LOOP', 'False'))
+        self.loop = loop if isinstance(loop, bool) else str(loop).lower() == 'true'
+
+        self.logger.info(f"Replaying {len(self.segments)} tick segment(s) from {path} at "
+                         f"{f'{self.speed:g}x' if self.speed else 'max'} speed for user {user_id}")
+        return {'success': True}
+
+    def connect(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='tick-replay', daemon=True)
+            self._thread.start()
+        return {'success': True}
+
+    def disconnect(self):
+        self._stop.set()
+        self._subscribed.set()  # wake a replay still waiting for its first subscription
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.cleanup_zmq()
+
+    def subscribe(self, symbol, exchange, mode=2, depth_level=5):
+        if mode not in MODE_NAMES:
+            return self._create_error_response('INVALID_MODE', f'Invalid mode {mode}. Must be 1 (LTP), 2 (Quote), or 3 (Depth)')
+
+        topic = f"{exchange}_{symbol}_{MODE_NAMES[mode]}".encode('utf-8')
+        self.subscriptions[topic] = {'symbol': symbol, 'exchange': exchange, 'mode': mode,
+                                     'depth_level': depth_level}
+        self._topic_matches = {}
+        self._subscribed.set()
+        return self._create_success_response(f'Subscribed to {symbol}.{exchange} (replay)', symbol=symbol,
+                                             exchange=exchange, mode=mode, actual_depth=depth_level)
+
+    def unsubscribe(self, symbol, exchange, mode=2):
+        topic = f"{exchange}_{symbol}_{MODE_NAMES.get(mode, mode)}".encode('utf-8')
+        if self.subscriptions.pop(topic, None) is None:
+            return self._create_error_response('NOT_SUBSCRIBED', f'Not subscribed to {symbol}.{exchange}')
+        self._topic_matches = {}
+        return self._create_success_response(f'Unsubscribed from {symbol}.{exchange}', symbol=symbol,
+                                             exchange=exchange, mode=mode)
+
+    def _wanted(self, topic: bytes) -> bool:
+        """Whether a recorded topic ('EXCHANGE_SYMBOL_MODE', possibly broker-prefixed) is subscribed"""
+        matches = self._topic_matches
+        wanted = matches.get(topic)
+        if wanted is None:
+            wanted = any(topic == key or topic.endswith(b'_' + key) for key in list(self.subscriptions))
+            matches[topic] = wanted
+        return wanted
+
+    def _run(self):
+        # Start the clock with the first subscription rather than on connect, so nothing is
+        # played to an empty room
+        self._subscribed.wait()
+        send = self.socket.send_multipart
+        published = FEED_TICKS_PUBLISHED.labels(self.broker_name)
+        try:
+            while not self._stop.is_set():
+                start_ns = time.perf_counter_ns()
+                first_ns = None
+                for ts_ns, topic, payload in read_segments(self.segments):
+                    if self._stop.is_set():
+                        return
+                    if self.speed:
+                        if first_ns is None:
+                            first_ns = ts_ns
+                        delay = (ts_ns - first_ns) / self.speed - (time.perf_counter_ns() - start_ns)
+                        if delay > 0 and self._stop.wait(delay / 1e9):
+                            return
+                    if self._wanted(topic):
+                        try:
+                            send([topic, payload])
+                        except Exception as e:
+                            FEED_PUBLISH_ERRORS.labels(self.broker_name).inc()
+                            self.logger.error(f"Error publishing replayed tick: {e}")
+                            continue
+                        published.inc()
+                        self.published += 1
+                if not self.loop:
+                    break
+            self.logger.info(f"Tick replay finished: {self.published} ticks published")
+        except Exception as e:
+            self.logger.exception(f"Tick replay stopped on error: {e}")
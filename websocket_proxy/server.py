@@ -9,7 +9,8 @@ import threading
 import time
 import os
 import socket
-from typing import Dict, Set, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Set, Any, NamedTuple, Optional
 from dotenv import load_dotenv
 
 from .port_check import is_port_in_use, find_available_port
@@ -17,11 +18,39 @@ from database.auth_db import get_broker_name
 from sqlalchemy import text
 from database.auth_db import verify_api_key
 from .broker_factory import create_broker_adapter
-from .base_adapter import BaseBrokerWebSocketAdapter
+from .base_adapter import BaseBrokerWebSocketAdapter, FEED_TICKS_PUBLISHED
+from .shared_feed import SharedFeed, feed_account
+from .feed_owner import FeedClient, RemoteFeed
+from .tick_recorder import TickRecorder
+from .workers import worker_count, start_workers, stop_workers
+from utils.feed_latency import observe as observe_trace
+from utils.metrics import counter, gauge, histogram, register_collector
 
 # Initialize logger
 logger = get_logger("websocket_proxy")
 
+# Feed metrics
+FEED_TICKS_RECEIVED = counter('openalgo_feed_ticks_received_total', 'Ticks received by the proxy from ZeroMQ', ('broker',))
+FEED_TICKS_SENT = counter('openalgo_feed_ticks_sent_total', 'Market data frames sent to WebSocket clients', ('broker',))
+FEED_DROPPED_FRAMES = counter('openalgo_feed_dropped_frames_total', 'Market data frames dropped by the proxy', ('reason',))
+FEED_SEND_SECONDS = histogram('openalgo_feed_client_send_seconds', 'Time to write one market data frame to a client',
+                              buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.25, 1.0))
+FEED_CLIENT_SEND_LAG = gauge('openalgo_feed_client_send_lag_seconds', 'Duration of the last market data write per client', ('client',))
+
+
+class Subscription(NamedTuple):
+    """A client's subscription, stored under its (symbol, exchange, mode) key"""
+    symbol: str
+    exchange: str
+    mode: Any
+    depth_level: int
+    broker: str
+
+
+# Feeds that hold subscriptions per client (the adapter itself does not know the proxy's clients)
+CLIENT_HELD_FEEDS = (SharedFeed, RemoteFeed)
+
+
 class WebSocketProxy:
     """
     WebSocket Proxy Server that handles client connections and authentication,
@@ -29,19 +58,26 @@ class WebSocketProxy:
     Supports dynamic broker selection based on user configuration.
     """
     
-    def __init__(self, host: str = "127.0.0.1", port: int = 8765):
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, worker_id: Optional[int] = None,
+                 feed_owner: Optional[FeedClient] = None):
         """
         Initialize the WebSocket Proxy
         
         Args:
             host: Hostname to bind the WebSocket server to
             port: Port number to bind the WebSocket server to
+            worker_id: Index of this process in scale-out mode (see workers.py), None when running alone
+            feed_owner: Connection to the process running the broker adapters in scale-out mode
+                (see feed_owner.py); None runs the adapters in this process
         """
         self.host = host
         self.port = port
+        self.worker_id = worker_id
+        self.feed_owner = feed_owner
         
         # Check if the required port is already in use - wait briefly for cleanup to complete
-        if is_port_in_use(host, port, wait_time=2.0):  # Wait up to 2 seconds for port release
+        # (workers share the port with their siblings; the launcher checked it before starting them)
+        if worker_id is None and is_port_in_use(host, port, wait_time=2.0):  # Wait up to 2 seconds for port release
             error_msg = (
                 f"WebSocket port {port} is already in use on {host}.\n"
                 f"This port is required for SDK compatibility (see strategies/ltp_example.py).\n"
@@ -55,12 +91,26 @@ class WebSocketProxy:
             raise RuntimeError(error_msg)
         
         self.clients = {}  # Maps client_id to websocket connection
-        self.subscriptions = {}  # Maps client_id to set of subscriptions
-        self.broker_adapters = {}  # Maps user_id to broker adapter
+        self.subscriptions = {}  # Maps client_id to {(symbol, exchange, mode): Subscription}
+        self.broker_adapters = {}  # Maps user_id to broker adapter (a SharedFeed in shared-feed mode)
         self.user_mapping = {}  # Maps client_id to user_id
         self.user_broker_mapping = {}  # Maps user_id to broker_name
         self.running = False
         
+        # Shared-feed mode: one adapter per configured broker feed account serves the users entitled
+        # to it, with subscriptions reference-counted across clients
+        self.shared_feed = os.getenv('WEBSOCKET_SHARED_FEED', 'False').lower() == 'true'
+        self.shared_feeds = {}  # Maps (broker_name, feed account) to SharedFeed (to RemoteFeed, also per user, in a worker)
+        
+        # Serve every user from recorded ticks instead of their broker (see replay_adapter.py)
+        self.replay = bool(os.getenv('TICK_REPLAY_PATH'))
+        
+        # API key verification (Argon2) and broker lookups block, so they run off the event loop
+        self.auth_executor = ThreadPoolExecutor(max_workers=int(os.getenv('WEBSOCKET_AUTH_THREADS', '4')),
+                                                thread_name_prefix='ws-auth')
+        # Requests to the feed owner wait for its reply; one thread keeps them in the order they were made
+        self.feed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ws-feed')
+        
         # ZeroMQ context for subscribing to broker adapters
         self.context = zmq.asyncio.Context()
         self.socket = self.context.socket(zmq.SUB)
@@ -71,6 +121,39 @@ class WebSocketProxy:
         
         # Set up ZeroMQ subscriber to receive all messages
         self.socket.setsockopt(zmq.SUBSCRIBE, b"")  # Subscribe to all topics
+        
+        # Optionally tap the same bus into daily tick segment files
+        record_dir = os.getenv('TICK_RECORD_DIR')
+        self.recorder = TickRecorder(record_dir, f"tcp://{ZMQ_HOST}:{ZMQ_PORT}") if record_dir else None
+        
+        register_collector('websocket_proxy', self.collect_metrics)
+    
+    def collect_metrics(self):
+        """Scrape-time feed metrics: client count, buffered bytes per client and ZMQ backlog"""
+        clients = list(self.clients.items())
+        yield ('openalgo_feed_clients', 'gauge', 'Connected WebSocket clients', [({}, len(clients))])
+        buffered = []
+        for client_id, websocket in clients:
+            transport = getattr(websocket, 'transport', None)
+            if transport is not None:
+                try:
+                    buffered.append(({'client': str(client_id)}, transport.get_write_buffer_size()))
+                except Exception:
+                    continue
+        if buffered:
+            yield ('openalgo_feed_client_buffered_bytes', 'gauge',
+                   'Bytes queued in a client socket write buffer (send backlog)', buffered)
+        # Adapters publish from this process, so published - received is the ZMQ backlog
+        # (workers get their ticks from the feed owner's process, see feed_owner.py)
+        if self.feed_owner is not None:
+            return
+        backlog = 0
+        for _, labels, value in FEED_TICKS_PUBLISHED.samples():
+            backlog += value
+        for _, labels, value in FEED_TICKS_RECEIVED.samples():
+            backlog -= value
+        yield ('openalgo_feed_zmq_backlog', 'gauge',
+               'Ticks published to ZeroMQ but not yet consumed by the proxy (includes HWM drops)', [({}, max(backlog, 0))])
     
     async def start(self):
         """Start the WebSocket server and ZeroMQ listener"""
@@ -86,6 +169,9 @@ class WebSocketProxy:
             # Create the ZMQ listener task
             zmq_task = loop.create_task(self.zmq_listener())
             
+            if self.recorder:
+                self.recorder.start()
+            
             # Start WebSocket server
             stop = aio.Future()  # Used to stop the server
             
@@ -132,7 +218,8 @@ class WebSocketProxy:
                 )
                 
                 highlighted_success_address = highlight_url(f"{self.host}:{self.port}")
-                logger.info(f"WebSocket server successfully started on {highlighted_success_address}")
+                worker = f" (worker {self.worker_id})" if self.worker_id is not None else ""
+                logger.info(f"WebSocket server successfully started on {highlighted_success_address}{worker}")
                 
                 await stop  # Wait until stopped
                 
@@ -198,12 +285,27 @@ class WebSocketProxy:
                 except asyncio.TimeoutError:
                     logger.warning("Timeout waiting for client connections to close")
             
-            # Disconnect all broker adapters
-            for user_id, adapter in self.broker_adapters.items():
+            # Release this worker's subscriptions in the feed owner, which runs its adapters
+            if self.feed_owner is not None:
+                try:
+                    await aio.get_running_loop().run_in_executor(self.feed_executor, self.feed_owner.close)
+                except Exception as e:
+                    logger.error(f"Error releasing the worker's feeds: {e}")
+            
+            # Disconnect all broker adapters (a shared feed once, whatever the number of its users)
+            adapters = {id(adapter): (user_id, adapter) for user_id, adapter in self.broker_adapters.items()}
+            for user_id, adapter in adapters.values():
                 try:
                     adapter.disconnect()
                 except Exception as e:
                     logger.error(f"Error disconnecting adapter for user {user_id}: {e}")
+            self.shared_feeds.clear()
+            
+            if self.recorder:
+                self.recorder.stop()
+            
+            self.auth_executor.shutdown(wait=False)
+            self.feed_executor.shutdown(wait=False)
             
             # Close ZeroMQ socket with linger=0 for immediate close
             if hasattr(self, 'socket') and self.socket:
@@ -234,7 +336,7 @@ class WebSocketProxy:
         """
         client_id = id(websocket)
         self.clients[client_id] = websocket
-        self.subscriptions[client_id] = set()
+        self.subscriptions[client_id] = {}
         
         # Get path info from websocket if available
         path = getattr(websocket, 'path', '/unknown')
@@ -271,31 +373,21 @@ class WebSocketProxy:
         # Remove client from tracking
         if client_id in self.clients:
             del self.clients[client_id]
+        FEED_CLIENT_SEND_LAG.remove(str(client_id))
         
         # Clean up subscriptions
         if client_id in self.subscriptions:
-            subscriptions = self.subscriptions[client_id]
-            # Unsubscribe from all subscriptions
-            for sub_json in subscriptions:
-                try:
-                    # Parse the JSON string to get the subscription info
-                    sub_info = json.loads(sub_json)
-                    symbol = sub_info.get('symbol')
-                    exchange = sub_info.get('exchange')
-                    mode = sub_info.get('mode')
-                    
-                    # Get the user's broker adapter
-                    user_id = self.user_mapping.get(client_id)
-                    if user_id and user_id in self.broker_adapters:
-                        adapter = self.broker_adapters[user_id]
-                        adapter.unsubscribe(symbol, exchange, mode)
-                except json.JSONDecodeError as e:
-                    logger.exception(f"Error parsing subscription: {sub_json}, Error: {e}")
-                except Exception as e:
-                    logger.exception(f"Error processing subscription: {e}")
-                    continue
+            subscriptions = self.subscriptions.pop(client_id)
             
-            del self.subscriptions[client_id]
+            # Unsubscribe from all subscriptions through the user's broker adapter, one batch per mode
+            user_id = self.user_mapping.get(client_id)
+            if subscriptions and user_id and user_id in self.broker_adapters:
+                adapter = self.broker_adapters[user_id]
+                for mode, instruments in self._group_by_mode(subscriptions.values()).items():
+                    try:
+                        await self._adapter_unsubscribe_many(adapter, client_id, instruments, mode)
+                    except Exception as e:
+                        logger.exception(f"Error processing subscriptions: {e}")
         
         # Remove from user mapping
         if client_id in self.user_mapping:
@@ -313,8 +405,14 @@ class WebSocketProxy:
                 adapter = self.broker_adapters[user_id]
                 broker_name = self.user_broker_mapping.get(user_id)
 
+                if isinstance(adapter, CLIENT_HELD_FEEDS):
+                    # The feed stays up while other users are on it
+                    del self.broker_adapters[user_id]
+                    self.user_broker_mapping.pop(user_id, None)
+                    if await self._feed_call(adapter, 'detach', user_id):
+                        self._release_shared_feed(adapter)
                 # For Flattrade and Shoonya, keep the connection alive and just unsubscribe from data
-                if broker_name in ['flattrade', 'shoonya'] and hasattr(adapter, 'unsubscribe_all'):
+                elif broker_name in ['flattrade', 'shoonya'] and hasattr(adapter, 'unsubscribe_all'):
                     logger.info(f"{broker_name.title()} adapter for user {user_id}: last client disconnected. Unsubscribing all symbols instead of disconnecting.")
                     adapter.unsubscribe_all()
                 else:
@@ -444,18 +542,23 @@ class WebSocketProxy:
             return
         
         # Verify the API key and get the user ID
-        user_id = verify_api_key(api_key)
+        loop = aio.get_running_loop()
+        user_id = await loop.run_in_executor(self.auth_executor, verify_api_key, api_key)
         
         if not user_id:
             await self.send_error(client_id, "AUTHENTICATION_ERROR", "Invalid API key")
             return
         
+        # Get broker name
+        broker_name = 'replay' if self.replay else await loop.run_in_executor(self.auth_executor, get_broker_name, api_key)
+        
+        # The client may have disconnected (and been cleaned up) while the lookups ran
+        if client_id not in self.subscriptions:
+            return
+        
         # Store the user mapping
         self.user_mapping[client_id] = user_id
         
-        # Get broker name
-        broker_name = get_broker_name(api_key)
-        
         if not broker_name:
             await self.send_error(client_id, "BROKER_ERROR", "No broker configuration found for user")
             return
@@ -463,6 +566,34 @@ class WebSocketProxy:
         # Store the broker mapping for this user
         self.user_broker_mapping[user_id] = broker_name
         
+        # Join the shared feed of the broker's feed account when the user is entitled to it
+        # (a worker joins it through the feed owner below)
+        account = feed_account(broker_name, user_id) if self.shared_feed else None
+        if (account and self.feed_owner is None and user_id not in self.broker_adapters
+                and (broker_name, account) in self.shared_feeds):
+            feed = self.shared_feeds[(broker_name, account)]
+            feed.attach(user_id)
+            self.broker_adapters[user_id] = feed
+            logger.info(f"User {user_id} joined the shared {broker_name} feed of {account} ({len(feed.users)} users)")
+        
+        # In a worker the feed owner process runs the adapter, shared with the user's clients in other workers
+        if self.feed_owner is not None and user_id not in self.broker_adapters:
+            key = (broker_name, account or user_id)
+            feed = self.shared_feeds.get(key) or RemoteFeed(self.feed_owner, *key)
+            result = await self._feed_call(feed, 'attach', user_id)
+            if client_id not in self.subscriptions:
+                # Disconnected while attaching: release the user unless another of their clients is on
+                if user_id not in self.user_mapping.values():
+                    if await self._feed_call(feed, 'detach', user_id) and self.shared_feeds.get(key) is feed:
+                        self._release_shared_feed(feed)
+                return
+            if result.get('status') != 'success':
+                await self.send_error(client_id, result.get('code', 'BROKER_ERROR'),
+                                      result.get('message', f"Failed to create adapter for broker: {broker_name}"))
+                return
+            self.shared_feeds[key] = feed
+            self.broker_adapters[user_id] = feed
+        
         # Create or reuse broker adapter
         if user_id not in self.broker_adapters:
             try:
@@ -474,7 +605,7 @@ class WebSocketProxy:
                 
                 # Initialize adapter with broker configuration
                 # The adapter's initialize method should handle broker-specific setup
-                initialization_result = adapter.initialize(broker_name, user_id)
+                initialization_result = adapter.initialize(broker_name, account or user_id)
                 if initialization_result and not initialization_result.get('success', True):
                     error_msg = initialization_result.get('error', 'Failed to initialize broker adapter')
                     await self.send_error(client_id, "BROKER_INIT_ERROR", error_msg)
@@ -488,6 +619,10 @@ class WebSocketProxy:
                     return
                 
                 # Store the adapter
+                if account:
+                    adapter = SharedFeed(broker_name, adapter, account)
+                    adapter.attach(user_id)
+                    self.shared_feeds[(broker_name, account)] = adapter
                 self.broker_adapters[user_id] = adapter
                 
                 logger.info(f"Successfully created and connected {broker_name} adapter for user {user_id}")
@@ -614,34 +749,27 @@ class WebSocketProxy:
         adapter = self.broker_adapters[user_id]
         broker_name = self.user_broker_mapping.get(user_id, "unknown")
         
-        # Process each symbol in the subscription request
+        # Subscribe to every valid symbol of the request in one batch
+        instruments = [(symbol_info.get("symbol"), symbol_info.get("exchange")) for symbol_info in symbols]
+        instruments = [(symbol, exchange) for symbol, exchange in instruments if symbol and exchange]  # Skip invalid symbols
+        responses = await self._adapter_subscribe_many(adapter, client_id, instruments, mode, depth_level) if instruments else []
+        
+        # The client may have disconnected (and been cleaned up) while the feed owner subscribed
+        if client_id not in self.subscriptions:
+            subscribed = [instrument for instrument, response in zip(instruments, responses)
+                          if response.get("status") == "success"]
+            if subscribed:
+                await self._adapter_unsubscribe_many(adapter, client_id, subscribed, mode)
+            return
+        
+        client_subscriptions = self.subscriptions.setdefault(client_id, {})
         subscription_responses = []
         subscription_success = True
         
-        for symbol_info in symbols:
-            symbol = symbol_info.get("symbol")
-            exchange = symbol_info.get("exchange")
-            
-            if not symbol or not exchange:
-                continue  # Skip invalid symbols
-                
-            # Subscribe to market data
-            response = adapter.subscribe(symbol, exchange, mode, depth_level)
-            
+        for (symbol, exchange), response in zip(instruments, responses):
             if response.get("status") == "success":
                 # Store the subscription
-                subscription_info = {
-                    "symbol": symbol,
-                    "exchange": exchange,
-                    "mode": mode,
-                    "depth_level": depth_level,
-                    "broker": broker_name
-                }
-                
-                if client_id in self.subscriptions:
-                    self.subscriptions[client_id].add(json.dumps(subscription_info))
-                else:
-                    self.subscriptions[client_id] = {json.dumps(subscription_info)}
+                client_subscriptions[(symbol, exchange, mode)] = Subscription(symbol, exchange, mode, depth_level, broker_name)
                 
                 # Add to successful subscriptions
                 subscription_responses.append({
@@ -719,26 +847,11 @@ class WebSocketProxy:
         
         # Handle unsubscribe_all case
         if is_unsubscribe_all:
-            # Get all current subscriptions
+            # Unsubscribe from all current subscriptions, one batch per mode
             if client_id in self.subscriptions:
-                # Convert all stored subscription strings back to dictionaries
-                all_subscriptions = []
-                for sub_json in self.subscriptions[client_id]:
-                    try:
-                        sub_dict = json.loads(sub_json)
-                        all_subscriptions.append(sub_dict)
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse subscription: {sub_json}")
-                
-                # Unsubscribe from each subscription
-                for sub in all_subscriptions:
-                    symbol = sub.get("symbol")
-                    exchange = sub.get("exchange")
-                    mode = sub.get("mode")
-                    
-                    if symbol and exchange:
-                        response = adapter.unsubscribe(symbol, exchange, mode)
-                        
+                for mode, instruments in self._group_by_mode(self.subscriptions[client_id].values()).items():
+                    responses = await self._adapter_unsubscribe_many(adapter, client_id, instruments, mode)
+                    for (symbol, exchange), response in zip(instruments, responses):
                         if response.get("status") == "success":
                             successful_unsubscriptions.append({
                                 "symbol": symbol,
@@ -758,42 +871,24 @@ class WebSocketProxy:
                 # Clear all subscriptions for this client
                 self.subscriptions[client_id].clear()
         else:
-            # Process specific symbols
-            for symbol_info in symbols:
-                symbol = symbol_info.get("symbol")
-                exchange = symbol_info.get("exchange")
-                mode = symbol_info.get("mode", 2)  # Default to Quote mode
-                
-                if not symbol or not exchange:
-                    continue  # Skip invalid symbols
-                
-                # Unsubscribe from market data
-                response = adapter.unsubscribe(symbol, exchange, mode)
-                
+            # Process specific symbols, one batch per mode
+            requested = [(symbol_info.get("symbol"), symbol_info.get("exchange"),
+                          symbol_info.get("mode", 2))  # Default to Quote mode
+                         for symbol_info in symbols]
+            requested = [sub for sub in requested if sub[0] and sub[1]]  # Skip invalid symbols
+            
+            responses = {}
+            for mode, instruments in self._group_by_mode(requested).items():
+                for (symbol, exchange), response in zip(instruments, await self._adapter_unsubscribe_many(adapter, client_id, instruments, mode)):
+                    responses[(symbol, exchange, mode)] = response
+            
+            client_subscriptions = self.subscriptions.get(client_id, {})
+            for key in requested:
+                symbol, exchange, mode = key
+                response = responses[key]
                 if response.get("status") == "success":
-                    # Try to remove subscription
-                    if client_id in self.subscriptions:
-                        subscription_info = {
-                            "symbol": symbol,
-                            "exchange": exchange,
-                            "mode": mode,
-                            "broker": broker_name
-                        }
-                        subscription_key = json.dumps(subscription_info)
-                        # Remove any matching subscription (with or without broker info)
-                        subscriptions_to_remove = []
-                        for sub_key in self.subscriptions[client_id]:
-                            try:
-                                sub_data = json.loads(sub_key)
-                                if (sub_data.get("symbol") == symbol and 
-                                    sub_data.get("exchange") == exchange and 
-                                    sub_data.get("mode") == mode):
-                                    subscriptions_to_remove.append(sub_key)
-                            except json.JSONDecodeError:
-                                continue
-                        
-                        for sub_key in subscriptions_to_remove:
-                            self.subscriptions[client_id].discard(sub_key)
+                    # Remove the subscription
+                    client_subscriptions.pop(key, None)
                     
                     successful_unsubscriptions.append({
                         "symbol": symbol,
@@ -826,6 +921,46 @@ class WebSocketProxy:
             "broker": broker_name
         })
     
+    @staticmethod
+    def _group_by_mode(subscriptions):
+        """{mode: [(symbol, exchange), ...]} of (symbol, exchange, mode, ...) subscriptions"""
+        groups = {}
+        for sub in subscriptions:
+            groups.setdefault(sub[2], []).append((sub[0], sub[1]))
+        return groups
+    
+    async def _feed_call(self, adapter, method, *args):
+        """Call an adapter method; a remote feed's round-trip to the feed owner runs off the event loop"""
+        if isinstance(adapter, RemoteFeed):
+            return await aio.get_running_loop().run_in_executor(self.feed_executor, getattr(adapter, method), *args)
+        return getattr(adapter, method)(*args)
+    
+    async def _adapter_subscribe_many(self, adapter, client_id, instruments, mode, depth_level):
+        """Subscribe through a user's adapter; a shared feed holds the subscriptions for this client"""
+        if isinstance(adapter, CLIENT_HELD_FEEDS):
+            return await self._feed_call(adapter, 'subscribe_many', client_id, instruments, mode, depth_level)
+        return adapter.subscribe_many(instruments, mode, depth_level)
+    
+    async def _adapter_unsubscribe_many(self, adapter, client_id, instruments, mode):
+        """Unsubscribe through a user's adapter; a shared feed only unsubscribes after the last holder"""
+        if isinstance(adapter, CLIENT_HELD_FEEDS):
+            return await self._feed_call(adapter, 'unsubscribe_many', client_id, instruments, mode)
+        return adapter.unsubscribe_many(instruments, mode)
+    
+    def _release_shared_feed(self, feed):
+        """Handle a shared feed whose last user left"""
+        if isinstance(feed, RemoteFeed):
+            # The feed owner releases the adapter once no worker has a user on it
+            del self.shared_feeds[(feed.broker_name, feed.account)]
+        elif feed.broker_name in ['flattrade', 'shoonya'] and hasattr(feed.adapter, 'unsubscribe_all'):
+            logger.info(f"Last user of the shared {feed.broker_name} feed left. Unsubscribing all symbols instead of disconnecting.")
+            feed.unsubscribe_all()
+        else:
+            logger.info(f"Last user of the shared {feed.broker_name} feed left. Disconnecting the adapter.")
+            feed.disconnect()
+            if self.shared_feeds.get((feed.broker_name, feed.account)) is feed:
+                del self.shared_feeds[(feed.broker_name, feed.account)]
+    
     async def send_message(self, client_id, message):
         """
         Send a message to a client
@@ -833,13 +968,18 @@ class WebSocketProxy:
         Args:
             client_id: ID of the client
             message: The message to send
+            
+        Returns:
+            bool: True if the message was written to the client
         """
         if client_id in self.clients:
             websocket = self.clients[client_id]
             try:
                 await websocket.send(json.dumps(message))
+                return True
             except websockets.exceptions.ConnectionClosed:
                 logger.info(f"Connection closed while sending message to client {client_id}")
+        return False
     
     async def send_error(self, client_id, code, message):
         """
@@ -868,13 +1008,19 @@ class WebSocketProxy:
                     
                 # Receive message from ZeroMQ with a timeout
                 try:
-                    [topic, data] = await aio.wait_for(
+                    frames = await aio.wait_for(
                         self.socket.recv_multipart(),
                         timeout=0.1
                     )
                 except aio.TimeoutError:
                     # No message received within timeout, continue the loop
                     continue
+                topic, data = frames[0], frames[1]
+                # A third frame carries the latency trace of a sampled tick
+                trace = frames[2] if len(frames) > 2 else None
+                if trace is not None:
+                    received_ns = time.monotonic_ns()
+                    sent_ns = None
                 
                 # Parse the message
                 topic_str = topic.decode('utf-8')
@@ -918,14 +1064,18 @@ class WebSocketProxy:
                     mode_str = parts[2]
                 else:
                     logger.warning(f"Invalid topic format: {topic_str}")
+                    FEED_DROPPED_FRAMES.labels('invalid_topic').inc()
                     continue
                 
+                FEED_TICKS_RECEIVED.labels(broker_name).inc()
+                
                 # Map mode string to mode number
                 mode_map = {"LTP": 1, "QUOTE": 2, "DEPTH": 3}
                 mode = mode_map.get(mode_str)
                 
                 if not mode:
                     logger.warning(f"Invalid mode in topic: {mode_str}")
+                    FEED_DROPPED_FRAMES.labels('invalid_mode').inc()
                     continue
                 
                 # Find clients subscribed to this data
@@ -943,32 +1093,39 @@ class WebSocketProxy:
                     if broker_name != "unknown" and client_broker and client_broker != broker_name:
                         continue  # Skip if broker doesn't match
                     
-                    # Create a snapshot of the subscription set before iteration
-                    subscriptions_list = list(subscriptions)
-                    for sub_json in subscriptions_list:
-                        try:
-                            sub = json.loads(sub_json)
-                            
-                            # Check subscription match
-                            if (sub.get("symbol") == symbol and 
-                                sub.get("exchange") == exchange and 
-                                (sub.get("mode") == mode or 
-                                 (mode_str == "LTP" and sub.get("mode") == 1) or
-                                 (mode_str == "QUOTE" and sub.get("mode") == 2) or
-                                 (mode_str == "DEPTH" and sub.get("mode") == 3))):
-                                
-                                # Forward data to the client
-                                await self.send_message(client_id, {
-                                    "type": "market_data",
-                                    "symbol": symbol,
-                                    "exchange": exchange,
-                                    "mode": mode,
-                                    "broker": broker_name if broker_name != "unknown" else client_broker,
-                                    "data": market_data
-                                })
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Error parsing subscription: {sub_json}, Error: {e}")
-                            continue
+                    # Check subscription match. A shared feed subscribes upstream at the highest
+                    # mode held on an instrument only, so its ticks also serve the lower modes held
+                    if isinstance(self.broker_adapters.get(user_id), CLIENT_HELD_FEEDS):
+                        client_modes = [m for m in range(mode, 0, -1) if (symbol, exchange, m) in subscriptions]
+                    elif (symbol, exchange, mode) in subscriptions:
+                        client_modes = (mode,)
+                    else:
+                        continue
+                    
+                    # Forward data to the client
+                    for client_mode in client_modes:
+                        send_start = time.perf_counter()
+                        sent = await self.send_message(client_id, {
+                            "type": "market_data",
+                            "symbol": symbol,
+                            "exchange": exchange,
+                            "mode": client_mode,
+                            "broker": broker_name if broker_name != "unknown" else client_broker,
+                            "data": market_data
+                        })
+                        send_seconds = time.perf_counter() - send_start
+                        if sent:
+                            FEED_TICKS_SENT.labels(broker_name).inc()
+                            FEED_SEND_SECONDS.observe(send_seconds)
+                            FEED_CLIENT_SEND_LAG.labels(str(client_id)).set(send_seconds)
+                            if trace is not None:
+                                sent_ns = time.monotonic_ns()
+                        else:
+                            FEED_DROPPED_FRAMES.labels('client_closed').inc()
+                            break
+                
+                if trace is not None:
+                    observe_trace(trace, received_ns, sent_ns)
             
             except Exception as e:
                 logger.error(f"Error in ZeroMQ listener: {e}")
@@ -988,6 +1145,16 @@ async def main():
         ws_host = os.getenv('WEBSOCKET_HOST', '127.0.0.1')
         ws_port = int(os.getenv('WEBSOCKET_PORT', '8765'))
         
+        # Scale-out mode: worker processes share the port, this process only supervises them
+        workers = worker_count()
+        if workers > 1:
+            processes = start_workers(workers, ws_host, ws_port)
+            try:
+                await aio.get_running_loop().run_in_executor(None, lambda: [p.wait() for p in processes])
+            finally:
+                stop_workers(processes)
+            return
+        
         # Create and start the WebSocket proxy
         proxy = WebSocketProxy(host=ws_host, port=ws_port)
         
@@ -0,0 +1,229 @@
+import os
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from utils.logging import get_logger
+from utils.metrics import gauge
+
+logger = get_logger(__name__)
+
+SHARED_FEED_USERS = gauge('openalgo_shared_feed_users', 'Users served by a shared broker feed', ('broker',))
+SHARED_FEED_SUBSCRIPTIONS = gauge('openalgo_shared_feed_subscriptions',
+                                  'Upstream subscriptions held by a shared broker feed', ('broker',))
+
+
+def feed_account(broker_name: str, user_id) -> Optional[str]:
+    """
+    The feed account whose shared feed a user may join, or None.
+
+    ``WEBSOCKET_SHARED_FEED_ACCOUNT_<BROKER>`` names the user whose broker
+    session the shared adapter runs on; ``WEBSOCKET_SHARED_FEED_USERS_<BROKER>``
+    lists (comma separated) the other users entitled to its data. Users of a
+    broker without a feed account, or not on its list, get their own adapter.
+    """
+    broker = broker_name.upper()
+    account = os.getenv(f'WEBSOCKET_SHARED_FEED_ACCOUNT_{broker}', '').strip()
+    if not account:
+        return None
+    allowed = {user.strip() for user in os.getenv(f'WEBSOCKET_SHARED_FEED_USERS_{broker}', '').split(',')}
+    if str(user_id) == account or str(user_id) in allowed:
+        return account
+    return None
+
+
+class SharedFeed:
+    """
+    One broker adapter, on a feed account's session, serving every user
+    entitled to that account's data (see ``feed_account``).
+
+    The proxy fans ticks out by topic (exchange, symbol, mode), so a single
+    upstream subscription can feed any number of clients. Adapters keep one
+    subscription per exchange:symbol, so each (symbol, exchange) keeps the
+    clients holding it per mode and is subscribed upstream once, at the
+    highest mode held: a client taking a higher mode upgrades it, a lower
+    mode never downgrades it, and when the last holder of the upstream mode
+    lets go it is re-subscribed at the highest mode left. The adapter is
+    asked to unsubscribe when no mode is held any more. Adapters publish the
+    upstream mode's topic only, so the proxy hands those ticks to a shared
+    feed's clients holding a lower mode of the instrument too. Holding a
+    subscription twice from the same client is the same as holding it once,
+    matching the proxy's per-client set.
+    """
+
+    def __init__(self, broker_name: str, adapter, account: Optional[str] = None):
+        self.broker_name = broker_name
+        self.adapter = adapter
+        self.account = account
+        self.users: Set[Hashable] = set()
+        self.holders: Dict[Tuple[str, str], Dict[int, Set[Hashable]]] = {}
+        self.upstream_modes: Dict[Tuple[str, str], int] = {}
+        self.actual_depth: Dict[Tuple[str, str], Any] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def status(self):
+        return getattr(self.adapter, 'status', 'connected')
+
+    def attach(self, user_id) -> None:
+        """Register a user served by this feed"""
+        with self.lock:
+            self.users.add(user_id)
+            SHARED_FEED_USERS.labels(self.broker_name).set(len(self.users))
+
+    def detach(self, user_id) -> bool:
+        """Unregister a user; True when no user is left on the feed"""
+        with self.lock:
+            self.users.discard(user_id)
+            SHARED_FEED_USERS.labels(self.broker_name).set(len(self.users))
+            return not self.users
+
+    def subscribe(self, client_id, symbol: str, exchange: str, mode: int = 2, depth_level: int = 5) -> Dict[str, Any]:
+        """Hold a subscription for a client, subscribing upstream for the first holder or a higher mode"""
+        key = (symbol, exchange)
+        with self.lock:
+            if self.upstream_modes.get(key, 0) >= mode:
+                return self._hold(client_id, key, mode, depth_level)
+
+            response = self.adapter.subscribe(symbol, exchange, mode, depth_level)
+            if response.get('status') == 'success':
+                self._subscribed(client_id, key, mode, response.get('actual_depth', depth_level))
+            return response
+
+    def unsubscribe(self, client_id, symbol: str, exchange: str, mode: int = 2) -> Dict[str, Any]:
+        """Release a client's subscription, unsubscribing upstream after the last holder"""
+        key = (symbol, exchange)
+        with self.lock:
+            downgrades = {}
+            response = self._release(client_id, key, mode, downgrades)
+            self._downgrade(downgrades)
+            if response is not None:
+                return response
+
+            response = self.adapter.unsubscribe(symbol, exchange, self.upstream_modes[key])
+            if response.get('status') == 'success':
+                self._drop(key)
+            return response
+
+    def subscribe_many(self, client_id, instruments: List[Tuple[str, str]], mode: int = 2,
+                       depth_level: int = 5) -> List[Dict[str, Any]]:
+        """Hold many subscriptions for a client, subscribing upstream in one batch for those not held at the mode"""
+        responses: List[Optional[Dict[str, Any]]] = [None] * len(instruments)
+        with self.lock:
+            new = []
+            for index, key in enumerate(instruments):
+                key = tuple(key)
+                if self.upstream_modes.get(key, 0) >= mode:
+                    responses[index] = self._hold(client_id, key, mode, depth_level)
+                else:
+                    new.append(index)
+
+            if new:
+                upstream = self.adapter.subscribe_many([instruments[index] for index in new], mode, depth_level)
+                for index, response in zip(new, upstream):
+                    responses[index] = response
+                    if response.get('status') == 'success':
+                        self._subscribed(client_id, tuple(instruments[index]), mode,
+                                         response.get('actual_depth', depth_level))
+                SHARED_FEED_SUBSCRIPTIONS.labels(self.broker_name).set(len(self.holders))
+        return responses
+
+    def unsubscribe_many(self, client_id, instruments: List[Tuple[str, str]], mode: int = 2) -> List[Dict[str, Any]]:
+        """Release many of a client's subscriptions, unsubscribing upstream in one batch per mode for those it held last"""
+        responses: List[Optional[Dict[str, Any]]] = [None] * len(instruments)
+        with self.lock:
+            last: Dict[int, List[int]] = {}
+            downgrades: Dict[int, List[Tuple[str, str]]] = {}
+            for index, key in enumerate(instruments):
+                key = tuple(key)
+                responses[index] = self._release(client_id, key, mode, downgrades)
+                if responses[index] is None:
+                    last.setdefault(self.upstream_modes[key], []).append(index)
+            self._downgrade(downgrades)
+
+            for upstream_mode, indices in last.items():
+                upstream = self.adapter.unsubscribe_many([instruments[index] for index in indices], upstream_mode)
+                for index, response in zip(indices, upstream):
+                    responses[index] = response
+                    if response.get('status') == 'success':
+                        self._drop(tuple(instruments[index]))
+            SHARED_FEED_SUBSCRIPTIONS.labels(self.broker_name).set(len(self.holders))
+        return responses
+
+    def unsubscribe_all(self):
+        """Drop every upstream subscription while keeping the broker connection"""
+        with self.lock:
+            self._clear()
+        return self.adapter.unsubscribe_all()
+
+    def disconnect(self):
+        with self.lock:
+            self._clear()
+        self.adapter.disconnect()
+
+    def _hold(self, client_id, key: Tuple[str, str], mode: int, depth_level: int) -> Dict[str, Any]:
+        """Add a client to an instrument already subscribed upstream at ``mode`` or higher (holding self.lock)"""
+        holders = self.holders[key].setdefault(mode, set())
+        holders.add(client_id)
+        return {
+            'status': 'success',
+            'message': f"Subscribed to {key[0]}.{key[1]} (shared feed, {len(holders)} clients)",
+            'actual_depth': self.actual_depth.get(key, depth_level)
+        }
+
+    def _subscribed(self, client_id, key: Tuple[str, str], mode: int, actual_depth) -> None:
+        """Record an upstream subscription (or upgrade) taken for a client (holding self.lock)"""
+        self.holders.setdefault(key, {}).setdefault(mode, set()).add(client_id)
+        self.upstream_modes[key] = mode
+        self.actual_depth[key] = actual_depth
+        SHARED_FEED_SUBSCRIPTIONS.labels(self.broker_name).set(len(self.holders))
+
+    def _release(self, client_id, key: Tuple[str, str], mode: int,
+                 downgrades: Dict[int, List[Tuple[str, str]]]) -> Optional[Dict[str, Any]]:
+        """
+        Release a client's hold on one mode of an instrument (holding self.lock).
+
+        Returns None when the client is the instrument's last holder, leaving
+        the upstream unsubscribe to the caller. When the upstream mode loses
+        its last holder, the instrument is added to ``downgrades`` under the
+        highest mode still held.
+        """
+        symbol, exchange = key
+        modes = self.holders.get(key, {})
+        holders = modes.get(mode)
+        if not holders or client_id not in holders:
+            return {'status': 'error', 'code': 'NOT_SUBSCRIBED',
+                    'message': f"Not subscribed to {symbol}.{exchange}"}
+        if len(modes) == 1 and holders == {client_id}:
+            return None
+
+        holders.discard(client_id)
+        if not holders:
+            del modes[mode]
+            highest = max(modes)
+            if highest < self.upstream_modes[key]:
+                downgrades.setdefault(highest, []).append(key)
+        remaining = len(set().union(*modes.values()))
+        return {'status': 'success',
+                'message': f"Unsubscribed from {symbol}.{exchange} ({remaining} clients still subscribed)"}
+
+    def _downgrade(self, downgrades: Dict[int, List[Tuple[str, str]]]) -> None:
+        """Re-subscribe instruments at the highest mode still held, one batch per mode (holding self.lock)"""
+        for mode, keys in downgrades.items():
+            for key, response in zip(keys, self.adapter.subscribe_many(keys, mode)):
+                if response.get('status') == 'success':
+                    self.upstream_modes[key] = mode
+                else:
+                    logger.warning(f"Keeping {key[1]}:{key[0]} at mode {self.upstream_modes[key]} on the "
+                                   f"{self.broker_name} shared feed: {response.get('message')}")
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        self.holders.pop(key, None)
+        self.upstream_modes.pop(key, None)
+        self.actual_depth.pop(key, None)
+        SHARED_FEED_SUBSCRIPTIONS.labels(self.broker_name).set(len(self.holders))
+
+    def _clear(self) -> None:
+        self.holders.clear()
+        self.upstream_modes.clear()
+        self.actual_depth.clear()
+        SHARED_FEED_SUBSCRIPTIONS.labels(self.broker_name).set(0)
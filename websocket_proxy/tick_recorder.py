@@ -0,0 +1,207 @@
+"""
+Tick recorder for the ZeroMQ market data bus.
+
+Adapters publish every tick as a ``[topic, json payload]`` multipart message
+(``BaseBrokerWebSocketAdapter.publish_market_data``). The recorder subscribes
+to that bus and appends each message, as received, to a daily segment file::
+
+    ticks-YYYYMMDD.bin = b'OATICKS1' + record*
+    record             = >qHI (receive time in ns since epoch, topic length,
+                         payload length) + topic + payload
+
+Segments are only ever appended to, so a recorder restarted on the same day
+continues the day's file. A record torn by a crash is skipped by
+``read_segment`` and cut off when the recorder reopens the segment, so new
+records never follow it. ``ReplayWebSocketAdapter`` publishes them back.
+"""
+
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import zmq
+
+from utils.logging import get_logger
+from utils.metrics import counter
+
+logger = get_logger(__name__)
+
+SEGMENT_MAGIC = b'OATICKS1'
+RECORD = struct.Struct('>qHI')
+
+TICKS_RECORDED = counter('openalgo_tick_recorder_records_total', 'Ticks written to tick recorder segments')
+BYTES_RECORDED = counter('openalgo_tick_recorder_bytes_total', 'Bytes written to tick recorder segments')
+
+
+def segment_name(ts_ns: int) -> str:
+    """Segment file name for the (local) day of a timestamp"""
+    return f"ticks-{datetime.fromtimestamp(ts_ns / 1e9):%Y%m%d}.bin"
+
+
+def segment_files(path) -> List[Path]:
+    """The segment file at ``path``, or the segments in a directory in time order"""
+    path = Path(path)
+    if path.is_dir():
+        return sorted(path.glob('ticks-*.bin'))
+    return [path] if path.exists() else []
+
+
+def read_segment(path) -> Iterator[Tuple[int, bytes, bytes]]:
+    """Yield (timestamp_ns, topic, payload) for every complete record of a segment"""
+    with open(path, 'rb', buffering=1 << 20) as f:
+        if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a tick segment")
+        read = f.read
+        unpack = RECORD.unpack
+        size = RECORD.size
+        while True:
+            header = read(size)
+            if len(header) < size:
+                return
+            ts_ns, topic_len, payload_len = unpack(header)
+            body = read(topic_len + payload_len)
+            if len(body) < topic_len + payload_len:
+                logger.warning(f"Skipping torn record at the end of {path}")
+                return
+            yield ts_ns, body[:topic_len], body[topic_len:]
+
+
+def complete_length(path) -> int:
+    """Length of a segment up to the end of its last complete record (0 if not even the magic is whole)"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        magic = f.read(len(SEGMENT_MAGIC))
+        if magic != SEGMENT_MAGIC:
+            if SEGMENT_MAGIC.startswith(magic):
+                return 0
+            raise ValueError(f"{path} is not a tick segment")
+        end = len(SEGMENT_MAGIC)
+        while end + RECORD.size <= size:
+            _, topic_len, payload_len = RECORD.unpack(f.read(RECORD.size))
+            record_end = end + RECORD.size + topic_len + payload_len
+            if record_end > size:
+                break
+            f.seek(record_end)
+            end = record_end
+        return end
+
+
+def read_segments(paths: Iterable) -> Iterator[Tuple[int, bytes, bytes]]:
+    for path in paths:
+        yield from read_segment(path)
+
+
+class TickRecorder:
+    """
+    Records the ZeroMQ tick stream into daily segment files.
+
+    ``start`` runs a subscriber thread connected to ``endpoint``; ``write``
+    may also be called directly (from one thread at a time) to record
+    messages from another source.
+    """
+
+    def __init__(self, directory, endpoint: Optional[str] = None, topics: Iterable[bytes] = (b'',),
+                 flush_interval: float = 1.0):
+        self.directory = Path(directory)
+        self.endpoint = endpoint or f"tcp://{os.getenv('ZMQ_HOST', '127.0.0.1')}:{os.getenv('ZMQ_PORT', '5555')}"
+        self.topics = tuple(topics)
+        self.flush_interval = flush_interval
+        self.records = 0
+        self._file = None
+        self._path = None
+        self._day_end = 0
+        self._last_flush = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def path(self) -> Optional[Path]:
+        """Segment currently written to"""
+        return self._path
+
+    def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='tick-recorder', daemon=True)
+        self._thread.start()
+        logger.info(f"Recording ticks from {self.endpoint} into {self.directory}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.close()
+        logger.info(f"Tick recorder stopped after {self.records} ticks")
+
+    def write(self, topic: bytes, payload: bytes, ts_ns: Optional[int] = None) -> None:
+        """Append one message, rolling over to the next day's segment when needed"""
+        if ts_ns is None:
+            ts_ns = time.time_ns()
+        if ts_ns >= self._day_end:
+            self._open_segment(ts_ns)
+        record = RECORD.pack(ts_ns, len(topic), len(payload)) + topic + payload
+        self._file.write(record)
+        self.records += 1
+        TICKS_RECORDED.inc()
+        BYTES_RECORDED.inc(len(record))
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._day_end = 0
+
+    def _open_segment(self, ts_ns: int) -> None:
+        self.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._path = self.directory / segment_name(ts_ns)
+        self._file = open(self._path, 'ab', buffering=1 << 20)
+        length = self._file.tell()
+        end = complete_length(self._path) if length else 0
+        if end < length:
+            logger.warning(f"Dropping {length - end} bytes of a torn record at the end of {self._path}")
+            self._file.truncate(end)
+        if end == 0:
+            self._file.write(SEGMENT_MAGIC)
+        day = datetime.fromtimestamp(ts_ns / 1e9).date() + timedelta(days=1)
+        self._day_end = int(datetime(day.year, day.month, day.day).timestamp()) * 1_000_000_000
+        logger.info(f"Recording ticks to {self._path}")
+
+    def _run(self) -> None:
+        context = zmq.Context.instance()
+        socket = context.socket(zmq.SUB)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.setsockopt(zmq.RCVHWM, 0)  # the recorder must not drop ticks while the disk catches up
+        for topic in self.topics:
+            socket.setsockopt(zmq.SUBSCRIBE, topic)
+        socket.connect(self.endpoint)
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        try:
+            while not self._stop.is_set():
+                if poller.poll(200):
+                    # Drain a batch of queued messages before checking the flush timer again
+                    for _ in range(1000):
+                        try:
+                            frames = socket.recv_multipart(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        if len(frames) >= 2:  # latency trace frames are not recorded
+                            self.write(frames[0], frames[1])
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    self.flush()
+        except Exception as e:
+            logger.exception(f"Tick recorder stopped on error: {e}")
+        finally:
+            socket.close()
+            self.flush()
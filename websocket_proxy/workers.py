@@ -0,0 +1,124 @@
+"""
+Scale-out mode of the WebSocket proxy: several worker processes sharing one port.
+
+With WEBSOCKET_WORKERS > 1 the proxy runs as that many processes, each a
+``WebSocketProxy`` on its own event loop: every worker binds the WebSocket
+port with SO_REUSEPORT, so the kernel spreads incoming connections across
+them, and keeps its own clients and their subscriptions.
+
+The broker adapters run in one more process, the feed owner (feed_owner.py):
+a user's clients share one broker connection whichever workers they land on.
+Workers send subscribe and unsubscribe requests to the owner and all listen
+to its single ZeroMQ bus on ZMQ_PORT; the owner also does the tick recording
+(TICK_RECORD_DIR). Feed metrics are kept per process.
+
+The owner and the workers are started as ``python -m websocket_proxy``
+subprocesses (__main__.py), never with multiprocessing: a spawned child
+re-imports the parent's main module, and when that is app.py every worker
+would build the Flask app and start its own sandbox engine and schedulers.
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+from typing import List
+
+from utils.logging import get_logger
+
+from .base_adapter import RANDOM_PORT_START
+from .port_check import is_port_in_use
+
+logger = get_logger("websocket_proxy")
+
+
+def worker_count() -> int:
+    """Configured number of proxy worker processes (1 = the proxy runs in-process)"""
+    try:
+        count = max(int(os.getenv('WEBSOCKET_WORKERS', '1')), 1)
+    except ValueError:
+        count = 1
+    if count > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        logger.warning("WEBSOCKET_WORKERS needs SO_REUSEPORT, which this platform lacks; running a single proxy")
+        return 1
+    return count
+
+
+async def _serve(index: int, host: str, port: int) -> None:
+    from .feed_owner import FeedClient
+    from .server import WebSocketProxy
+
+    proxy = WebSocketProxy(host=host, port=port, worker_id=index, feed_owner=FeedClient(index))
+    try:
+        await proxy.start()
+    finally:
+        await proxy.stop()
+
+
+def run_worker(index: int, host: str, port: int) -> None:
+    """Entry point of worker process ``index``"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    os.environ.pop('TICK_RECORD_DIR', None)  # the feed owner records the bus
+
+    try:
+        asyncio.run(_serve(index, host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+def feed_ports() -> List[int]:
+    """The feed owner's bus (ZMQ_PORT) and request (WEBSOCKET_FEED_CONTROL_PORT) ports"""
+    return [int(os.getenv('ZMQ_PORT', '5555')), int(os.getenv('WEBSOCKET_FEED_CONTROL_PORT', '5554'))]
+
+
+def _spawn(*args: str) -> subprocess.Popen:
+    """Run ``python -m websocket_proxy *args`` from the project root, with this process's environment"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen([sys.executable, '-m', 'websocket_proxy', *args], cwd=root)
+
+
+def start_workers(count: int, host: str, port: int) -> List[subprocess.Popen]:
+    """Start the feed owner and ``count`` proxy worker processes on host:port (the owner first in the list)"""
+    if is_port_in_use(host, port, wait_time=2.0):
+        raise RuntimeError(f"WebSocket port {port} is already in use on {host}")
+
+    # The feed owner binds fixed ports: check them now, and keep adapters (in every process
+    # spawned from here) from binding them at random
+    zmq_host = os.getenv('ZMQ_HOST', '127.0.0.1')
+    for feed_port in feed_ports():
+        if is_port_in_use(zmq_host, feed_port, wait_time=2.0):
+            raise RuntimeError(f"Feed owner port {feed_port} is already in use on {zmq_host}")
+        if feed_port >= RANDOM_PORT_START:
+            logger.warning(f"Feed owner port {feed_port} lies in the range adapters pick ports from at random "
+                           f"(from {RANDOM_PORT_START}); ports below it are safer")
+    os.environ['ZMQ_RESERVED_PORTS'] = ','.join(str(feed_port) for feed_port in feed_ports())
+
+    # fresh interpreters: no inherited threads, event loop or ZeroMQ context, and no app.py import
+    processes = [_spawn('feed-owner')]
+    for index in range(count):
+        processes.append(_spawn('worker', str(index), host, str(port)))
+    logger.info(f"Started {count} WebSocket proxy workers on {host}:{port}")
+    return processes
+
+
+def stop_workers(processes: List[subprocess.Popen], timeout: float = 5.0) -> None:
+    """Stop the workers, then the feed owner they release their feeds to (as returned by start_workers)"""
+    _stop(processes[1:], timeout)
+    _stop(processes[:1], timeout)
+
+
+def _stop(processes: List[subprocess.Popen], timeout: float) -> None:
+    """Ask processes to shut down (SIGTERM) and kill those that do not exit in time"""
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"{' '.join(process.args[2:])} (pid {process.pid}) did not stop in {timeout}s, killing it")
+            process.kill()
+            process.wait()